@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+
+'''Checks and timing for prep/dedup.py on synthetic page text, plus an
+exact-hash report on the real rfpdb_pdfs folder.
+
+1. Labelled corpus. Base RFPs of 6-31 pages, every one carrying the same
+   two boilerplate pages (general conditions, insurance). Variants:
+   - re-saved copies: same text;
+   - "(1)" copies: 1% of the words changed on two pages;
+   - addenda: the base with a revised page 1 and two new pages at the end;
+   - unrelated documents that share only the boilerplate.
+   Every true group must be found, with no false groupings. An addendum
+   becomes the canonical; the base's only diff page is its old page 1.
+   An edited copy has no diff pages.
+2. Scale: grouping time and LSH candidate pairs at 1/4, 1/2 and all of
+   --scale documents, against the page pairs an all-pairs pass would
+   compare.
+3. rfpdb_pdfs: byte-identical files, by sha256. Page text needs PyMuPDF;
+   when it is installed the folder also goes through dedup.plan.
+Exit 1 when a check fails.
+
+Usage: python bench/dedup_bench.py [--bases 300] [--scale 20000] [--json]'''
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(SERVER_DIR, 'prep'))
+import dedup
+
+VOCABULARY = [f"{a}{b}" for a in ("con", "sub", "pro", "re", "de", "in", "ex", "per", "trans", "pre")
+              for b in ("tract", "mit", "ject", "vide", "cure", "port", "struct", "form", "pend", "sign",
+                    "duct", "fer", "pose", "scribe", "tain", "vert", "gress", "cede", "plete", "spect")]
+VOCABULARY += [str(n) for n in range(200)]
+
+
+def page(rng, words=300):
+    return ' '.join(rng.choice(VOCABULARY) for _ in range(words)) + '.'
+
+
+BOILERPLATE = [page(random.Random('conditions')), page(random.Random('insurance'))]
+
+
+def base_document(rng):
+    pages = [f"Request for proposals {rng.randrange(10 ** 9)}. " + page(rng)]
+    pages += [page(rng) for _ in range(rng.randint(3, 28))]
+    return pages + BOILERPLATE
+
+
+def edited(rng, pages, share=0.01, count=2, fixed=len(BOILERPLATE)):
+    """
+    A copy with `share` of the words changed on `count` pages, leaving the last `fixed` pages alone.
+    """
+    pages = list(pages)
+    for k in rng.sample(range(len(pages) - fixed), min(count, len(pages) - fixed)):
+        words = pages[k].split(' ')
+        for w in rng.sample(range(len(words)), max(1, int(len(words) * share))):
+            words[w] = rng.choice(VOCABULARY)
+        pages[k] = ' '.join(words)
+    return pages
+
+
+def addendum(rng, pages):
+    return ["Addendum 1. Revised schedule. " + page(rng)] + pages[1:] + [page(rng), page(rng)]
+
+
+def labelled_corpus(bases, seed=7):
+    """
+    {key: pages}, {key: truth group id}, and the (base, addendum) pairs.
+    """
+    rng = random.Random(seed)
+    docs, truth, addenda = {}, {}, []
+    for b in range(bases):
+        pages = base_document(rng)
+        key = f"base-{b:04d}"
+        docs[key], truth[key] = pages, key
+        kind = b % 5
+        if kind == 0:
+            docs[key + "-resaved"], truth[key + "-resaved"] = list(pages), key
+        elif kind == 1:
+            docs[key + "(1)"], truth[key + "(1)"] = edited(rng, pages), key
+        elif kind == 2:
+            docs[key + "-addendum"], truth[key + "-addendum"] = addendum(rng, pages), key
+            addenda.append((key, key + "-addendum"))
+        elif kind == 3:
+            docs[key + "-resaved"], truth[key + "-resaved"] = list(pages), key
+            docs[key + "(1)"], truth[key + "(1)"] = edited(rng, pages), key
+    return docs, truth, addenda
+
+
+def build(docs):
+    index = dedup.DedupIndex(':memory:')
+    start = time.perf_counter()
+    for key, pages in docs.items():
+        index.add(key, list(enumerate(pages, 1)))
+    signing = time.perf_counter() - start
+    return index.load(docs), signing
+
+
+def pair_set(groups_of):
+    """
+    Unordered key pairs that share a group. groups_of: {key: group id}.
+    """
+    members = {}
+    for key, group in groups_of.items():
+        members.setdefault(group, []).append(key)
+    return {(a, b) for keys in members.values() for a in keys for b in keys if a < b}
+
+
+def labelled(bases, check):
+    docs, truth, addenda = labelled_corpus(bases)
+    loaded, signing = build(docs)
+    groups, stats = dedup.find_groups(loaded)
+    found = {key: key for key in docs}
+    for group in groups:
+        for key in group["members"]:
+            found[key] = group["canonical"]
+        found[group["canonical"]] = group["canonical"]
+    expected, got = pair_set(truth), pair_set(found)
+    true_pairs = len(expected & got)
+    precision = true_pairs / len(got) if got else 1.0
+    recall = true_pairs / len(expected) if expected else 1.0
+    check(precision == 1.0, f"labelled: precision {precision:.3f}, false pairs {sorted(got - expected)[:5]}")
+    check(recall == 1.0, f"labelled: recall {recall:.3f}, missed pairs {sorted(expected - got)[:5]}")
+
+    by_canonical = {g["canonical"]: g["members"] for g in groups}
+    for base, add in addenda:
+        members = by_canonical.get(add, {})
+        check(base in members and members[base]["diff_pages"] == [1],
+              f"labelled: {base} under {add}: {members.get(base)}")
+    edits = [(g["canonical"], key, m) for g in groups for key, m in g["members"].items() if key.endswith("(1)")]
+    check(all(m["reason"] == "near" and not m["diff_pages"] for _, _, m in edits),
+          f"labelled: edited copies with diff pages {[(k, m) for _, k, m in edits if m['diff_pages']][:3]}")
+    reasons = {}
+    for g in groups:
+        for m in g["members"].values():
+            reasons[m["reason"]] = reasons.get(m["reason"], 0) + 1
+    return {"documents": len(docs), "true_groups": len(set(truth.values())) - sum(
+                1 for t in set(truth.values()) if list(truth.values()).count(t) == 1),
+            "groups": len(groups), "by_reason": reasons, "precision": precision, "recall": recall,
+            "signing_seconds": round(signing, 2), **{k: stats[k] for k in ("pages", "candidate_pairs", "seconds")}}
+
+
+def scale_corpus(count, seed=11):
+    """
+    `count` documents of 2-10 pages; one in ten is an edited copy of an earlier one.
+    """
+    rng = random.Random(seed)
+    docs = {}
+    for d in range(count):
+        if d and d % 10 == 0:
+            source = docs[f"doc-{rng.randrange(d):06d}"]
+            docs[f"doc-{d:06d}"] = edited(rng, source, count=1, fixed=0)
+        else:
+            docs[f"doc-{d:06d}"] = [page(rng, 200) for _ in range(rng.randint(2, 10))]
+    return docs
+
+
+def scale(count):
+    docs = scale_corpus(count)
+    loaded, signing = build(docs)
+    keys = sorted(loaded)
+    runs = []
+    for share in (4, 2, 1):
+        subset = {k: loaded[k] for k in keys[:count // share]}
+        groups, stats = dedup.find_groups(subset)
+        pages = stats["pages"]
+        runs.append({"documents": len(subset), "pages": pages, "seconds": stats["seconds"],
+                     "candidate_pairs": stats["candidate_pairs"], "all_pairs": pages * (pages - 1) // 2,
+                     "groups": len(groups)})
+    return {"signing_seconds": round(signing, 2),
+            "signing_ms_per_page": round(1000 * signing / max(runs[-1]["pages"], 1), 3), "runs": runs}
+
+
+def real_folder():
+    report = {"folder": dedup.PDF_DIR}
+    if not os.path.isdir(dedup.PDF_DIR):
+        report["missing"] = True
+        return report
+    by_hash = {}
+    for path in dedup._expand([dedup.PDF_DIR]):
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        by_hash.setdefault(h.hexdigest(), []).append(os.path.basename(path))
+    report["pdfs"] = sum(len(v) for v in by_hash.values())
+    report["distinct"] = len(by_hash)
+    report["byte_identical"] = sorted(sorted(v) for v in by_hash.values() if len(v) > 1)
+    try:
+        import fitz  # noqa: F401
+    except ImportError:
+        report["plan"] = "skipped: PyMuPDF not installed, no page text"
+        return report
+    summary = dedup.summarize(dedup.plan(list(dedup._expand([dedup.PDF_DIR])), index=dedup.DedupIndex(':memory:')))
+    report["plan"] = summary
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="prep/dedup.py checks and timing")
+    parser.add_argument('--bases', type=int, default=300)
+    parser.add_argument('--scale', type=int, default=20000)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+    failures = []
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+
+    report = {"labelled": labelled(args.bases, check)}
+    if args.scale:
+        report["scale"] = scale(args.scale)
+        runs = report["scale"]["runs"]
+        check(all(r["candidate_pairs"] < r["all_pairs"] / 1000 for r in runs),
+              f"scale: candidate pairs near all-pairs {runs}")
+    report["rfpdb_pdfs"] = real_folder()
+
+    if failures:
+        print(json.dumps({"failures": failures, **report}, indent=2))
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    lab = report["labelled"]
+    print(f"labelled: {lab['documents']} documents, {lab['pages']} pages, {lab['groups']} groups "
+          f"{lab['by_reason']}  precision {lab['precision']:.3f}  recall {lab['recall']:.3f}  "
+          f"signing {lab['signing_seconds']}s  grouping {lab['seconds']}s")
+    if "scale" in report:
+        print(f"scale: signing {report['scale']['signing_seconds']}s ({report['scale']['signing_ms_per_page']} ms/page)")
+        for r in report["scale"]["runs"]:
+            print(f"  {r['documents']:>7} documents {r['pages']:>8} pages: grouping {r['seconds']:.2f}s  "
+                  f"{r['candidate_pairs']} candidate pairs vs {r['all_pairs']:.3g} all-pairs  {r['groups']} groups")
+    real = report["rfpdb_pdfs"]
+    if real.get("missing"):
+        print(f"rfpdb_pdfs: {real['folder']} not found")
+    else:
+        print(f"rfpdb_pdfs: {real['pdfs']} PDFs, {real['distinct']} distinct; byte-identical: {real['byte_identical']}")
+        print(f"  plan: {real['plan']}")
+
+
+if __name__ == "__main__":
+    main()
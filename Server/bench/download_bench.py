@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import argparse
+
+'''Checks and timing for dataCollection/downloader.py against bench/stub_files.py.
+
+1. Serial bare requests.get (the old SAM.download_attachments loop) vs the
+   pooled Downloader on the same attachment set. The set includes tiny
+   files (dropped by min_size) and HTML error pages.
+2. Resume: every file's first response is cut off halfway. Each file must
+   end byte-identical to the source. Every file whose first half fills at
+   least one read chunk must finish through a Range request.
+3. Rate limits: injected 429s are retried, and the peak number of requests
+   in flight never exceeds the per-host cap.
+Exit 1 when a check fails.
+
+Usage: python bench/download_bench.py [--files 60] [--latency-ms 50] [--json]'''
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(SERVER_DIR, 'dataCollection'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import downloader
+import stub_files
+
+MIN_SIZE = 50
+
+
+def attachment_set(base_url, n, seed=3):
+    """
+    (url, name, size, kind) for n files: mostly PDFs of 20 KB - 2 MB, some tiny, some HTML.
+    """
+    rng = random.Random(seed)
+    files = []
+    for i in range(n):
+        kind, size = 'pdf', rng.randint(20_000, 2_000_000)
+        if i % 15 == 7:
+            size = 30
+        elif i % 15 == 11:
+            kind, size = 'html', 2_000
+        name = f"notice{i:04d}_resource_0"
+        files.append((f"{base_url}/files/{name}?size={size}&kind={kind}", name, size, kind))
+    return files
+
+
+def legacy(files, folder):
+    import requests
+    for url, name, _, _ in files:
+        r = requests.get(url)
+        ext = downloader.extension_for(r.content)
+        if r.status_code == 200 and len(r.content) >= MIN_SIZE:
+            with open(os.path.join(folder, name + ext), 'wb') as f:
+                f.write(r.content)
+
+
+def stats(base_url):
+    import requests
+    return requests.get(base_url + '/stats').json()
+
+
+def verify(files, folder):
+    """
+    Names of files that are missing or differ from what the stub serves.
+    """
+    bad = []
+    for url, name, size, kind in files:
+        if size < MIN_SIZE:
+            continue
+        path = downloader.existing(folder, name)
+        if path is None:
+            bad.append(name)
+            continue
+        with open(path, 'rb') as f:
+            if f.read() != stub_files.content(name, size, kind):
+                bad.append(name)
+    return bad
+
+
+def run(files, folder, **options):
+    start = time.perf_counter()
+    d = downloader.Downloader(min_size=MIN_SIZE, **options)
+    results = d.download_many((url, folder, name) for url, name, _, _ in files)
+    return downloader.summarize(results, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="downloader.py checks and timing against a local stub host")
+    parser.add_argument('--files', type=int, default=60)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+    report = {}
+    failures = []
+
+    server, base_url = stub_files.start_stub(latency_ms=args.latency_ms)
+    try:
+        files = attachment_set(base_url, args.files)
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            legacy(files, tmp)
+            report["legacy_serial"] = {"files": len(files), "seconds": round(time.perf_counter() - start, 2)}
+        with tempfile.TemporaryDirectory() as tmp:
+            report["pooled"] = run(files, tmp, limiter=downloader.HostLimiter(concurrency=8, rps=0))
+            failures += [f"pooled: {name}" for name in verify(files, tmp)]
+            report["pooled_rerun"] = run(files, tmp)
+            if report["pooled_rerun"]["statuses"].get("exists", 0) != report["pooled"]["statuses"].get("downloaded", 0):
+                failures.append("re-run did not skip finished files")
+        report["speedup"] = round(report["legacy_serial"]["seconds"] / report["pooled"]["seconds"], 1)
+    finally:
+        server.shutdown()
+
+    server, base_url = stub_files.start_stub(latency_ms=args.latency_ms, drop_rate=1.0)
+    try:
+        files = [f for f in attachment_set(base_url, args.files) if f[3] == 'pdf' and f[2] >= MIN_SIZE]
+        with tempfile.TemporaryDirectory() as tmp:
+            report["resume"] = run(files, tmp, limiter=downloader.HostLimiter(concurrency=8, rps=0))
+            report["resume"]["range_requests"] = stats(base_url)["partial"]
+            failures += [f"resume: {name}" for name in verify(files, tmp)]
+            # a cut-off body shorter than one read chunk leaves nothing to resume from
+            expected = sum(1 for f in files if f[2] // 2 >= downloader.CHUNK_SIZE)
+            if report["resume"]["resumed"] < expected:
+                failures.append(f"resume: {report['resume']['resumed']} resumed, expected at least {expected}")
+    finally:
+        server.shutdown()
+
+    server, base_url = stub_files.start_stub(latency_ms=args.latency_ms, fail_rate=0.3)
+    try:
+        files = attachment_set(base_url, args.files)
+        with tempfile.TemporaryDirectory() as tmp:
+            report["rate_limited"] = run(files, tmp, workers=16, limiter=downloader.HostLimiter(concurrency=4, rps=20))
+            served = stats(base_url)
+            report["rate_limited"].update({"http_429": served["rate_limited"], "peak_in_flight": served["peak_in_flight"]})
+            failures += [f"rate_limited: {name}" for name in verify(files, tmp)]
+            if served["peak_in_flight"] > 4:
+                failures.append(f"rate_limited: {served['peak_in_flight']} requests in flight, cap 4")
+    finally:
+        server.shutdown()
+
+    if failures:
+        print(json.dumps({"failures": failures, **report}, indent=2))
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"legacy serial: {report['legacy_serial']['seconds']:.2f}s for {report['legacy_serial']['files']} files")
+        for key in ("pooled", "pooled_rerun", "resume", "rate_limited"):
+            r = report[key]
+            extra = {k: r[k] for k in ("range_requests", "http_429", "peak_in_flight") if k in r}
+            print(f"{key:>13}: {r['seconds']:.2f}s  {r['statuses']}  {r['megabytes']} MB  {extra or ''}")
+        print(f"speedup {report['speedup']}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+'''Golden checks and timing for takeoff/geometry.py.
+
+The golden cases (hand-computed areas, overlaps and unions, scale parsing)
+are checked first (exit 1 on any mismatch). measure() is then timed on
+synthetic sheets of 1k-5k rooms, as boxes and as 5-point polygons, and
+the box-union and label-map unions are compared on the same boxes.
+
+Usage: python bench/geometry_bench.py [--rooms 1000,3000,5000] [--repeat N] [--json]'''
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(SERVER_DIR, 'takeoff'))
+import geometry
+
+
+def box(x0, y0, x1, y1, points=False):
+    pred = {"x": (x0 + x1) / 2, "y": (y0 + y1) / 2, "width": x1 - x0, "height": y1 - y0, "class": "room", "confidence": 0.9}
+    if points:
+        pred["points"] = [{"x": x0, "y": y0}, {"x": x0, "y": y1}, {"x": x1, "y": y1}, {"x": x1, "y": y0}]
+    return pred
+
+
+def triangle(x0, y0, x1, y1):
+    pred = box(x0, y0, x1, y1)
+    pred["points"] = [{"x": x0, "y": y0}, {"x": x1, "y": y0}, {"x": x0, "y": y1}]
+    return pred
+
+
+# (predictions, scale, expected subset of measure() keys)
+GOLDEN = [
+    ([], None, {"room_count": 0, "union_area_px": 0.0, "overlaps": []}),
+    ([box(0, 0, 10, 10), box(5, 5, 15, 15), box(100, 100, 102, 102)], None,
+     {"total_area_px": 204.0, "union_area_px": 179.0, "overlap_area_px": 25.0, "overlaps": [[1, 2, 25.0]], "union_method": "boxes"}),
+    ([box(0, 0, 10, 10, points=True), box(2, 2, 4, 4, points=True)], None,
+     {"union_area_px": 100.0, "overlap_area_px": 4.0, "union_method": "boxes"}),
+    ([box(0, 0, 200, 100)], '1/8" = 1\'-0"', {"feet_per_pixel": 0.04, "total_area_sqft": 32.0, "union_area_sqft": 32.0}),
+    ([box(0, 0, 200, 100)], '1" = 20\'', {"feet_per_pixel": 0.1, "union_area_sqft": 200.0}),
+    ([triangle(0, 0, 100, 100)], None, {"total_area_px": 5000.0, "union_method": "label_map"}),
+]
+
+SCALES = [('1/8" = 1\'-0"', 8.0), ('1/4"=1\'', 4.0), ('1 1/2" = 1\'-0"', 2 / 3), ('3/32" = 1\'-0"', 32 / 3),
+          ('1" = 20\'', 20.0), ('1:120', 10.0), ('8', 8.0), (None, None), ('NTS', None)]
+
+
+def check_golden():
+    failures = []
+    for predictions, scale, expected in GOLDEN:
+        got = geometry.measure(predictions, 400, 400, scale)
+        for key, value in expected.items():
+            if isinstance(value, float) and isinstance(got[key], float) and abs(got[key] - value) <= max(1e-6, abs(value) * 1e-6):
+                continue
+            if got[key] != value:
+                failures.append({"rooms": len(predictions), "key": key, "expected": value, "got": got[key]})
+    triangle_union = geometry.measure([triangle(0, 0, 100, 100)], 400, 400, max_side=400)["union_area_px"]
+    # raster union of a 5000 px^2 triangle, edges included
+    if not 5000 <= triangle_union <= 5300:
+        failures.append({"key": "triangle label-map union", "expected": "5000..5300", "got": triangle_union})
+    for text, expected in SCALES:
+        got = geometry.parse_scale(text)
+        if (got is None) != (expected is None) or (got is not None and abs(got - expected) > 1e-9):
+            failures.append({"scale": text, "expected": expected, "got": got})
+    return failures
+
+
+def synthetic(n, polygons, width=8400, height=6000, seed=1):
+    rng = random.Random(seed)
+    predictions = []
+    for _ in range(n):
+        w, h = rng.uniform(50, 400), rng.uniform(50, 400)
+        x0, y0 = rng.uniform(0, width - w), rng.uniform(0, height - h)
+        pred = box(x0, y0, x0 + w, y0 + h)
+        if polygons:
+            # an L-shaped room: the box with its upper-right quarter cut away
+            pred["points"] = [{"x": x0, "y": y0}, {"x": x0, "y": y0 + h}, {"x": x0 + w, "y": y0 + h},
+                              {"x": x0 + w, "y": y0 + h / 2}, {"x": x0 + w / 2, "y": y0 + h / 2}, {"x": x0 + w / 2, "y": y0}]
+        predictions.append(pred)
+    return predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="takeoff/geometry.py golden check and timing")
+    parser.add_argument('--rooms', default='1000,3000,5000')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    failures = check_golden()
+    if failures:
+        print(json.dumps({"golden_failures": failures}, indent=2))
+        sys.exit(1)
+
+    rows = []
+    for n in (int(v) for v in args.rooms.split(',')):
+        for polygons in (False, True):
+            predictions = synthetic(n, polygons)
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                takeoff = geometry.measure(predictions, 8400, 6000, '1/8" = 1\'-0"')
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            rows.append({"rooms": n, "shape": "L-polygon" if polygons else "box", "ms": round(best * 1000, 1),
+                         "union_method": takeoff["union_method"], "overlap_pairs": len(takeoff["overlaps"])})
+        b = geometry.boxes(synthetic(n, False))
+        exact = geometry.box_union_area(b)
+        labels, factor = geometry.label_map(synthetic(n, False), 8400, 6000)
+        if exact is not None:
+            rows[-1]["label_map_union_error"] = round(((labels > 0).sum() * factor ** 2 - exact) / exact, 4)
+
+    report = {"golden_cases": len(GOLDEN) + len(SCALES) + 1, "runs": rows}
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['golden_cases']} golden cases ok")
+        for row in rows:
+            extra = f"  label-map union error {row['label_map_union_error']:+.2%}" if "label_map_union_error" in row else ""
+            print(f"{row['rooms']:>6} {row['shape']:>9}: {row['ms']:7.1f} ms  union via {row['union_method']:<9}  "
+                  f"{row['overlap_pairs']} overlapping pairs{extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import os
+import re
+import sys
+import json
+import subprocess
+
+'''Import-time budget check for the scripts the Node routes launch.
+
+Each module is imported in a fresh interpreter with `python -X importtime`
+and its cumulative import time is compared to its budget.
+Exits non-zero when any module is over budget or fails to import.
+
+Usage: python bench/importtime.py [--json] [--repeat N]'''
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+DEFAULT_BUDGET_MS = 100
+# (directory, module, budget in ms)
+MODULES = [
+    ('prep', 'llm', DEFAULT_BUDGET_MS),
+    ('prep', 'conversation', DEFAULT_BUDGET_MS),
+    ('prep', 'trajectory', DEFAULT_BUDGET_MS),
+    ('prep', 'pdfparser', DEFAULT_BUDGET_MS),
+    ('prep', 'ocr', DEFAULT_BUDGET_MS),
+    ('prep', 'indexer', DEFAULT_BUDGET_MS),
+    ('prep', 'vector_index', DEFAULT_BUDGET_MS),
+    ('prep', 'page_store', DEFAULT_BUDGET_MS),
+    ('prep', 'dedup', DEFAULT_BUDGET_MS),
+    ('prep', 'text_index', DEFAULT_BUDGET_MS),
+    ('prep', 'vision_text', DEFAULT_BUDGET_MS),
+    ('prep', 'pdf_to_image_and_gcs', DEFAULT_BUDGET_MS),
+    ('prep', 'worker', DEFAULT_BUDGET_MS),
+    ('takeoff', 'mask', DEFAULT_BUDGET_MS),
+    ('takeoff', 'geometry', DEFAULT_BUDGET_MS),
+    ('dataCollection', 'downloader', DEFAULT_BUDGET_MS),
+    ('dataCollection', 'rfpdb', DEFAULT_BUDGET_MS),
+    ('dataCollection', 'opportunity_store', DEFAULT_BUDGET_MS),
+]
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+def measure_import(directory, module):
+    """
+    Import `module` from Server/<directory> in a fresh interpreter.
+    Returns (cumulative_ms, error).
+    """
+    path = os.path.join(SERVER_DIR, directory)
+    code = f"import sys; sys.path.insert(0, {path!r}); import {module}"
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, cwd=path,
+    )
+    if proc.returncode != 0:
+        return None, proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'import failed'
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_LINE.match(line)
+        if m and m.group(4) == module:
+            return int(m.group(2)) / 1000.0, None
+    return None, 'module not found in -X importtime output'
+
+
+def main():
+    as_json = '--json' in sys.argv
+    repeat = 3
+    if '--repeat' in sys.argv:
+        repeat = int(sys.argv[sys.argv.index('--repeat') + 1])
+    results = []
+    failed = False
+    for directory, module, budget_ms in MODULES:
+        timings = []
+        error = None
+        for _ in range(repeat):
+            ms, error = measure_import(directory, module)
+            if error:
+                break
+            timings.append(ms)
+        # best of N keeps disk cache / scheduler noise out of the budget check
+        best = min(timings) if timings else None
+        ok = error is None and best <= budget_ms
+        failed = failed or not ok
+        results.append({
+            "module": f"{directory}/{module}",
+            "import_ms": round(best, 2) if best is not None else None,
+            "budget_ms": budget_ms,
+            "ok": ok,
+            "error": error,
+        })
+    if as_json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            status = 'ok' if r['ok'] else 'OVER BUDGET' if r['error'] is None else 'ERROR'
+            timing = f"{r['import_ms']:8.2f} ms" if r['import_ms'] is not None else '       -   '
+            print(f"{r['module']:32} {timing} / {r['budget_ms']} ms  {status}" + (f"  ({r['error']})" if r['error'] else ''))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
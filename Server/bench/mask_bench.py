@@ -0,0 +1,223 @@
+import os
+import io
+import sys
+import json
+import time
+import copy
+import tempfile
+import argparse
+
+'''Equivalence check and timing for the takeoff/mask.py image path.
+
+The legacy run_mask steps (point() binarize, disk + in-memory PNG, reopen
+for an RGBA alpha_composite overlay) are timed against the NumPy path
+(one decode, LUT binarize, min-pool to the detector size, in-place
+overlay) on the same sheet. The detector is not called: both paths use
+the predictions in takeoff/output/roomplanner_results.json, which the new
+path first scales down to the detector resolution and then back up.
+
+Before timing, the LUT output is compared with point() at full size, and
+pooled-then-thresholded with thresholded-then-pooled (exit 1 on mismatch).
+
+--tiled instead compares whole-sheet and tiled detection against
+bench/stub_detector.py on a synthetic walled sheet with known rooms:
+rooms found (IoU >= 0.8 with a true room), spurious boxes, requests and
+wall time.
+
+Usage: python bench/mask_bench.py [--image PNG] [--max-side N] [--repeat N] [--tiled] [--json]'''
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(SERVER_DIR, 'takeoff'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import mask
+import stub_detector
+
+IMAGE_PATH = os.path.join(SERVER_DIR, 'takeoff', 'data', 'rec_center_page1.png')
+RESULTS_PATH = os.path.join(SERVER_DIR, 'takeoff', 'output', 'roomplanner_results.json')
+
+
+def legacy(image_path, output_dir, result, threshold=200):
+    from PIL import Image, ImageDraw
+    timings = {}
+    t = time.perf_counter()
+    img_orig = Image.open(image_path).convert("L")
+    img_bin = img_orig.point(lambda x: 255 if x > threshold else 0, mode='1')
+    img_bin.convert("L").save(os.path.join(output_dir, "binarized_input.png"))
+    img_bytes = io.BytesIO()
+    img_bin.convert("RGB").save(img_bytes, format='PNG')
+    timings["prepare_seconds"] = time.perf_counter() - t
+    timings["upload_bytes"] = img_bytes.tell()
+
+    t = time.perf_counter()
+    img = Image.open(image_path).convert("RGBA")
+    overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    for pred in result.get('predictions', []):
+        x, y, w, h = (pred.get(k) for k in ('x', 'y', 'width', 'height'))
+        if None not in (x, y, w, h):
+            draw.rectangle([int(x - w/2), int(y - h/2), int(x + w/2), int(y + h/2)],
+                           outline=mask.OUTLINE_RGBA, width=mask.OUTLINE_WIDTH, fill=mask.FILL_RGBA)
+    composed = Image.alpha_composite(img, overlay)
+    composed.save(os.path.join(output_dir, "room_mask_overlay.png"))
+    timings["overlay_seconds"] = time.perf_counter() - t
+    return timings, composed
+
+
+def vectorized(image_path, output_dir, result, max_side, threshold=200):
+    import numpy as np
+    from PIL import Image
+    timings = {}
+    t = time.perf_counter()
+    image = mask.decode(image_path)
+    gray = np.asarray(image.convert("L"))
+    png_bytes, factor, small = mask.prepare_upload(gray, threshold, max_side)
+    timings["prepare_seconds"] = time.perf_counter() - t
+    timings["upload_bytes"] = len(png_bytes)
+    timings["detector_input"] = f"{small.shape[1]}x{small.shape[0]}"
+
+    # what the detector would return at its input size, mapped back up
+    result = copy.deepcopy(result)
+    for pred in result['predictions']:
+        for key in ('x', 'y', 'width', 'height'):
+            pred[key] /= factor
+    result = mask.scale_result(result, factor, gray.shape[1], gray.shape[0])
+
+    t = time.perf_counter()
+    overlay = mask.render_overlay(np.asarray(image.convert("RGB")), result['predictions'])
+    Image.fromarray(overlay, mode="RGB").save(os.path.join(output_dir, "room_mask_overlay.png"), compress_level=1)
+    timings["overlay_seconds"] = time.perf_counter() - t
+    return timings, overlay
+
+
+def check(image_path, max_side, threshold=200):
+    import numpy as np
+    from PIL import Image
+    failures = []
+    gray = mask.load_gray(image_path)
+    with Image.open(image_path) as img:
+        expected = np.asarray(img.convert("L").point(lambda x: 255 if x > threshold else 0, mode='1').convert("L"))
+    if not np.array_equal(mask.binarize(gray, threshold), expected):
+        failures.append("LUT binarize differs from point()")
+    _, factor, small = mask.prepare_upload(gray, threshold, max_side)
+    if not np.array_equal(small, mask.min_pool(expected, factor)):
+        failures.append("pool-then-threshold differs from threshold-then-pool")
+    if max(small.shape) > max_side:
+        failures.append(f"detector input {small.shape} exceeds {max_side}")
+    return failures
+
+
+def match_rooms(predictions, rooms, min_iou=0.8):
+    """
+    (true rooms matched by some prediction, predictions matching no room).
+    """
+    import numpy as np
+    if not predictions:
+        return 0, 0
+    pred = np.array([(p['x'] - p['width'] / 2, p['y'] - p['height'] / 2, p['x'] + p['width'] / 2, p['y'] + p['height'] / 2)
+                     for p in predictions])
+    true = np.array(rooms, dtype=np.float64)
+    w = np.minimum(pred[:, None, 2], true[None, :, 2]) - np.maximum(pred[:, None, 0], true[None, :, 0])
+    h = np.minimum(pred[:, None, 3], true[None, :, 3]) - np.maximum(pred[:, None, 1], true[None, :, 1])
+    inter = np.maximum(w, 0) * np.maximum(h, 0)
+    area = lambda b: (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    iou = inter / (area(pred)[:, None] + area(true)[None, :] - inter)
+    hit = iou >= min_iou
+    return int(hit.any(axis=0).sum()), int((~hit.any(axis=1)).sum())
+
+
+def tiled_report(max_side, latency_ms=300):
+    import urllib.request
+    gray, rooms = stub_detector.synthetic_sheet()
+    server, url = stub_detector.start_stub(latency_ms=latency_ms)
+    report = {"sheet": f"{gray.shape[1]}x{gray.shape[0]}", "rooms": len(rooms), "stub_latency_ms": latency_ms}
+    try:
+        for name in ("whole", "tiled"):
+            before = json.load(urllib.request.urlopen(url + '/stats'))["requests"]
+            t = time.perf_counter()
+            if name == "tiled":
+                result = mask.detect_tiled(gray, max_side=max_side, api_key="stub", url=url)
+            else:
+                png_bytes, factor, _ = mask.prepare_upload(gray, 200, max_side)
+                result = mask.scale_result(mask.detect(png_bytes, "stub", url), factor, gray.shape[1], gray.shape[0])
+            seconds = time.perf_counter() - t
+            found, spurious = match_rooms(result['predictions'], rooms)
+            report[name] = {
+                "predictions": len(result['predictions']),
+                "rooms_found": found,
+                "spurious": spurious,
+                "requests": json.load(urllib.request.urlopen(url + '/stats'))["requests"] - before,
+                "seconds": round(seconds, 2),
+            }
+    finally:
+        server.shutdown()
+    return report
+
+
+def main():
+    import numpy as np
+    parser = argparse.ArgumentParser(description="takeoff/mask.py image path benchmark")
+    parser.add_argument('--image', default=IMAGE_PATH)
+    parser.add_argument('--max-side', type=int, default=mask.DETECT_MAX_SIDE)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tiled', action='store_true', help="whole-sheet vs tiled detection against the stub detector")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    if args.tiled:
+        report = tiled_report(args.max_side)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print(f"{report['sheet']} sheet, {report['rooms']} rooms, stub latency {report['stub_latency_ms']} ms")
+            for name in ("whole", "tiled"):
+                r = report[name]
+                print(f"{name:>6}: {r['rooms_found']}/{report['rooms']} rooms found, {r['spurious']} spurious, "
+                      f"{r['requests']} requests, {r['seconds']:.2f}s")
+        return
+
+    failures = check(args.image, args.max_side)
+    if failures:
+        print(json.dumps({"failures": failures}, indent=2))
+        sys.exit(1)
+
+    with open(RESULTS_PATH, 'r') as f:
+        result = json.load(f)
+
+    runs = {"legacy": [], "vectorized": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(args.repeat):
+            timings, legacy_overlay = legacy(args.image, tmp, result)
+            runs["legacy"].append(timings)
+            timings, new_overlay = vectorized(args.image, tmp, result, args.max_side)
+            runs["vectorized"].append(timings)
+    diff = np.abs(np.asarray(legacy_overlay.convert("RGB"), dtype=np.int16) - new_overlay.astype(np.int16))
+
+    def best(name):
+        timings = runs[name]
+        report = dict(timings[0])
+        for key in ("prepare_seconds", "overlay_seconds"):
+            report[key] = round(min(t[key] for t in timings), 3)
+        report["total_seconds"] = round(report["prepare_seconds"] + report["overlay_seconds"], 3)
+        return report
+
+    report = {
+        "image": args.image,
+        "size": f"{legacy_overlay.width}x{legacy_overlay.height}",
+        "predictions": len(result.get('predictions', [])),
+        "legacy": best("legacy"),
+        "vectorized": best("vectorized"),
+        "overlay_max_pixel_diff": int(diff.max()),
+    }
+    report["speedup"] = round(report["legacy"]["total_seconds"] / report["vectorized"]["total_seconds"], 1)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for name in ("legacy", "vectorized"):
+            r = report[name]
+            print(f"{name:>10}: prepare {r['prepare_seconds']:.3f}s  overlay {r['overlay_seconds']:.3f}s  "
+                  f"total {r['total_seconds']:.3f}s  upload {r['upload_bytes'] / 1e6:.2f} MB")
+        print(f"speedup {report['speedup']}x, overlay max pixel diff {report['overlay_max_pixel_diff']}")
+
+
+if __name__ == "__main__":
+    main()
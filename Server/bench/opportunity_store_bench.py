@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import argparse
+from datetime import date, datetime, timedelta, timezone
+
+'''Checks and timing for dataCollection/opportunity_store.py.
+
+--count synthetic SAM records: NAICS and PSC codes, set-asides, deadlines
+with assorted UTC offsets, and titles and descriptions built from a
+construction vocabulary.
+
+1. Bulk insert of the whole set in one upsert_many, then a re-upsert with
+   nothing changed (no rows rewritten), then one with 1% changed.
+2. Filter and text queries: results must equal a plain Python pass over
+   the JSON records; the deadline comparison happens in UTC. Reports
+   p50/p95 latency per query next to that pass.
+Exit 1 when a check fails.
+
+Usage: python bench/opportunity_store_bench.py [--count 50000] [--repeat 20] [--json]'''
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(SERVER_DIR, 'dataCollection'))
+import opportunity_store
+
+NAICS = ["236220", "236210", "237310", "237990", "238160", "238210", "238220", "238910", "562910", "541330"]
+PSC = ["Y1AA", "Y1JZ", "Z2AA", "Z1DB", "Z2JZ", "C1AA", "J041", "S208"]
+SET_ASIDES = [None, "SBA", "8A", "SDVOSBC", "HZC", "WOSB"]
+OFFSETS = [-8, -7, -6, -5, -4, 0]
+WORDS = ("roof replacement hvac upgrade paving repair renovation demolition electrical plumbing asbestos abatement "
+         "bridge culvert dredging fencing lighting elevator modernization parking garage barracks runway taxiway "
+         "seawall levee sewer water main generator boiler chiller painting flooring drywall masonry concrete "
+         "steel erection fire alarm sprinkler security cameras access control").split()
+
+
+def make_records(count, seed=5):
+    rng = random.Random(seed)
+    today = date(2024, 6, 1)
+    records = []
+    for i in range(count):
+        posted = today - timedelta(days=rng.randint(0, 365))
+        due = datetime.combine(posted + timedelta(days=rng.randint(7, 60)), datetime.min.time()).replace(
+            hour=rng.choice([10, 14, 17]), tzinfo=timezone(timedelta(hours=rng.choice(OFFSETS))))
+        records.append({
+            "noticeId": f"{i:08x}{rng.getrandbits(32):08x}",
+            "title": ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 7))).title(),
+            "solicitationNumber": f"W912-{i:06d}",
+            "department": rng.choice(["DEPT OF DEFENSE", "GENERAL SERVICES ADMINISTRATION", "VETERANS AFFAIRS"]),
+            "subTier": rng.choice(["DEPT OF THE ARMY", "PUBLIC BUILDINGS SERVICE", "VETERANS HEALTH"]),
+            "office": f"OFFICE {rng.randint(1, 40)}",
+            "postedDate": posted.isoformat(),
+            "type": "Solicitation",
+            "baseType": "Solicitation",
+            "active": "Yes",
+            "naicsCode": rng.choice(NAICS),
+            "classificationCode": rng.choice(PSC),
+            "typeOfSetAside": rng.choice(SET_ASIDES),
+            "responseDeadLine": due.isoformat(),
+            "description": ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))),
+            "resourceLinks": [f"https://sam.gov/files/{i}_{k}.pdf" for k in range(rng.randint(0, 3))],
+        })
+    return records
+
+
+def utc(value):
+    return datetime.fromisoformat(value).astimezone(timezone.utc)
+
+
+QUERIES = [
+    ("naics", {"naics": "236220"},
+     lambda o: o["naicsCode"] == "236220"),
+    ("naics_prefix_and_posted", {"naics": "2382", "posted_from": "2024-03-01", "posted_to": "2024-03-31"},
+     lambda o: o["naicsCode"].startswith("2382") and "2024-03-01" <= o["postedDate"] <= "2024-03-31"),
+    ("deadline_window_utc", {"deadline_from": "2024-06-10T00:00:00+00:00", "deadline_to": "2024-06-12T23:59:59+00:00"},
+     lambda o: datetime(2024, 6, 10, tzinfo=timezone.utc) <= utc(o["responseDeadLine"])
+     <= datetime(2024, 6, 12, 23, 59, 59, tzinfo=timezone.utc)),
+    ("classification_set_aside", {"classification": ["Y1AA", "Z2AA"], "set_aside": "SBA"},
+     lambda o: o["classificationCode"] in ("Y1AA", "Z2AA") and o["typeOfSetAside"] == "SBA"),
+    ("text_phrase", {"text": '"roof replacement"'},
+     lambda o: "roof replacement" in o["title"].lower() or "roof replacement" in o["description"]),
+    ("text_and_naics", {"text": "asbestos AND abatement", "naics": "562910"},
+     lambda o: o["naicsCode"] == "562910" and all(w in (o["title"].lower() + ' ' + o["description"]).split()
+                                                  for w in ("asbestos", "abatement"))),
+]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="opportunity_store.py checks and timing")
+    parser.add_argument('--count', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+    failures = []
+    report = {"count": args.count}
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+
+    records = make_records(args.count)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = opportunity_store.OpportunityStore(os.path.join(tmp, 'opportunities.sqlite3'))
+        start = time.perf_counter()
+        stored = store.upsert_many(records)
+        report["bulk_insert"] = {"seconds": round(time.perf_counter() - start, 2), **stored}
+        check(stored["inserted"] == args.count, f"bulk insert: {stored}")
+        start = time.perf_counter()
+        stored = store.upsert_many(records)
+        report["reupsert_unchanged"] = {"seconds": round(time.perf_counter() - start, 2), **stored}
+        check(stored["unchanged"] == args.count, f"re-upsert: {stored}")
+        for o in records[::100]:
+            o["title"] += " (amended)"
+        start = time.perf_counter()
+        stored = store.upsert_many(records)
+        report["reupsert_1pct_changed"] = {"seconds": round(time.perf_counter() - start, 2), **stored}
+        check(stored["updated"] == len(records[::100]), f"re-upsert with changes: {stored}")
+        check(store.count(text="amended") == len(records[::100]), "amended titles not found by text search")
+
+        report["queries"] = {}
+        for name, filters, predicate in QUERIES:
+            filters = dict(filters)
+            text = filters.pop("text", None)
+            expected = sorted(o["noticeId"] for o in records if predicate(o))
+            got = sorted(r["notice_id"] for r in store.query(text, limit=args.count, **filters))
+            check(got == expected, f"{name}: {len(got)} results, expected {len(expected)}")
+            latencies = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                store.query(text, limit=100, **filters)
+                store.count(text, **filters)
+                latencies.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            for raw in (json.dumps(o) for o in records):
+                predicate(json.loads(raw))
+            scan_ms = (time.perf_counter() - start) * 1000
+            report["queries"][name] = {"matches": len(expected), "p50_ms": round(percentile(latencies, 50), 2),
+                                       "p95_ms": round(percentile(latencies, 95), 2), "json_scan_ms": round(scan_ms, 1)}
+        report["size_mb"] = round(os.path.getsize(os.path.join(tmp, 'opportunities.sqlite3')) / 1e6, 1)
+
+    if failures:
+        print(json.dumps({"failures": failures, **report}, indent=2))
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for key in ("bulk_insert", "reupsert_unchanged", "reupsert_1pct_changed"):
+        r = report[key]
+        print(f"{key:>22}: {r['seconds']}s  inserted {r['inserted']}  updated {r['updated']}  unchanged {r['unchanged']}")
+    print(f"store: {report['count']} opportunities, {report['size_mb']} MB")
+    for name, r in report["queries"].items():
+        print(f"{name:>26}: {r['matches']:>6} matches  top 100 + count p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  "
+              f"(JSON scan {r['json_scan_ms']} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import subprocess
+
+'''Checks and timing for the dataCollection/rfpdb.py crawler against bench/stub_rfpdb.py.
+
+1. Cold crawl: the old serial loop (bare requests.get, one connection per
+   request) vs the crawler. Every PDF must arrive intact. Requests in flight
+   must stay within the host cap, over a handful of reused connections.
+2. Recrawl with nothing changed: every request is answered 304, so nothing
+   is downloaded again.
+3. Recrawl after three documents get a new revision and one is added: only
+   the pages and PDFs that changed are fetched.
+4. Resume: the crawler CLI is killed mid-crawl, then run again on the same
+   frontier. Apart from requests that were in flight at the kill, no URL
+   is fetched twice, and every PDF ends up intact.
+Exit 1 when a check fails.
+
+Usage: python bench/rfpdb_bench.py [--pages 10] [--per-page 10] [--latency-ms 30] [--json]'''
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(SERVER_DIR, 'dataCollection'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import downloader
+import rfpdb
+import stub_rfpdb
+
+WORKERS = 8
+HOST_CONCURRENCY = 4
+
+
+def stats(base_url):
+    import requests
+    return requests.get(base_url + '/stats').json()
+
+
+def legacy(base_url, pages, folder):
+    import requests
+    for page in range(1, pages + 1):
+        resp = requests.get(base_url + stub_rfpdb.SEARCH_PREFIX + str(page))
+        for rfp_url in rfpdb.parse_rfp_links(resp.text, base_url):
+            for pdf_url in rfpdb.parse_pdf_links(requests.get(rfp_url).text, base_url):
+                filename = os.path.join(folder, pdf_url.split("/")[-1])
+                if os.path.exists(filename):
+                    continue
+                resp = requests.get(pdf_url, stream=True)
+                if resp.status_code == 200:
+                    with open(filename, "wb") as f:
+                        for chunk in resp.iter_content(1024):
+                            f.write(chunk)
+
+
+def crawl(base_url, pages, folder, frontier_path):
+    crawler = rfpdb.Crawler(frontier=rfpdb.Frontier(frontier_path), output_dir=folder, workers=WORKERS, pages=pages,
+                            search_url=base_url + stub_rfpdb.SEARCH_PREFIX + '{}',
+                            limiter=downloader.HostLimiter(HOST_CONCURRENCY, 0))
+    return crawler.run()
+
+
+def verify(site, folder):
+    """
+    PDFs that are missing or differ from what the site serves now.
+    """
+    bad = []
+    for path, data in site.pdf_urls():
+        name = os.path.basename(path)
+        try:
+            with open(os.path.join(folder, name), 'rb') as f:
+                if f.read() != data:
+                    bad.append(name)
+        except OSError:
+            bad.append(name)
+    return bad
+
+
+def delta(after, before):
+    return {key: after[key] - before.get(key, 0) for key in ("requests", "200", "304", "connections")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="rfpdb.py crawler checks and timing against a local stub site")
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=30)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+    report = {}
+    failures = []
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+
+    server, base_url = stub_rfpdb.start_stub(latency_ms=args.latency_ms, pages=args.pages, per_page=args.per_page)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            legacy(base_url, args.pages, tmp)
+            report["legacy_serial"] = {"seconds": round(time.perf_counter() - start, 2), **delta(stats(base_url), {})}
+    finally:
+        server.shutdown()
+
+    server, base_url = stub_rfpdb.start_stub(latency_ms=args.latency_ms, pages=args.pages, per_page=args.per_page)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            folder, frontier_path = os.path.join(tmp, 'pdfs'), os.path.join(tmp, 'frontier.sqlite3')
+            before = stats(base_url)
+            report["cold"] = crawl(base_url, args.pages, folder, frontier_path)
+            after = stats(base_url)
+            report["cold"].update(delta(after, before), peak_in_flight=after["peak_in_flight"])
+            check(not verify(server.site, folder), f"cold: bad PDFs {verify(server.site, folder)[:5]}")
+            check(after["peak_in_flight"] <= HOST_CONCURRENCY, f"cold: {after['peak_in_flight']} in flight")
+            check(report["cold"]["connections"] <= WORKERS, f"cold: {report['cold']['connections']} connections")
+
+            before = stats(base_url)
+            report["unchanged"] = crawl(base_url, args.pages, folder, frontier_path)
+            report["unchanged"].update(delta(stats(base_url), before))
+            check(report["unchanged"]["200"] == 0, f"unchanged: {report['unchanged']['200']} full responses")
+
+            for i in range(3):
+                server.update(f"rfp-001-{i:03d}")
+            server.add_document(2, "rfp-new-001")
+            before = stats(base_url)
+            report["changed"] = crawl(base_url, args.pages, folder, frontier_path)
+            report["changed"].update(delta(stats(base_url), before))
+            # page 2, three revised view pages with 3 PDFs each, the new view page and its 2 PDFs
+            check(report["changed"]["200"] == 1 + 3 * 4 + 3, f"changed: {report['changed']['200']} full responses")
+            check(not verify(server.site, folder), f"changed: bad PDFs {verify(server.site, folder)[:5]}")
+    finally:
+        server.shutdown()
+
+    server, base_url = stub_rfpdb.start_stub(latency_ms=args.latency_ms, pages=args.pages, per_page=args.per_page)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            folder, frontier_path = os.path.join(tmp, 'pdfs'), os.path.join(tmp, 'frontier.sqlite3')
+            env = dict(os.environ, RFPDB_BASE_URL=base_url, RFPDB_OUTPUT_DIR=folder, RFPDB_FRONTIER_PATH=frontier_path,
+                       RFPDB_SEARCH_PAGES=str(args.pages), RFPDB_WORKERS=str(WORKERS), RFPDB_HOST_RPS='0',
+                       RFPDB_HOST_CONCURRENCY=str(HOST_CONCURRENCY))
+            total = args.pages * (1 + args.per_page * 4)
+            proc = subprocess.Popen([sys.executable, os.path.join(SERVER_DIR, 'dataCollection', 'rfpdb.py')],
+                                    env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            while proc.poll() is None and stats(base_url)["requests"] < total * 0.4:
+                time.sleep(0.05)
+            proc.kill()
+            proc.wait()
+            killed_at = stats(base_url)["requests"]
+            report["resume"] = crawl(base_url, args.pages, folder, frontier_path)
+            served = stats(base_url)
+            twice = [path for path, n in served["fetched"].items() if n > 1]
+            report["resume"].update(killed_at=killed_at, requests=served["requests"], fetched_twice=len(twice))
+            check(report["resume"]["resumed"], "resume: run did not resume the interrupted pass")
+            check(len(twice) <= WORKERS, f"resume: {len(twice)} URLs fetched twice: {twice[:5]}")
+            check(not verify(server.site, folder), f"resume: bad PDFs {verify(server.site, folder)[:5]}")
+    finally:
+        server.shutdown()
+
+    report["speedup"] = round(report["legacy_serial"]["seconds"] / report["cold"]["seconds"], 1)
+    if failures:
+        print(json.dumps({"failures": failures, **report}, indent=2))
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        legacy_run = report["legacy_serial"]
+        print(f"legacy serial: {legacy_run['seconds']:.2f}s  {legacy_run['requests']} requests over "
+              f"{legacy_run['connections']} connections")
+        for key in ("cold", "unchanged", "changed", "resume"):
+            r = report[key]
+            extra = {k: r[k] for k in ("connections", "peak_in_flight", "killed_at", "fetched_twice") if k in r}
+            print(f"{key:>13}: {r['seconds']:.2f}s  {r['requests']} requests  200s {r.get('200', '-')}  "
+                  f"304s {r.get('304', '-')}  {r['megabytes']} MB  {r['counts']}  {extra}")
+        print(f"speedup {report['speedup']}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,648 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import importlib
+import importlib.util
+import subprocess
+import contextlib
+
+'''Offline benchmark suite for the Python hot paths.
+
+Every stage runs in its own interpreter with its own temporary page store,
+caches and indexes, so results do not depend on what ran before. The
+corpus is the checked-in rfpdb_pdfs folder (--pdfs limits it to the first
+N files) and the images in takeoff/data. Stages:
+
+  extract_fitz, extract_pypdf2, extract_pdfplumber
+                     text layer of every page with each parser
+  page_store_cold    page_store.ensure_many (the path every consumer uses)
+  page_store_warm    page_store.document_text once the store holds the corpus
+  ocr                ocr.ocr_page on the first page of --ocr-pages PDFs
+  clean_pdf_text     trajectory.clean_pdf_text per page
+  chunk_text         trajectory.chunk_text per document
+  embeddings         indexer.encode, one EMBED_BATCH_SIZE batch at a time
+  filter_files       filter_files.classify_many, cold and from the text index
+  run_mask_prepare   mask.load_gray + prepare_upload (decode, pool, threshold, PNG)
+  run_mask           mask.run_mask end to end against bench/stub_detector.py
+  summarize          conversation.summarize_file against bench/stub_llm.py
+  estimate           trajectory.iter_materials_from_pdf against bench/stub_llm.py
+
+Each stage reports items/s in its unit, MB/s where input bytes apply,
+p50/p95 latency of its unit of work, wall time and the peak RSS of its
+process. A stage whose library is not installed (PyMuPDF, PyPDF2,
+pdfplumber, pytesseract, sentence-transformers, openai) is reported as
+skipped. Without PyMuPDF the text stages run on stand-in files holding
+bench/textnorm_bench.py's synthetic pages; "corpus" says which was used,
+and a baseline is only compared where it matches.
+
+--save-baseline writes the results (default bench/baseline.json);
+--baseline compares against one and exits 1 when a stage lost more than
+--tolerance of its throughput, or gained that much p95 latency (when
+the baseline p95 is at least LATENCY_FLOOR_MS; sub-millisecond calls are
+timer noise) or peak RSS.
+
+Usage: python bench/run.py [--stages a,b,...] [--pdfs N] [--repeat N] [--workers N] [--llm-latency-ms 50]
+                           [--json] [--output FILE] [--save-baseline [PATH]] [--baseline [PATH]] [--tolerance 0.15]
+       python bench/run.py --list'''
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.abspath(os.path.join(BENCH_DIR, '..'))
+PDF_DIR = os.path.abspath(os.path.join(SERVER_DIR, '..', 'rfpdb_pdfs'))
+IMAGE_DIR = os.path.join(SERVER_DIR, 'takeoff', 'data')
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+for _dir in ('prep', 'takeoff', 'dataCollection'):
+    sys.path.insert(0, os.path.join(SERVER_DIR, _dir))
+sys.path.insert(0, BENCH_DIR)
+
+STUB_ESTIMATE = json.dumps({"metadata": {}, "materials": [], "labor": [], "section_costs": {}, "total_bid": 0})
+LATENCY_FLOOR_MS = 1.0
+OPTIONAL_MODULES = ("fitz", "PyPDF2", "pdfplumber", "pytesseract", "sentence_transformers", "openai", "tiktoken")
+
+
+class Skip(Exception):
+    pass
+
+
+def need(module):
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise Skip(f"{module} not installed")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class Context:
+    """
+    What a stage gets: the arguments, a private temporary folder and the
+    corpus, loaded once on first use.
+    """
+
+    def __init__(self, args, tmp):
+        self.args = args
+        self.tmp = tmp
+        self.latencies = []
+        self._docs = None
+
+    def timed(self, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.latencies.append((time.perf_counter() - start) * 1000)
+        return result
+
+    def pdf_paths(self):
+        paths = [os.path.join(self.args.pdf_dir, name) for name in sorted(os.listdir(self.args.pdf_dir))
+                 if name.lower().endswith('.pdf')]
+        return paths[:self.args.pdfs] if self.args.pdfs else paths
+
+    def docs(self):
+        """
+        (corpus, [[page text, ...] per document]): the PDFs' text layers
+        through page_store, or synthetic pages without PyMuPDF.
+        """
+        if self._docs is None:
+            try:
+                need('fitz')
+                import page_store
+                paths = self.pdf_paths()
+                page_store.ensure_many(paths, run_ocr=False)
+                self._docs = ("rfpdb_pdfs", [[text for _, text in page_store.iter_pages(p, run_ocr=False)]
+                                             for p in paths])
+            except Skip:
+                import textnorm_bench
+                pages = textnorm_bench.synthetic_corpus(self.args.synthetic_pages)
+                self._docs = ("synthetic", [pages[i:i + 20] for i in range(0, len(pages), 20)])
+        return self._docs
+
+    def standins(self, docs, folder='standins'):
+        """
+        Stand-in PDF files whose page text is put straight into page_store,
+        so page_store consumers run without PyMuPDF.
+        """
+        import page_store
+        store = page_store.get_store()
+        folder = os.path.join(self.tmp, folder)
+        os.makedirs(folder, exist_ok=True)
+        paths = []
+        for i, pages in enumerate(docs):
+            path = os.path.join(folder, f"doc_{i:04d}.pdf")
+            with open(path, 'wb') as f:
+                f.write(hashlib.sha256(f"{i}".encode()).digest() * 64)
+            store.put(store.hash_path(path), [{"page": n, "text": t, "ocr": False, "text_ms": 0.0}
+                                              for n, t in enumerate(pages, 1)], 0.0)
+            paths.append(path)
+        return paths
+
+
+def result(ctx, unit, items, seconds, corpus, size=None, **extra):
+    return {"unit": unit, "items": items, "seconds": seconds, "corpus": corpus, "bytes": size,
+            "latencies_ms": ctx.latencies, "extra": extra}
+
+
+def _extract(ctx, open_pages):
+    paths = ctx.pdf_paths()
+    pages = chars = errors = 0
+    start = time.perf_counter()
+    for path in paths:
+        try:
+            for page in open_pages(path):
+                chars += len(ctx.timed(page))
+                pages += 1
+        except Exception as e:
+            errors += 1
+            print(f"[run.py] {os.path.basename(path)}: {e}", file=sys.stderr)
+    return result(ctx, "pages", pages, time.perf_counter() - start, "rfpdb_pdfs",
+                  sum(os.path.getsize(p) for p in paths), chars=chars, errors=errors)
+
+
+def stage_extract_fitz(ctx):
+    fitz = need('fitz')
+
+    def pages(path):
+        with fitz.open(path) as doc:
+            for page in doc:
+                yield page.get_text
+    return _extract(ctx, pages)
+
+
+def stage_extract_pypdf2(ctx):
+    PyPDF2 = need('PyPDF2')
+
+    def pages(path):
+        for page in PyPDF2.PdfReader(path).pages:
+            yield page.extract_text
+    return _extract(ctx, pages)
+
+
+def stage_extract_pdfplumber(ctx):
+    pdfplumber = need('pdfplumber')
+
+    def pages(path):
+        with pdfplumber.open(path) as pdf:
+            for page in pdf.pages:
+                yield lambda: page.extract_text() or ''
+    return _extract(ctx, pages)
+
+
+def stage_page_store_cold(ctx):
+    need('fitz')
+    import page_store
+    paths = ctx.pdf_paths()
+    start = time.perf_counter()
+    for path in paths:
+        ctx.timed(page_store.ensure_many, [path], run_ocr=False)
+    seconds = time.perf_counter() - start
+    stats = page_store.get_store().stats()
+    return result(ctx, "pages", stats["pages"], seconds, "rfpdb_pdfs", sum(os.path.getsize(p) for p in paths),
+                  documents=stats["documents"], pending_ocr_pages=stats["pending_ocr_pages"],
+                  latency_of="document")
+
+
+def stage_page_store_warm(ctx):
+    need('fitz')
+    import page_store
+    paths = ctx.pdf_paths()
+    page_store.ensure_many(paths, run_ocr=False)
+    start = time.perf_counter()
+    for path in paths:
+        ctx.timed(page_store.document_text, path, run_ocr=False)
+    seconds = time.perf_counter() - start
+    return result(ctx, "pages", page_store.get_store().stats()["pages"], seconds, "rfpdb_pdfs",
+                  sum(os.path.getsize(p) for p in paths), latency_of="document")
+
+
+def stage_ocr(ctx):
+    need('fitz')
+    need('pytesseract')
+    if not shutil.which('tesseract'):
+        raise Skip("tesseract binary not found")
+    import ocr
+    paths = ctx.pdf_paths()[:ctx.args.ocr_pages]
+    render_ms = ocr_ms = 0.0
+    start = time.perf_counter()
+    for path in paths:
+        page = ctx.timed(ocr.ocr_page, path, 0)
+        render_ms += page["render_ms"]
+        ocr_ms += page["ocr_ms"]
+    return result(ctx, "pages", len(paths), time.perf_counter() - start, "rfpdb_pdfs",
+                  render_ms=round(render_ms, 1), ocr_ms=round(ocr_ms, 1))
+
+
+def stage_clean_pdf_text(ctx):
+    import trajectory
+    corpus, docs = ctx.docs()
+    pages = [text for doc in docs for text in doc]
+    start = time.perf_counter()
+    for text in pages:
+        ctx.timed(trajectory.clean_pdf_text, text)
+    return result(ctx, "pages", len(pages), time.perf_counter() - start, corpus,
+                  sum(len(t.encode('utf-8')) for t in pages))
+
+
+def stage_chunk_text(ctx):
+    import trajectory
+    corpus, docs = ctx.docs()
+    texts = ['\n'.join(doc) for doc in docs]
+    start = time.perf_counter()
+    chunks = sum(len(ctx.timed(trajectory.chunk_text, text)) for text in texts)
+    return result(ctx, "pages", sum(len(doc) for doc in docs), time.perf_counter() - start, corpus,
+                  sum(len(t.encode('utf-8')) for t in texts), chunks=chunks, latency_of="document")
+
+
+def stage_embeddings(ctx):
+    need('sentence_transformers')
+    import indexer
+    import trajectory
+    try:
+        model = indexer.get_model()
+    except OSError as e:
+        raise Skip(f"embedding model not available offline: {e}")
+    corpus, docs = ctx.docs()
+    chunks = [c for doc in docs for c in trajectory.chunk_text('\n'.join(doc), 200)][:ctx.args.embed_chunks]
+    batch = indexer.EMBED_BATCH_SIZE
+    indexer.encode(model, chunks[:batch])  # warm-up: first call allocates
+    start = time.perf_counter()
+    for i in range(0, len(chunks), batch):
+        ctx.timed(indexer.encode, model, chunks[i:i + batch])
+    return result(ctx, "chunks", len(chunks), time.perf_counter() - start, corpus,
+                  sum(len(c.encode('utf-8')) for c in chunks), batch=batch, latency_of="batch")
+
+
+def stage_filter_files(ctx):
+    import filter_files
+    import text_index
+    try:
+        need('fitz')
+        corpus, paths = "rfpdb_pdfs", ctx.pdf_paths()
+    except Skip:
+        corpus, docs = ctx.docs()
+        paths = ctx.standins(docs)
+    size = sum(os.path.getsize(p) for p in paths)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        _, cold = filter_files.classify_many(paths, workers=ctx.args.workers,
+                                             cache=filter_files.VerdictCache(os.path.join(ctx.tmp, 'v1.sqlite3')),
+                                             index=False)
+        seconds = time.perf_counter() - start
+        index = text_index.get_index()
+        sync = index.sync()
+        _, indexed = filter_files.classify_many(paths, workers=ctx.args.workers,
+                                                cache=filter_files.VerdictCache(os.path.join(ctx.tmp, 'v2.sqlite3')),
+                                                index=index)
+    # per-file latency from classifying one file at a time, after the pool run
+    for path in paths[:ctx.args.latency_samples]:
+        ctx.timed(filter_files.classify_content, path)
+    return result(ctx, "files", len(paths), seconds, corpus, size, kept=cold["kept"], workers=cold["workers"],
+                  index_sync_seconds=sync["seconds"], from_index_seconds=indexed["seconds"],
+                  latency_of="file (inline, page store warm)")
+
+
+def _images():
+    return [os.path.join(IMAGE_DIR, name) for name in sorted(os.listdir(IMAGE_DIR)) if name.lower().endswith('.png')]
+
+
+def stage_run_mask_prepare(ctx):
+    import mask
+    images = _images() * ctx.args.image_repeat
+    pixels = 0
+    start = time.perf_counter()
+    for path in images:
+        def prepare():
+            gray = mask.load_gray(path)
+            mask.prepare_upload(gray)
+            return gray.size
+        pixels += ctx.timed(prepare)
+    return result(ctx, "images", len(images), time.perf_counter() - start, "takeoff/data",
+                  sum(os.path.getsize(p) for p in images), megapixels=round(pixels / 1e6, 1))
+
+
+def stage_run_mask(ctx):
+    import mask
+    import stub_detector
+    server, url = stub_detector.start_stub(latency_ms=ctx.args.detector_latency_ms)
+    images = _images() * ctx.args.image_repeat
+    try:
+        start = time.perf_counter()
+        for i, path in enumerate(images):
+            ctx.timed(mask.run_mask, path, output_dir=os.path.join(ctx.tmp, f"mask_{i}"), url=url, api_key='stub',
+                      verbose=False)
+        seconds = time.perf_counter() - start
+    finally:
+        server.shutdown()
+    return result(ctx, "images", len(images), seconds, "takeoff/data", sum(os.path.getsize(p) for p in images),
+                  detector_latency_ms=ctx.args.detector_latency_ms)
+
+
+def _stub_llm(ctx, reply=None):
+    need('openai')
+    import stub_llm
+    server, base_url = stub_llm.start_stub(latency_ms=ctx.args.llm_latency_ms, reply=reply)
+    os.environ.update(OPENAI_BASE_URL=base_url, OPENAI_API_KEY='stub')
+    import llm
+    complete = llm.complete
+
+    def timed_complete(*args, **kwargs):
+        return ctx.timed(complete, *args, **kwargs)
+    llm.complete = timed_complete
+    return server
+
+
+def stage_summarize(ctx):
+    server = _stub_llm(ctx)
+    try:
+        import conversation
+        corpus, docs = ctx.docs()
+        pages = [text for doc in docs for text in doc][:ctx.args.llm_pages]
+        folder = os.path.join(ctx.tmp, 'pages')
+        os.makedirs(folder)
+        paths = []
+        for n, text in enumerate(pages, 1):
+            paths.append(os.path.join(folder, f"page_{n}.json"))
+            with open(paths[-1], 'w', encoding='utf-8') as f:
+                json.dump({"text": text}, f)
+        start = time.perf_counter()
+        conversation.summarize_file(paths, os.path.join(ctx.tmp, 'summary.json'))
+        seconds = time.perf_counter() - start
+        requests = server.RequestHandlerClass.stats["requests"]
+    finally:
+        server.shutdown()
+    return result(ctx, "pages", len(pages), seconds, corpus, sum(len(t.encode('utf-8')) for t in pages),
+                  requests=requests, llm_latency_ms=ctx.args.llm_latency_ms, latency_of="LLM call")
+
+
+def stage_estimate(ctx):
+    server = _stub_llm(ctx, reply=STUB_ESTIMATE)
+    try:
+        import trajectory
+        corpus, docs = ctx.docs()
+        docs = docs[:ctx.args.llm_docs]
+        paths = ctx.standins(docs)
+        start = time.perf_counter()
+        chunks = sum(1 for path in paths for _ in trajectory.iter_materials_from_pdf(path))
+        seconds = time.perf_counter() - start
+        requests = server.RequestHandlerClass.stats["requests"]
+    finally:
+        server.shutdown()
+    return result(ctx, "pages", sum(len(doc) for doc in docs), seconds, corpus,
+                  sum(len(t.encode('utf-8')) for doc in docs for t in doc), chunks=chunks, requests=requests,
+                  llm_latency_ms=ctx.args.llm_latency_ms, latency_of="LLM call")
+
+
+STAGES = {name[len('stage_'):]: fn for name, fn in globals().items() if name.startswith('stage_')}
+# environment for every stage process: caches and stores go to its temporary folder
+STAGE_ENV = {
+    'PAGE_STORE_PATH': 'page_store.sqlite3',
+    'TEXT_INDEX_PATH': 'text_index.sqlite3',
+    'RFP_VERDICTS_PATH': 'rfp_verdicts.sqlite3',
+    'DEDUP_INDEX_PATH': 'dedup_index.sqlite3',
+    'INDEX_LEDGER_PATH': 'index_ledger.sqlite3',
+    'SUMMARY_TREE_PATH': 'summary_tree.sqlite3',
+    'LLM_CACHE_PATH': 'llm_cache.sqlite3',
+}
+
+
+def run_child(args):
+    """
+    One stage in this process; prints its raw result as JSON on stdout.
+    """
+    os.environ.setdefault('LLM_CACHE', '0')
+    os.environ.setdefault('OPENAI_RPM', '1000000')
+    os.environ.setdefault('OPENAI_TPM', '1000000000')
+    ctx = Context(args, args.tmp)
+    start_rss = peak_rss_mb()
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            raw = STAGES[args.child](ctx)
+    except Skip as e:
+        raw = {"skipped": str(e)}
+    raw["start_rss_mb"] = start_rss
+    raw["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(raw))
+
+
+def summarize(raw):
+    if "skipped" in raw:
+        return {"skipped": raw["skipped"]}
+    latencies = raw["latencies_ms"]
+    seconds = raw["seconds"]
+    summary = {
+        "unit": raw["unit"],
+        "items": raw["items"],
+        "corpus": raw["corpus"],
+        "seconds": round(seconds, 3),
+        "per_s": round(raw["items"] / seconds, 2) if seconds else None,
+        "mb_per_s": round(raw["bytes"] / 1e6 / seconds, 2) if raw["bytes"] and seconds else None,
+        "p50_ms": round(percentile(latencies, 50), 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95), 3) if latencies else None,
+        "latency_of": raw["extra"].pop("latency_of", raw["unit"][:-1]) if latencies else None,
+        "peak_rss_mb": raw["peak_rss_mb"],
+        "start_rss_mb": raw["start_rss_mb"],
+    }
+    summary.update(raw["extra"])
+    return summary
+
+
+def run_stage(name, args):
+    """
+    Run a stage --repeat times, each in a fresh process and folder; keeps
+    the run with the median throughput.
+    """
+    runs = []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, **{key: os.path.join(tmp, name) for key, name in STAGE_ENV.items()})
+            command = [sys.executable, os.path.abspath(__file__), '--child', name, '--tmp', tmp] + args.passthrough
+            try:
+                done = subprocess.run(command, env=env, capture_output=True, text=True, timeout=args.stage_timeout)
+            except subprocess.TimeoutExpired:
+                return {"error": f"timed out after {args.stage_timeout}s"}
+            if done.returncode != 0:
+                return {"error": (done.stderr.strip().splitlines() or ["failed"])[-1]}
+            summary = summarize(json.loads(done.stdout.strip().splitlines()[-1]))
+        if "skipped" in summary:
+            return summary
+        runs.append(summary)
+    runs.sort(key=lambda r: r["per_s"] or 0)
+    chosen = runs[len(runs) // 2]
+    if len(runs) > 1:
+        chosen["runs_per_s"] = [r["per_s"] for r in runs]
+    return chosen
+
+
+def environment(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    installed = {m: importlib.util.find_spec(m) is not None for m in OPTIONAL_MODULES}
+    pdfs = sorted(n for n in os.listdir(args.pdf_dir) if n.lower().endswith('.pdf'))[:args.pdfs or None]
+    listing = hashlib.sha256(json.dumps([(n, os.path.getsize(os.path.join(args.pdf_dir, n))) for n in pdfs])
+                             .encode('utf-8')).hexdigest()[:16]
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "installed": installed,
+        "corpus": {"pdfs": len(pdfs), "megabytes": round(sum(os.path.getsize(os.path.join(args.pdf_dir, n))
+                                                                 for n in pdfs) / 1e6, 1),
+                   "listing": listing},
+    }
+
+
+def compare(current, baseline, tolerance):
+    """
+    Per-stage ratios against a baseline. Returns (rows, regressions).
+    """
+    rows, regressions = [], []
+    for name, now in current["stages"].items():
+        base = baseline["stages"].get(name)
+        row = {"stage": name}
+        if not base or "per_s" not in now or "per_s" not in base:
+            row["status"] = "no baseline" if not base else "not run"
+        elif (now["corpus"], now["unit"], now["items"]) != (base["corpus"], base["unit"], base["items"]):
+            row["status"] = "different input"
+        else:
+            row["throughput"] = round(now["per_s"] / base["per_s"], 3) if base["per_s"] else None
+            if now["p95_ms"] and base["p95_ms"]:
+                row["p95"] = round(now["p95_ms"] / base["p95_ms"], 3)
+            if now["peak_rss_mb"] and base["peak_rss_mb"]:
+                row["peak_rss"] = round(now["peak_rss_mb"] / base["peak_rss_mb"], 3)
+            worse = []
+            if row["throughput"] is not None and row["throughput"] < 1 - tolerance:
+                worse.append("throughput")
+            if base["p95_ms"] and base["p95_ms"] >= LATENCY_FLOOR_MS and row.get("p95", 0) > 1 + tolerance:
+                worse.append("p95")
+            if row.get("peak_rss", 0) > 1 + tolerance:
+                worse.append("peak_rss")
+            row["status"] = "regressed: " + ', '.join(worse) if worse else "ok"
+            if worse:
+                regressions.append(name)
+        rows.append(row)
+    return rows, regressions
+
+
+def print_table(report):
+    print(f"{'stage':>18} {'items':>8} {'unit':>7} {'per s':>10} {'MB/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'peak MB':>8}  corpus")
+    for name, r in report["stages"].items():
+        if "per_s" not in r:
+            print(f"{name:>18}  {r.get('skipped') and 'skipped: ' + r['skipped'] or 'error: ' + r.get('error', '')}")
+            continue
+        cells = [r["items"], r["unit"], r["per_s"], r["mb_per_s"], r["p50_ms"], r["p95_ms"], r["peak_rss_mb"]]
+        cells = ['-' if c is None else c for c in cells]
+        print(f"{name:>18} {cells[0]:>8} {cells[1]:>7} {cells[2]:>10} {cells[3]:>8} {cells[4]:>9} {cells[5]:>9} "
+              f"{cells[6]:>8}  {r['corpus']}")
+    comparison = report.get("comparison")
+    if comparison:
+        differ = [k for k, same in comparison["same_environment"].items() if not same]
+        if not comparison["same_settings"]:
+            differ.append("settings")
+        print(f"against {comparison['baseline']} ({comparison['baseline_created']})"
+              + (f"; differs in: {', '.join(differ)}" if differ else ''))
+    for row in (comparison or {}).get("stages", []):
+        ratios = '  '.join(f"{k} x{row[k]}" for k in ("throughput", "p95", "peak_rss") if k in row)
+        print(f"{row['stage']:>18}  {row['status']}  {ratios}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for the Python hot paths")
+    parser.add_argument('--stages', help="comma-separated stages (default: all)")
+    parser.add_argument('--list', action='store_true')
+    parser.add_argument('--pdf-dir', default=PDF_DIR)
+    parser.add_argument('--pdfs', type=int, default=0, help="only the first N PDFs (0: all)")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--ocr-pages', type=int, default=10)
+    parser.add_argument('--embed-chunks', type=int, default=2048)
+    parser.add_argument('--image-repeat', type=int, default=3)
+    parser.add_argument('--latency-samples', type=int, default=50)
+    parser.add_argument('--synthetic-pages', type=int, default=2000)
+    parser.add_argument('--llm-latency-ms', type=float, default=50)
+    parser.add_argument('--llm-pages', type=int, default=60)
+    parser.add_argument('--llm-docs', type=int, default=3)
+    parser.add_argument('--detector-latency-ms', type=float, default=0)
+    parser.add_argument('--stage-timeout', type=float, default=1800)
+    parser.add_argument('--json', action='store_true')
+    parser.add_argument('--output')
+    parser.add_argument('--save-baseline', nargs='?', const=BASELINE_PATH)
+    parser.add_argument('--baseline', nargs='?', const=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--tmp', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args)
+        return
+    if args.list:
+        for name, fn in STAGES.items():
+            print(name)
+        return
+    stages = args.stages.split(',') if args.stages else list(STAGES)
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)} (see --list)")
+    # what a stage process needs to see of the arguments
+    settings = {"pdfs": args.pdfs, "workers": args.workers, "ocr_pages": args.ocr_pages,
+                "embed_chunks": args.embed_chunks, "image_repeat": args.image_repeat,
+                "latency_samples": args.latency_samples, "synthetic_pages": args.synthetic_pages,
+                "llm_latency_ms": args.llm_latency_ms, "llm_pages": args.llm_pages, "llm_docs": args.llm_docs,
+                "detector_latency_ms": args.detector_latency_ms}
+    args.passthrough = ['--pdf-dir', args.pdf_dir] + [
+        item for key, value in settings.items() if value is not None
+        for item in ('--' + key.replace('_', '-'), str(value))]
+
+    report = {"created": time.strftime('%Y-%m-%dT%H:%M:%S'), "environment": environment(args),
+              "settings": settings, "stages": {}}
+    for name in stages:
+        start = time.perf_counter()
+        report["stages"][name] = run_stage(name, args)
+        print(f"[run.py] {name}: {time.perf_counter() - start:.1f}s", file=sys.stderr, flush=True)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows, regressions = compare(report, baseline, args.tolerance)
+        report["comparison"] = {"baseline": args.baseline, "baseline_created": baseline.get("created"),
+                                "tolerance": args.tolerance, "stages": rows, "regressions": regressions,
+                                "same_settings": baseline.get("settings") == settings,
+                                "same_environment": {k: baseline.get("environment", {}).get(k) == v
+                                                     for k, v in report["environment"].items()
+                                                     if k not in ("commit",)}}
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            os.replace(path + '.tmp', path)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(report)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import argparse
+import contextlib
+from datetime import date, timedelta
+
+'''Checks and timing for the incremental sync in dataCollection/SAM.py
+against bench/stub_sam.py and bench/stub_files.py.
+
+1. Cold run: every notice posted in the first window is fetched. This takes
+   more than one page. Every attachment is downloaded.
+2. Nightly run, nothing changed: only the overlap window is read, and
+   nothing is downloaded.
+3. After new notices, amended records and changed attachment lists: the
+   report names exactly those notices. Only their attachments are fetched.
+   A notice whose file host answers 503 is left for the next run. The
+   opportunity store holds every notice and finds the amended titles.
+4. A second query returning the same notices keeps rows of its own:
+   the first query's failed notice stays pending for it, including after
+   the second query is forgotten.
+5. Five days later the host still fails. Ten days later it is back; the
+   notice is outside the window by then and is retried from the state
+   store. Nothing is pending afterwards.
+Exit 1 when a check fails.
+
+Usage: python bench/sam_sync_bench.py [--count 1500] [--page-size 200] [--json]'''
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import stub_sam
+import stub_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAM.py incremental sync checks against local stubs")
+    parser.add_argument('--count', type=int, default=1500)
+    parser.add_argument('--page-size', type=int, default=200)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    files_server, files_url = stub_files.start_stub(latency_ms=20)
+    sam_server, search_url = stub_sam.start_stub(files_url, latency_ms=100, count=args.count)
+    os.environ['SAM_SEARCH_URL'] = search_url
+    # a 503 is retried once within the run, then left for the next run
+    os.environ['DOWNLOAD_RETRIES'] = '1'
+    # the stub host has no rate limit to respect
+    os.environ['DOWNLOAD_HOST_RPS'] = '0'
+    os.environ['DOWNLOAD_HOST_CONCURRENCY'] = '8'
+    sys.path.insert(0, os.path.join(SERVER_DIR, 'dataCollection'))
+    import SAM
+
+    today = date.today()
+    report = {}
+    failures = []
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+
+    def run(key, state, folder, day=today, query=SAM.QUERY):
+        with contextlib.redirect_stdout(io.StringIO()):
+            report[key] = SAM.sync(query, state=state, download_folder=folder, today=day, limit=args.page_size,
+                                   store=store)
+        return report[key]
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            state = SAM.SyncState(os.path.join(tmp, 'state.sqlite3'))
+            store = SAM.opportunity_store.OpportunityStore(os.path.join(tmp, 'opportunities.sqlite3'))
+            folder = os.path.join(tmp, 'attachments')
+            opps = sam_server.opportunities
+            since = (today - timedelta(days=SAM.SYNC_INITIAL_DAYS)).isoformat()
+            in_window = [o for o in opps if o["postedDate"] >= since]
+
+            r = run("cold", state, folder)
+            check(len(r["new"]) == len(in_window), f"cold: {len(r['new'])} new, expected {len(in_window)}")
+            check(r["pages"] > 1, "cold: pagination never went past the first page")
+            expected_files = sum(len(o["resourceLinks"]) for o in in_window)
+            check(r["downloads"].get("downloaded") == expected_files,
+                  f"cold: {r['downloads']} downloads, expected {expected_files}")
+            check(r["stored"]["inserted"] == len(in_window), f"cold: stored {r['stored']}")
+
+            r = run("nightly", state, folder)
+            check(not (r["new"] or r["changed"] or r["retried"] or r["downloads"]), f"nightly: unexpected deltas {r}")
+
+            rng = random.Random(5)
+            recent = sorted(in_window, key=lambda o: o["postedDate"])[-40:]
+            with sam_server.lock:
+                added = [stub_sam.make_opportunity(rng, today, files_url, 100_000 + i) for i in range(12)]
+                opps.extend(added)
+                # an amendment re-posts the notice
+                for o in recent[:8]:
+                    o.update(title=o["title"] + " (amended)", postedDate=today.isoformat())
+                for o in recent[8:13]:
+                    o.update(resourceLinks=o["resourceLinks"] + [f"{files_url}/files/{o['noticeId']}_amendment.pdf?size=40000"],
+                             postedDate=today.isoformat())
+            broken = added[0]
+            files_server.unavailable.add(broken["resourceLinks"][0].split('/files/')[1].split('?')[0])
+
+            r = run("amended", state, folder)
+            check(sorted(r["new"]) == sorted(o["noticeId"] for o in added), f"amended: new {r['new']}")
+            check(sorted(r["changed"]) == sorted(o["noticeId"] for o in recent[:13]), f"amended: changed {r['changed']}")
+            check(sorted(r["attachments_changed"]) == sorted(o["noticeId"] for o in recent[8:13]),
+                  f"amended: attachments_changed {r['attachments_changed']}")
+            new_files = sum(len(o["resourceLinks"]) for o in added) - 1 + 5
+            check(r["downloads"].get("downloaded") == new_files, f"amended: {r['downloads']}, expected {new_files} new files")
+            check(r["retry_next_run"] == [broken["noticeId"]], f"amended: retry_next_run {r['retry_next_run']}")
+            check(r["stored"] == {"inserted": 12, "updated": 13, "unchanged": 0}, f"amended: stored {r['stored']}")
+            check(store.count() == len(in_window) + 12, f"amended: store holds {store.count()}")
+            check(sorted(o["notice_id"] for o in store.query("amended")) == sorted(o["noticeId"] for o in recent[:8]),
+                  "amended: full-text search for the amended titles")
+
+            pending = [o["noticeId"] for o in state.pending(SAM.QUERY)]
+            r = run("other_query", state, folder, query="renovation")
+            check(len(r["new"]) == len(in_window) + 12, f"other_query: {len(r['new'])} new")
+            check([o["noticeId"] for o in state.pending(SAM.QUERY)] == pending,
+                  "other_query: changed the first query's pending notices")
+            state.forget("renovation")
+            check([o["noticeId"] for o in state.pending(SAM.QUERY)] == pending == [broken["noticeId"]],
+                  "other_query: forget() removed the first query's rows")
+
+            r = run("day_5", state, folder, today + timedelta(days=5))
+            check(r["retry_next_run"] == [broken["noticeId"]], f"day_5: retry_next_run {r['retry_next_run']}")
+
+            files_server.unavailable.clear()
+            r = run("retry", state, folder, today + timedelta(days=10))
+            # the window now starts after the notice was posted
+            check(r["fetched"] == 0 and r["retried"] == [broken["noticeId"]], f"retry: {r}")
+            check(r["retry_next_run"] == [], f"retry: still pending {r['retry_next_run']}")
+            check(not state.pending(SAM.QUERY), "retry: notices still pending")
+    finally:
+        sam_server.shutdown()
+        files_server.shutdown()
+
+    if failures:
+        print(json.dumps({"failures": failures}, indent=2))
+        sys.exit(1)
+    summary = {key: {k: (len(v) if isinstance(v, list) else v) for k, v in r.items()} for key, r in report.items()}
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        for key, r in summary.items():
+            print(f"{key:>8}: {r['seconds']:.2f}s  {r['pages']} pages  {r['fetched']} fetched  new {r['new']}  "
+                  f"changed {r['changed']}  retried {r['retried']}  unchanged {r['unchanged']}  "
+                  f"{r['downloads']}  {r['megabytes']} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+'''Local stand-in for the Roboflow room detector used by takeoff/mask.py.
+
+Answers POST /<model>/<version> (multipart "file" PNG) with a response in
+the detector's JSON shape. Like the hosted model it first shrinks the image
+to fit input_side pixels, so thin walls fade on large uploads. It then
+finds rooms as the cells between full-length dark wall lines. Cells cut
+by the image edge are reported with lower confidence, as a partial room
+would be. It can inject 429s to exercise the retry path.
+
+synthetic_sheet() draws a walled floor plan with known rooms for checks;
+bench/mask_bench.py --tiled uses both. Point mask.py at it with
+    python takeoff/mask.py SHEET.png --url http://127.0.0.1:8766/estima_ai/2
+
+Usage: python bench/stub_detector.py [--port 8766] [--latency-ms 300] [--input-side 640] [--fail-rate 0.0]'''
+
+MIN_ROOM_PX = 12
+
+
+def synthetic_sheet(width=8400, height=6000, wall=8, seed=7):
+    """
+    White sheet with full-length black walls at random spacing.
+    Returns (gray uint8 array, rooms as [x0, y0, x1, y1] interior boxes).
+    """
+    import numpy as np
+    rng = random.Random(seed)
+
+    def walls(length, low, high):
+        positions = [0]
+        while positions[-1] + high < length - wall:
+            positions.append(positions[-1] + rng.randint(low, high))
+        positions.append(length - wall)
+        return positions
+
+    xs, ys = walls(width, 500, 1400), walls(height, 400, 1100)
+    gray = np.full((height, width), 255, dtype=np.uint8)
+    for x in xs:
+        gray[:, x:x + wall] = 0
+    for y in ys:
+        gray[y:y + wall, :] = 0
+    rooms = [[x0 + wall, y0 + wall, x1, y1] for y0, y1 in zip(ys, ys[1:]) for x0, x1 in zip(xs, xs[1:])]
+    return gray, rooms
+
+
+def _runs(mask):
+    """
+    [start, end) runs of True in a 1-D boolean array.
+    """
+    import numpy as np
+    padded = np.concatenate([[False], mask, [False]])
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(edges[::2], edges[1::2]))
+
+
+def _cells(length, walls):
+    """
+    (start, end, cut) spans between walls; cut when bounded by the image edge.
+    """
+    bounds = [(None, 0)] + [(s, e) for s, e in walls] + [(length, None)]
+    spans = []
+    for (_, start), (end, _) in zip(bounds, bounds[1:]):
+        if start is None or end is None or end - start < MIN_ROOM_PX:
+            continue
+        spans.append((start, end, start == 0 or end == length))
+    return spans
+
+
+def find_rooms(image, input_side=640):
+    """
+    Room predictions (detector JSON shape) for a PIL image, in its own pixel coordinates.
+    """
+    import numpy as np
+    from PIL import Image
+    gray = image.convert("L")
+    scale = 1.0
+    if max(gray.size) > input_side:
+        scale = max(gray.size) / input_side
+        gray = gray.resize((max(1, round(gray.width / scale)), max(1, round(gray.height / scale))), Image.BOX)
+    dark = np.asarray(gray) < 128
+    rows = _cells(dark.shape[0], _runs(dark.mean(axis=1) > 0.5))
+    cols = _cells(dark.shape[1], _runs(dark.mean(axis=0) > 0.5))
+    predictions = []
+    for y0, y1, cut_y in rows:
+        for x0, x1, cut_x in cols:
+            # a real room is mostly empty paper
+            if dark[y0:y1, x0:x1].mean() > 0.5:
+                continue
+            box = [v * scale for v in (x0, y0, x1, y1)]
+            predictions.append({
+                "x": (box[0] + box[2]) / 2,
+                "y": (box[1] + box[3]) / 2,
+                "width": box[2] - box[0],
+                "height": box[3] - box[1],
+                "confidence": 0.55 if cut_x or cut_y else 0.9,
+                "class": "room",
+                "class_id": 0,
+                "detection_id": str(uuid.uuid4()),
+                "points": [{"x": box[0], "y": box[1]}, {"x": box[0], "y": box[3]},
+                           {"x": box[2], "y": box[3]}, {"x": box[2], "y": box[1]}],
+            })
+    return predictions
+
+
+class StubDetectorHandler(BaseHTTPRequestHandler):
+    latency_ms = 300
+    input_side = 640
+    fail_rate = 0.0
+    stats = {"requests": 0, "rate_limited": 0, "pixels": 0}
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/stats'):
+            with self.stats_lock:
+                self._send_json(200, dict(self.stats))
+            return
+        self._send_json(404, {"message": "not found"})
+
+    def do_POST(self):
+        from PIL import Image
+        start = time.perf_counter()
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode('utf-8')
+        message = BytesParser().parsebytes(header + body)
+        files = [part.get_payload(decode=True) for part in message.walk() if part.get_param('name', header='content-disposition') == 'file']
+        if not files:
+            self._send_json(400, {"message": "missing file"})
+            return
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            limited = random.random() < self.fail_rate
+            if limited:
+                self.stats["rate_limited"] += 1
+        if limited:
+            self._send_json(429, {"message": "Rate limit exceeded"})
+            return
+        with Image.open(io.BytesIO(files[0])) as image:
+            image.load()
+        with self.stats_lock:
+            self.stats["pixels"] += image.width * image.height
+        predictions = find_rooms(image, self.input_side)
+        time.sleep(self.latency_ms / 1000.0)
+        self._send_json(200, {
+            "inference_id": str(uuid.uuid4()),
+            "time": round(time.perf_counter() - start, 3),
+            "image": {"width": image.width, "height": image.height},
+            "predictions": predictions,
+        })
+
+
+def start_stub(port=0, latency_ms=300, input_side=640, fail_rate=0.0):
+    """
+    Start the stub in a background thread. Returns (server, detector_url).
+    """
+    handler = type('Handler', (StubDetectorHandler,), {
+        'latency_ms': latency_ms,
+        'input_side': input_side,
+        'fail_rate': fail_rate,
+        'stats': {"requests": 0, "rate_limited": 0, "pixels": 0},
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/estima_ai/2"
+
+
+def main():
+    def arg(name, default):
+        if name in sys.argv:
+            return sys.argv[sys.argv.index(name) + 1]
+        return default
+    port = int(arg('--port', os.getenv('STUB_DETECTOR_PORT', 8766)))
+    latency_ms = float(arg('--latency-ms', os.getenv('STUB_DETECTOR_LATENCY_MS', 300)))
+    input_side = int(arg('--input-side', os.getenv('STUB_DETECTOR_INPUT_SIDE', 640)))
+    fail_rate = float(arg('--fail-rate', os.getenv('STUB_DETECTOR_FAIL_RATE', 0.0)))
+    server, url = start_stub(port, latency_ms, input_side, fail_rate)
+    print(f"Stub detector listening on {url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+'''Local stand-in for attachment hosts (SAM.gov resource links, rfpdb PDFs).
+
+GET /files/<name>?size=N[&kind=pdf|html|bin] serves N deterministic bytes,
+starting with %PDF for kind=pdf (the default) and <html> for kind=html, with
+ETag, Content-Length and single-range (Range / If-Range) support.
+Failure injection:
+    drop_rate   first request for a file closes the connection halfway through the body
+    fail_rate   answer 429 with Retry-After
+    latency_ms  added before every response
+    unavailable names answered with 503 (a set the caller can change while the stub runs)
+GET /stats reports requests, bytes sent, 206s, 429s, 503s, drops and the peak
+number of requests in flight.
+
+Usage: python bench/stub_files.py [--port 8767] [--latency-ms 50] [--drop-rate 0] [--fail-rate 0]'''
+
+
+def content(name, size, kind='pdf'):
+    """
+    The bytes served for a file: a type-specific header padded with a hash stream.
+    """
+    head = {'pdf': b'%PDF-1.7\n', 'html': b'<html><body>Not found</body></html>\n', 'bin': b'\x00\x01BIN'}[kind]
+    seed = hashlib.sha256(f"{name}:{size}:{kind}".encode('utf-8')).digest()
+    body = (seed * (size // len(seed) + 1))[:max(size - len(head), 0)]
+    return (head + body)[:size]
+
+
+class StubFilesHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes; with Nagle on, keep-alive clients stall on delayed ACKs
+    disable_nagle_algorithm = True
+    latency_ms = 50
+    drop_rate = 0.0
+    fail_rate = 0.0
+    stats = None
+    dropped = None
+    unavailable = set()
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, key, value=1):
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + value
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        from urllib.parse import urlsplit, parse_qs
+        url = urlsplit(self.path)
+        if url.path.rstrip('/') == '/stats':
+            with self.lock:
+                self._send_json(200, dict(self.stats))
+            return
+        if not url.path.startswith('/files/'):
+            self._send_json(404, {"error": "not found"})
+            return
+        query = parse_qs(url.query)
+        name = url.path[len('/files/'):]
+        size = int(query.get('size', ['100000'])[0])
+        kind = query.get('kind', ['pdf'])[0]
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+            self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+            limited = random.random() < self.fail_rate
+            drop = name not in self.dropped and random.random() < self.drop_rate
+            if drop:
+                self.dropped.add(name)
+        try:
+            time.sleep(self.latency_ms / 1000.0)
+            if limited:
+                self._count("rate_limited")
+                self.send_response(429)
+                self.send_header('Retry-After', '0.2')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if name in self.unavailable:
+                self._count("unavailable")
+                self._send_json(503, {"error": "unavailable"})
+                return
+            data = content(name, size, kind)
+            etag = '"' + hashlib.sha1(data).hexdigest()[:16] + '"'
+            start = 0
+            range_header = self.headers.get('Range')
+            if range_header and range_header.startswith('bytes=') and self.headers.get('If-Range', etag) == etag:
+                start = int(range_header[len('bytes='):].split('-')[0] or 0)
+                if start >= len(data):
+                    self.send_response(416)
+                    self.send_header('Content-Range', f"bytes */{len(data)}")
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+            body = data[start:]
+            self.send_response(206 if start else 200)
+            if start:
+                self._count("partial")
+                self.send_header('Content-Range', f"bytes {start}-{len(data) - 1}/{len(data)}")
+            self.send_header('Content-Type', 'text/html' if kind == 'html' else 'application/pdf')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.end_headers()
+            if drop:
+                self.wfile.write(body[:len(body) // 2])
+                self.wfile.flush()
+                self._count("dropped")
+                self._count("bytes_sent", len(body) // 2)
+                self.close_connection = True
+                return
+            self.wfile.write(body)
+            self._count("bytes_sent", len(body))
+        finally:
+            self._count("in_flight", -1)
+
+
+def start_stub(port=0, latency_ms=50, drop_rate=0.0, fail_rate=0.0):
+    """
+    Start the stub in a background thread. Returns (server, base_url).
+    """
+    handler = type('Handler', (StubFilesHandler,), {
+        'latency_ms': latency_ms,
+        'drop_rate': drop_rate,
+        'fail_rate': fail_rate,
+        'stats': {"requests": 0, "bytes_sent": 0, "partial": 0, "rate_limited": 0, "dropped": 0, "unavailable": 0,
+                  "in_flight": 0, "peak_in_flight": 0},
+        'dropped': set(),
+        'unavailable': set(),
+        'lock': threading.Lock(),
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.unavailable = handler.unavailable
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    def arg(name, default):
+        if name in sys.argv:
+            return sys.argv[sys.argv.index(name) + 1]
+        return default
+    port = int(arg('--port', os.getenv('STUB_FILES_PORT', 8767)))
+    latency_ms = float(arg('--latency-ms', os.getenv('STUB_FILES_LATENCY_MS', 50)))
+    drop_rate = float(arg('--drop-rate', os.getenv('STUB_FILES_DROP_RATE', 0.0)))
+    fail_rate = float(arg('--fail-rate', os.getenv('STUB_FILES_FAIL_RATE', 0.0)))
+    server, base_url = start_stub(port, latency_ms, drop_rate, fail_rate)
+    print(f"Stub file host listening on {base_url}/files/<name>?size=N", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
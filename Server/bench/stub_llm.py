@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+'''Local stand-in for the OpenAI chat completions API.
+
+Answers POST /v1/chat/completions after a configurable delay with a canned
+completion that echoes the start of the user prompt, and can inject 429s to
+exercise the retry path. Point the prep scripts at it with
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub
+
+Usage: python bench/stub_llm.py [--port 8765] [--latency-ms 200] [--fail-rate 0.0]'''
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    latency_ms = 200
+    fail_rate = 0.0
+    reply = None
+    stats = {"requests": 0, "rate_limited": 0}
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/stats'):
+            with self.stats_lock:
+                self._send_json(200, dict(self.stats))
+            return
+        self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            limited = random.random() < self.fail_rate
+            if limited:
+                self.stats["rate_limited"] += 1
+        if limited:
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"retry-after": "0.1"})
+            return
+        time.sleep(self.latency_ms / 1000.0)
+        messages = body.get('messages') or [{}]
+        prompt = messages[-1].get('content') or ''
+        content = self.reply if self.reply is not None else f"Stub summary of {len(prompt)} chars: {prompt[-200:]}"
+        self._send_json(200, {
+            "id": f"chatcmpl-stub-{self.stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get('model', 'stub'),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (len(prompt) + len(content)) // 4,
+            },
+        })
+
+
+def start_stub(port=0, latency_ms=200, fail_rate=0.0, reply=None):
+    """
+    Start the stub in a background thread. Returns (server, base_url).
+    """
+    handler = type('Handler', (StubLLMHandler,), {
+        'latency_ms': latency_ms,
+        'fail_rate': fail_rate,
+        'reply': reply,
+        'stats': {"requests": 0, "rate_limited": 0},
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    def arg(name, default):
+        if name in sys.argv:
+            return sys.argv[sys.argv.index(name) + 1]
+        return default
+    port = int(arg('--port', os.getenv('STUB_LLM_PORT', 8765)))
+    latency_ms = float(arg('--latency-ms', os.getenv('STUB_LLM_LATENCY_MS', 200)))
+    fail_rate = float(arg('--fail-rate', os.getenv('STUB_LLM_FAIL_RATE', 0.0)))
+    server, base_url = start_stub(port, latency_ms, fail_rate)
+    print(f"Stub LLM listening on {base_url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import stub_files
+
+'''Local stand-in for rfpdb.com used by dataCollection/rfpdb.py.
+
+Serves fixture pages in the site's layout:
+    /search/search/identifier/8ec982aa56df/page/<n>   result headings (<h3><a>) linking to view pages,
+                                                      plus sidebar links that are not results
+    /view/document/name/<slug>                        a document page linking to its PDFs
+    /file/<slug>_<k>.pdf                              PDF bytes (bench/stub_files.content)
+Every response carries an ETag and a Last-Modified, and answers 304 to a
+matching If-None-Match / If-Modified-Since. server.update(slug) and
+server.add_document(page) change the site between crawls. GET /stats
+reports per-status counts, 200s per URL, the peak number of requests in
+flight and the number of distinct client connections.
+
+Point rfpdb.py at it with RFPDB_BASE_URL=http://127.0.0.1:8769
+
+Usage: python bench/stub_rfpdb.py [--port 8769] [--pages 10] [--per-page 10] [--latency-ms 30]'''
+
+SEARCH_PREFIX = '/search/search/identifier/8ec982aa56df/page/'
+
+
+class Site:
+    """
+    pages -> document slugs, slug -> (version, PDF count and sizes), each change stamped with a time.
+    """
+
+    def __init__(self, pages=10, per_page=10, pdfs_per_document=3, pdf_size=60_000):
+        self.lock = threading.Lock()
+        self.pages = {}
+        self.documents = {}
+        self.changed = {}
+        start = time.time() - 86400
+        for page in range(1, pages + 1):
+            self.pages[page] = []
+            for i in range(per_page):
+                self._add(page, f"rfp-{page:03d}-{i:03d}", pdfs_per_document, pdf_size, start)
+        self.changed['site'] = start
+
+    def _add(self, page, slug, pdfs, size, stamp):
+        self.pages[page].append(slug)
+        self.documents[slug] = {"version": 1, "pdfs": [size + 997 * k for k in range(pdfs)]}
+        self.changed[slug] = stamp
+        self.changed[('page', page)] = stamp
+
+    def add_document(self, page, slug, pdfs=2, size=50_000):
+        with self.lock:
+            self._add(page, slug, pdfs, size, time.time())
+
+    def update(self, slug):
+        """
+        A new revision of a document: its view page and every PDF change.
+        """
+        with self.lock:
+            self.documents[slug]["version"] += 1
+            self.changed[slug] = time.time()
+
+    def pdf_urls(self):
+        with self.lock:
+            return [(f"/file/{slug}_{k}.pdf", self.pdf_bytes(slug, k))
+                    for slug, doc in self.documents.items() for k in range(len(doc["pdfs"]))]
+
+    def pdf_bytes(self, slug, k):
+        doc = self.documents[slug]
+        return stub_files.content(f"{slug}_{k}_v{doc['version']}", doc["pdfs"][k])
+
+    def render(self, path):
+        """
+        (body bytes, content type, last-modified time) for a path, or None.
+        """
+        with self.lock:
+            if path.startswith(SEARCH_PREFIX):
+                page = int(path[len(SEARCH_PREFIX):].strip('/') or 0)
+                if page not in self.pages:
+                    return "<html><body><p>No results</p></body></html>".encode('utf-8'), 'text/html', self.changed['site']
+                items = ''.join(f'<div class="result"><h3><a href="/view/document/name/{slug}">{slug}</a></h3>'
+                                f'<p>Posted by <a href="/view/agency/{slug}">agency</a></p></div>'
+                                for slug in self.pages[page])
+                nav = '<a href="/view/document/name/featured-ad">Featured</a><a href="/about">About</a>'
+                body = f"<html><body><nav>{nav}</nav><h2>Results</h2>{items}</body></html>"
+                return body.encode('utf-8'), 'text/html', self.changed[('page', page)]
+            if path.startswith('/view/document/name/'):
+                slug = path.rsplit('/', 1)[1]
+                if slug not in self.documents:
+                    return None
+                doc = self.documents[slug]
+                links = ''.join(f'<li><a href="/file/{slug}_{k}.pdf">Document {k} (rev {doc["version"]})</a></li>'
+                                for k in range(len(doc["pdfs"])))
+                body = (f"<html><body><h1>{slug}</h1><ul>{links}</ul>"
+                        f'<a href="/view/document/name/{slug}/print">Print</a><a href="mailto:x@example.com">Mail</a>'
+                        f"</body></html>")
+                return body.encode('utf-8'), 'text/html', self.changed[slug]
+            if path.startswith('/file/') and path.endswith('.pdf'):
+                slug, _, k = path[len('/file/'):-len('.pdf')].rpartition('_')
+                if slug not in self.documents or not k.isdigit() or int(k) >= len(self.documents[slug]["pdfs"]):
+                    return None
+                return self.pdf_bytes(slug, int(k)), 'application/pdf', self.changed[slug]
+        return None
+
+
+class StubRfpdbHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes; with Nagle on, keep-alive clients stall on delayed ACKs
+    disable_nagle_algorithm = True
+    latency_ms = 30
+    site = None
+    stats = None
+    connections = None
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, key, value=1):
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + value
+
+    def _send(self, status, body=b'', content_type='application/json', headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client went away (an interrupted crawl)
+            self.close_connection = True
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path.rstrip('/') == '/stats':
+            with self.lock:
+                self._send(200, json.dumps({**self.stats, "connections": len(self.connections)}).encode('utf-8'))
+            return
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+            self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+            self.connections.add(self.client_address)
+        try:
+            time.sleep(self.latency_ms / 1000.0)
+            page = self.site.render(path)
+            if page is None:
+                self._count("404")
+                self._send(404, b'{"error": "not found"}')
+                return
+            body, content_type, changed = page
+            etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+            last_modified = formatdate(int(changed), usegmt=True)
+            validators = [('ETag', etag), ('Last-Modified', last_modified)]
+            if self.headers.get('If-None-Match') == etag or (
+                    'If-None-Match' not in self.headers and self.headers.get('If-Modified-Since') == last_modified):
+                self._count("304")
+                self._send(304, headers=validators)
+                return
+            self._count("200")
+            self._count("bytes_sent", len(body))
+            with self.lock:
+                self.stats["fetched"][path] = self.stats["fetched"].get(path, 0) + 1
+            self._send(200, body, content_type, validators)
+        finally:
+            self._count("in_flight", -1)
+
+
+def start_stub(port=0, latency_ms=30, pages=10, per_page=10, pdfs_per_document=3, pdf_size=60_000):
+    """
+    Start the stub in a background thread. Returns (server, base_url); server.site is the live Site.
+    """
+    site = Site(pages, per_page, pdfs_per_document, pdf_size)
+    handler = type('Handler', (StubRfpdbHandler,), {
+        'latency_ms': latency_ms,
+        'site': site,
+        'stats': {"requests": 0, "200": 0, "304": 0, "404": 0, "bytes_sent": 0, "in_flight": 0,
+                  "peak_in_flight": 0, "fetched": {}},
+        'connections': set(),
+        'lock': threading.Lock(),
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    server.site = site
+    server.add_document = site.add_document
+    server.update = site.update
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    def arg(name, default):
+        if name in sys.argv:
+            return sys.argv[sys.argv.index(name) + 1]
+        return default
+    port = int(arg('--port', os.getenv('STUB_RFPDB_PORT', 8769)))
+    pages = int(arg('--pages', 10))
+    per_page = int(arg('--per-page', 10))
+    latency_ms = float(arg('--latency-ms', 30))
+    server, base_url = start_stub(port, latency_ms, pages, per_page)
+    print(f"Stub rfpdb listening on {base_url}{SEARCH_PREFIX}1", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+import time
+import random
+import threading
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+'''Local stand-in for the SAM.gov opportunities search API used by dataCollection/SAM.py.
+
+GET /opportunities/v2/search?postedFrom=MM/dd/yyyy&postedTo=MM/dd/yyyy&limit=N&offset=K
+answers in the API's JSON shape ({"totalRecords", "limit", "offset",
+"opportunitiesData"}). Results are the generated opportunities posted in
+the window, newest first, with offset as a page index (offset_is_page).
+Windows longer than a year get a 400, as they do from the real API.
+Resource links point at a files host (bench/stub_files.py).
+
+server.opportunities is the live list. Append to it or edit it between
+runs to simulate new and amended notices. Point SAM.py at the stub with
+    SAM_SEARCH_URL=http://127.0.0.1:8768/opportunities/v2/search
+
+Usage: python bench/stub_sam.py --files-url http://127.0.0.1:8767 [--port 8768] [--count 1500] [--days 400]'''
+
+
+def make_opportunity(rng, posted, files_url, index):
+    """
+    One opportunity record posted on `posted` with 1-3 PDF resource links.
+    """
+    notice_id = f"{rng.getrandbits(64):016x}"
+    links = [f"{files_url}/files/{notice_id}_{k}.pdf?size={rng.randint(5_000, 120_000)}"
+             for k in range(rng.randint(1, 3))]
+    return {
+        "noticeId": notice_id,
+        "title": f"Construction services {index}",
+        "solicitationNumber": f"SOL-{index:06d}",
+        "department": "GENERAL SERVICES ADMINISTRATION",
+        "postedDate": posted.isoformat(),
+        "type": "Solicitation",
+        "baseType": "Solicitation",
+        "active": "Yes",
+        "naicsCode": "236220",
+        "resourceLinks": links,
+        "additionalInfoLink": None,
+    }
+
+
+def make_opportunities(count, days, files_url, today=None, seed=11):
+    """
+    `count` opportunities posted over the `days` days up to today.
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    return [make_opportunity(rng, today - timedelta(days=rng.randint(0, days)), files_url, i) for i in range(count)]
+
+
+class StubSamHandler(BaseHTTPRequestHandler):
+    latency_ms = 100
+    offset_is_page = True
+    opportunities = []
+    stats = None
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        from urllib.parse import urlsplit, parse_qs
+        url = urlsplit(self.path)
+        if url.path.rstrip('/') == '/stats':
+            with self.lock:
+                self._send_json(200, dict(self.stats))
+            return
+        if not url.path.rstrip('/').endswith('/opportunities/v2/search'):
+            self._send_json(404, {"error": "not found"})
+            return
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            posted_from = datetime.strptime(query['postedFrom'], "%m/%d/%Y").date()
+            posted_to = datetime.strptime(query['postedTo'], "%m/%d/%Y").date()
+        except (KeyError, ValueError):
+            self._send_json(400, {"error": "postedFrom and postedTo are mandatory (MM/dd/yyyy)"})
+            return
+        if (posted_to - posted_from).days > 365:
+            self._send_json(400, {"error": "Date range must be 1 year(s) apart"})
+            return
+        limit = min(int(query.get('limit', 1)), 1000)
+        offset = int(query.get('offset', 0))
+        start = offset * limit if self.offset_is_page else offset
+        time.sleep(self.latency_ms / 1000.0)
+        with self.lock:
+            self.stats["requests"] += 1
+            matches = [opp for opp in self.opportunities
+                       if posted_from.isoformat() <= opp["postedDate"] <= posted_to.isoformat()]
+        matches.sort(key=lambda opp: (opp["postedDate"], opp["noticeId"]), reverse=True)
+        self._send_json(200, {
+            "totalRecords": len(matches),
+            "limit": limit,
+            "offset": offset,
+            "opportunitiesData": matches[start:start + limit],
+        })
+
+
+def start_stub(files_url, port=0, latency_ms=100, count=1500, days=400, offset_is_page=True):
+    """
+    Start the stub in a background thread. Returns (server, search_url).
+    """
+    handler = type('Handler', (StubSamHandler,), {
+        'latency_ms': latency_ms,
+        'offset_is_page': offset_is_page,
+        'opportunities': make_opportunities(count, days, files_url),
+        'stats': {"requests": 0},
+        'lock': threading.Lock(),
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    server.opportunities = handler.opportunities
+    server.lock = handler.lock
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/opportunities/v2/search"
+
+
+def main():
+    def arg(name, default):
+        if name in sys.argv:
+            return sys.argv[sys.argv.index(name) + 1]
+        return default
+    files_url = arg('--files-url', os.getenv('STUB_FILES_URL', 'http://127.0.0.1:8767'))
+    port = int(arg('--port', os.getenv('STUB_SAM_PORT', 8768)))
+    count = int(arg('--count', 1500))
+    days = int(arg('--days', 400))
+    server, url = start_stub(files_url, port, count=count, days=days)
+    print(f"Stub SAM search listening on {url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
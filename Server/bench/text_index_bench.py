@@ -0,0 +1,190 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import tempfile
+import argparse
+
+'''Checks and timing for prep/text_index.py.
+
+PyMuPDF is not needed: a temporary page store is filled with --docs
+synthetic documents (1-20 pages of construction RFP vocabulary with
+trigger phrases mixed in), which is all the index reads.
+
+1. Incremental sync: the first sync indexes every document, a re-sync
+   indexes none, --new added documents are the only ones indexed next,
+   and completing OCR on a pending page re-indexes just that document and
+   makes the OCR text searchable.
+2. Phrase, prefix and boolean queries: page hits equal a Python pass over
+   every page's words; hits come best bm25 first with a marked snippet,
+   and a first/last page filter keeps only those pages.
+3. rank_chunks (chat retrieval without embeddings) puts the chunk that
+   holds the prompt's rare words first.
+Reports p50/p95 query latency next to a Python pass over the page words,
+which first have to be loaded from the page store (timed separately).
+Exit 1 when a check fails.
+
+Usage: python bench/text_index_bench.py [--docs 3000] [--new 100] [--repeat 10] [--json]'''
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(SERVER_DIR, 'prep'))
+
+WORDS = ("the contractor shall provide all labor materials and equipment necessary to complete work described "
+         "herein accordance with drawings applicable codes roof replacement hvac upgrade paving repair renovation "
+         "demolition electrical plumbing asbestos abatement bridge culvert dredging fencing lighting elevator "
+         "parking garage barracks runway seawall sewer generator boiler chiller painting flooring masonry concrete "
+         "steel fire alarm sprinkler security cameras access control specifications specification requirements "
+         "requirement offeror government").split()
+PHRASES = ["request for proposal", "statement of work", "section m", "section b", "closing date", "proposals due"]
+QUERIES = {
+    "phrase": '"closing date"',
+    "phrase_2": '"section m"',
+    "prefix": 'spec*',
+    "boolean": 'asbestos AND abatement NOT concrete',
+    "or_near": '"request for proposal" OR NEAR(boiler chiller, 3)',
+}
+_WORD = re.compile(r"\w+")
+
+
+def make_page(rng):
+    # Zipf-ish word choice so bm25 has common and rare terms to weigh
+    words = [WORDS[min(len(WORDS) - 1, int(rng.paretovariate(1.1)) - 1)] for _ in range(rng.randint(150, 500))]
+    for _ in range(rng.choice([0, 0, 0, 1, 2])):
+        words.insert(rng.randrange(len(words)), rng.choice(PHRASES))
+    return ' '.join(words)
+
+
+def fill(store, rng, start, count, pending=0):
+    for i in range(start, start + count):
+        pages = [{"page": n, "text": make_page(rng), "ocr": False, "text_ms": 0.0} for n in range(1, rng.randint(2, 21))]
+        for record in pages[:pending]:
+            record.update(text='', ocr=None)
+        store.put(f"{i:064x}", pages, 0.0)
+
+
+def has_phrase(tokens, phrase):
+    n = len(phrase)
+    return any(tokens[i:i + n] == phrase for i in range(len(tokens) - n + 1))
+
+
+def expected(name, tokens):
+    if name == "phrase":
+        return has_phrase(tokens, ["closing", "date"])
+    if name == "phrase_2":
+        return has_phrase(tokens, ["section", "m"])
+    if name == "prefix":
+        return any(t.startswith("spec") for t in tokens)
+    if name == "boolean":
+        return "asbestos" in tokens and "abatement" in tokens and "concrete" not in tokens
+    if name == "or_near":
+        boilers = [i for i, t in enumerate(tokens) if t == "boiler"]
+        chillers = [i for i, t in enumerate(tokens) if t == "chiller"]
+        return has_phrase(tokens, ["request", "for", "proposal"]) or any(
+            abs(i - j) <= 4 for i in boilers for j in chillers)
+    raise KeyError(name)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="text_index.py checks and timing")
+    parser.add_argument('--docs', type=int, default=3000)
+    parser.add_argument('--new', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+    failures = []
+    report = {}
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['PAGE_STORE_PATH'] = os.path.join(tmp, 'page_store.sqlite3')
+        os.environ['TEXT_INDEX_PATH'] = os.path.join(tmp, 'text_index.sqlite3')
+        import page_store
+        import text_index
+        store = page_store.get_store()
+        index = text_index.get_index()
+        rng = random.Random(7)
+        fill(store, rng, 0, args.docs, pending=0)
+        ocr_doc = f"{args.docs:064x}"
+        fill(store, rng, args.docs, 1, pending=1)
+
+        report["cold_sync"] = index.sync(store)
+        check(report["cold_sync"]["indexed"] == args.docs + 1, f"cold sync: {report['cold_sync']}")
+        report["resync"] = index.sync(store)
+        check(report["resync"]["indexed"] == 0, f"re-sync: {report['resync']}")
+        fill(store, rng, args.docs + 1, args.new)
+        report["new_sync"] = index.sync(store)
+        check(report["new_sync"]["indexed"] == args.new, f"new documents: {report['new_sync']}")
+        store.fill_ocr(ocr_doc, {1: {"text": "zzocrmarker scanned page", "render_ms": 0.0, "ocr_ms": 0.0}}, 0.0)
+        ocr_sync = index.sync(store)
+        check(ocr_sync["indexed"] == 1, f"OCR completed: {ocr_sync}")
+        check([(h["hash"], h["page"]) for h in index.search("zzocrmarker")] == [(ocr_doc, 1)],
+              "OCR text not searchable after sync")
+
+        start = time.perf_counter()
+        pages = {}
+        for doc_hash in store.catalog():
+            for number, text, _ in store.pages(doc_hash):
+                if text.strip():
+                    pages[(doc_hash, number)] = _WORD.findall(text.lower())
+        report["scan_load_seconds"] = round(time.perf_counter() - start, 2)
+        report["pages"] = len(pages)
+        report["queries"] = {}
+        for name, query in QUERIES.items():
+            start = time.perf_counter()
+            want = {key for key, tokens in pages.items() if expected(name, tokens)}
+            scan_ms = (time.perf_counter() - start) * 1000
+            hits = index.search(query, limit=len(pages) + 1)
+            got = {(h["hash"], h["page"]) for h in hits}
+            check(got == want, f"{name}: {len(got)} pages, expected {len(want)}")
+            check(index.count(query) == len(want), f"{name}: count differs")
+            check(all(a["rank"] <= b["rank"] for a, b in zip(hits, hits[1:])), f"{name}: not ranked")
+            top = index.search(query, limit=10)
+            check(all('[' in h["snippet"] for h in top), f"{name}: snippet without a marked hit")
+            docs = index.documents(query, limit=len(pages))
+            check(len(docs) == len({h for h, _ in want}), f"{name}: {len(docs)} documents")
+            firsts = index.search(query, limit=len(pages), first=1, last=3)
+            check({(h["hash"], h["page"]) for h in firsts} == {k for k in want if k[1] <= 3},
+                  f"{name}: page filter")
+            latencies = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                index.search(query, limit=20)
+                index.count(query)
+                latencies.append((time.perf_counter() - start) * 1000)
+            report["queries"][name] = {"pages": len(want), "p50_ms": round(percentile(latencies, 50), 2),
+                                       "p95_ms": round(percentile(latencies, 95), 2), "scan_ms": round(scan_ms, 1)}
+
+        chunks = [make_page(rng) for _ in range(40)]
+        chunks[23] += " the seawall riprap geotextile must be replaced"
+        positions = text_index.rank_chunks("What does the spec say about riprap and geotextile?", chunks, 3)
+        check(23 in positions, f"rank_chunks: {positions}")
+        report["index_bytes"] = index.stats()["bytes"]
+
+    if failures:
+        print(json.dumps({"failures": failures, **report}, indent=2))
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for key in ("cold_sync", "resync", "new_sync"):
+        r = report[key]
+        print(f"{key:>10}: {r['seconds']}s  indexed {r['indexed']} documents, {r['pages']} pages")
+    print(f"index: {report['pages']} pages, {report['index_bytes'] / 1e6:.1f} MB; "
+          f"loading them for a scan took {report['scan_load_seconds']}s")
+    for name, r in report["queries"].items():
+        print(f"{name:>9}: {r['pages']:>6} pages  top 20 + count p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  "
+              f"(scan of loaded words {r['scan_ms']} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import os
+import re
+import sys
+import json
+import time
+import string
+import argparse
+
+'''Golden-output check and throughput benchmark for prep/textnorm.py.
+
+The golden cases are checked first (exit 1 on any mismatch), then
+textnorm.normalize is timed against the legacy trajectory.clean_pdf_text
+over a text corpus: .txt files from --text-dir, otherwise the rfpdb_pdfs
+corpus extracted with PyMuPDF, otherwise a synthetic RFP-like corpus.
+
+Usage: python bench/textnorm_bench.py [--text-dir DIR] [--pdf-dir DIR] [--repeat N] [--json]'''
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(SERVER_DIR, 'prep'))
+import textnorm
+
+PDF_DIR = os.path.abspath(os.path.join(SERVER_DIR, '..', 'rfpdb_pdfs'))
+
+# (input, strip_numbers, expected)
+GOLDEN = [
+    ("  a \t b\n\n c  ", False, "a b c"),
+    ("Scope of work\nPage 3\nContinued text", False, "Scope of work Continued text"),
+    ("Header\nPage 3 of 10\n- 4 -\n12\nBody", False, "Header 12 Body"),
+    ("12\nHeader\nBody\n 7 ", False, "Header Body"),
+    ("Install 12\n doors\n2024\nPage 5", False, "Install 12 doors 2024"),
+    ("See page 7 for details", False, "See for details"),
+    ("Table of Contents\nSection 1 .......... 5\n..........\n------------", False, "Table of Contents Section 1 5"),
+    ("“Quoted” ‘single’ – dash — em", False, "\"Quoted\" 'single' - dash - em"),
+    ("• item one\n item two", False, "* item one * item two"),
+    ("Café résumé ﬁnish", False, "Cafe resume finish"),
+    ("5/8½” gypsum board", False, "5/8 1/2\" gypsum board"),
+    ("at 3½” penetrations, ¾ plywood", False, "at 3 1/2\" penetrations, 3/4 plywood"),
+    ("中文 text ☃ here", False, "text here"),
+    ("bad\x00ctrl\x07chars\r\nnext\x0cpage", False, "badctrlchars next page"),
+    ("Install 12 doors, 4 data drops", True, "Install doors, data drops"),
+    ("Install 12 doors, 4 data drops", False, "Install 12 doors, 4 data drops"),
+    ("Section 01 10 00 - 2,000 SF", True, "Section - , SF"),
+    ("", False, ""),
+    ("\n\n \n", False, ""),
+]
+
+
+def legacy_clean_pdf_text(text):
+    # trajectory.clean_pdf_text before textnorm; its regexes are double-escaped and never match
+    text = ''.join(ch for ch in text if ch in string.printable)
+    lines = text.splitlines()
+    cleaned_lines = []
+    for line in lines:
+        if len(line) == 0:
+            continue
+        nonword = sum(1 for c in line if c in '.- \t')
+        if nonword / len(line) > 0.6:
+            continue
+        cleaned_lines.append(line)
+    text = ' '.join(cleaned_lines)
+    text = re.sub(r'\\s+', ' ', text)
+    text = re.sub(r'\\bPage \\d+\\b', '', text)
+    text = re.sub(r'\\b\\d+\\b', '', text)
+    text = re.sub(r'[^\\x00-\\x7F]+', ' ', text)
+    return text.strip()
+
+
+def check_golden():
+    failures = []
+    for text, strip_numbers, expected in GOLDEN:
+        got = textnorm.normalize(text, strip_numbers=strip_numbers)
+        if got != expected:
+            failures.append({"input": text, "strip_numbers": strip_numbers, "expected": expected, "got": got})
+    return failures
+
+
+def load_text_dir(path):
+    texts = []
+    for name in sorted(os.listdir(path)):
+        if name.endswith('.txt'):
+            with open(os.path.join(path, name), encoding='utf-8', errors='replace') as f:
+                texts.append(f.read())
+    return texts
+
+
+def load_pdf_dir(path):
+    try:
+        import fitz
+    except ImportError:
+        return []
+    texts = []
+    for name in sorted(os.listdir(path)):
+        if not name.lower().endswith('.pdf'):
+            continue
+        try:
+            with fitz.open(os.path.join(path, name)) as doc:
+                texts.append('\n'.join(page.get_text() for page in doc))
+        except Exception as e:
+            print(f"[textnorm_bench] skipping {name}: {e}", file=sys.stderr)
+    return texts
+
+
+def synthetic_corpus(pages=2000):
+    page = (
+        "REQUEST FOR PROPOSALS\nPage {n} of {total}\n"
+        "Table of Contents\nSection 1 Scope ........................ {n}\n"
+        "------------------------------------------\n"
+        "The Contractor shall furnish and install 2,400 SF of 5/8” Type X gypsum board,\n"
+        "• 12 hollow metal doors – including hardware\n"
+        "• 480 LF of “fire-rated” caulking at 3½” penetrations\n"
+        "Bids are due no later than 2:00 PM on March {n}, 2024.\r\n\x0c"
+    )
+    return [page.format(n=i, total=pages) for i in range(1, pages + 1)]
+
+
+def throughput(func, texts, repeat):
+    size = sum(len(t.encode('utf-8')) for t in texts)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {"seconds": round(best, 4), "mb_per_s": round(size / 1e6 / best, 2) if best else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="textnorm golden check and throughput benchmark")
+    parser.add_argument('--text-dir', help="directory of extracted .txt files")
+    parser.add_argument('--pdf-dir', default=PDF_DIR, help="PDF corpus to extract with PyMuPDF")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    failures = check_golden()
+    if failures:
+        print(json.dumps({"golden_failures": failures}, indent=2))
+        sys.exit(1)
+
+    if args.text_dir:
+        texts, source = load_text_dir(args.text_dir), args.text_dir
+    else:
+        texts, source = (load_pdf_dir(args.pdf_dir), args.pdf_dir) if os.path.isdir(args.pdf_dir) else ([], None)
+    if not texts:
+        texts, source = synthetic_corpus(), 'synthetic'
+
+    report = {
+        "golden_cases": len(GOLDEN),
+        "corpus": source,
+        "documents": len(texts),
+        "megabytes": round(sum(len(t.encode('utf-8')) for t in texts) / 1e6, 2),
+        "normalize": throughput(lambda t: textnorm.normalize(t, strip_numbers=True), texts, args.repeat),
+        "legacy": throughput(legacy_clean_pdf_text, texts, args.repeat),
+    }
+    report["speedup"] = round(report["legacy"]["seconds"] / report["normalize"]["seconds"], 1)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"golden: {report['golden_cases']} cases ok")
+        print(f"corpus: {report['corpus']} ({report['documents']} docs, {report['megabytes']} MB)")
+        for name in ('normalize', 'legacy'):
+            print(f"{name:>10}: {report[name]['mb_per_s']:>8} MB/s  ({report[name]['seconds']}s)")
+        print(f"   speedup: {report['speedup']}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,91 +1,223 @@
 import os
-import requests
-from datetime import datetime, timedelta
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
-import PyPDF2
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-import shutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'prep'))
+import page_store
+import downloader
+import opportunity_store
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
 SAM_API_KEY = os.getenv('SAM_API_KEY')
+SAM_SEARCH_URL = os.getenv('SAM_SEARCH_URL', "https://api.sam.gov/opportunities/v2/search")
+NOTICE_TYPES = "solicitation,combinedsynopsis/solicitation"
 QUERY = "construction"
 LIMIT = 1000
 posted_to = (datetime.now() - timedelta(days=300)).strftime("%m/%d/%Y")
 posted_from = (datetime.now() - timedelta(days=600)).strftime("%m/%d/%Y")
 
-def fetch_opportunities(query, limit, posted_from, posted_to):
-    url = "https://api.sam.gov/opportunities/v2/search"
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+ATTACHMENTS_DIR = os.path.join(DATA_DIR, 'sam_api_attachments')
+OPPORTUNITY_PDFS_DIR = os.path.join(DATA_DIR, 'sam_api_opportunity_pdfs')
+STATE_PATH = os.getenv('SAM_STATE_PATH', os.path.join(DATA_DIR, 'cache', 'sam_state.sqlite3'))
+# first incremental run for a query looks back this far
+SYNC_INITIAL_DAYS = int(os.getenv('SAM_SYNC_INITIAL_DAYS', 365))
+# later runs re-read a few days before the watermark for late-indexed notices
+SYNC_OVERLAP_DAYS = int(os.getenv('SAM_SYNC_OVERLAP_DAYS', 3))
+# postedFrom..postedTo may span at most one year
+MAX_WINDOW_DAYS = 364
+# the API documents offset as a page index; set SAM_OFFSET_IS_PAGE=0 if it counts records
+OFFSET_IS_PAGE = os.getenv('SAM_OFFSET_IS_PAGE', '1') != '0'
+PDF_WORKERS = int(os.getenv('SAM_PDF_WORKERS', os.cpu_count() or 1))
+
+def fetch_page(query, limit, posted_from, posted_to, offset=0, session=None):
     params = {
         "api_key": SAM_API_KEY,
         "q": query,
-        "noticeType": "solicitation,combinedsynopsis/solicitation",
+        "noticeType": NOTICE_TYPES,
         "active": "true",
         "limit": limit,
+        "offset": offset,
         "postedFrom": posted_from,
         "postedTo": posted_to
     }
-    resp = requests.get(url, params=params)
+    # pooled, so the pages of a sync reuse one connection
+    resp = (session or downloader.get_session()).get(SAM_SEARCH_URL, params=params, timeout=60)
     resp.raise_for_status()
-    return resp.json().get('opportunitiesData', [])
+    return resp.json()
+
+def fetch_opportunities(query, limit, posted_from, posted_to, offset=0):
+    return fetch_page(query, limit, posted_from, posted_to, offset).get('opportunitiesData', [])
+
+def iter_opportunities(query, posted_from, posted_to, limit=LIMIT, session=None, stats=None):
+    """
+    Every opportunity posted in the window, one page of `limit` at a time,
+    until totalRecords is reached or a page comes back short.
+    """
+    page = 0
+    seen = 0
+    while True:
+        data = fetch_page(query, limit, posted_from, posted_to, page if OFFSET_IS_PAGE else page * limit, session)
+        opps = data.get('opportunitiesData') or []
+        if stats is not None:
+            stats["pages"] = stats.get("pages", 0) + 1
+        yield from opps
+        seen += len(opps)
+        total = data.get('totalRecords')
+        if len(opps) < limit or (total is not None and seen >= int(total)):
+            return
+        page += 1
+
+def date_windows(start, end, days=MAX_WINDOW_DAYS):
+    """
+    (postedFrom, postedTo) MM/dd/yyyy pairs covering start..end, each at most `days` long.
+    """
+    windows = []
+    while start <= end:
+        stop = min(end, start + timedelta(days=days))
+        windows.append((start.strftime("%m/%d/%Y"), stop.strftime("%m/%d/%Y")))
+        start = stop + timedelta(days=1)
+    return windows
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def record_hash(opp):
+    return _digest(opp)
+
+def attachments_hash(opp):
+    return _digest(sorted(opp.get('resourceLinks') or []) + [opp.get('additionalInfoLink') or ''])
+
+class SyncState:
+    """
+    Per-query watermarks, and per (query, noticeId) the record as last
+    synced with hashes of it and of its attachment list. attachments_hash
+    stays NULL until every attachment of the notice has been fetched. A
+    notice returned by two queries has a row under each, so one query's
+    sync or forget() leaves the other's rows alone.
+    """
+
+    def __init__(self, path=STATE_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS watermarks ("
+            "query TEXT PRIMARY KEY, posted_to TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS notices ("
+            "query TEXT NOT NULL, notice_id TEXT NOT NULL, posted_date TEXT, record TEXT NOT NULL, "
+            "record_hash TEXT NOT NULL, attachments_hash TEXT, updated REAL NOT NULL, PRIMARY KEY (query, notice_id))"
+        )
+        # state files from before rows were keyed per query
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'opportunities'").fetchone():
+            self.conn.execute(
+                "INSERT OR IGNORE INTO notices (query, notice_id, posted_date, record, record_hash, attachments_hash, updated) "
+                "SELECT query, notice_id, posted_date, record, record_hash, attachments_hash, updated FROM opportunities")
+            self.conn.execute("DROP TABLE opportunities")
+        self.conn.commit()
+
+    def watermark(self, query):
+        row = self.conn.execute("SELECT posted_to FROM watermarks WHERE query = ?", (query,)).fetchone()
+        return date.fromisoformat(row[0]) if row else None
+
+    def set_watermark(self, query, day):
+        self.conn.execute("INSERT OR REPLACE INTO watermarks (query, posted_to, updated) VALUES (?, ?, ?)",
+                          (query, day.isoformat(), time.time()))
+        self.conn.commit()
+
+    def known(self, query):
+        rows = self.conn.execute(
+            "SELECT notice_id, record_hash, attachments_hash FROM notices WHERE query = ?", (query,))
+        return {notice_id: (rh, ah) for notice_id, rh, ah in rows}
+
+    def pending(self, query):
+        """
+        Records of the query's notices whose attachments are not all fetched yet.
+        """
+        rows = self.conn.execute(
+            "SELECT record FROM notices WHERE query = ? AND attachments_hash IS NULL", (query,))
+        return [json.loads(record) for record, in rows]
+
+    def mark(self, query, opps, attachments_done):
+        """
+        Save opps as synced. attachments_done: noticeIds whose attachments
+        are all fetched; the rest keep a NULL attachments_hash.
+        """
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO notices "
+            "(notice_id, query, posted_date, record, record_hash, attachments_hash, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(opp['noticeId'], query, opp.get('postedDate'), json.dumps(opp), record_hash(opp),
+              attachments_hash(opp) if opp['noticeId'] in attachments_done else None, now) for opp in opps],
+        )
+        self.conn.commit()
+
+    def forget(self, query):
+        self.conn.execute("DELETE FROM watermarks WHERE query = ?", (query,))
+        self.conn.execute("DELETE FROM notices WHERE query = ?", (query,))
+        self.conn.commit()
 
 def get_extension_from_content(content):
-    if content[:4] == b'%PDF':
-        return '.pdf'
-    return ''
+    return downloader.extension_for(content)
 
-def download_attachments(opps, download_folder, min_size_bytes=50):
-    os.makedirs(download_folder, exist_ok=True)
+def _attachment_name(link, fallback, prefix):
+    file_name = os.path.basename(link.split('?')[0])
+    if not file_name or file_name.lower() == 'download':
+        return fallback
+    return prefix + file_name
+
+def attachment_jobs(opps):
+    """
+    (url, file name, notice id, kind) for every resource link and additionalInfoLink.
+    """
+    jobs = []
     for opp in opps:
         notice_id = opp.get('noticeId')
         resource_links = opp.get('resourceLinks')
-        if resource_links:
-            for idx, link in enumerate(resource_links):
-                try:
-                    file_name = os.path.basename(link.split('?')[0])
-                    if not file_name or file_name.lower() == 'download':
-                        file_name = f"{notice_id}_resource_{idx}"
-                    else:
-                        file_name = f"{notice_id}_resource_{idx}_" + file_name
-                    r = requests.get(link)
-                    ext = get_extension_from_content(r.content)
-                    file_path = os.path.join(download_folder, file_name + ext)
-                    if r.status_code == 200:
-                        if len(r.content) >= min_size_bytes:
-                            with open(file_path, 'wb') as f:
-                                f.write(r.content)
-                            print(f"Downloaded resource for {notice_id} to {file_path}")
-                        else:
-                            print(f"Skipped small file for {notice_id}: {file_name} ({len(r.content)} bytes)")
-                    else:
-                        print(f"Failed to download resource for {notice_id}: {r.status_code}")
-                except Exception as e:
-                    print(f"Error downloading resource for {notice_id}: {e}")
+        for idx, link in enumerate(resource_links or []):
+            name = _attachment_name(link, f"{notice_id}_resource_{idx}", f"{notice_id}_resource_{idx}_")
+            jobs.append((link, name, notice_id, 'resource'))
         addl_link = opp.get('additionalInfoLink')
         if addl_link:
-            try:
-                file_name = os.path.basename(addl_link.split('?')[0])
-                if not file_name or file_name.lower() == 'download':
-                    file_name = f"{notice_id}_attachment"
-                else:
-                    file_name = f"{notice_id}_attachment_" + file_name
-                r = requests.get(addl_link)
-                ext = get_extension_from_content(r.content)
-                file_path = os.path.join(download_folder, file_name + ext)
-                if r.status_code == 200:
-                    if len(r.content) >= min_size_bytes:
-                        with open(file_path, 'wb') as f:
-                            f.write(r.content)
-                        print(f"Downloaded attachment for {notice_id} to {file_path}")
-                    else:
-                        print(f"Skipped small attachment for {notice_id}: {file_name} ({len(r.content)} bytes)")
-                else:
-                    print(f"Failed to download attachment for {notice_id}: {r.status_code}")
-            except Exception as e:
-                print(f"Error downloading attachment for {notice_id}: {e}")
+            name = _attachment_name(addl_link, f"{notice_id}_attachment", f"{notice_id}_attachment_")
+            jobs.append((addl_link, name, notice_id, 'attachment'))
         if not resource_links and not addl_link:
             print(f"No attachments for {notice_id}")
+    return jobs
+
+def download_attachments(opps, download_folder, min_size_bytes=50, workers=downloader.DOWNLOAD_WORKERS):
+    """
+    Download every attachment concurrently (see downloader.py). Returns the result dicts.
+    """
+    os.makedirs(download_folder, exist_ok=True)
+    jobs = attachment_jobs(opps)
+    owners = {(url, name): (notice_id, kind) for url, name, notice_id, kind in jobs}
+    results = []
+    for r in downloader.Downloader(workers=workers, min_size=min_size_bytes).iter_download(
+            (url, download_folder, name) for url, name, _, _ in jobs):
+        notice_id, kind = owners[(r["url"], r["name"])]
+        r["notice_id"] = notice_id
+        if r["status"] == "downloaded":
+            print(f"Downloaded {kind} for {notice_id} to {r['path']}")
+        elif r["status"] == "exists":
+            print(f"Already have {kind} for {notice_id}: {r['path']}")
+        elif r["status"] == "too_small":
+            print(f"Skipped small {kind} for {notice_id}: {r['name']} ({r['bytes']} bytes)")
+        elif r["status"] == "http_error":
+            print(f"Failed to download {kind} for {notice_id}: {r['http_status']}")
+        else:
+            print(f"Error downloading {kind} for {notice_id}: {r['error'] or r['status']}")
+        results.append(r)
+    return results
 
 def extract_text_from_pdfs(pdf_folder, output_folder):
     os.makedirs(output_folder, exist_ok=True)
@@ -94,11 +226,8 @@ def extract_text_from_pdfs(pdf_folder, output_folder):
             pdf_path = os.path.join(pdf_folder, filename)
             output_path = os.path.join(output_folder, filename + '.txt')
             try:
-                with open(pdf_path, 'rb') as f:
-                    reader = PyPDF2.PdfReader(f)
-                    text = ''
-                    for page in reader.pages:
-                        text += page.extract_text() or ''
+                # shared page store: parsed once, no OCR here (as with the old PyPDF2 pass)
+                text = page_store.document_text(pdf_path, run_ocr=False)
                 with open(output_path, 'w', encoding='utf-8') as out:
                     out.write(text)
                 print(f"Extracted text from {filename} to {output_path}")
@@ -106,6 +235,8 @@ def extract_text_from_pdfs(pdf_folder, output_folder):
                 print(f"Failed to extract {filename}: {e}")
 
 def create_opportunity_pdf(opp, output_folder, suffix=None):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
     os.makedirs(output_folder, exist_ok=True)
     notice_id = opp.get('noticeId', 'unknown')
     if suffix:
@@ -170,10 +301,127 @@ def create_opportunity_pdf(opp, output_folder, suffix=None):
     c.save()
     print(f"Created PDF for {notice_id} at {pdf_path}")
 
+def export_opportunity_pdfs(opps, output_folder, workers=None):
+    """
+    Optional export: one reportlab PDF per opportunity, rendered across a
+    process pool. The fields themselves live in opportunity_store.
+    Returns the number of PDFs written.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    opps = list(opps)
+    workers = max(1, min(workers or PDF_WORKERS, len(opps)))
+    if workers == 1 or len(opps) < 2:
+        for opp in opps:
+            create_opportunity_pdf(opp, output_folder)
+        return len(opps)
+    os.makedirs(output_folder, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        list(pool.map(create_opportunity_pdf, opps, [output_folder] * len(opps), chunksize=16))
+    return len(opps)
+
+def _fetched_all(result):
+    # a retry can fix connection errors, 429s and 5xx; anything else is final
+    if result["status"] == "error":
+        return False
+    return not (result["status"] == "http_error" and (result["http_status"] == 429 or (result["http_status"] or 0) >= 500))
+
+def sync(query=QUERY, state=None, download_folder=ATTACHMENTS_DIR, pdf_folder=OPPORTUNITY_PDFS_DIR, full=False,
+         today=None, limit=LIMIT, session=None, make_pdfs=False, workers=downloader.DOWNLOAD_WORKERS, store=None):
+    """
+    Incremental sync of one query. Fetches every page posted since the
+    query's watermark (less SYNC_OVERLAP_DAYS). New and changed records go
+    into the opportunity store in one transaction. Downloads attachments
+    only for notices that are new, whose attachment list changed, or whose
+    downloads failed last run. With make_pdfs, also renders PDFs for new or
+    changed records. Returns the delta report.
+    """
+    start = time.perf_counter()
+    state = state or SyncState()
+    store = store or opportunity_store.OpportunityStore()
+    today = today or date.today()
+    mark = None if full else state.watermark(query)
+    since = mark - timedelta(days=SYNC_OVERLAP_DAYS) if mark else today - timedelta(days=SYNC_INITIAL_DAYS)
+    stats = {"pages": 0}
+    fetched = {}
+    for window_from, window_to in date_windows(since, today):
+        for opp in iter_opportunities(query, window_from, window_to, limit, session, stats):
+            if opp.get('noticeId'):
+                fetched[opp['noticeId']] = opp
+
+    known = state.known(query)
+    report = {"query": query, "posted_from": since.isoformat(), "posted_to": today.isoformat(), "pages": stats["pages"],
+              "fetched": len(fetched), "new": [], "changed": [], "attachments_changed": [], "retried": [],
+              "unchanged": 0}
+    to_save, to_download, to_render, attachments_done = [], [], [], set()
+    for notice_id, opp in fetched.items():
+        rh, ah = record_hash(opp), attachments_hash(opp)
+        old_rh, old_ah = known.get(notice_id, (None, None))
+        if notice_id not in known:
+            report["new"].append(notice_id)
+        elif (old_rh, old_ah) == (rh, ah):
+            report["unchanged"] += 1
+            continue
+        elif old_rh == rh:
+            report["retried"].append(notice_id)
+        else:
+            report["changed"].append(notice_id)
+            if old_ah is not None and old_ah != ah:
+                report["attachments_changed"].append(notice_id)
+        to_save.append(opp)
+        if old_rh != rh:
+            to_render.append(opp)
+        if old_ah != ah:
+            to_download.append(opp)
+        else:
+            attachments_done.add(notice_id)
+    # failed downloads of notices posted before this window
+    for opp in state.pending(query):
+        if opp['noticeId'] not in fetched:
+            report["retried"].append(opp['noticeId'])
+            to_download.append(opp)
+    stored = store.upsert_many(to_save)
+    state.mark(query, to_save, attachments_done)
+    state.set_watermark(query, today)
+
+    results = download_attachments(to_download, download_folder, workers=workers) if to_download else []
+    retry = {r["notice_id"] for r in results if not _fetched_all(r)}
+    state.mark(query, to_download, {opp['noticeId'] for opp in to_download} - retry)
+    if make_pdfs:
+        export_opportunity_pdfs(to_render, pdf_folder)
+
+    downloads = {}
+    for r in results:
+        downloads[r["status"]] = downloads.get(r["status"], 0) + 1
+    report.update({
+        "downloads": downloads,
+        "megabytes": round(sum(r["bytes"] for r in results if r["status"] == "downloaded") / 1e6, 2),
+        "retry_next_run": sorted(retry),
+        "stored": stored,
+        "pdfs": len(to_render) if make_pdfs else 0,
+        "seconds": round(time.perf_counter() - start, 2),
+    })
+    return report
+
+def main():
+    def arg(name, default):
+        if name in sys.argv:
+            return sys.argv[sys.argv.index(name) + 1]
+        return default
+    if '--sync' not in sys.argv:
+        opps = fetch_opportunities(QUERY, LIMIT, posted_from, posted_to)
+        print(f"Fetched {len(opps)} opportunities.")
+        print(f"Stored: {opportunity_store.OpportunityStore().upsert_many(opps)}")
+        download_attachments(opps, ATTACHMENTS_DIR)
+        if '--pdfs' in sys.argv:
+            export_opportunity_pdfs(opps, OPPORTUNITY_PDFS_DIR)
+        return
+    report = sync(arg('--query', QUERY), full='--full' in sys.argv, make_pdfs='--pdfs' in sys.argv)
+    print(f"[SAM.py] {report['query']}: {report['fetched']} fetched over {report['pages']} pages, "
+          f"{len(report['new'])} new, {len(report['changed'])} changed "
+          f"({len(report['attachments_changed'])} with new attachments), {len(report['retried'])} retried, "
+          f"{report['unchanged']} unchanged, {report['megabytes']} MB in {report['seconds']}s", file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
 if __name__ == "__main__":
-    opps = fetch_opportunities(QUERY, LIMIT, posted_from, posted_to)
-    print(f"Fetched {len(opps)} opportunities.")
-    download_attachments(opps, os.path.join(os.path.dirname(__file__), '../data/sam_api_attachments'))
-    pdf_output_folder = os.path.join(os.path.dirname(__file__), '../data/sam_api_opportunity_pdfs')
-    for opp in opps:
-        create_opportunity_pdf(opp, pdf_output_folder)
+    main()
@@ -0,0 +1,355 @@
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+'''Pooled, concurrent, resumable file downloads.
+
+One requests.Session (connection pool sized to the worker count) is shared
+by DOWNLOAD_WORKERS threads. Each host gets at most DOWNLOAD_HOST_CONCURRENCY
+requests in flight and DOWNLOAD_HOST_RPS request starts per second; 429 and
+5xx answers are retried with backoff (honouring Retry-After).
+
+Bodies are streamed to {dest_dir}/.partial/<sha1 of name and url>.part,
+so two jobs fetching one URL under different names keep separate partial
+files. The size is checked from Content-Length before the body is read,
+and again while streaming. The first chunk's magic bytes pick the file
+extension. A .part file left behind by an interrupted run is resumed with
+a Range request (If-Range on the saved ETag / Last-Modified); a server
+that answers 200 instead restarts it. The finished file is renamed into
+place, and a later run skips it, unless validators (a saved ETag /
+Last-Modified) are passed. In that case a conditional request re-fetches
+it only if it changed.
+
+Usage: python dataCollection/downloader.py <dest_dir> URL [URL ...]'''
+
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', 8))
+DOWNLOAD_HOST_CONCURRENCY = int(os.getenv('DOWNLOAD_HOST_CONCURRENCY', 4))
+DOWNLOAD_HOST_RPS = float(os.getenv('DOWNLOAD_HOST_RPS', 5))
+DOWNLOAD_RETRIES = int(os.getenv('DOWNLOAD_RETRIES', 4))
+DOWNLOAD_TIMEOUT = float(os.getenv('DOWNLOAD_TIMEOUT', 60))
+# attachments above this are not worth keeping (drawings sets are far smaller)
+DOWNLOAD_MAX_BYTES = int(os.getenv('DOWNLOAD_MAX_BYTES', 500 * 1024 * 1024))
+CHUNK_SIZE = 1 << 16
+PARTIAL_DIR = '.partial'
+
+MAGIC = [
+    (b'%PDF', '.pdf'),
+]
+
+
+def extension_for(first_bytes):
+    for magic, ext in MAGIC:
+        if first_bytes.startswith(magic):
+            return ext
+    return ''
+
+
+class HostLimiter:
+    """
+    Per-host concurrency cap and request-start rate (evenly spaced starts).
+    """
+
+    def __init__(self, concurrency=DOWNLOAD_HOST_CONCURRENCY, rps=DOWNLOAD_HOST_RPS):
+        self.concurrency = concurrency
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self.lock = threading.Lock()
+        self.slots = {}
+        self.next_start = {}
+
+    def _slot(self, host):
+        with self.lock:
+            if host not in self.slots:
+                self.slots[host] = threading.BoundedSemaphore(self.concurrency)
+            return self.slots[host]
+
+    def acquire(self, host):
+        self._slot(host).acquire()
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start.get(host, now))
+            self.next_start[host] = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def release(self, host):
+        self._slot(host).release()
+
+    def backoff(self, host, seconds):
+        # a 429 pushes every later request to this host back, not just the retried one
+        with self.lock:
+            self.next_start[host] = max(self.next_start.get(host, 0.0), time.monotonic() + seconds)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size=DOWNLOAD_WORKERS):
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=max(pool_size, 1))
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+    return _session
+
+
+def _partial_paths(dest_dir, url, name):
+    # keyed on the target name too: two jobs fetching one URL under different
+    # names must not share (and resume from) each other's partial bytes
+    key = hashlib.sha1(f"{name}\0{url}".encode('utf-8')).hexdigest()
+    base = os.path.join(dest_dir, PARTIAL_DIR, key)
+    return base + '.part', base + '.json'
+
+
+# _attempt result meaning "retry after the usual backoff"
+RETRY = object()
+
+
+def _retry_after(response):
+    try:
+        return min(60.0, float(response.headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return RETRY
+
+
+def backoff_delay(attempt, response=None):
+    """
+    Seconds to wait before retry `attempt` (0-based): the response's
+    Retry-After when it has one, otherwise jittered exponential backoff.
+    """
+    retry = _retry_after(response) if response is not None else RETRY
+    return retry if retry is not RETRY else min(30.0, 0.5 * 2 ** attempt) * (1 + random.random() * 0.25)
+
+
+def _drain(response):
+    # a short body read to the end lets the connection go back to the pool
+    # instead of being closed with the response
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and int(length) <= CHUNK_SIZE:
+        response.content
+
+
+def existing(dest_dir, name):
+    """
+    Path of an already finished download of `name` (with any known extension), or None.
+    """
+    for ext in [''] + [ext for _, ext in MAGIC]:
+        path = os.path.join(dest_dir, name + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class Downloader:
+    """
+    download(url, dest_dir, name) for one file, download_many(jobs) for many.
+    Every call returns a result dict:
+        {"url", "name", "path", "status": "downloaded" | "exists" | "not_modified" | "too_small"
+         | "too_large" | "wrong_type" | "http_error" | "error", "bytes", "resumed", "http_status", "error",
+         "etag", "last_modified"}
+    accept: extensions (from MAGIC, '' for unknown) to keep; the body is
+    abandoned after its first chunk when it is anything else.
+    """
+
+    def __init__(self, workers=DOWNLOAD_WORKERS, min_size=0, max_size=DOWNLOAD_MAX_BYTES,
+                 retries=DOWNLOAD_RETRIES, timeout=DOWNLOAD_TIMEOUT, limiter=None, session=None, verify=True,
+                 accept=None):
+        self.workers = workers
+        self.accept = set(accept) if accept is not None else None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.retries = retries
+        self.timeout = timeout
+        self.limiter = limiter or HostLimiter()
+        self.session = session or get_session(workers)
+        self.verify = verify
+
+    def download(self, url, dest_dir, name, validators=None):
+        """
+        validators: {"etag", "last_modified"} saved from an earlier result. When
+        given, a finished file is revalidated instead of skipped.
+        """
+        result = {"url": url, "name": name, "path": None, "status": None, "bytes": 0, "resumed": False,
+                  "http_status": None, "error": None, "etag": None, "last_modified": None}
+        done = existing(dest_dir, name)
+        if done and not (validators and (validators.get('etag') or validators.get('last_modified'))):
+            result.update(status="exists", path=done, bytes=os.path.getsize(done))
+            return result
+        conditional = {}
+        if done:
+            if validators.get('etag'):
+                conditional['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                conditional['If-Modified-Since'] = validators['last_modified']
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire(host)
+            try:
+                retry = self._attempt(url, dest_dir, name, result, conditional)
+            except Exception as e:
+                # connection reset / timeout mid-body: the .part file keeps what arrived
+                retry = RETRY
+                result.update(status="error", error=f"{type(e).__name__}: {e}")
+            finally:
+                self.limiter.release(host)
+            if retry is None:
+                return result
+            if attempt == self.retries:
+                break
+            delay = retry if retry is not RETRY else backoff_delay(attempt)
+            if result["http_status"] == 429:
+                self.limiter.backoff(host, delay)
+            print(f"[downloader.py] {url}: {result['error']}, retrying in {delay:.1f}s", file=sys.stderr, flush=True)
+            time.sleep(delay)
+        return result
+
+    def _attempt(self, url, dest_dir, name, result, conditional=None):
+        """
+        One request. Returns None when finished (any final status), otherwise
+        the server's Retry-After seconds or RETRY.
+        """
+        part_path, meta_path = _partial_paths(dest_dir, url, name)
+        os.makedirs(os.path.dirname(part_path), exist_ok=True)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        meta = {}
+        if offset and os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        headers = {} if offset else dict(conditional or {})
+        if offset:
+            headers['Range'] = f"bytes={offset}-"
+            validator = meta.get('etag') or meta.get('last_modified')
+            if validator:
+                headers['If-Range'] = validator
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout, verify=self.verify) as r:
+            result.update(http_status=r.status_code, etag=r.headers.get('ETag'),
+                          last_modified=r.headers.get('Last-Modified'))
+            if r.status_code not in (200, 206):
+                _drain(r)
+            if r.status_code == 304 and conditional:
+                done = existing(dest_dir, name)
+                result.update(status="not_modified", path=done, bytes=os.path.getsize(done), error=None)
+                return None
+            if r.status_code == 429 or r.status_code >= 500:
+                result.update(status="http_error", error=f"HTTP {r.status_code}")
+                return _retry_after(r)
+            if r.status_code == 416 and offset:
+                # the .part already holds the whole body
+                result.update(etag=meta.get('etag'), last_modified=meta.get('last_modified'))
+                return self._finish(part_path, meta_path, dest_dir, name, offset, result)
+            if r.status_code not in (200, 206):
+                result.update(status="http_error", error=f"HTTP {r.status_code}")
+                return None
+            resumed = r.status_code == 206 and offset > 0
+            if not resumed:
+                offset = 0
+            length = r.headers.get('Content-Length')
+            total = offset + int(length) if length and length.isdigit() else None
+            if total is not None and total < self.min_size:
+                _drain(r)
+                result.update(status="too_small", bytes=total)
+                return None
+            if total is not None and total > self.max_size:
+                result.update(status="too_large", bytes=total)
+                return None
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({"url": url, "etag": r.headers.get('ETag'), "last_modified": r.headers.get('Last-Modified'),
+                           "total": total}, f)
+            size = offset
+            with open(part_path, 'ab' if resumed else 'wb') as f:
+                for chunk in r.iter_content(CHUNK_SIZE):
+                    if size == 0 and self.accept is not None and extension_for(chunk) not in self.accept:
+                        # e.g. an HTML error page served with status 200
+                        f.close()
+                        self._discard(part_path, meta_path)
+                        result.update(status="wrong_type", error=f"unexpected content {chunk[:16]!r}")
+                        return None
+                    size += len(chunk)
+                    if size > self.max_size:
+                        f.close()
+                        self._discard(part_path, meta_path)
+                        result.update(status="too_large", bytes=size)
+                        return None
+                    f.write(chunk)
+            result["resumed"] = resumed
+            if total is not None and size < total:
+                raise IOError(f"connection closed at {size} of {total} bytes")
+        return self._finish(part_path, meta_path, dest_dir, name, size, result)
+
+    def _finish(self, part_path, meta_path, dest_dir, name, size, result):
+        if size < self.min_size:
+            self._discard(part_path, meta_path)
+            result.update(status="too_small", bytes=size)
+            return None
+        with open(part_path, 'rb') as f:
+            ext = extension_for(f.read(8))
+        path = os.path.join(dest_dir, name + ext)
+        previous = existing(dest_dir, name)
+        if previous and previous != path:
+            # a revalidated file whose type changed
+            os.remove(previous)
+        os.replace(part_path, path)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        result.update(status="downloaded", path=path, bytes=size, error=None)
+        return None
+
+    @staticmethod
+    def _discard(part_path, meta_path):
+        for path in (part_path, meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def iter_download(self, jobs):
+        """
+        Download (url, dest_dir, name) jobs across the worker threads and
+        yield each result as it finishes.
+        """
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            futures = [pool.submit(self.download, url, dest_dir, name) for url, dest_dir, name in jobs]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def download_many(self, jobs):
+        return list(self.iter_download(jobs))
+
+
+def summarize(results, seconds):
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return {
+        "files": len(results),
+        "statuses": counts,
+        "resumed": sum(1 for r in results if r["resumed"]),
+        "megabytes": round(sum(r["bytes"] for r in results if r["status"] == "downloaded") / 1e6, 2),
+        "seconds": round(seconds, 2),
+    }
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(json.dumps({"error": "Usage: downloader.py <dest_dir> URL [URL ...]"}))
+        sys.exit(1)
+    dest_dir = sys.argv[1]
+    jobs = [(url, dest_dir, os.path.basename(urlsplit(url).path) or hashlib.sha1(url.encode()).hexdigest()[:12])
+            for url in sys.argv[2:]]
+    start = time.perf_counter()
+    results = Downloader().download_many(jobs)
+    for r in results:
+        print(f"[downloader.py] {r['status']}: {r['url']} -> {r['path'] or r['error'] or ''}", file=sys.stderr)
+    print(json.dumps(summarize(results, time.perf_counter() - start), indent=2))
+
+
+if __name__ == "__main__":
+    main()
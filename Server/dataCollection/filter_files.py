@@ -1,47 +1,441 @@
 import os
+import re
+import sys
+import json
+import time
 import shutil
-from PyPDF2 import PdfReader
-import fitz  # PyMuPDF
+import sqlite3
+import hashlib
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
-def is_likely_rfp(filename):
-    filename = filename.lower()
-    include = ["rfp", "solicitation", "statement", "sow", "requirement", "spec"]
-    exclude = ["amend", "qa", "sf1449", "mod", "cover", "pricing", "addendum", "attachment"]
-    return any(word in filename for word in include) and not any(word in filename for word in exclude)
-
-def check_pdf_for_rfp_keywords(file_path, pages_to_check=3):
-    keywords = [
-        "request for proposal", "solicitation", "statement of work", "section b", "section m",
-        "proposals due", "closing date", "requirement", "specification"
-    ]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'prep'))
+import page_store
+import text_index
+
+'''Sort downloaded attachments into RFPs and everything else.
+
+Each PDF gets a score with the evidence behind it: keyword hits in its
+first pages (weighted by KEYWORDS) plus FILENAME_WEIGHT when the file name
+looks like an RFP (include word, no exclude word). A score of at least
+KEEP_SCORE keeps it. Every hit is counted and the first one per keyword
+is kept in context, so a verdict can be reviewed without opening the PDF.
+
+Content verdicts are cached by the PDF's sha256 (page_store's content hash)
+together with a fingerprint of the rules, so a re-run only reads new files
+and a rule change re-reads everything. Files to read are spread over a
+process pool; the text comes from page_store, so it is parsed once for
+every later stage too. Documents already in text_index's full-text index
+are classified from it instead: one keyword query returns only their
+matching first pages, and a document with none scores 0 without its text
+being read. Both paths match keywords the same way, in one pass, where a
+word starts ("requirements" counts, "nonsolicitation" does not), so they
+give the same verdicts. RFP_TEXT_INDEX=0 turns the index path off.
+
+--dry-run writes a manifest (one entry per file: action, destination,
+score, evidence) instead of moving anything; --apply moves files as a
+reviewed manifest says.
+
+Usage: python dataCollection/filter_files.py [SOURCE_DIR] [--dry-run [MANIFEST]] [--apply MANIFEST]
+                                             [--workers N] [--pages 3] [--json]'''
+
+SOURCE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../data/sam_api_attachments'))
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'cache'))
+VERDICTS_PATH = os.getenv('RFP_VERDICTS_PATH', os.path.join(CACHE_DIR, 'rfp_verdicts.sqlite3'))
+CLASSIFY_WORKERS = int(os.getenv('RFP_CLASSIFY_WORKERS', os.cpu_count() or 1))
+PAGES_TO_CHECK = 3
+MANIFEST_NAME = 'filter_manifest.json'
+
+FILENAME_INCLUDE = ("rfp", "solicitation", "statement", "sow", "requirement", "spec")
+FILENAME_EXCLUDE = ("amend", "qa", "sf1449", "mod", "cover", "pricing", "addendum", "attachment")
+FILENAME_WEIGHT = 3
+# content keyword -> weight; any single hit reaches the default KEEP_SCORE
+KEYWORDS = {
+    "request for proposal": 3,
+    "statement of work": 3,
+    "solicitation": 2,
+    "proposals due": 2,
+    "section b": 1,
+    "section m": 1,
+    "closing date": 1,
+    "requirement": 1,
+    "specification": 1,
+}
+KEEP_SCORE = float(os.getenv('RFP_KEEP_SCORE', 1))
+USE_TEXT_INDEX = os.getenv('RFP_TEXT_INDEX', '1') != '0'
+# how content keywords match; part of the verdict cache key
+MATCH_RULE = "word-start"
+# characters of text kept on each side of a hit as evidence
+CONTEXT_CHARS = 40
+
+
+# between the words of a keyword: any run of characters that is not a
+# letter or digit, as for the full-text index's tokenizer
+_GAP = r'[\W_]+'
+
+
+def _trie_pattern(keywords):
+    """
+    One regex alternation for the keywords, factored by shared prefixes
+    ("s(?:ection...|olicitation|...)") so the engine tries each branch once.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def emit(node):
+        branches = [(_GAP if ch == ' ' else re.escape(ch)) + emit(child)
+                    for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # a keyword that ends here: the longer ones are tried first
+        return f'(?:{body})?' if '' in node else body
+    return emit(trie)
+
+
+class KeywordMatcher:
+    """
+    Hit count and first offset of every keyword from a fixed set of
+    lowercase keywords, found in one pass of a single compiled regex.
+    With word_start, a keyword only matches where a word starts and may run
+    on into a longer word ("requirement" finds "requirements", not
+    "nonrequirement"), the rule text_index.keyword_query gives the
+    full-text index, so content verdicts are the same whether the index or
+    the page text supplied the pages. Without it, keywords match anywhere
+    (file names such as "FinalRFP.pdf").
+    """
+
+    def __init__(self, keywords, word_start=True):
+        self.keywords = tuple(sorted(set(keywords)))
+        self.word_start = word_start
+        self.pattern = re.compile(_trie_pattern(self.keywords))
+
+    def search(self, text):
+        """
+        {keyword: (count, first offset)} for the keywords in `text` (lowercased by the caller).
+        """
+        found = {}
+        search = self.pattern.search
+        match = search(text)
+        while match:
+            at = match.start()
+            if self.word_start and at and text[at - 1].isalnum():
+                # inside a word; a keyword may still start within the match
+                match = search(text, at + 1)
+                continue
+            keyword = _GAP_RE.sub(' ', match.group())
+            count, first = found.get(keyword, (0, at))
+            found[keyword] = (count + 1, first)
+            match = search(text, match.end())
+        return found
+
+
+_GAP_RE = re.compile(_GAP)
+_filename_matcher = KeywordMatcher(FILENAME_INCLUDE + FILENAME_EXCLUDE, word_start=False)
+_content_matcher = KeywordMatcher(KEYWORDS)
+_keyword_query = text_index.keyword_query(KEYWORDS)
+
+
+def rules_fingerprint(pages_to_check=PAGES_TO_CHECK):
+    # MATCH_RULE: verdicts cached under substring matching are not reused
+    return hashlib.sha1(json.dumps([KEYWORDS, pages_to_check, MATCH_RULE], sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def filename_evidence(filename):
+    """
+    (score, evidence) from the file name alone.
+    """
+    found = _filename_matcher.search(filename.lower())
+    include = [w for w in FILENAME_INCLUDE if w in found]
+    exclude = [w for w in FILENAME_EXCLUDE if w in found]
+    evidence = [{"where": "filename", "keyword": w, "exclude": w in exclude} for w in include + exclude]
+    return (FILENAME_WEIGHT if include and not exclude else 0), evidence
+
+
+def content_evidence(pages):
+    """
+    (score, evidence) from [(page_number, text)]: each keyword found scores
+    its weight once; evidence has its hit count and first hit in context.
+    """
+    hits = {}
+    for page_number, text in pages:
+        for keyword, (count, at) in _content_matcher.search(text.lower()).items():
+            hit = hits.get(keyword)
+            if hit is None:
+                context = ' '.join(text[max(0, at - CONTEXT_CHARS):at + len(keyword) + CONTEXT_CHARS].split())
+                hits[keyword] = {"where": f"page {page_number}", "keyword": keyword, "count": count, "context": context}
+            else:
+                hit["count"] += count
+    evidence = sorted(hits.values(), key=lambda h: (-KEYWORDS[h["keyword"]], h["keyword"]))
+    return sum(KEYWORDS[k] for k in hits), evidence
+
+
+def classify_content(file_path, pages_to_check=PAGES_TO_CHECK):
+    """
+    Content score and evidence for one PDF (text layer of the first
+    pages_to_check pages). Runs in pool processes; an unreadable file
+    reports its error instead of raising.
+    """
+    start = time.perf_counter()
     try:
-        doc = fitz.open(file_path)
-        text = ""
-        for page in doc[:pages_to_check]:
-            text += page.get_text().lower()
-        return any(keyword in text for keyword in keywords)
+        pages = list(page_store.iter_pages(file_path, run_ocr=False, last=pages_to_check))
+        score, evidence = content_evidence(pages)
+        return {"score": score, "evidence": evidence, "seconds": round(time.perf_counter() - start, 3)}
     except Exception as e:
-        print(f"Error reading {file_path}: {e}")
-        return False
+        return {"score": 0, "evidence": [], "error": str(e), "seconds": round(time.perf_counter() - start, 3)}
+
 
-def filter_pdfs_by_content(source_dir, keep_dir, discard_dir, pages_to_check=3):
+def classify_indexed(index, doc_hashes, pages_to_check=PAGES_TO_CHECK):
+    """
+    classify_content() for documents in the full-text index, from the first
+    pages that match a keyword, all fetched by one query. Returns {hash: verdict}.
+    """
+    start = time.perf_counter()
+    matches = index.matching_pages(doc_hashes, _keyword_query, last=pages_to_check)
+    seconds = round((time.perf_counter() - start) / max(1, len(doc_hashes)), 3)
+    verdicts = {}
+    for doc_hash in doc_hashes:
+        score, evidence = content_evidence(matches.get(doc_hash, []))
+        verdicts[doc_hash] = {"score": score, "evidence": evidence, "seconds": seconds}
+    return verdicts
+
+
+class VerdictCache:
+    """
+    Content verdicts by (content hash, rules fingerprint) in SQLite. Name
+    evidence is not cached: the same bytes can arrive under many names.
+    """
+
+    def __init__(self, path=VERDICTS_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            " hash TEXT NOT NULL, rules TEXT NOT NULL, score REAL NOT NULL, evidence TEXT NOT NULL,"
+            " classified REAL NOT NULL, PRIMARY KEY (hash, rules)) WITHOUT ROWID"
+        )
+        self.conn.commit()
+
+    def get_many(self, doc_hashes, rules):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT hash, score, evidence FROM verdicts WHERE rules = ? AND hash IN (SELECT value FROM json_each(?))",
+                (rules, json.dumps(list(doc_hashes)))).fetchall()
+        return {h: {"score": score, "evidence": json.loads(evidence)} for h, score, evidence in rows}
+
+    def put_many(self, rules, verdicts):
+        """
+        verdicts: [(hash, verdict)], written in one transaction.
+        """
+        now = time.time()
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO verdicts (hash, rules, score, evidence, classified) VALUES (?, ?, ?, ?, ?)",
+                    [(h, rules, v["score"], json.dumps(v["evidence"]), now) for h, v in verdicts])
+
+    def stats(self):
+        with self.lock:
+            return {"verdicts": self.conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]}
+
+
+def _create_pool(workers):
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def classify_many(pdf_paths, pages_to_check=PAGES_TO_CHECK, workers=None, cache=None, index=None):
+    """
+    Classify many PDFs. Cached content verdicts are reused, documents in
+    the full-text index are classified from it (index=False skips it) and
+    the rest are read across a process pool (inline when only one needs
+    reading) and then added to the index. Returns ({path: verdict}, stats);
+    a verdict has name, hash, score, keep, evidence, cached and, for
+    unreadable files, error.
+    """
+    start = time.perf_counter()
+    cache = cache or VerdictCache()
+    rules = rules_fingerprint(pages_to_check)
+    store = page_store.get_store()
+    hashes, errors = {}, {}
+    for path in pdf_paths:
+        try:
+            hashes[path] = store.hash_path(path)
+        except OSError as e:
+            errors[path] = str(e)
+    known = cache.get_many(set(hashes.values()), rules)
+    content, todo, queued = {}, [], set()
+    for path, doc_hash in hashes.items():
+        if doc_hash in known:
+            content[path] = dict(known[doc_hash], cached=True)
+        elif doc_hash not in queued:
+            queued.add(doc_hash)
+            todo.append(path)
+    classified = len(todo)
+    if index is None:
+        index = text_index.get_index() if USE_TEXT_INDEX else False
+    from_index = []
+    if index and todo:
+        index.sync(store, hashes={hashes[path] for path in todo})
+        indexed = index.indexed({hashes[path] for path in todo})
+        from_index = [path for path in todo if hashes[path] in indexed]
+        todo = [path for path in todo if hashes[path] not in indexed]
+        found = classify_indexed(index, [hashes[path] for path in from_index], pages_to_check)
+        _collect(((path, found[hashes[path]]) for path in from_index), hashes, rules, cache, content)
+    workers = max(1, min(workers or CLASSIFY_WORKERS, len(todo)))
+    if workers == 1:
+        results = ((path, classify_content(path, pages_to_check)) for path in todo)
+        _collect(results, hashes, rules, cache, content)
+    else:
+        with _create_pool(workers) as pool:
+            futures = [(path, pool.submit(classify_content, path, pages_to_check)) for path in todo]
+            _collect(((path, f.result()) for path, f in futures), hashes, rules, cache, content)
+    if index and todo:
+        index.sync(store, hashes={hashes[path] for path in todo})
+    by_hash = {hashes[path]: verdict for path, verdict in content.items()}
+
+    verdicts = {}
+    for path in pdf_paths:
+        name = os.path.basename(path)
+        if path in errors:
+            verdicts[path] = {"name": name, "hash": None, "score": 0, "keep": False, "evidence": [], "cached": False,
+                              "error": errors[path]}
+            continue
+        found = content.get(path) or dict(by_hash[hashes[path]], cached=True)
+        name_score, name_evidence = filename_evidence(name)
+        score = name_score + found["score"]
+        verdicts[path] = {"name": name, "hash": hashes[path], "score": score, "keep": score >= KEEP_SCORE,
+                          "evidence": name_evidence + found["evidence"], "cached": found["cached"]}
+        if found.get("error"):
+            verdicts[path]["error"] = found["error"]
+    stats = {"files": len(pdf_paths), "read": len(todo), "from_index": len(from_index),
+             "cached": len(pdf_paths) - classified - len(errors),
+             "errors": sum(1 for v in verdicts.values() if v.get("error")),
+             "kept": sum(1 for v in verdicts.values() if v["keep"]), "workers": workers if todo else 0,
+             "seconds": round(time.perf_counter() - start, 2)}
+    return verdicts, stats
+
+
+def _collect(results, hashes, rules, cache, content, batch=200):
+    done = []
+    for path, verdict in results:
+        content[path] = dict(verdict, cached=False)
+        if "error" in verdict:
+            print(f"Error reading {path}: {verdict['error']}")
+        else:
+            # unreadable files are not cached, so a fixed download is read again
+            done.append((hashes[path], verdict))
+        if len(done) >= batch:
+            cache.put_many(rules, done)
+            done = []
+    cache.put_many(rules, done)
+
+
+def is_likely_rfp(filename):
+    return filename_evidence(filename)[0] > 0
+
+
+def check_pdf_for_rfp_keywords(file_path, pages_to_check=PAGES_TO_CHECK):
+    result = classify_content(file_path, pages_to_check)
+    if "error" in result:
+        print(f"Error reading {file_path}: {result['error']}")
+    return result["score"] > 0
+
+
+def write_manifest(entries, manifest_path, stats=None):
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({"created": time.strftime('%Y-%m-%dT%H:%M:%S'), "keep_score": KEEP_SCORE, "stats": stats or {},
+                   "files": entries}, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def apply_manifest(manifest_path):
+    """
+    Move files as a (reviewed) manifest says. Entries whose source is gone
+    are reported and skipped. Returns {"moved": n, "missing": [paths]}.
+    """
+    with open(manifest_path, encoding='utf-8') as f:
+        entries = json.load(f)["files"]
+    moved, missing = 0, []
+    for entry in entries:
+        if not os.path.exists(entry["source"]):
+            missing.append(entry["source"])
+            continue
+        os.makedirs(os.path.dirname(entry["destination"]), exist_ok=True)
+        shutil.move(entry["source"], entry["destination"])
+        moved += 1
+    return {"moved": moved, "missing": missing}
+
+
+def filter_pdfs_by_content(source_dir, keep_dir, discard_dir, pages_to_check=PAGES_TO_CHECK, dry_run=False,
+                           manifest_path=None, workers=None, cache=None):
+    """
+    Classify every PDF in source_dir and move it to keep_dir or discard_dir,
+    or with dry_run only write the manifest (default source_dir/MANIFEST_NAME).
+    Returns (manifest entries, stats).
+    """
+    pdf_paths = [os.path.join(source_dir, name) for name in sorted(os.listdir(source_dir))
+                 if name.lower().endswith('.pdf')]
+    verdicts, stats = classify_many(pdf_paths, pages_to_check, workers, cache)
+    entries = []
+    for path in pdf_paths:
+        verdict = verdicts[path]
+        if verdict["hash"] is None:
+            print(f"Error processing {verdict['name']}: {verdict['error']}")
+            continue
+        action = "keep" if verdict["keep"] else "discard"
+        entries.append({"source": path, "action": action,
+                        "destination": os.path.join(keep_dir if verdict["keep"] else discard_dir, verdict["name"]),
+                        **{k: verdict[k] for k in ("score", "evidence", "cached", "hash")}})
+    if dry_run:
+        manifest_path = manifest_path or os.path.join(source_dir, MANIFEST_NAME)
+        write_manifest(entries, manifest_path, stats)
+        print(f"Dry run: wrote {len(entries)} verdicts to {manifest_path} ({stats['kept']} keep).")
+        return entries, stats
     os.makedirs(keep_dir, exist_ok=True)
     os.makedirs(discard_dir, exist_ok=True)
-    for filename in os.listdir(source_dir):
-        if filename.lower().endswith('.pdf'):
-            filepath = os.path.join(source_dir, filename)
-            try:
-                if is_likely_rfp(filename) or check_pdf_for_rfp_keywords(filepath, pages_to_check):
-                    shutil.move(filepath, os.path.join(keep_dir, filename))
-                    print(f"Kept {filename} (RFP detected by filename or content).")
-                else:
-                    shutil.move(filepath, os.path.join(discard_dir, filename))
-                    print(f"Moved {filename} to discard folder (not an RFP).")
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
+    for entry in entries:
+        name = os.path.basename(entry["source"])
+        try:
+            shutil.move(entry["source"], entry["destination"])
+            if entry["action"] == "keep":
+                print(f"Kept {name} (RFP score {entry['score']:g}).")
+            else:
+                print(f"Moved {name} to discard folder (not an RFP, score {entry['score']:g}).")
+        except Exception as e:
+            print(f"Error processing {name}: {e}")
+    return entries, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sort PDFs into RFPs and the rest by file name and content")
+    parser.add_argument('source', nargs='?', default=SOURCE_DIR)
+    parser.add_argument('--dry-run', nargs='?', const='', default=None, metavar='MANIFEST',
+                        help=f"write a manifest (default SOURCE/{MANIFEST_NAME}) instead of moving files")
+    parser.add_argument('--apply', metavar='MANIFEST', help="move files as a reviewed manifest says")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--pages', type=int, default=PAGES_TO_CHECK)
+    parser.add_argument('--json', action='store_true', help="print the run stats as JSON")
+    args = parser.parse_args()
+    if args.apply:
+        print(json.dumps(apply_manifest(args.apply), indent=2))
+        return
+    source = os.path.abspath(args.source)
+    _, stats = filter_pdfs_by_content(source, os.path.join(source, 'keep'), os.path.join(source, 'discard'),
+                                      args.pages, dry_run=args.dry_run is not None,
+                                      manifest_path=args.dry_run or None, workers=args.workers)
+    print(json.dumps(stats, indent=2) if args.json else
+          f"{stats['files']} files: {stats['kept']} kept, {stats['read']} read, {stats['from_index']} from the index, "
+          f"{stats['cached']} cached, {stats['errors']} errors in {stats['seconds']}s")
+
 
 if __name__ == "__main__":
-    source = os.path.abspath(os.path.join(os.path.dirname(__file__), '../data/sam_api_attachments'))
-    keep = os.path.join(source, 'keep')
-    discard = os.path.join(source, 'discard')
-    filter_pdfs_by_content(source, keep, discard)
\ No newline at end of file
+    main()
@@ -0,0 +1,359 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+'''Local, indexed store of SAM.gov opportunity records.
+
+One row per noticeId holds the fields that get filtered on, as columns,
+plus the full JSON record. Indexed columns: notice_id (primary key),
+naics_code, response_deadline, posted_date and classification_code.
+Title, description and agency are full-text searchable through an FTS5
+table. Triggers keep it in step with the rows.
+
+Deadlines are stored as UTC ISO timestamps ("2024-07-15T18:00:00Z"), so
+range filters compare correctly across the offsets SAM sends. upsert_many()
+writes one sync in one transaction and leaves unchanged records alone.
+query() turns keyword filters into one indexed SELECT.
+
+Usage: python dataCollection/opportunity_store.py stats
+       python dataCollection/opportunity_store.py backfill [SAM_STATE_PATH]
+       python dataCollection/opportunity_store.py query [--text Q] [--naics CODE ...] [--classification CODE ...]
+              [--set-aside CODE] [--posted-from D] [--posted-to D] [--deadline-from D] [--deadline-to D]
+              [--limit N] [--json] [--pdfs DIR]'''
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+STORE_PATH = os.getenv('OPPORTUNITY_STORE_PATH', os.path.join(DATA_DIR, 'opportunities.sqlite3'))
+
+# (column, record key); agency, description and response_deadline are derived
+FIELDS = (
+    ("notice_id", "noticeId"),
+    ("solicitation_number", "solicitationNumber"),
+    ("title", "title"),
+    ("department", "department"),
+    ("sub_tier", "subTier"),
+    ("office", "office"),
+    ("posted_date", "postedDate"),
+    ("naics_code", "naicsCode"),
+    ("classification_code", "classificationCode"),
+    ("set_aside", "typeOfSetAside"),
+    ("set_aside_description", "typeOfSetAsideDescription"),
+    ("type", "type"),
+    ("base_type", "baseType"),
+    ("active", "active"),
+    ("archive_date", "archiveDate"),
+    ("ui_link", "uiLink"),
+)
+COLUMNS = [c for c, _ in FIELDS] + ["response_deadline", "agency", "description", "description_url",
+                                    "record", "record_hash", "updated"]
+INDEXED = ("naics_code", "response_deadline", "posted_date", "classification_code")
+# bm25 weights for title, description, agency
+RANK_WEIGHTS = (10.0, 1.0, 2.0)
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def deadline_key(value):
+    """
+    A deadline (ISO string with or without offset, date or datetime) as a
+    sortable UTC string; dates and naive times are taken as given.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        moment = value
+    elif isinstance(value, date):
+        return value.isoformat()
+    else:
+        try:
+            moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return str(value)
+        if len(str(value)) == 10:
+            return moment.date().isoformat()
+    if moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return moment.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def _day(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def row_for(opp, now):
+    description = opp.get('description') or ''
+    url = description if description.startswith(('http://', 'https://')) else None
+    agency = ' / '.join(str(opp[k]) for k in ('department', 'subTier', 'office') if opp.get(k))
+    values = [opp.get(key) for _, key in FIELDS]
+    values = [v if v is None or isinstance(v, (str, int, float)) else json.dumps(v) for v in values]
+    return values + [deadline_key(opp.get('responseDeadLine')), agency, '' if url else description, url,
+                     json.dumps(opp), _digest(opp), now]
+
+
+class OpportunityStore:
+    """
+    SQLite opportunities table with column indexes and an external-content
+    FTS5 table (opportunities_fts) over title, description and agency.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        columns = ', '.join(f"{c} TEXT" for c in COLUMNS if c not in ("notice_id", "record", "record_hash", "updated"))
+        self.conn.executescript(
+            f"CREATE TABLE IF NOT EXISTS opportunities (notice_id TEXT PRIMARY KEY, {columns},"
+            " record TEXT NOT NULL, record_hash TEXT NOT NULL, updated REAL NOT NULL);"
+            + ''.join(f"CREATE INDEX IF NOT EXISTS opportunities_{c} ON opportunities ({c});" for c in INDEXED) +
+            "CREATE VIRTUAL TABLE IF NOT EXISTS opportunities_fts USING fts5("
+            " title, description, agency, content='opportunities', content_rowid='rowid', tokenize='porter unicode61');"
+            "CREATE TRIGGER IF NOT EXISTS opportunities_ai AFTER INSERT ON opportunities BEGIN"
+            " INSERT INTO opportunities_fts (rowid, title, description, agency)"
+            " VALUES (new.rowid, new.title, new.description, new.agency); END;"
+            "CREATE TRIGGER IF NOT EXISTS opportunities_ad AFTER DELETE ON opportunities BEGIN"
+            " INSERT INTO opportunities_fts (opportunities_fts, rowid, title, description, agency)"
+            " VALUES ('delete', old.rowid, old.title, old.description, old.agency); END;"
+            "CREATE TRIGGER IF NOT EXISTS opportunities_au AFTER UPDATE ON opportunities BEGIN"
+            " INSERT INTO opportunities_fts (opportunities_fts, rowid, title, description, agency)"
+            " VALUES ('delete', old.rowid, old.title, old.description, old.agency);"
+            " INSERT INTO opportunities_fts (rowid, title, description, agency)"
+            " VALUES (new.rowid, new.title, new.description, new.agency); END;"
+        )
+        self.conn.commit()
+
+    def upsert_many(self, opps):
+        """
+        Insert or update records in one transaction; records whose content
+        did not change are not rewritten. Returns {"inserted", "updated", "unchanged"}.
+        """
+        opps = [opp for opp in opps if opp.get('noticeId')]
+        now = time.time()
+        rows = [row_for(opp, now) for opp in opps]
+        placeholders = ', '.join('?' for _ in COLUMNS)
+        updates = ', '.join(f"{c} = excluded.{c}" for c in COLUMNS if c != "notice_id")
+        with self.lock:
+            with self.conn:
+                known = dict(self.conn.execute(
+                    "SELECT notice_id, record_hash FROM opportunities WHERE notice_id IN (SELECT value FROM json_each(?))",
+                    (json.dumps([opp['noticeId'] for opp in opps]),)).fetchall())
+                self.conn.executemany(
+                    f"INSERT INTO opportunities ({', '.join(COLUMNS)}) VALUES ({placeholders}) "
+                    f"ON CONFLICT (notice_id) DO UPDATE SET {updates} "
+                    "WHERE opportunities.record_hash != excluded.record_hash", rows)
+        hashes = {row[0]: row[COLUMNS.index("record_hash")] for row in rows}
+        inserted = sum(1 for n in hashes if n not in known)
+        unchanged = sum(1 for n, h in hashes.items() if known.get(n) == h)
+        return {"inserted": inserted, "updated": len(hashes) - inserted - unchanged, "unchanged": unchanged}
+
+    def delete(self, notice_ids):
+        with self.lock:
+            with self.conn:
+                return self.conn.execute(
+                    "DELETE FROM opportunities WHERE notice_id IN (SELECT value FROM json_each(?))",
+                    (json.dumps(list(notice_ids)),)).rowcount
+
+    def get(self, notice_id):
+        with self.lock:
+            row = self.conn.execute("SELECT record FROM opportunities WHERE notice_id = ?", (notice_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # CROSS JOIN keeps the text match as the outer loop; left to itself the
+    # planner may walk a filter index and re-run the MATCH once per row
+    FTS_JOIN = "opportunities_fts CROSS JOIN opportunities o ON o.rowid = opportunities_fts.rowid"
+
+    def _where(self, naics=None, classification=None, set_aside=None, posted_from=None, posted_to=None,
+               deadline_from=None, deadline_to=None, active=None, notice_ids=None):
+        clauses, params = [], []
+
+        def codes(column, values):
+            # a NAICS/PSC prefix ("2362") is a range on the index
+            values = [values] if isinstance(values, str) else list(values)
+            parts = []
+            for v in values:
+                if column == "naics_code" and len(v) < 6:
+                    parts.append(f"(o.{column} >= ? AND o.{column} < ?)")
+                    params.extend([v, v[:-1] + chr(ord(v[-1]) + 1)])
+                else:
+                    parts.append(f"o.{column} = ?")
+                    params.append(v)
+            clauses.append('(' + ' OR '.join(parts) + ')')
+
+        if naics:
+            codes("naics_code", naics)
+        if classification:
+            codes("classification_code", classification)
+        if set_aside:
+            codes("set_aside", set_aside)
+        if posted_from:
+            clauses.append("o.posted_date >= ?")
+            params.append(_day(posted_from).isoformat())
+        if posted_to:
+            clauses.append("o.posted_date <= ?")
+            params.append(_day(posted_to).isoformat())
+        if deadline_from:
+            clauses.append("o.response_deadline >= ?")
+            params.append(deadline_key(deadline_from))
+        if deadline_to:
+            bound = deadline_key(deadline_to)
+            if len(bound) == 10:
+                # a bare date includes the whole day
+                clauses.append("o.response_deadline < ?")
+                params.append((_day(bound) + timedelta(days=1)).isoformat())
+            else:
+                clauses.append("o.response_deadline <= ?")
+                params.append(bound)
+        if active is not None:
+            clauses.append("o.active = ?")
+            params.append('Yes' if active else 'No')
+        if notice_ids is not None:
+            clauses.append("o.notice_id IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(list(notice_ids)))
+        return clauses, params
+
+    def query(self, text=None, order=None, limit=100, offset=0, records=False, **filters):
+        """
+        Opportunities matching every filter given, as dicts of the stored
+        columns (plus "record" when records=True). text is an FTS5 query
+        over title, description and agency: words, "a phrase", prefix*,
+        AND / OR / NOT; text hits carry "rank" (bm25, lower is better) and
+        a "snippet". Filters: naics / classification / set_aside (a code or
+        a list; a NAICS code under 6 digits is a prefix), posted_from /
+        posted_to (dates), deadline_from / deadline_to (dates or times),
+        active, notice_ids. order defaults to rank for text queries and
+        newest posted first otherwise.
+        """
+        clauses, params = self._where(**filters)
+        columns = ', '.join(f"o.{c}" for c in COLUMNS if c not in ("record", "record_hash", "updated"))
+        if records:
+            columns += ", o.record"
+        if text:
+            weights = ', '.join(str(w) for w in RANK_WEIGHTS)
+            sql = (f"SELECT {columns}, bm25(opportunities_fts, {weights}) AS rank,"
+                   " snippet(opportunities_fts, -1, '[', ']', '...', 12) AS snippet"
+                   f" FROM {self.FTS_JOIN} WHERE opportunities_fts MATCH ?")
+            params.insert(0, text)
+            order = order or "rank"
+        else:
+            sql = f"SELECT {columns} FROM opportunities o WHERE 1"
+            order = order or "o.posted_date DESC, o.notice_id"
+        sql += ''.join(f" AND {c}" for c in clauses) + f" ORDER BY {order} LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        try:
+            with self.lock:
+                rows = self.conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            if text:
+                raise ValueError(f"Bad search query {text!r}: {e}") from e
+            raise
+        results = []
+        for row in rows:
+            result = dict(row)
+            if records:
+                result["record"] = json.loads(result["record"])
+            results.append(result)
+        return results
+
+    def count(self, text=None, **filters):
+        clauses, params = self._where(**filters)
+        if text:
+            sql = f"SELECT COUNT(*) FROM {self.FTS_JOIN} WHERE opportunities_fts MATCH ?"
+            params.insert(0, text)
+        else:
+            sql = "SELECT COUNT(*) FROM opportunities o WHERE 1"
+        sql += ''.join(f" AND {c}" for c in clauses)
+        with self.lock:
+            return self.conn.execute(sql, params).fetchone()[0]
+
+    def iter_records(self, batch=500, **filters):
+        """
+        Full JSON records matching the filters, oldest posted first, read in batches.
+        """
+        offset = 0
+        while True:
+            rows = self.query(order="o.posted_date, o.notice_id", limit=batch, offset=offset, records=True, **filters)
+            for row in rows:
+                yield row["record"]
+            if len(rows) < batch:
+                return
+            offset += batch
+
+    def stats(self):
+        with self.lock:
+            total, first, last = self.conn.execute(
+                "SELECT COUNT(*), MIN(posted_date), MAX(posted_date) FROM opportunities").fetchone()
+            naics = self.conn.execute("SELECT COUNT(DISTINCT naics_code) FROM opportunities").fetchone()[0]
+        return {"opportunities": total, "posted_from": first, "posted_to": last, "naics_codes": naics}
+
+
+def backfill(store, state_path):
+    """
+    Load every record the SAM sync state (SAM.SyncState) has seen.
+    """
+    conn = sqlite3.connect(state_path, timeout=30)
+    try:
+        records = [json.loads(record) for record, in conn.execute("SELECT record FROM opportunities")]
+    finally:
+        conn.close()
+    return store.upsert_many(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SAM.gov opportunity store")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats')
+    fill = sub.add_parser('backfill', help="load the records kept by SAM.py's sync state")
+    fill.add_argument('state', nargs='?', default=os.getenv('SAM_STATE_PATH', os.path.join(DATA_DIR, 'cache', 'sam_state.sqlite3')))
+    q = sub.add_parser('query')
+    q.add_argument('--text')
+    q.add_argument('--naics', nargs='+')
+    q.add_argument('--classification', nargs='+')
+    q.add_argument('--set-aside', nargs='+')
+    for name in ('posted-from', 'posted-to', 'deadline-from', 'deadline-to'):
+        q.add_argument('--' + name)
+    q.add_argument('--limit', type=int, default=50)
+    q.add_argument('--json', action='store_true')
+    q.add_argument('--pdfs', metavar='DIR', help="also render one PDF per listed match (reportlab), in parallel")
+    args = parser.parse_args()
+    store = OpportunityStore()
+    if args.command == 'stats':
+        print(json.dumps(store.stats(), indent=2))
+        return
+    if args.command == 'backfill':
+        print(json.dumps(backfill(store, args.state), indent=2))
+        return
+    filters = {k: v for k, v in (("naics", args.naics), ("classification", args.classification),
+                                 ("set_aside", args.set_aside), ("posted_from", args.posted_from),
+                                 ("posted_to", args.posted_to), ("deadline_from", args.deadline_from),
+                                 ("deadline_to", args.deadline_to)) if v}
+    start = time.perf_counter()
+    rows = store.query(args.text, limit=args.limit, **filters)
+    total = store.count(args.text, **filters)
+    ms = (time.perf_counter() - start) * 1000
+    if args.json:
+        print(json.dumps({"total": total, "ms": round(ms, 2), "results": rows}, indent=2))
+    else:
+        for row in rows:
+            print(f"{row['notice_id']}  {row['posted_date'] or '':10}  due {row['response_deadline'] or '-':20}  "
+                  f"{row['naics_code'] or '':6}  {row['title']}")
+        print(f"[opportunity_store.py] {len(rows)} of {total} matches in {ms:.1f} ms", file=sys.stderr)
+    if args.pdfs:
+        import SAM
+        SAM.export_opportunity_pdfs([store.get(row["notice_id"]) for row in rows], args.pdfs)
+
+
+if __name__ == "__main__":
+    main()
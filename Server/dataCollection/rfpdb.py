@@ -1,56 +1,356 @@
 import os
-import re
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-from tqdm import tqdm
-import urllib3
-
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-BASE_URL = "https://www.rfpdb.com"
-SEARCH_URL = "https://www.rfpdb.com/search/search/identifier/8ec982aa56df/page/{}"
-OUTPUT_DIR = "rfpdb_pdfs"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-def get_rfp_links(page_num):
-    url = SEARCH_URL.format(page_num)
-    resp = requests.get(url, verify=False)
-    soup = BeautifulSoup(resp.text, "html.parser")
-    links = []
-    for h3 in soup.find_all("h3"):
-        a = h3.find("a", href=True)
-        if a and "/view/document/name/" in a["href"]:
-            links.append(urljoin(BASE_URL, a["href"]))
-    return links
-
-def get_pdf_links(rfp_url):
-    resp = requests.get(rfp_url, verify=False)
-    soup = BeautifulSoup(resp.text, "html.parser")
-    pdf_links = []
-    for a in soup.find_all("a", href=True):
-        href = a["href"]
-        if href.lower().endswith(".pdf"):
-            pdf_links.append(urljoin(BASE_URL, href))
-    return pdf_links
-
-def download_pdf(pdf_url):
-    if not pdf_url.startswith("http://") and not pdf_url.startswith("https://"):
-        return
-    filename = os.path.join(OUTPUT_DIR, pdf_url.split("/")[-1])
-    if os.path.exists(filename):
-        return
-    resp = requests.get(pdf_url, stream=True, verify=False)
-    if resp.status_code == 200:
-        with open(filename, "wb") as f:
-            for chunk in resp.iter_content(1024):
-                f.write(chunk)
+import sys
+import json
+import time
+import queue
+import sqlite3
+import threading
+import itertools
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+import downloader
+
+'''Crawler for rfpdb.com search results and their PDFs.
+
+Search pages link to RFP view pages, and view pages link to PDFs. Every
+URL goes through one work queue served by RFPDB_WORKERS threads. The
+threads share a pooled session and a per-host limiter
+(RFPDB_HOST_CONCURRENCY requests in flight, RFPDB_HOST_RPS starts per
+second). PDFs go through downloader.Downloader: streamed, PDF-only,
+resumable.
+
+The frontier (SQLite) records each URL, the pass it was last finished in,
+its ETag / Last-Modified and the links found on it. A run that is
+interrupted is resumed by the next one: finished pages are expanded from
+the stored links without a request. Once a pass completes, the next run
+starts a new one and revalidates every URL with a conditional request. A
+304 reuses the stored links or the saved file.
+
+Usage: python dataCollection/rfpdb.py [--pages 49] [--workers 8] [--restart]'''
+
+BASE_URL = os.getenv('RFPDB_BASE_URL', "https://www.rfpdb.com")
+SEARCH_URL = BASE_URL + "/search/search/identifier/8ec982aa56df/page/{}"
+SEARCH_PAGES = int(os.getenv('RFPDB_SEARCH_PAGES', 49))
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+OUTPUT_DIR = os.getenv('RFPDB_OUTPUT_DIR', os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'rfpdb_pdfs')))
+FRONTIER_PATH = os.getenv('RFPDB_FRONTIER_PATH', os.path.join(DATA_DIR, 'cache', 'rfpdb_frontier.sqlite3'))
+CRAWL_WORKERS = int(os.getenv('RFPDB_WORKERS', 8))
+# politeness towards a single small site
+HOST_CONCURRENCY = int(os.getenv('RFPDB_HOST_CONCURRENCY', 2))
+HOST_RPS = float(os.getenv('RFPDB_HOST_RPS', 2))
+RETRIES = int(os.getenv('RFPDB_RETRIES', 3))
+TIMEOUT = float(os.getenv('RFPDB_TIMEOUT', 30))
+# the site's certificate chain does not verify
+VERIFY = os.getenv('RFPDB_VERIFY', '0') == '1'
+
+# queue order: finish documents before opening more search pages
+PRIORITY = {'pdf': 0, 'view': 1, 'search': 2}
+
+
+class _LinkParser(HTMLParser):
+    """
+    (href, is the first link inside an <h3>) for every <a href> on a page.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+        self.h3_depth = 0
+        self.h3_linked = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'h3':
+            self.h3_depth += 1
+            self.h3_linked = False
+        elif tag == 'a':
+            href = dict(attrs).get('href')
+            if href:
+                heading = self.h3_depth > 0 and not self.h3_linked
+                self.h3_linked = self.h3_linked or self.h3_depth > 0
+                self.links.append((href, heading))
+
+    def handle_endtag(self, tag):
+        if tag == 'h3' and self.h3_depth:
+            self.h3_depth -= 1
+
+
+def _links(html):
+    parser = _LinkParser()
+    parser.feed(html)
+    parser.close()
+    return parser.links
+
+
+def _unique(urls):
+    return list(dict.fromkeys(urls))
+
+
+def parse_rfp_links(html, base_url=BASE_URL):
+    """
+    RFP view pages linked from the result headings of a search page.
+    """
+    return _unique(urljoin(base_url, href) for href, heading in _links(html)
+                   if heading and "/view/document/name/" in href)
+
+
+def parse_pdf_links(html, base_url=BASE_URL):
+    return _unique(urljoin(base_url, href) for href, _ in _links(html) if href.lower().endswith(".pdf"))
+
+
+def pdf_name(pdf_url):
+    """
+    Downloader name for a PDF URL: its file name without .pdf (the
+    downloader adds the extension from the content).
+    """
+    name = os.path.basename(urlsplit(pdf_url).path)
+    return name[:-4] if name.lower().endswith('.pdf') else name
 
-if __name__ == "__main__":
 
-    for page_num in tqdm(range(1, 50)):
-        rfp_links = get_rfp_links(page_num)
-        for rfp_url in rfp_links:
-            pdf_links = get_pdf_links(rfp_url)
-            for pdf_url in pdf_links:
-                download_pdf(pdf_url)
\ No newline at end of file
+class Frontier:
+    """
+    url -> kind ('search' | 'view' | 'pdf'), parent page, the pass it was last
+    finished in, status ('done' | 'failed'), validators, links found on it
+    (pages) and saved path (PDFs). meta holds the current pass and whether
+    it completed.
+    """
+
+    def __init__(self, path=FRONTIER_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "url TEXT PRIMARY KEY, kind TEXT NOT NULL, parent TEXT, pass INTEGER NOT NULL, status TEXT NOT NULL, "
+            "etag TEXT, last_modified TEXT, links TEXT, path TEXT, updated REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.commit()
+
+    def _meta(self, key, default):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def begin(self, restart=False):
+        """
+        Returns (pass number, resumed): the unfinished pass if there is one,
+        otherwise a new pass.
+        """
+        with self.lock:
+            current = int(self._meta('pass', 0))
+            resumed = current > 0 and self._meta('complete', '1') == '0' and not restart
+            if not resumed:
+                current += 1
+                self.conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                      [('pass', str(current)), ('complete', '0')])
+                self.conn.commit()
+            return current, resumed
+
+    def finish(self):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('complete', '1')")
+            self.conn.commit()
+
+    def get(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT kind, parent, pass, status, etag, last_modified, links, path FROM urls WHERE url = ?",
+                (url,)).fetchone()
+        if row is None:
+            return None
+        keys = ('kind', 'parent', 'pass', 'status', 'etag', 'last_modified', 'links', 'path')
+        entry = dict(zip(keys, row))
+        entry['links'] = json.loads(entry['links']) if entry['links'] is not None else None
+        return entry
+
+    def record(self, url, kind, parent, pass_number, status, etag=None, last_modified=None, links=None, path=None):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO urls (url, kind, parent, pass, status, etag, last_modified, links, path, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, kind, parent, pass_number, status, etag, last_modified,
+                 json.dumps(links) if links is not None else None, path, time.time()))
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT kind, status, COUNT(*) FROM urls GROUP BY kind, status").fetchall()
+        return {f"{kind}_{status}": count for kind, status, count in rows}
+
+
+class Crawler:
+    """
+    One crawl pass over `pages` search pages (see the module docstring).
+    run() returns a report of counts per outcome.
+    """
+
+    def __init__(self, frontier=None, output_dir=OUTPUT_DIR, workers=CRAWL_WORKERS, pages=SEARCH_PAGES,
+                 search_url=SEARCH_URL, limiter=None, session=None, verify=VERIFY):
+        self.frontier = frontier or Frontier()
+        self.output_dir = output_dir
+        self.workers = workers
+        self.pages = pages
+        self.search_url = search_url
+        self.base_url = '{0.scheme}://{0.netloc}'.format(urlsplit(search_url))
+        self.verify = verify
+        self.limiter = limiter or downloader.HostLimiter(HOST_CONCURRENCY, HOST_RPS)
+        self.session = session or downloader.get_session(workers)
+        self.downloader = downloader.Downloader(workers=workers, limiter=self.limiter, session=self.session,
+                                                verify=verify, retries=RETRIES, timeout=TIMEOUT, accept={'.pdf'})
+        self.queue = queue.PriorityQueue()
+        self.order = itertools.count()
+        self.seen = set()
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.bytes = 0
+        self.pass_number = None
+
+    def _count(self, key, nbytes=0):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.bytes += nbytes
+
+    def _enqueue(self, kind, url, parent):
+        with self.lock:
+            if url in self.seen:
+                return
+            self.seen.add(url)
+        self.queue.put((PRIORITY[kind], next(self.order), (kind, url, parent)))
+
+    def _get(self, url, entry):
+        """
+        GET a page with retry, conditional on the stored validators when the
+        stored links can stand in for a 304.
+        """
+        headers = {}
+        if entry and entry['links'] is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        host = urlsplit(url).netloc
+        for attempt in range(RETRIES + 1):
+            response = None
+            self.limiter.acquire(host)
+            try:
+                response = self.session.get(url, headers=headers, timeout=TIMEOUT, verify=self.verify)
+                error = f"HTTP {response.status_code}" if response.status_code == 429 or response.status_code >= 500 else None
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            finally:
+                self.limiter.release(host)
+            if error is None:
+                return response
+            if attempt == RETRIES:
+                raise IOError(error)
+            delay = downloader.backoff_delay(attempt, response)
+            if response is not None and response.status_code == 429:
+                self.limiter.backoff(host, delay)
+            print(f"[rfpdb.py] {url}: {error}, retrying in {delay:.1f}s", file=sys.stderr, flush=True)
+            time.sleep(delay)
+
+    def _page(self, kind, url, parent):
+        entry = self.frontier.get(url)
+        if entry and entry['pass'] == self.pass_number and entry['status'] == 'done':
+            # finished earlier in this pass, before an interruption
+            links = entry['links']
+            self._count(f"{kind}_resumed")
+        else:
+            r = self._get(url, entry)
+            if r.status_code == 304 and entry and entry['links'] is not None:
+                links = entry['links']
+                self._count(f"{kind}_not_modified")
+            elif r.status_code == 200:
+                parse = parse_rfp_links if kind == 'search' else parse_pdf_links
+                links = parse(r.text, self.base_url)
+                self._count(f"{kind}_fetched", len(r.content))
+            else:
+                self.frontier.record(url, kind, parent, self.pass_number, 'failed')
+                self._count(f"{kind}_http_{r.status_code}")
+                return
+            self.frontier.record(url, kind, parent, self.pass_number, 'done',
+                                 r.headers.get('ETag') or (entry or {}).get('etag'),
+                                 r.headers.get('Last-Modified') or (entry or {}).get('last_modified'), links)
+        child = 'view' if kind == 'search' else 'pdf'
+        for link in links:
+            self._enqueue(child, link, url)
+
+    def _pdf(self, url, parent):
+        if not url.startswith("http://") and not url.startswith("https://"):
+            return
+        entry = self.frontier.get(url)
+        if entry and entry['pass'] == self.pass_number and entry['status'] == 'done':
+            self._count("pdf_resumed")
+            return
+        validators = {"etag": entry['etag'], "last_modified": entry['last_modified']} if entry else None
+        result = self.downloader.download(url, self.output_dir, pdf_name(url), validators)
+        status = result["status"]
+        # connection errors, 429s and 5xx may pass; anything else is final for this pass
+        retryable = status == "error" or (status == "http_error" and (result["http_status"] == 429
+                                                                      or (result["http_status"] or 0) >= 500))
+        self.frontier.record(url, 'pdf', parent, self.pass_number, 'failed' if retryable else 'done',
+                             result["etag"] or (entry or {}).get('etag'),
+                             result["last_modified"] or (entry or {}).get('last_modified'), path=result["path"])
+        self._count(f"pdf_{status}", result["bytes"] if status == "downloaded" else 0)
+
+    def _work(self):
+        while True:
+            _, _, item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                kind, url, parent = item
+                try:
+                    if kind == 'pdf':
+                        self._pdf(url, parent)
+                    else:
+                        self._page(kind, url, parent)
+                except Exception as e:
+                    self.frontier.record(url, kind, parent, self.pass_number, 'failed')
+                    self._count(f"{kind}_error")
+                    print(f"[rfpdb.py] {kind} {url}: {type(e).__name__}: {e}", file=sys.stderr, flush=True)
+            finally:
+                self.queue.task_done()
+
+    def run(self, restart=False):
+        start = time.perf_counter()
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.pass_number, resumed = self.frontier.begin(restart)
+        threads = [threading.Thread(target=self._work, daemon=True) for _ in range(max(1, self.workers))]
+        for thread in threads:
+            thread.start()
+        for page in range(1, self.pages + 1):
+            self._enqueue('search', self.search_url.format(page), None)
+        self.queue.join()
+        for _ in threads:
+            self.queue.put((len(PRIORITY), next(self.order), None))
+        for thread in threads:
+            thread.join()
+        self.frontier.finish()
+        return {
+            "pass": self.pass_number,
+            "resumed": resumed,
+            "counts": dict(sorted(self.counts.items())),
+            "megabytes": round(self.bytes / 1e6, 2),
+            "seconds": round(time.perf_counter() - start, 2),
+        }
+
+
+def main():
+    def arg(name, default):
+        if name in sys.argv:
+            return sys.argv[sys.argv.index(name) + 1]
+        return default
+    if not VERIFY:
+        import urllib3
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    crawler = Crawler(workers=int(arg('--workers', CRAWL_WORKERS)), pages=int(arg('--pages', SEARCH_PAGES)))
+    report = crawler.run(restart='--restart' in sys.argv)
+    report["frontier"] = crawler.frontier.stats()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
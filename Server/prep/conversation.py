@@ -1,16 +1,36 @@
-
 import os
 import sys
 import json
-import openai
+import shutil
 from dotenv import load_dotenv
+import llm
+import summary_tree
+import indexer
+import vector_index
+import page_store
+import text_index
 
 # Configure UTF-8 encoding for stdout/stderr
 if sys.platform == 'win32':
     os.environ['PYTHONIOENCODING'] = 'utf-8'
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
-openai_api_key = os.getenv("OPENAI_API_KEY")
+
+# Max page summaries in flight at once; the rate limiter in llm.py still applies
+SUMMARY_CONCURRENCY = int(os.getenv('SUMMARY_CONCURRENCY', 8))
+
+SUMMARY_SYSTEM_PROMPT = "You are an expert construction estimator AI assistant. Create detailed summaries focused on quantifiable measurements and specifications needed for construction takeoffs and cost estimation."
+ANSWER_SYSTEM_PROMPT = "You are an expert construction estimator AI assistant. Answer based on the provided context."
+
+# Contexts longer than RETRIEVAL_MIN_CHARS are cut down to the RETRIEVAL_TOP_K
+# page/file summaries (or page-text windows) closest to the prompt
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', 8))
+RETRIEVAL_MIN_CHARS = int(os.getenv('RETRIEVAL_MIN_CHARS', 6000))
+PAGE_WINDOW_WORDS = 200
+PAGE_WINDOW_OVERLAP = 40
+CONTEXT_INDEX_DIR = os.path.join(vector_index.INDEX_DIR, 'context')
+# context indexes kept on disk; the least recently used beyond this are removed
+CONTEXT_INDEX_MAX = int(os.getenv('CONTEXT_INDEX_MAX', 64))
 
 def summarize_text(text, context_type="page", page_number=None):
     """
@@ -44,59 +64,191 @@ Be specific with numbers and units.
 
 Text to summarize:
 {text}"""
-    client = openai.OpenAI(api_key=openai_api_key)
-    response = client.chat.completions.create(
-        model="gpt-4o-mini-2024-07-18",
-        messages=[
-            {"role": "system", "content": f"You are an expert construction estimator AI assistant. Create detailed summaries focused on quantifiable measurements and specifications needed for construction takeoffs and cost estimation."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=512,
-        temperature=0.2
-    )
-    return response.choices[0].message.content
-
-def summarize_file(page_json_paths, output_path):
+    return llm.complete(SUMMARY_SYSTEM_PROMPT, prompt, max_tokens=512, temperature=0.2)
+
+def page_number_from_path(page_path, index):
+    if 'page_' in page_path:
+        try:
+            return int(page_path.split('page_')[1].split('.')[0])
+        except:
+            return index + 1
+    return index + 1
+
+def get_tree(max_workers=None):
+    return summary_tree.SummaryTree(summarize_text, max_workers=max_workers or SUMMARY_CONCURRENCY)
+
+def summarize_file(page_json_paths, output_path, max_workers=None):
     """
     Summarize all pages in a file and save the file summary to output_path.
+    Pages go through the summary tree: unchanged pages are reused, new or
+    changed pages are summarized concurrently (SUMMARY_CONCURRENCY at a time)
+    and the file node is reduced with bounded fan-in.
     """
-    page_summaries = []
+    pages = []
     for i, page_path in enumerate(page_json_paths):
         with open(page_path, 'r', encoding='utf-8') as f:
             page_data = json.load(f)
-        page_text = page_data.get('text', '')
-  
-        page_number = None
-        if 'page_' in page_path:
-            try:
-                page_number = int(page_path.split('page_')[1].split('.')[0])
-            except:
-                page_number = i + 1
-        else:
-            page_number = i + 1
-        summary = summarize_text(page_text, context_type="page", page_number=page_number)
-        page_summaries.append(summary)
-
-    file_summary = summarize_text("\n".join(page_summaries), context_type="file")
+        pages.append((page_data.get('text', ''), page_number_from_path(page_path, i)))
+    pages.sort(key=lambda p: p[1])
+    tree = get_tree(max_workers)
+    page_nodes = tree.summarize_pages(pages)
+    file_hash, file_summary = tree.reduce(page_nodes, "file")
     with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump({"summary": file_summary, "page_summaries": page_summaries}, f, indent=2)
+        json.dump({
+            "summary": file_summary,
+            "page_summaries": [summary for _, summary in page_nodes],
+            "hash": file_hash,
+            "page_hashes": [h for h, _ in page_nodes],
+        }, f, indent=2)
+    print(f"[conversation.py] File summary tree: {tree.stats()}", file=sys.stderr, flush=True)
     return file_summary
 
-def summarize_workspace(file_summary_paths, output_path):
+def summarize_workspace(file_summary_paths, output_path, max_workers=None):
     """
     Summarize all files in a workspace (project) and save the workspace summary to output_path.
+    File summaries are keyed by the tree hash stored in their JSON, so the
+    workspace root is only recomputed when a file was added or changed.
     """
-    file_summaries = []
+    file_nodes = []
     for file_path in file_summary_paths:
         with open(file_path, 'r', encoding='utf-8') as f:
             file_data = json.load(f)
         file_summary = file_data.get('summary', '')
-        file_summaries.append(file_summary)
-    workspace_summary = summarize_text("\n".join(file_summaries), context_type="workspace")
+        file_hash = file_data.get('hash') or summary_tree.leaf_hash(file_summary)
+        file_nodes.append((file_hash, file_summary))
+    # order-independent: the same set of files always gives the same root
+    file_nodes.sort(key=lambda node: node[0])
+    tree = get_tree(max_workers)
+    workspace_hash, workspace_summary = tree.reduce(file_nodes, "workspace")
     with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump({"summary": workspace_summary, "file_summaries": file_summaries}, f, indent=2)
+        json.dump({
+            "summary": workspace_summary,
+            "file_summaries": [summary for _, summary in file_nodes],
+            "hash": workspace_hash,
+            "file_hashes": [h for h, _ in file_nodes],
+        }, f, indent=2)
+    print(f"[conversation.py] Workspace summary tree: {tree.stats()}", file=sys.stderr, flush=True)
     return workspace_summary
 
+def context_chunks(context_data):
+    """
+    Retrievable pieces of a context JSON: page summaries of a file summary,
+    file summaries of a workspace summary, or word windows of raw page text.
+    """
+    if context_data.get('page_summaries'):
+        return [text for text in context_data['page_summaries'] if text]
+    if context_data.get('file_summaries'):
+        return [text for text in context_data['file_summaries'] if text]
+    words = context_data.get('pageText', '').split()
+    chunks = []
+    for start in range(0, len(words), PAGE_WINDOW_WORDS - PAGE_WINDOW_OVERLAP):
+        chunks.append(' '.join(words[start:start + PAGE_WINDOW_WORDS]))
+        if start + PAGE_WINDOW_WORDS >= len(words):
+            break
+    return chunks
+
+def get_context_index(chunks):
+    """
+    Vector index over chunks, built once per distinct chunk list and reopened
+    through mmap afterwards. At most CONTEXT_INDEX_MAX are kept.
+    """
+    key = indexer.text_hash('\x00'.join(chunks))
+    path = os.path.join(CONTEXT_INDEX_DIR, key)
+    if vector_index.exists(path):
+        # mark as recently used for prune_context_indexes
+        os.utime(path)
+        return vector_index.VectorIndex(path)
+    # build next to the final path and rename, so concurrent workers never see a partial index
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    index = vector_index.VectorIndex(tmp_path, dim=indexer.EMBED_DIMENSION)
+    embeddings = indexer.encode(indexer.get_model(), chunks)
+    index.add([str(i) for i in range(len(chunks))], embeddings, [{"position": i} for i in range(len(chunks))])
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # another worker finished first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    prune_context_indexes()
+    return vector_index.VectorIndex(path)
+
+def prune_context_indexes(keep=CONTEXT_INDEX_MAX):
+    """
+    Remove all but the `keep` most recently used context indexes. A worker
+    that still has a removed index open keeps reading its unlinked files.
+    """
+    try:
+        names = [n for n in os.listdir(CONTEXT_INDEX_DIR) if not n.endswith('.tmp')]
+    except FileNotFoundError:
+        return 0
+    paths = [os.path.join(CONTEXT_INDEX_DIR, n) for n in names]
+    paths.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0, reverse=True)
+    for path in paths[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+    return max(0, len(paths) - keep)
+
+def retrieve_chunks(prompt, chunks, k=RETRIEVAL_TOP_K):
+    """
+    The k chunks closest to the prompt, in their original order.
+    """
+    index = get_context_index(chunks)
+    query = indexer.encode(indexer.get_model(), [prompt])
+    hits = index.search(query, k=k)[0]
+    return [chunks[i] for i in sorted(meta["position"] for _, _, meta in hits)]
+
+def corpus_pages(prompt, k=RETRIEVAL_TOP_K):
+    """
+    Text of the k RFP corpus pages (text_index) that best match the prompt,
+    each headed by its file name and page number.
+    """
+    query = text_index.query_from_text(prompt)
+    if not query:
+        return []
+    store = page_store.get_store()
+    pages = []
+    for hit in text_index.search(query, limit=k):
+        name = os.path.basename(hit["paths"][0]) if hit["paths"] else hit["hash"][:12]
+        for number, text, _ in store.pages(hit["hash"], hit["page"], hit["page"]):
+            pages.append(f"[{name} p.{number}]\n{text.strip()}")
+    return pages
+
+def build_context(prompt, context_data):
+    if context_data.get('scope') == 'rfp-corpus':
+        pages = corpus_pages(prompt)
+        return "Most relevant RFP pages:\n" + ("\n\n".join(pages) if pages else "(no matching pages)")
+    summary = context_data.get('summary', None)
+    page_text = context_data.get('pageText', '')
+    chunks = context_chunks(context_data)
+    if sum(len(c) for c in chunks) > RETRIEVAL_MIN_CHARS:
+        try:
+            selected = retrieve_chunks(prompt, chunks)
+        except ImportError as e:
+            # no embedding model here: rank the same chunks by bm25 instead
+            print(f"[conversation.py] Vector retrieval unavailable ({e}), ranking by keywords", file=sys.stderr, flush=True)
+            selected = [chunks[i] for i in text_index.rank_chunks(prompt, chunks, RETRIEVAL_TOP_K)]
+        if selected:
+            excerpts = "\n\n".join(selected)
+            if summary:
+                return f"Summary: {summary}\n\nMost relevant excerpts:\n{excerpts}"
+            return f"Most relevant page text:\n{excerpts}"
+    # Use summary if available, else fallback to pageText
+    return f"Summary: {summary}" if summary else f"Page text: {page_text}"
+
+def answer_prompt(prompt, context_path):
+    """
+    Answer a user prompt using the summary or page text stored in context_path.
+    Large contexts are reduced to the chunks most relevant to the prompt.
+    A context of {"scope": "rfp-corpus"} answers from the best matching
+    pages of the full-text index over every parsed RFP instead.
+    Returns {"content": answer}.
+    """
+    with open(context_path, 'r', encoding='utf-8') as f:
+        context_data = json.load(f)
+
+    user_prompt = f"{prompt}\n\n{build_context(prompt, context_data)}"
+
+    answer = llm.complete(ANSWER_SYSTEM_PROMPT, user_prompt, max_tokens=512, temperature=0.2, use_cache=False)
+    return {"content": answer}
+
 def main():
     if len(sys.argv) < 3:
         print(json.dumps({"error": "Usage: conversation.py <prompt> <context_json_file> [--summarize <type> <output_path> <input_paths...>]"}))
@@ -125,28 +277,8 @@ def main():
         sys.exit(0)
     prompt = sys.argv[1]
     context_path = sys.argv[2]
-    with open(context_path, 'r', encoding='utf-8') as f:
-        context_data = json.load(f)
-
-    # Use summary if available, else fallback to pageText
-    summary = context_data.get('summary', None)
-    page_text = context_data.get('pageText', '')
-    context_for_llm = f"Summary: {summary}" if summary else f"Page text: {page_text}"
-    user_prompt = f"{prompt}\n\n{context_for_llm}"
-
     try:
-        client = openai.OpenAI(api_key=openai_api_key)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini-2024-07-18",
-            messages=[
-                {"role": "system", "content": "You are an expert construction estimator AI assistant. Answer based on the provided context."},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=512,
-            temperature=0.2
-        )
-        answer = response.choices[0].message.content
-        print(json.dumps({"content": answer}))
+        print(json.dumps(answer_prompt(prompt, context_path)))
     except Exception as e:
         print(json.dumps({"error": str(e)}))
         sys.exit(1)
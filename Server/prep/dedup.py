@@ -0,0 +1,482 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import textnorm
+
+'''Exact and near-duplicate detection for the PDF corpus.
+
+Three layers, cheapest first:
+1. Bytes: paths with the same sha256 (page_store's content hash) are one
+   document.
+2. Text: documents whose normalized text is identical, such as re-saved
+   or re-uploaded copies.
+3. Pages: each page's normalized, lowercased text is cut into
+   SHINGLE_WORDS-word shingles. A MinHash signature (NUM_PERM
+   multiply-shift hashes) estimates the Jaccard similarity of two pages.
+   LSH on BANDS bands of the signature compares only pages that collide
+   in some band, so the work grows with the number of pages, not with
+   its square. Two documents are near-duplicates when at least DOC_OVERLAP
+   of the pages of one of them match pages of the other, so an addendum
+   that repeats the base RFP plus a few new pages qualifies. Pages that
+   land in an LSH bucket over MAX_BUCKET (boilerplate shared across the
+   corpus) and pages too short to shingle do not count; they match by exact text only.
+
+Each group's canonical document is its longest one. For every other
+member, plan() lists the pages that have no match in the canonical (the
+diff pages). Downstream stages process the canonical plus those pages.
+
+Signatures are stored per content hash (SQLite), so only new documents
+are shingled. A document is shingled again once OCR fills its pages.
+
+Usage: python prep/dedup.py [PDF_OR_DIR ...] [--json]'''
+
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'cache'))
+INDEX_PATH = os.getenv('DEDUP_INDEX_PATH', os.path.join(CACHE_DIR, 'dedup_index.sqlite3'))
+PDF_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../rfpdb_pdfs'))
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+BANDS = 32
+# estimated Jaccard at which two pages count as the same page
+PAGE_THRESHOLD = float(os.getenv('DEDUP_PAGE_THRESHOLD', 0.8))
+# share of one document's pages that must match the other's for a near-duplicate
+DOC_OVERLAP = float(os.getenv('DEDUP_DOC_OVERLAP', 0.8))
+# pages with fewer shingles (covers, blank separators) are matched by exact text only
+MIN_SHINGLES = 8
+# an LSH bucket this full is boilerplate shared across the corpus, not a duplicate
+MAX_BUCKET = int(os.getenv('DEDUP_MAX_BUCKET', 500))
+SEED = 20240611
+
+_P = 0x100000001b3
+_Q = 0x9e3779b97f4a7c15
+_hashers = None
+
+
+def _hashers_for():
+    """
+    (A, B) multiply-shift parameters and the byte-position power tables, built once.
+    """
+    global _hashers
+    if _hashers is None:
+        import numpy as np
+        rng = np.random.default_rng(SEED)
+        a = rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        b = rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+        _hashers = {"a": a[:, None], "b": b[:, None], "pow": np.ones(1, dtype=np.uint64),
+                    "inv": np.ones(1, dtype=np.uint64)}
+    return _hashers
+
+
+def _powers(key, base, n):
+    import numpy as np
+    h = _hashers_for()
+    if len(h[key]) < n:
+        size = max(n, 2 * len(h[key]))
+        # uint64 products wrap, i.e. arithmetic mod 2**64
+        h[key] = np.cumprod(np.concatenate((np.ones(1, dtype=np.uint64), np.full(size - 1, base, dtype=np.uint64))))
+    return h[key]
+
+
+def normalize_page(text):
+    return textnorm.normalize(text).lower()
+
+
+def word_hashes(text):
+    """
+    64-bit polynomial hash of every space-separated word of ASCII `text`.
+    The prefix sums run in NumPy: word [s, e) hashes to
+    (G[e] - G[s]) * P**(e-1), where G[i] = sum(byte_k * P**-k for k < i).
+    """
+    import numpy as np
+    data = np.frombuffer(text.encode('ascii', 'ignore'), dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.uint64)
+    word = data != 32
+    edges = np.diff(np.concatenate(([0], word.view(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    inverse = _powers("inv", pow(_P, -1, 2 ** 64), len(data) + 1)
+    powers = _powers("pow", _P, len(data) + 1)
+    with np.errstate(over='ignore'):
+        prefix = np.concatenate((np.zeros(1, dtype=np.uint64),
+                                 np.cumsum(data.astype(np.uint64) * inverse[:len(data)], dtype=np.uint64)))
+        return (prefix[ends] - prefix[starts]) * powers[ends - 1]
+
+
+def shingles(text):
+    """
+    Sorted unique hashes of the SHINGLE_WORDS-word shingles of normalized text.
+    """
+    import numpy as np
+    words = word_hashes(text)
+    if len(words) < SHINGLE_WORDS:
+        return np.unique(words[:0])
+    n = len(words) - SHINGLE_WORDS + 1
+    combined = words[:n].copy()
+    with np.errstate(over='ignore'):
+        for k in range(1, SHINGLE_WORDS):
+            combined = combined * np.uint64(_Q) + words[k:k + n]
+    return np.unique(combined)
+
+
+def page_signatures(pages):
+    """
+    pages: [(page_number, text)]. Returns (entries, signatures): entries are
+    (page_number, shingle count, sha1 of the normalized text) and
+    signatures a (pages, NUM_PERM) uint32 array (all ones for pages under
+    MIN_SHINGLES).
+    """
+    import numpy as np
+    h = _hashers_for()
+    entries, sets = [], []
+    for page_number, text in pages:
+        norm = normalize_page(text)
+        s = shingles(norm)
+        entries.append((page_number, len(s), hashlib.sha1(norm.encode('utf-8')).hexdigest()))
+        sets.append(s)
+    signatures = np.full((len(entries), NUM_PERM), 0xffffffff, dtype=np.uint32)
+    rows = [i for i, s in enumerate(sets) if len(s) >= MIN_SHINGLES]
+    if rows:
+        values = np.concatenate([sets[i] for i in rows])
+        offsets = np.cumsum([0] + [len(sets[i]) for i in rows[:-1]])
+        with np.errstate(over='ignore'):
+            hashed = (h["a"] * values[None, :] + h["b"]) >> np.uint64(32)
+        signatures[rows] = np.minimum.reduceat(hashed, offsets, axis=1).T.astype(np.uint32)
+    return entries, signatures
+
+
+def text_hash(entries):
+    return hashlib.sha1(''.join(e[2] for e in entries).encode('utf-8')).hexdigest()
+
+
+class DedupIndex:
+    """
+    Page signatures per content hash. documents: hash -> page count and
+    normalized-text hash; pages: (hash, page) -> shingle count,
+    normalized-text hash, signature bytes.
+    """
+
+    PARAMS = f"{SHINGLE_WORDS}:{NUM_PERM}:{SEED}"
+
+    def __init__(self, path=INDEX_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " hash TEXT PRIMARY KEY, pages INTEGER NOT NULL, text_hash TEXT NOT NULL, pending_ocr INTEGER NOT NULL,"
+            " indexed REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " hash TEXT NOT NULL, page INTEGER NOT NULL, shingles INTEGER NOT NULL, text_hash TEXT NOT NULL,"
+            " signature BLOB NOT NULL, PRIMARY KEY (hash, page)) WITHOUT ROWID;"
+        )
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'params'").fetchone()
+        if row is None or row[0] != self.PARAMS:
+            # signatures from other shingle/hash settings are not comparable
+            self.conn.executescript("DELETE FROM documents; DELETE FROM pages;")
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('params', ?)", (self.PARAMS,))
+        self.conn.commit()
+
+    def indexed(self, doc_hashes):
+        """
+        {hash: pages still pending OCR when it was indexed} for the known hashes.
+        """
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT hash, pending_ocr FROM documents WHERE hash IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(doc_hashes)),)))
+
+    def add(self, doc_hash, pages, pending_ocr=0):
+        entries, signatures = page_signatures(pages)
+        rows = [(doc_hash, page, count, norm_hash, signatures[i].tobytes())
+                for i, (page, count, norm_hash) in enumerate(entries)]
+        with self.lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM pages WHERE hash = ?", (doc_hash,))
+                self.conn.executemany(
+                    "INSERT INTO pages (hash, page, shingles, text_hash, signature) VALUES (?, ?, ?, ?, ?)", rows)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO documents (hash, pages, text_hash, pending_ocr, indexed) VALUES (?, ?, ?, ?, ?)",
+                    (doc_hash, len(entries), text_hash(entries), pending_ocr, time.time()))
+
+    def load(self, doc_hashes):
+        """
+        {hash: {"text_hash", "entries", "signatures"}} for the known hashes.
+        """
+        import numpy as np
+        wanted = json.dumps(list(doc_hashes))
+        docs = {}
+        with self.lock:
+            for doc_hash, th in self.conn.execute(
+                    "SELECT hash, text_hash FROM documents WHERE hash IN (SELECT value FROM json_each(?))", (wanted,)):
+                docs[doc_hash] = {"text_hash": th, "entries": [], "signatures": []}
+            for doc_hash, page, count, norm_hash, signature in self.conn.execute(
+                    "SELECT hash, page, shingles, text_hash, signature FROM pages "
+                    "WHERE hash IN (SELECT value FROM json_each(?)) ORDER BY hash, page", (wanted,)):
+                docs[doc_hash]["entries"].append((page, count, norm_hash))
+                docs[doc_hash]["signatures"].append(signature)
+        for doc in docs.values():
+            doc["signatures"] = (np.frombuffer(b''.join(doc["signatures"]), dtype=np.uint32).reshape(-1, NUM_PERM)
+                                 if doc["signatures"] else np.zeros((0, NUM_PERM), dtype=np.uint32))
+        return docs
+
+    def stats(self):
+        with self.lock:
+            documents, pages = self.conn.execute(
+                "SELECT COUNT(*), (SELECT COUNT(*) FROM pages) FROM documents").fetchone()
+        return {"documents": documents, "pages": pages}
+
+
+def _candidate_pairs(signatures):
+    """
+    Unique (i, j), i < j, row pairs of `signatures` that share an LSH band
+    key, and a mask of the rows that fell in a bucket over MAX_BUCKET
+    (those buckets are skipped).
+    """
+    import numpy as np
+    rows = NUM_PERM // BANDS
+    n = len(signatures)
+    found = []
+    common = np.zeros(n, dtype=bool)
+    with np.errstate(over='ignore'):
+        for band in range(BANDS):
+            block = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+            keys = np.full(n, band, dtype=np.uint64)
+            for r in range(rows):
+                keys = keys * np.uint64(_Q) + block[:, r]
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            edges = np.flatnonzero(np.diff(sorted_keys)) + 1
+            bounds = np.concatenate(([0], edges, [n]))
+            sizes = np.diff(bounds)
+            common[order[np.repeat(sizes > MAX_BUCKET, sizes)]] = True
+            # pairs (nearly every bucket) in one step, larger buckets one by one
+            starts = bounds[:-1][sizes == 2]
+            a, b = order[starts], order[starts + 1]
+            found.append(np.minimum(a, b).astype(np.int64) * n + np.maximum(a, b))
+            larger = (sizes > 2) & (sizes <= MAX_BUCKET)
+            for start, size in zip(bounds[:-1][larger], sizes[larger]):
+                members = np.sort(order[start:start + size])
+                i, j = np.triu_indices(size, 1)
+                found.append(members[i].astype(np.int64) * n + members[j])
+    if not found:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), common
+    pairs = np.unique(np.concatenate(found))
+    return pairs // n, pairs % n, common
+
+
+class _UnionFind:
+    def __init__(self, keys):
+        self.parent = {k: k for k in keys}
+
+    def find(self, k):
+        root = k
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[k] != root:
+            self.parent[k], k = root, self.parent[k]
+        return root
+
+    def union(self, a, b):
+        self.parent[self.find(a)] = self.find(b)
+
+
+def find_groups(docs):
+    """
+    docs: {key: {"text_hash", "entries", "signatures"}} (DedupIndex.load).
+    Returns (groups, stats). groups: [{"canonical": key, "members": {key: {"reason": "text" | "near",
+    "diff_pages": [page numbers]}}}] for every group with more than one document.
+    """
+    import numpy as np
+    start = time.perf_counter()
+    keys = sorted(docs, key=lambda k: (-len(docs[k]["entries"]), k))
+    uf = _UnionFind(keys)
+    reason = {}
+
+    # layer 2: identical normalized text (documents without text never group this way)
+    by_text = {}
+    for key in keys:
+        if any(count >= MIN_SHINGLES for _, count, _ in docs[key]["entries"]):
+            by_text.setdefault(docs[key]["text_hash"], []).append(key)
+    representatives, slot = [], {}
+    for same in by_text.values():
+        for key in same:
+            slot[key] = len(representatives)
+        representatives.append(same[0])
+        for key in same[1:]:
+            uf.union(key, same[0])
+            reason[key] = "text"
+
+    # layer 3: page MinHash + LSH over one representative per text
+    owner, page_of, blocks = [], [], []
+    for d, key in enumerate(representatives):
+        entries = docs[key]["entries"]
+        rows = [i for i, (_, count, _) in enumerate(entries) if count >= MIN_SHINGLES]
+        owner.extend([d] * len(rows))
+        page_of.extend(entries[i][0] for i in rows)
+        blocks.append(docs[key]["signatures"][rows])
+    signatures = np.concatenate(blocks) if blocks else np.zeros((0, NUM_PERM), dtype=np.uint32)
+    owner = np.asarray(owner, dtype=np.int64)
+    page_of = np.asarray(page_of, dtype=np.int64)
+    i, j, common = _candidate_pairs(signatures)
+    candidates = len(i)
+    content_pages = np.bincount(owner[~common], minlength=len(representatives))
+    boilerplate = set(zip(owner[common].tolist(), page_of[common].tolist()))
+    cross = (owner[i] != owner[j]) & ~common[i] & ~common[j]
+    i, j = i[cross], j[cross]
+    similar = (signatures[i] == signatures[j]).mean(axis=1) >= PAGE_THRESHOLD
+    i, j = i[similar], j[similar]
+
+    # pages of each side matched, per document pair
+    swap = owner[i] > owner[j]
+    i, j = np.where(swap, j, i), np.where(swap, i, j)
+    n_docs = max(len(representatives), 1)
+    pair = owner[i] * n_docs + owner[j]
+    matches = {}
+    for p, a, b in zip(pair.tolist(), page_of[i].tolist(), page_of[j].tolist()):
+        left, right = matches.setdefault(p, (set(), set()))
+        left.add(a)
+        right.add(b)
+    near = 0
+    for p, (left, right) in matches.items():
+        a, b = p // n_docs, p % n_docs
+        if max(len(left) / content_pages[a], len(right) / content_pages[b]) >= DOC_OVERLAP:
+            uf.union(representatives[a], representatives[b])
+            near += 1
+
+    grouped = {}
+    for key in keys:
+        grouped.setdefault(uf.find(key), []).append(key)
+    groups = []
+    for members in grouped.values():
+        if len(members) < 2:
+            continue
+        # keys are sorted longest first, so members[0] is the longest document
+        canonical = members[0]
+        entry = {"canonical": canonical, "members": {}}
+        for key in members[1:]:
+            if reason.get(key) == "text" and docs[key]["text_hash"] == docs[canonical]["text_hash"]:
+                entry["members"][key] = {"reason": "text", "diff_pages": []}
+                continue
+            entry["members"][key] = {"reason": "near", "diff_pages": _diff_pages(
+                docs, key, canonical, matches, slot, n_docs, boilerplate)}
+        groups.append(entry)
+    stats = {"documents": len(docs), "pages": int(len(signatures)), "candidate_pairs": int(candidates),
+             "similar_pairs": int(len(i)), "near_pairs": near, "groups": len(groups),
+             "seconds": round(time.perf_counter() - start, 3)}
+    return groups, stats
+
+
+def _diff_pages(docs, key, canonical, matches, slot, n_docs, boilerplate):
+    """
+    Pages of `key` with no counterpart in `canonical`: content pages without
+    a similar page there, short and boilerplate pages whose exact text it
+    lacks, and blank pages (nothing to compare until they are OCRed).
+    """
+    matched = set()
+    if key in slot and canonical in slot:
+        # slot: the LSH position of the document's same-text representative
+        da, db = slot[key], slot[canonical]
+        left, right = matches.get(min(da, db) * n_docs + max(da, db), (set(), set()))
+        matched = left if da < db else right
+    canonical_text = {norm for _, _, norm in docs[canonical]["entries"]}
+    blank = hashlib.sha1(b'').hexdigest()
+    diff = []
+    for page, count, norm in docs[key]["entries"]:
+        if norm == blank:
+            diff.append(page)
+        elif count >= MIN_SHINGLES and (slot.get(key), page) not in boilerplate:
+            if page not in matched:
+                diff.append(page)
+        elif norm not in canonical_text:
+            diff.append(page)
+    return diff
+
+
+def plan(pdf_paths, index=None, run_ocr=False, hashes=None):
+    """
+    What each PDF needs processing: {path: {"canonical": path of the group's
+    canonical document (itself when it is one), "reason": None | "exact" |
+    "text" | "near", "pages": None (all pages) or the diff page numbers}}.
+    Text comes from page_store (extracted first, with OCR only if run_ocr;
+    pass `hashes` from an earlier ensure_many to skip that). Unreadable
+    PDFs are left out.
+    """
+    import page_store
+    index = index or DedupIndex()
+    store = page_store.get_store()
+    if hashes is None:
+        hashes = page_store.ensure_many(pdf_paths, run_ocr=run_ocr)
+    hashes = {path: doc_hash for path, doc_hash in hashes.items() if doc_hash}
+    indexed = index.indexed(set(hashes.values()))
+    for doc_hash in set(hashes.values()):
+        document = store.document(doc_hash)
+        if document is not None and indexed.get(doc_hash) != document["pending_ocr"]:
+            index.add(doc_hash, ((page, text) for page, text, _ in store.pages(doc_hash)), document["pending_ocr"])
+    docs = index.load(set(hashes.values()))
+    groups, _ = find_groups(docs)
+
+    # layer 1: the first path with a content hash stands for the document; other paths are exact copies
+    first_path = {}
+    for path in sorted(hashes):
+        first_path.setdefault(hashes[path], path)
+    result = {path: {"canonical": path, "reason": None, "pages": None} for path in hashes}
+    for path, doc_hash in hashes.items():
+        if first_path[doc_hash] != path:
+            result[path] = {"canonical": first_path[doc_hash], "reason": "exact", "pages": []}
+    for group in groups:
+        canonical = first_path[group["canonical"]]
+        for doc_hash, member in group["members"].items():
+            path = first_path[doc_hash]
+            result[path] = {"canonical": canonical, "reason": member["reason"], "pages": member["diff_pages"]}
+    # exact copies of a member point at the group's canonical too
+    for path, entry in result.items():
+        if entry["reason"] == "exact":
+            entry["canonical"] = result[entry["canonical"]]["canonical"]
+    return result
+
+
+def summarize(result):
+    groups = {}
+    for path, entry in result.items():
+        if entry["reason"] is not None:
+            groups.setdefault(entry["canonical"], []).append(path)
+    return {
+        "documents": len(result),
+        "duplicates": sum(1 for e in result.values() if e["reason"] is not None),
+        "by_reason": {r: sum(1 for e in result.values() if e["reason"] == r) for r in ("exact", "text", "near")},
+        "groups": {os.path.basename(c): sorted(os.path.basename(p) for p in members) for c, members in groups.items()},
+    }
+
+
+def _expand(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith('.pdf'):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    paths = list(_expand(args or [PDF_DIR]))
+    start = time.perf_counter()
+    result = plan(paths)
+    if '--json' in sys.argv:
+        print(json.dumps(result, indent=2))
+        return
+    summary = summarize(result)
+    summary["seconds"] = round(time.perf_counter() - start, 2)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import random
+import threading
+
+'''Batched embedding and bulk upsert of RFP chunks into a vector store.
+
+Chunks are embedded EMBED_BATCH_SIZE at a time (optionally across
+EMBED_WORKERS processes with sentence-transformers' multi-process pool) and
+upserted UPSERT_BATCH_SIZE vectors per call with retry and backoff. A SQLite
+ledger remembers the text hash of every vector id that made it into an
+index, so a re-run only embeds and uploads new or changed chunks.
+
+Any object with upsert(vectors=[(id, values, metadata), ...]) works as the
+index: a pinecone.Index, a local vector_index.VectorIndex, or MemoryIndex
+for checks.'''
+
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'cache'))
+LEDGER_PATH = os.getenv('INDEX_LEDGER_PATH', os.path.join(CACHE_DIR, 'index_ledger.sqlite3'))
+
+EMBED_MODEL = 'all-MiniLM-L6-v2'
+EMBED_DIMENSION = 384
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', 256))
+EMBED_WORKERS = int(os.getenv('EMBED_WORKERS', 1))
+UPSERT_BATCH_SIZE = int(os.getenv('UPSERT_BATCH_SIZE', 100))
+UPSERT_RETRIES = int(os.getenv('UPSERT_RETRIES', 5))
+
+
+def vector_id(chunk):
+    return f"{chunk['filename']}_{chunk['chunk_id']}"
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class MemoryIndex:
+    """
+    In-memory stand-in for a pinecone.Index (upsert/fetch/describe_index_stats).
+    fail_rate makes upserts raise at random to exercise the retry path.
+    """
+
+    def __init__(self, fail_rate=0.0):
+        self.vectors = {}
+        self.fail_rate = fail_rate
+        self.upsert_calls = 0
+
+    def upsert(self, vectors):
+        self.upsert_calls += 1
+        if self.fail_rate and random.random() < self.fail_rate:
+            raise ConnectionError("simulated upsert failure")
+        for vid, values, meta in vectors:
+            self.vectors[vid] = (list(values), dict(meta))
+        return {"upserted_count": len(vectors)}
+
+    def fetch(self, ids):
+        return {"vectors": {vid: self.vectors[vid] for vid in ids if vid in self.vectors}}
+
+    def describe_index_stats(self):
+        return {"total_vector_count": len(self.vectors)}
+
+
+class Ledger:
+    """
+    vector id -> text hash of what is already stored, per index name.
+    """
+
+    def __init__(self, path=LEDGER_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS indexed ("
+            "index_name TEXT NOT NULL, id TEXT NOT NULL, hash TEXT NOT NULL, updated REAL NOT NULL, "
+            "PRIMARY KEY (index_name, id))"
+        )
+        self.conn.commit()
+
+    def known(self, index_name):
+        rows = self.conn.execute("SELECT id, hash FROM indexed WHERE index_name = ?", (index_name,))
+        return dict(rows)
+
+    def mark(self, index_name, entries):
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO indexed (index_name, id, hash, updated) VALUES (?, ?, ?, ?)",
+            [(index_name, vid, h, now) for vid, h in entries],
+        )
+        self.conn.commit()
+
+    def count(self, index_name):
+        return self.conn.execute("SELECT COUNT(*) FROM indexed WHERE index_name = ?", (index_name,)).fetchone()[0]
+
+    def forget(self, index_name):
+        self.conn.execute("DELETE FROM indexed WHERE index_name = ?", (index_name,))
+        self.conn.commit()
+
+
+def load_model(name=EMBED_MODEL):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name)
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """
+    Process-wide embedding model for query-time use (retrieval).
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = load_model()
+    return _model
+
+
+def encode(model, texts, batch_size=EMBED_BATCH_SIZE, workers=EMBED_WORKERS):
+    """
+    Embed texts in batches. Returns a (len(texts), dim) float32 array.
+    """
+    if workers > 1 and len(texts) > batch_size:
+        pool = model.start_multi_process_pool(target_devices=['cpu'] * workers)
+        try:
+            return model.encode_multi_process(texts, pool, batch_size=batch_size)
+        finally:
+            model.stop_multi_process_pool(pool)
+    return model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+
+
+def upsert_with_retry(index, vectors, retries=UPSERT_RETRIES):
+    for attempt in range(retries + 1):
+        try:
+            return index.upsert(vectors=vectors)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = min(30.0, 0.5 * 2 ** attempt) * (1 + random.random() * 0.25)
+            print(f"[indexer.py] upsert failed ({type(e).__name__}: {e}), retrying in {delay:.1f}s", file=sys.stderr, flush=True)
+            time.sleep(delay)
+
+
+def index_chunks(all_chunks, index, index_name, model=None, ledger=None,
+                 embed_batch_size=EMBED_BATCH_SIZE, upsert_batch_size=UPSERT_BATCH_SIZE, workers=EMBED_WORKERS):
+    """
+    Embed and upsert the chunks that are not already in the index with the
+    same text. Returns counts and timings.
+    """
+    start = time.perf_counter()
+    ledger = ledger or Ledger()
+    known = ledger.known(index_name)
+    pending = []
+    for chunk in all_chunks:
+        vid = vector_id(chunk)
+        h = text_hash(chunk['text'])
+        if known.get(vid) != h:
+            pending.append((vid, h, chunk))
+    stats = {"chunks": len(all_chunks), "skipped": len(all_chunks) - len(pending), "upserted": 0, "upsert_calls": 0}
+    if not pending:
+        stats["seconds"] = round(time.perf_counter() - start, 2)
+        return stats
+
+    model = model or load_model()
+    # embed a few upsert batches at a time so memory stays bounded on large corpora
+    group = max(embed_batch_size, upsert_batch_size) * max(1, workers) * 4
+    encode_seconds = 0.0
+    for g in range(0, len(pending), group):
+        part = pending[g:g + group]
+        t = time.perf_counter()
+        embeddings = encode(model, [chunk['text'] for _, _, chunk in part], embed_batch_size, workers)
+        encode_seconds += time.perf_counter() - t
+        for b in range(0, len(part), upsert_batch_size):
+            batch = part[b:b + upsert_batch_size]
+            vectors = [
+                (vid, embeddings[b + i].tolist(), {'filename': chunk['filename'], 'chunk_id': chunk['chunk_id'], 'text': chunk['text']})
+                for i, (vid, _, chunk) in enumerate(batch)
+            ]
+            upsert_with_retry(index, vectors)
+            # only record what the store acknowledged, so a crash resumes at this batch
+            ledger.mark(index_name, [(vid, h) for vid, h, _ in batch])
+            stats["upserted"] += len(batch)
+            stats["upsert_calls"] += 1
+    stats["encode_seconds"] = round(encode_seconds, 2)
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    return stats
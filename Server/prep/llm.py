@@ -0,0 +1,150 @@
+import os
+import sys
+import time
+import random
+import threading
+from dotenv import load_dotenv
+import llm_cache
+
+'''Shared OpenAI access for the prep scripts: one client per process, a
+request/token-per-minute limiter and retry with exponential backoff.
+
+OPENAI_BASE_URL is honoured by the client, so everything here can be pointed
+at a local stub server (see bench/stub_llm.py).'''
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
+
+MODEL = "gpt-4o-mini-2024-07-18"
+REQUESTS_PER_MINUTE = int(os.getenv('OPENAI_RPM', 500))
+TOKENS_PER_MINUTE = int(os.getenv('OPENAI_TPM', 200000))
+MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 6))
+BACKOFF_BASE = float(os.getenv('OPENAI_BACKOFF_BASE', 1.0))
+BACKOFF_MAX = float(os.getenv('OPENAI_BACKOFF_MAX', 60.0))
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            import openai
+            # retries are handled by complete() so they count against the rate limiter
+            _client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    return _client
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English prose; good enough for rate limiting
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """
+    Token buckets for requests/minute and tokens/minute shared by all threads.
+    acquire(tokens) blocks until both buckets can pay for the request.
+    """
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.requests = float(requests_per_minute)
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60.0)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60.0)
+
+    def acquire(self, tokens):
+        # a single request larger than the whole bucket still has to go through eventually
+        tokens = min(tokens, self.tpm)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1
+                    self.tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self.requests) * 60.0 / self.rpm,
+                    (tokens - self.tokens) * 60.0 / self.tpm,
+                )
+            time.sleep(max(wait, 0.01))
+
+
+_limiter = None
+
+
+def get_limiter():
+    global _limiter
+    with _client_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+    return _limiter
+
+
+def _retry_after(error):
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def cache_stats():
+    cache = llm_cache.get_cache()
+    return cache.stats() if cache else {"enabled": False}
+
+
+def complete(system_prompt, user_prompt, model=MODEL, max_tokens=512, temperature=0.2, use_cache=True):
+    """
+    Run one chat completion and return the message content.
+    Answers are served from llm_cache when the exact same request was made
+    before; otherwise the call is rate limited and retried on 429s, timeouts,
+    connection and 5xx errors.
+    """
+    cache = llm_cache.get_cache() if use_cache else None
+    if cache:
+        key = llm_cache.cache_key(model, system_prompt, user_prompt, temperature, max_tokens)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    content = _complete_uncached(system_prompt, user_prompt, model, max_tokens, temperature)
+    if cache and content:
+        cache.put(key, content)
+    return content
+
+
+def _complete_uncached(system_prompt, user_prompt, model, max_tokens, temperature):
+    import openai
+    retryable = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+    client = get_client()
+    limiter = get_limiter()
+    cost = estimate_tokens(system_prompt) + estimate_tokens(user_prompt) + max_tokens
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire(cost)
+        try:
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+            return response.choices[0].message.content
+        except retryable as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _retry_after(e) or min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+            delay *= 1 + random.random() * 0.25
+            print(f"[llm.py] {type(e).__name__}, retrying in {delay:.1f}s (attempt {attempt+1}/{MAX_RETRIES})", file=sys.stderr, flush=True)
+            time.sleep(delay)
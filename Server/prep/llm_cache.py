@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+'''Content-addressed cache for LLM responses.
+
+Keys are sha256(model, system prompt, user prompt, temperature, max_tokens).
+Lookups go through an in-memory LRU first and then a SQLite file shared by
+every process (worker pool, CLI runs). The SQLite tier is capped by total
+size and entries expire after a TTL.
+
+Hit/miss counters are summed across processes in the SQLite file: each
+process adds its counts there every COUNTER_FLUSH_EVERY events and when
+stats() is called, so the totals can trail other processes by that many.
+
+Usage: python prep/llm_cache.py [stats|clear|evict]'''
+
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'cache'))
+
+ENABLED = os.getenv('LLM_CACHE', '1') != '0'
+CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join(CACHE_DIR, 'llm_cache.sqlite3'))
+MEMORY_ITEMS = int(os.getenv('LLM_CACHE_MEMORY_ITEMS', 512))
+MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_MB', 256)) * 1024 * 1024
+TTL_SECONDS = float(os.getenv('LLM_CACHE_TTL_DAYS', 30)) * 86400
+# run size/TTL eviction every N stores rather than on every write
+EVICT_EVERY = 50
+# add this process's counts to the shared totals every N counted events
+COUNTER_FLUSH_EVERY = 50
+
+
+def cache_key(model, system_prompt, user_prompt, temperature, max_tokens):
+    payload = json.dumps([model, system_prompt, user_prompt, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier (memory LRU + SQLite) response cache with hit/miss counters.
+    """
+
+    def __init__(self, path=CACHE_PATH, memory_items=MEMORY_ITEMS, max_bytes=MAX_BYTES, ttl_seconds=TTL_SECONDS):
+        self.path = path
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        # counts not yet added to the shared counters table
+        self.unflushed = dict.fromkeys(self.counters, 0)
+        self.unflushed_events = 0
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, key, value, created):
+        self.memory[key] = (value, created)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def _count(self, name, n=1):
+        # called under the lock
+        self.counters[name] += n
+        self.unflushed[name] += n
+        self.unflushed_events += 1
+        if self.unflushed_events >= COUNTER_FLUSH_EVERY:
+            self._flush_counters()
+
+    def _flush_counters(self):
+        if not self.unflushed_events:
+            return
+        db = self._db()
+        db.executemany(
+            "INSERT INTO counters (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            [(name, n) for name, n in self.unflushed.items() if n])
+        db.commit()
+        self.unflushed = dict.fromkeys(self.counters, 0)
+        self.unflushed_events = 0
+
+    def get(self, key):
+        with self.lock:
+            now = time.time()
+            if key in self.memory:
+                value, created = self.memory[key]
+                if now - created <= self.ttl_seconds:
+                    self.memory.move_to_end(key)
+                    self._count("memory_hits")
+                    return value
+                del self.memory[key]
+            db = self._db()
+            row = db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self._count("misses")
+                return None
+            db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            db.commit()
+            self._count("disk_hits")
+            self._remember(key, row[0], row[1])
+            return row[0]
+
+    def put(self, key, value):
+        with self.lock:
+            now = time.time()
+            self._remember(key, value, now)
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode('utf-8')), now, now),
+            )
+            db.commit()
+            self._count("stores")
+            if self.counters["stores"] % EVICT_EVERY == 0:
+                self._evict()
+
+    def _evict(self):
+        db = self._db()
+        removed = db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,)).rowcount
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            # drop least recently used rows until we are back under 90% of the cap
+            target = total - int(self.max_bytes * 0.9)
+            freed = 0
+            stale = []
+            for key, size in db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                stale.append((key,))
+                freed += size
+                if freed >= target:
+                    break
+            db.executemany("DELETE FROM responses WHERE key = ?", stale)
+            removed += len(stale)
+        db.commit()
+        if removed:
+            self._count("evictions", removed)
+        return removed
+
+    def evict(self):
+        with self.lock:
+            return self._evict()
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            db = self._db()
+            db.execute("DELETE FROM responses")
+            db.execute("DELETE FROM counters")
+            db.commit()
+            self.unflushed = dict.fromkeys(self.counters, 0)
+            self.unflushed_events = 0
+
+    def stats(self):
+        """
+        Counters summed over every process sharing the SQLite file, with
+        this process's own counts under "process".
+        """
+        with self.lock:
+            self._flush_counters()
+            db = self._db()
+            totals = dict.fromkeys(self.counters, 0)
+            totals.update(db.execute("SELECT name, value FROM counters"))
+            entries, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            lookups = totals["memory_hits"] + totals["disk_hits"] + totals["misses"]
+            hits = lookups - totals["misses"]
+            return dict(
+                totals,
+                process=dict(self.counters),
+                memory_entries=len(self.memory),
+                disk_entries=entries,
+                disk_bytes=size,
+                hit_rate=round(hits / lookups, 4) if lookups else 0.0,
+            )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Process-wide cache, or None when disabled with LLM_CACHE=0.
+    """
+    global _cache
+    if not ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+    return _cache
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    cache = ResponseCache()
+    if command == 'clear':
+        cache.clear()
+        print(json.dumps({"status": "cleared"}))
+    elif command == 'evict':
+        print(json.dumps({"evicted": cache.evict()}))
+    elif command == 'stats':
+        print(json.dumps(cache.stats(), indent=2))
+    else:
+        print(json.dumps({"error": "Usage: llm_cache.py [stats|clear|evict]"}))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+'''Page-level OCR for PDFs without a text layer.
+
+The parent process reads the text layer of every page with PyMuPDF. Pages
+that have no text are sent to a process pool, one task per page, across all
+files at once. Each pool process keeps its recently used documents open,
+renders the page straight from fitz into an in-memory grayscale image and
+runs tesseract on it, so there is no poppler subprocess and no re-parse of
+the PDF per page. The render DPI is picked from the page size: small pages
+get OCR_MAX_DPI, large drawings are scaled down towards OCR_TARGET_PIXELS
+but never below OCR_MIN_DPI.
+
+Usage: python prep/ocr.py [PDF or directory ...] [--workers N] [--json]'''
+
+PDF_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../rfpdb_pdfs'))
+
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', os.cpu_count() or 1))
+OCR_MIN_DPI = int(os.getenv('OCR_MIN_DPI', 150))
+OCR_MAX_DPI = int(os.getenv('OCR_MAX_DPI', 300))
+# a US letter page at 300 DPI
+OCR_TARGET_PIXELS = int(os.getenv('OCR_TARGET_PIXELS', 2550 * 3300))
+# OCR pages submitted ahead of the page iter_page_records is waiting on
+OCR_AHEAD = int(os.getenv('OCR_AHEAD', 2 * OCR_WORKERS))
+# open documents kept per pool process
+DOC_CACHE_SIZE = 4
+
+_docs = OrderedDict()
+
+
+def pick_dpi(width_pt, height_pt):
+    """
+    DPI for a page of the given size in PDF points (1/72 inch).
+    """
+    area_in = (width_pt / 72.0) * (height_pt / 72.0)
+    if area_in <= 0:
+        return OCR_MAX_DPI
+    dpi = int((OCR_TARGET_PIXELS / area_in) ** 0.5)
+    return max(OCR_MIN_DPI, min(OCR_MAX_DPI, dpi))
+
+
+def _init_process():
+    # one tesseract thread per process; the pool provides the parallelism
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+
+
+def _open(pdf_path):
+    import fitz
+    doc = _docs.get(pdf_path)
+    if doc is None:
+        doc = fitz.open(pdf_path)
+        _docs[pdf_path] = doc
+        while len(_docs) > DOC_CACHE_SIZE:
+            _docs.popitem(last=False)[1].close()
+    _docs.move_to_end(pdf_path)
+    return doc
+
+
+def render_page(page, dpi=None):
+    """
+    Rasterize a fitz page into a grayscale PIL image.
+    """
+    import fitz
+    from PIL import Image
+    if dpi is None:
+        dpi = pick_dpi(page.rect.width, page.rect.height)
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    return Image.frombytes("L", (pix.width, pix.height), pix.samples), dpi
+
+
+def ocr_page(pdf_path, page_index, dpi=None):
+    """
+    OCR one page (0-based index) of a PDF. Runs in the pool processes.
+    Returns {"text", "dpi", "render_ms", "ocr_ms"}.
+    """
+    import pytesseract
+    start = time.perf_counter()
+    image, dpi = render_page(_open(pdf_path)[page_index], dpi)
+    rendered = time.perf_counter()
+    text = pytesseract.image_to_string(image)
+    done = time.perf_counter()
+    return {
+        "text": text,
+        "dpi": dpi,
+        "render_ms": round((rendered - start) * 1000, 1),
+        "ocr_ms": round((done - rendered) * 1000, 1),
+    }
+
+
+def create_pool(max_workers=None):
+    return ProcessPoolExecutor(
+        max_workers=max_workers or OCR_WORKERS,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_process,
+    )
+
+
+def _scan(pdf_path, submit, run_ocr=True):
+    """
+    Read the text layer page by page, submitting OCR for the empty pages,
+    and yield each page record as it is read; OCR pages carry a future until
+    collected. With run_ocr=False empty pages get text '' and ocr None (no
+    OCR text yet).
+    """
+    import fitz
+    with fitz.open(pdf_path) as doc:
+        for index, page in enumerate(doc):
+            start = time.perf_counter()
+            text = page.get_text()
+            record = {"page": index + 1, "ocr": False, "text_ms": round((time.perf_counter() - start) * 1000, 1)}
+            if text.strip():
+                record["text"] = text
+            elif not run_ocr:
+                record["text"] = ""
+                record["ocr"] = None
+            else:
+                record["ocr"] = True
+                record["future"] = submit(ocr_page, pdf_path, index)
+            yield record
+
+
+def _resolve(pdf_path, record):
+    future = record.pop("future", None)
+    if future is None:
+        return record
+    try:
+        record.update(future.result())
+    except Exception as e:
+        print(f"[ocr.py] OCR failed for {pdf_path} page {record['page']}: {e}", file=sys.stderr, flush=True)
+        # ocr None marks the page as still without text, so a later run retries it
+        record.update({"text": "", "ocr": None, "dpi": None, "render_ms": 0.0, "ocr_ms": 0.0, "error": str(e)})
+    return record
+
+
+class LazyPool:
+    """
+    OCR pool that is only started once some page actually needs OCR.
+    Wraps an existing executor (not shut down here) when one is given.
+    """
+
+    def __init__(self, pool=None, max_workers=None):
+        self.pool = pool
+        self.owned = pool is None
+        self.max_workers = max_workers
+
+    def submit(self, *args):
+        if self.pool is None:
+            self.pool = create_pool(self.max_workers)
+        return self.pool.submit(*args)
+
+    def close(self):
+        if self.owned and self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+
+def iter_documents(pdf_paths, max_workers=None, pool=None, run_ocr=True):
+    """
+    Extract text from many PDFs, OCRing text-less pages in parallel across
+    all files. Yields (pdf_path, pages) in input order, where pages is a list
+    of {"page", "ocr", "text", "text_ms"[, "dpi", "render_ms", "ocr_ms"]}.
+    A PDF that cannot be opened yields (pdf_path, None).
+    """
+    lazy = LazyPool(pool, max_workers)
+    try:
+        scanned = []
+        for pdf_path in pdf_paths:
+            try:
+                scanned.append((pdf_path, list(_scan(pdf_path, lazy.submit, run_ocr))))
+            except Exception as e:
+                print(f"[ocr.py] Failed to open {pdf_path}: {e}", file=sys.stderr, flush=True)
+                scanned.append((pdf_path, None))
+        for pdf_path, pages in scanned:
+            yield pdf_path, [_resolve(pdf_path, record) for record in pages] if pages is not None else None
+    finally:
+        lazy.close()
+
+
+def iter_page_records(pdf_path, max_workers=None, pool=None, run_ocr=True):
+    """
+    Page records of one PDF in page order, each yielded as soon as it and
+    the pages before it are ready. The text layer is read page by page, and
+    reading runs ahead of a page waiting for OCR until OCR_AHEAD OCR pages
+    are in flight. Raises if the PDF cannot be opened.
+    """
+    lazy = LazyPool(pool, max_workers)
+    window = deque()
+    in_flight = 0
+    try:
+        for record in _scan(pdf_path, lazy.submit, run_ocr):
+            window.append(record)
+            in_flight += "future" in record
+            while window and ("future" not in window[0] or window[0]["future"].done() or in_flight >= OCR_AHEAD):
+                in_flight -= "future" in window[0]
+                yield _resolve(pdf_path, window.popleft())
+        while window:
+            yield _resolve(pdf_path, window.popleft())
+    finally:
+        lazy.close()
+
+
+def document_text(pages):
+    return ''.join(record["text"] + '\n' for record in pages)
+
+
+def summarize_timing(documents, wall_seconds):
+    all_pages = [record for _, pages in documents if pages for record in pages]
+    ocr_pages = [record for record in all_pages if record["ocr"]]
+    return {
+        "files": len(documents),
+        "pages": len(all_pages),
+        "ocr_pages": len(ocr_pages),
+        "render_seconds": round(sum(r["render_ms"] for r in ocr_pages) / 1000, 2),
+        "ocr_seconds": round(sum(r["ocr_ms"] for r in ocr_pages) / 1000, 2),
+        "wall_seconds": round(wall_seconds, 2),
+    }
+
+
+def _expand(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith('.pdf'):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR PDFs page by page across a process pool")
+    parser.add_argument('paths', nargs='*', default=[PDF_DIR])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--json', action='store_true', help="print per-page timing as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    documents = []
+    for pdf_path, pages in iter_documents(list(_expand(args.paths)), args.workers):
+        if pages is not None:
+            for record in pages:
+                record["chars"] = len(record.pop("text"))
+        documents.append((pdf_path, pages))
+    summary = summarize_timing(documents, time.perf_counter() - start)
+    if args.json:
+        print(json.dumps({
+            "summary": summary,
+            "files": [{"path": path, "pages": pages} for path, pages in documents],
+        }, indent=2))
+    else:
+        print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+import os
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+import ocr
+
+'''Per-page text store shared by every PDF consumer.
+
+A document is parsed once (PyMuPDF text layer, tesseract for pages without
+one; see ocr.py) and stored under the sha256 of its bytes, so copies, moves
+and renames of the same PDF are free. Each page row keeps zlib-compressed
+text, how it was obtained ('text', 'ocr' or 'none' when OCR was not run)
+and its extraction time. A later request that needs OCR only OCRs the
+'none' pages of a document parsed without it. File hashes are cached by
+(path, size, mtime), so a known document costs two lookups.
+
+Usage: python prep/page_store.py [stats | ingest PDF_OR_DIR... [--no-ocr] | text PDF]'''
+
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'cache'))
+STORE_PATH = os.getenv('PAGE_STORE_PATH', os.path.join(CACHE_DIR, 'page_store.sqlite3'))
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _source(record):
+    if record["ocr"]:
+        return 'ocr'
+    return 'none' if record["ocr"] is None else 'text'
+
+
+def _record_ms(record):
+    return record["text_ms"] + record.get("render_ms", 0.0) + record.get("ocr_ms", 0.0)
+
+
+class PageStore:
+    """
+    SQLite tables: documents (one row per content hash), pages (one row per
+    page) and paths (path/size/mtime -> content hash).
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " hash TEXT PRIMARY KEY, pages INTEGER NOT NULL, pending_ocr INTEGER NOT NULL,"
+            " seconds REAL NOT NULL, extracted REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " hash TEXT NOT NULL, page INTEGER NOT NULL, text BLOB NOT NULL, source TEXT NOT NULL,"
+            " ms REAL NOT NULL, PRIMARY KEY (hash, page)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS paths ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, hash TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS paths_hash ON paths (hash);"
+        )
+        self.conn.commit()
+
+    def hash_path(self, pdf_path):
+        pdf_path = os.path.abspath(pdf_path)
+        st = os.stat(pdf_path)
+        with self.lock:
+            row = self.conn.execute("SELECT size, mtime_ns, hash FROM paths WHERE path = ?", (pdf_path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        doc_hash = file_hash(pdf_path)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO paths (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+                (pdf_path, st.st_size, st.st_mtime_ns, doc_hash),
+            )
+            self.conn.commit()
+        return doc_hash
+
+    def document(self, doc_hash):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT pages, pending_ocr, seconds, extracted FROM documents WHERE hash = ?", (doc_hash,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"hash": doc_hash, "pages": row[0], "pending_ocr": row[1], "seconds": row[2], "extracted": row[3]}
+
+    def put(self, doc_hash, records, seconds):
+        """
+        Store (or overwrite) a document from ocr.py page records.
+        """
+        rows = [
+            (doc_hash, r["page"], zlib.compress(r["text"].encode('utf-8')), _source(r), _record_ms(r))
+            for r in records
+        ]
+        pending = sum(1 for r in records if r["ocr"] is None)
+        with self.lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM pages WHERE hash = ?", (doc_hash,))
+                self.conn.executemany("INSERT INTO pages (hash, page, text, source, ms) VALUES (?, ?, ?, ?, ?)", rows)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO documents (hash, pages, pending_ocr, seconds, extracted) VALUES (?, ?, ?, ?, ?)",
+                    (doc_hash, len(records), pending, seconds, time.time()),
+                )
+
+    def pending_pages(self, doc_hash):
+        with self.lock:
+            return [row[0] for row in self.conn.execute(
+                "SELECT page FROM pages WHERE hash = ? AND source = 'none' ORDER BY page", (doc_hash,)
+            )]
+
+    def fill_ocr(self, doc_hash, results, seconds):
+        """
+        results: {page_number: ocr_page() result} for previously pending pages.
+        """
+        with self.lock:
+            with self.conn:
+                for page, result in results.items():
+                    self.conn.execute(
+                        "UPDATE pages SET text = ?, source = 'ocr', ms = ms + ? WHERE hash = ? AND page = ?",
+                        (zlib.compress(result["text"].encode('utf-8')), result["render_ms"] + result["ocr_ms"], doc_hash, page),
+                    )
+                self.conn.execute(
+                    "UPDATE documents SET pending_ocr = pending_ocr - ?, seconds = seconds + ? WHERE hash = ?",
+                    (len(results), seconds, doc_hash),
+                )
+
+    def pages(self, doc_hash, first=1, last=None):
+        """
+        Yield (page_number, text, source) one row at a time.
+        """
+        last = last if last is not None else sys.maxsize
+        page = first
+        while page <= last:
+            # one short query per page keeps the lock free between pages
+            with self.lock:
+                row = self.conn.execute(
+                    "SELECT page, text, source FROM pages WHERE hash = ? AND page >= ? AND page <= ? ORDER BY page LIMIT 1",
+                    (doc_hash, page, last),
+                ).fetchone()
+            if row is None:
+                return
+            yield row[0], zlib.decompress(row[1]).decode('utf-8'), row[2]
+            page = row[0] + 1
+
+    def catalog(self):
+        """
+        {content hash: (pages, pending OCR pages)} for every stored document.
+        """
+        with self.lock:
+            return {row[0]: (row[1], row[2]) for row in self.conn.execute(
+                "SELECT hash, pages, pending_ocr FROM documents")}
+
+    def paths_for(self, doc_hashes):
+        """
+        {content hash: [known paths]} for the given hashes.
+        """
+        found = {}
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT hash, path FROM paths WHERE hash IN (SELECT value FROM json_each(?)) ORDER BY path",
+                (json.dumps(list(doc_hashes)),)).fetchall()
+        for doc_hash, path in rows:
+            found.setdefault(doc_hash, []).append(path)
+        return found
+
+    def stats(self):
+        with self.lock:
+            docs, pages, pending, seconds = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(pages), 0), COALESCE(SUM(pending_ocr), 0), COALESCE(SUM(seconds), 0) FROM documents"
+            ).fetchone()
+            ocr_pages, text_bytes = self.conn.execute(
+                "SELECT COALESCE(SUM(source = 'ocr'), 0), COALESCE(SUM(LENGTH(text)), 0) FROM pages"
+            ).fetchone()
+        return {
+            "documents": docs,
+            "pages": pages,
+            "ocr_pages": ocr_pages,
+            "pending_ocr_pages": pending,
+            "compressed_text_bytes": text_bytes,
+            "extraction_seconds": round(seconds, 2),
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PageStore()
+    return _store
+
+
+def _complete_ocr(store, pdf_path, doc_hash, lazy_pool):
+    pending = store.pending_pages(doc_hash)
+    if not pending:
+        return
+    start = time.perf_counter()
+    futures = {page: lazy_pool.submit(ocr.ocr_page, pdf_path, page - 1) for page in pending}
+    results = {}
+    for page, future in futures.items():
+        try:
+            results[page] = future.result()
+        except Exception as e:
+            print(f"[page_store.py] OCR failed for {pdf_path} page {page}: {e}", file=sys.stderr, flush=True)
+    store.fill_ocr(doc_hash, results, time.perf_counter() - start)
+
+
+def ensure_many(pdf_paths, run_ocr=True, max_workers=None):
+    """
+    Make sure every PDF is in the store (with OCR when run_ocr). Unknown
+    documents are extracted together so their OCR pages share one pool.
+    Returns {pdf_path: content hash, or None if the PDF could not be read}.
+    """
+    store = get_store()
+    hashes = {}
+    missing = []
+    lazy = ocr.LazyPool(max_workers=max_workers)
+    try:
+        for pdf_path in pdf_paths:
+            try:
+                doc_hash = store.hash_path(pdf_path)
+            except OSError as e:
+                print(f"[page_store.py] Cannot read {pdf_path}: {e}", file=sys.stderr, flush=True)
+                hashes[pdf_path] = None
+                continue
+            hashes[pdf_path] = doc_hash
+            document = store.document(doc_hash)
+            if document is None:
+                missing.append(pdf_path)
+            elif run_ocr and document["pending_ocr"]:
+                _complete_ocr(store, pdf_path, doc_hash, lazy)
+        if missing:
+            start = time.perf_counter()
+            for pdf_path, records in ocr.iter_documents(missing, run_ocr=run_ocr, pool=lazy):
+                if records is None:
+                    hashes[pdf_path] = None
+                    continue
+                store.put(hashes[pdf_path], records, sum(_record_ms(r) for r in records) / 1000)
+            print(f"[page_store.py] Extracted {len(missing)} documents in {time.perf_counter() - start:.1f}s", file=sys.stderr, flush=True)
+    finally:
+        lazy.close()
+    return hashes
+
+
+def iter_pages(pdf_path, run_ocr=True, first=1, last=None):
+    """
+    Yield (page_number, text) for pages first..last that have text.
+    A known document is read from the store row by row; an unknown one is
+    extracted page by page (see ocr.iter_page_records), each page yielded
+    as soon as it is read or OCRed, and stored once complete.
+    """
+    store = get_store()
+    doc_hash = store.hash_path(pdf_path)
+    document = store.document(doc_hash)
+    if document is not None:
+        if run_ocr and document["pending_ocr"]:
+            lazy = ocr.LazyPool()
+            try:
+                _complete_ocr(store, pdf_path, doc_hash, lazy)
+            finally:
+                lazy.close()
+        for page_number, text, _ in store.pages(doc_hash, first, last):
+            if text.strip():
+                yield page_number, text
+        return
+    records = []
+    for record in ocr.iter_page_records(pdf_path, run_ocr=run_ocr):
+        records.append(record)
+        page_number = record["page"]
+        if page_number >= first and (last is None or page_number <= last) and record["text"].strip():
+            yield page_number, record["text"]
+    store.put(doc_hash, records, sum(_record_ms(r) for r in records) / 1000)
+
+
+def document_text(pdf_path, run_ocr=True, first=1, last=None):
+    return ''.join(text + '\n' for _, text in iter_pages(pdf_path, run_ocr, first, last))
+
+
+def _expand(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith('.pdf'):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def main():
+    args = sys.argv[1:]
+    command = args[0] if args else 'stats'
+    if command == 'ingest' and len(args) > 1:
+        run_ocr = '--no-ocr' not in args
+        paths = list(_expand(a for a in args[1:] if a != '--no-ocr'))
+        start = time.perf_counter()
+        hashes = ensure_many(paths, run_ocr=run_ocr)
+        print(json.dumps({
+            "documents": len(paths),
+            "failed": sum(1 for h in hashes.values() if h is None),
+            "seconds": round(time.perf_counter() - start, 2),
+            **get_store().stats(),
+        }, indent=2))
+    elif command == 'text' and len(args) > 1:
+        sys.stdout.write(document_text(args[1]))
+    elif command == 'stats':
+        print(json.dumps(get_store().stats(), indent=2))
+    else:
+        print(json.dumps({"error": "Usage: page_store.py [stats | ingest PDF_OR_DIR... [--no-ocr] | text PDF]"}))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,280 @@
 import sys
 import os
-import fitz 
 import json
-from google.cloud import storage
+import time
+import hashlib
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+'''Render PDF pages to PNG and upload them to a bucket.
+
+Pages are rendered across a process pool that lives as long as the calling
+process (one page per task; each render process keeps the document open), and the PNG bytes are uploaded straight from
+memory by a bounded thread pool. At most RENDER_AHEAD rendered pages wait
+for upload, so memory stays flat on large documents.
+
+A manifest ({prefix}/images_manifest.json: source hash, dpi, uploaded pages)
+is rewritten every MANIFEST_EVERY pages and at the end. Re-running with the
+same prefix, PDF and dpi skips pages that are in the manifest and still in
+the bucket. iter_page_images yields one event per page as soon as its
+upload finishes, so callers can show page 1 before the last page renders.
+
+bucket_name "file:///some/dir" selects LocalBucket, a directory-backed
+stand-in for GCS.
+
+Usage: python prep/pdf_to_image_and_gcs.py <pdf_path> <bucket_name> <gcs_prefix>'''
+
+DPI = 200
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', 8))
+UPLOAD_RETRIES = 3
+RENDER_AHEAD = RENDER_WORKERS * 2
+MANIFEST_EVERY = 10
+MANIFEST_NAME = 'images_manifest.json'
+
+_storage_client = None
+_render_pool = None
+
+def get_storage_client():
+    global _storage_client
+    if _storage_client is None:
+        from google.cloud import storage
+        _storage_client = storage.Client()
+    return _storage_client
+
+
+def get_render_pool():
+    """
+    The process-wide render pool, started on first use.
+    """
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(
+            max_workers=RENDER_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _render_pool
+
+
+def _discard_render_pool(pool):
+    # a render process died and took the pool with it; the next call starts a new one
+    global _render_pool
+    if _render_pool is pool:
+        _render_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class LocalBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.path = os.path.join(bucket.root, name)
+
+    def upload_from_string(self, data, content_type=None):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+    def download_as_bytes(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+
+class LocalBucket:
+    """
+    The subset of google.cloud.storage.Bucket used here, backed by a directory.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.name = root
+        os.makedirs(root, exist_ok=True)
+
+    def blob(self, name):
+        return LocalBlob(self, name)
+
+    def list_blobs(self, prefix=''):
+        directory = os.path.join(self.root, os.path.dirname(prefix))
+        if not os.path.isdir(directory):
+            return []
+        names = (os.path.relpath(os.path.join(dirpath, f), self.root).replace(os.sep, '/')
+                 for dirpath, _, files in os.walk(directory) for f in files)
+        return [LocalBlob(self, name) for name in sorted(names) if name.startswith(prefix) and not name.endswith('.tmp')]
+
+
+def get_bucket(bucket_name):
+    if bucket_name.startswith('file://'):
+        return LocalBucket(bucket_name[len('file://'):])
+    return get_storage_client().bucket(bucket_name)
+
+
+def _url(bucket_name, name):
+    if bucket_name.startswith('file://'):
+        return f"{bucket_name.rstrip('/')}/{name}"
+    return f"gs://{bucket_name}/{name}"
+
+
+def _page_blob_name(gcs_prefix, page_number):
+    return f"{gcs_prefix}/page_{page_number}.png"
+
+
+_docs = OrderedDict()
+
+
+def render_page_png(pdf_path, page_index, dpi=DPI):
+    """
+    PNG bytes of one page. Runs in the render pool; keeps a few documents open per process.
+    """
+    import fitz
+    # render processes outlive one upload, so a path reused for another file must not hit the cache
+    stat = os.stat(pdf_path)
+    key = (pdf_path, stat.st_size, stat.st_mtime_ns)
+    doc = _docs.get(key)
+    if doc is None:
+        doc = _docs[key] = fitz.open(pdf_path)
+        while len(_docs) > 2:
+            _docs.popitem(last=False)[1].close()
+    start = time.perf_counter()
+    png = doc.load_page(page_index).get_pixmap(dpi=dpi).tobytes("png")
+    return png, round((time.perf_counter() - start) * 1000, 1)
+
+
+def _file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _load_manifest(bucket, gcs_prefix, source_hash, dpi):
+    blob = bucket.blob(f"{gcs_prefix}/{MANIFEST_NAME}")
+    try:
+        manifest = json.loads(blob.download_as_bytes())
+    except Exception:
+        return {}
+    if manifest.get('source_hash') != source_hash or manifest.get('dpi') != dpi:
+        return {}
+    # only trust pages whose image is still in the bucket
+    present = {b.name for b in bucket.list_blobs(prefix=f"{gcs_prefix}/page_")}
+    return {int(page): url for page, url in manifest.get('pages', {}).items()
+            if _page_blob_name(gcs_prefix, int(page)) in present}
+
+
+def _save_manifest(bucket, gcs_prefix, source_hash, dpi, page_count, pages):
+    manifest = {
+        "source_hash": source_hash,
+        "dpi": dpi,
+        "page_count": page_count,
+        "pages": {str(page): url for page, url in sorted(pages.items())},
+    }
+    bucket.blob(f"{gcs_prefix}/{MANIFEST_NAME}").upload_from_string(json.dumps(manifest), content_type='application/json')
+
+
+def _upload(bucket, name, data):
+    for attempt in range(UPLOAD_RETRIES + 1):
+        try:
+            start = time.perf_counter()
+            bucket.blob(name).upload_from_string(data, content_type='image/png')
+            return round((time.perf_counter() - start) * 1000, 1)
+        except Exception as e:
+            if attempt == UPLOAD_RETRIES:
+                raise
+            print(f"[pdf_to_image_and_gcs.py] Upload of {name} failed ({e}), retrying", file=sys.stderr, flush=True)
+            time.sleep(0.5 * 2 ** attempt)
+
+
+def iter_page_images(pdf_path, bucket_name, gcs_prefix, dpi=DPI, render_workers=None, upload_concurrency=None):
+    """
+    Render and upload every page, yielding
+    {"page", "url", "pageCount", "skipped", "render_ms", "upload_ms"} per page
+    in completion order.
+    """
+    import fitz
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    bucket = get_bucket(bucket_name)
+    source_hash = _file_hash(pdf_path)
+    done = _load_manifest(bucket, gcs_prefix, source_hash, dpi)
+    for page_number in sorted(done):
+        yield {"page": page_number, "url": done[page_number], "pageCount": page_count, "skipped": True, "render_ms": 0.0, "upload_ms": 0.0}
+    todo = [n for n in range(1, page_count + 1) if n not in done]
+    if not todo:
+        return
+
+    since_save = 0
+    # render_workers asks for a pool of that size just for this call
+    renders = ProcessPoolExecutor(
+        max_workers=min(render_workers, len(todo)),
+        mp_context=multiprocessing.get_context('spawn'),
+    ) if render_workers else get_render_pool()
+    uploads = ThreadPoolExecutor(max_workers=upload_concurrency or UPLOAD_CONCURRENCY)
+    queue = iter(todo)
+    rendering = {}
+    uploading = {}
+    try:
+        def fill():
+            # keep the render pool busy, but never hold more than RENDER_AHEAD pages in memory
+            while len(rendering) + len(uploading) < RENDER_AHEAD:
+                page_number = next(queue, None)
+                if page_number is None:
+                    return
+                rendering[renders.submit(render_page_png, pdf_path, page_number - 1, dpi)] = page_number
+
+        fill()
+        while rendering or uploading:
+            finished, _ = wait(list(rendering) + list(uploading), return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future in rendering:
+                    page_number = rendering.pop(future)
+                    png, render_ms = future.result()
+                    name = _page_blob_name(gcs_prefix, page_number)
+                    uploading[uploads.submit(_upload, bucket, name, png)] = (page_number, render_ms)
+                else:
+                    page_number, render_ms = uploading.pop(future)
+                    upload_ms = future.result()
+                    url = _url(bucket_name, _page_blob_name(gcs_prefix, page_number))
+                    done[page_number] = url
+                    since_save += 1
+                    if since_save >= MANIFEST_EVERY:
+                        _save_manifest(bucket, gcs_prefix, source_hash, dpi, page_count, done)
+                        since_save = 0
+                    yield {"page": page_number, "url": url, "pageCount": page_count, "skipped": False,
+                           "render_ms": render_ms, "upload_ms": upload_ms}
+            fill()
+    except BrokenProcessPool:
+        if not render_workers:
+            _discard_render_pool(renders)
+        raise
+    finally:
+        if render_workers:
+            renders.shutdown(cancel_futures=True)
+        else:
+            # the shared pool stays up; drop the renders this call no longer wants
+            for future in rendering:
+                future.cancel()
+        uploads.shutdown(wait=True)
+        if since_save:
+            _save_manifest(bucket, gcs_prefix, source_hash, dpi, page_count, done)
+
 
 def pdf_to_images(pdf_path, bucket_name, gcs_prefix):
-    doc = fitz.open(pdf_path)
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    manifest = []
-    for i in range(doc.page_count):
-        page = doc.load_page(i)
-        pix = page.get_pixmap(dpi=200)
-        img_filename = f"{gcs_prefix}_page_{i+1}.png"
-        local_dir = os.path.dirname(img_filename)
-        if local_dir and not os.path.exists(local_dir):
-            os.makedirs(local_dir, exist_ok=True)
-        pix.save(img_filename)
-        # Upload to GCS
-        blob = bucket.blob(f"{gcs_prefix}/page_{i+1}.png")
-        blob.upload_from_filename(img_filename)
-        manifest.append(f"gs://{bucket_name}/{gcs_prefix}/page_{i+1}.png")
-        os.remove(img_filename)
-    return manifest
+    """
+    All page image URLs in page order (the non-streaming form of iter_page_images).
+    """
+    pages = {event["page"]: event["url"] for event in iter_page_images(pdf_path, bucket_name, gcs_prefix)}
+    return [pages[n] for n in sorted(pages)]
 
-if __name__ == "__main__":
+def main():
     try:
         pdf_path, bucket_name, gcs_prefix = sys.argv[1:4]
         manifest = pdf_to_images(pdf_path, bucket_name, gcs_prefix)
@@ -33,5 +283,8 @@ if __name__ == "__main__":
             print("Warning: No images generated from PDF.", file=sys.stderr)
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
-        print(json.dumps([])) 
-        sys.exit(1)
\ No newline at end of file
+        print(json.dumps([]))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
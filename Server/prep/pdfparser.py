@@ -1,12 +1,11 @@
 import os
-import fitz
-import pytesseract
-from pdf2image import convert_from_path
-from PIL import Image
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import pinecone
-from sentence_transformers import SentenceTransformer
+import json
 from dotenv import load_dotenv
+import page_store
+import dedup
+import text_index
+import indexer
+import vector_index
 
 
 
@@ -15,52 +14,85 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 PDF_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../rfpdb_pdfs'))
 CHUNKS_OUTPUT = os.path.abspath(os.path.join(os.path.dirname(__file__), 'rfp_chunks.txt'))
 
+PINECONE_API_KEY = os.getenv('PINECONE_API_KEY')
+PINECONE_ENV = os.getenv('PINECONE_ENV', 'us-west1-gcp')
+INDEX_NAME = os.getenv('PINECONE_INDEX', 'rfp-chunks')
+# chunk one canonical copy per duplicate group, plus the diff pages of near-duplicates
+DEDUP = os.getenv('PDF_DEDUP', '1') != '0'
+
 def extract_text_with_ocr(pdf_path):
-    doc = fitz.open(pdf_path)
-    text = ''
-    for page_num, page in enumerate(doc):
-        page_text = page.get_text()
-        if page_text.strip():
-            text += page_text + '\n'
-        else:
-            images = convert_from_path(pdf_path, first_page=page_num+1, last_page=page_num+1)
-            for img in images:
-                ocr_text = pytesseract.image_to_string(img)
-                text += ocr_text + '\n'
-    return text
+    # parsed once into page_store; pages without a text layer are OCRed by ocr.py
+    return page_store.document_text(pdf_path)
 
-all_chunks = []
-for fname in os.listdir(PDF_DIR):
-    if fname.lower().endswith('.pdf'):
-        pdf_path = os.path.join(PDF_DIR, fname)
-        text = extract_text_with_ocr(pdf_path)
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+def chunk_pdfs(pdf_dir):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+    pdf_paths = [os.path.join(pdf_dir, fname) for fname in sorted(os.listdir(pdf_dir)) if fname.lower().endswith('.pdf')]
+    # new documents are extracted together so their OCR pages share one pool; known ones are lookups.
+    # Text layers come first so duplicates are found before anything is OCRed.
+    hashes = page_store.ensure_many(pdf_paths, run_ocr=not DEDUP)
+    if DEDUP:
+        plan = dedup.plan(pdf_paths, hashes=hashes)
+        print(f"Dedup: {json.dumps(dedup.summarize(plan)['by_reason'])}")
+        pdf_paths = [p for p in pdf_paths if p in plan and plan[p]["reason"] in (None, "near")]
+        page_store.ensure_many(pdf_paths)
+    all_chunks = []
+    for pdf_path in pdf_paths:
+        if hashes[pdf_path] is None:
+            continue
+        pages = plan[pdf_path]["pages"] if DEDUP else None
+        if pages is None:
+            text = page_store.document_text(pdf_path)
+        else:
+            wanted = set(pages)
+            text = ''.join(t + '\n' for n, t in page_store.iter_pages(pdf_path) if n in wanted)
         chunks = splitter.split_text(text)
         for i, chunk in enumerate(chunks):
-            all_chunks.append({'filename': fname, 'chunk_id': i, 'text': chunk})
+            all_chunks.append({'filename': os.path.basename(pdf_path), 'chunk_id': i, 'text': chunk})
+    print(f"Page store: {json.dumps(page_store.get_store().stats())}")
+    # keep the full-text index (prep/text_index.py) in step with what was just parsed
+    print(f"Text index: {json.dumps(text_index.get_index().sync())}")
+    return all_chunks
 
-with open(CHUNKS_OUTPUT, 'w', encoding='utf-8') as f:
-    for chunk in all_chunks:
-        f.write(f"FILENAME: {chunk['filename']} | CHUNK_ID: {chunk['chunk_id']}\n{chunk['text']}\n{'-'*80}\n")
+def write_chunks(all_chunks, output_path):
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for chunk in all_chunks:
+            f.write(f"FILENAME: {chunk['filename']} | CHUNK_ID: {chunk['chunk_id']}\n{chunk['text']}\n{'-'*80}\n")
 
-PINECONE_API_KEY = os.getenv('PINECONE_API_KEY')
-PINECONE_ENV = os.getenv('PINECONE_ENV', 'us-west1-gcp')
-INDEX_NAME = os.getenv('PINECONE_INDEX', 'rfp-chunks')
-
-if PINECONE_API_KEY:
+def upload_to_pinecone(all_chunks):
+    import pinecone
     pinecone.init(api_key=PINECONE_API_KEY, environment=PINECONE_ENV)
+    ledger = indexer.Ledger()
     if INDEX_NAME not in pinecone.list_indexes():
-        pinecone.create_index(INDEX_NAME, dimension=384)
+        pinecone.create_index(INDEX_NAME, dimension=indexer.EMBED_DIMENSION)
+        # a new index holds nothing, whatever the ledger remembers
+        ledger.forget(INDEX_NAME)
     index = pinecone.Index(INDEX_NAME)
 
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    for chunk in all_chunks:
-        vector = model.encode(chunk['text']).tolist()
-        meta = {'filename': chunk['filename'], 'chunk_id': chunk['chunk_id']}
-        index.upsert([(f"{chunk['filename']}_{chunk['chunk_id']}", vector, meta)])
-    print(f"Uploaded {len(all_chunks)} chunks to Pinecone index '{INDEX_NAME}'.")
-else:
-    print("PINECONE_API_KEY not found in environment. Skipping Pinecone upload.")
-    
-    
-    
\ No newline at end of file
+    stats = indexer.index_chunks(all_chunks, index, INDEX_NAME, ledger=ledger)
+    print(f"Uploaded {stats['upserted']} chunks to Pinecone index '{INDEX_NAME}' "
+          f"({stats['skipped']} unchanged, {stats['upsert_calls']} upserts, {stats['seconds']}s).")
+
+def index_locally(all_chunks):
+    path = os.path.join(vector_index.INDEX_DIR, INDEX_NAME)
+    ledger = indexer.Ledger()
+    index = vector_index.VectorIndex(path, dim=indexer.EMBED_DIMENSION)
+    # an index holding fewer vectors than the ledger lists (new, or lost) is refilled from scratch
+    if len(index) < ledger.count(f"local:{INDEX_NAME}"):
+        ledger.forget(f"local:{INDEX_NAME}")
+    stats = indexer.index_chunks(all_chunks, index, f"local:{INDEX_NAME}", ledger=ledger)
+    removed = index.compact()
+    print(f"Indexed {stats['upserted']} chunks into {path} "
+          f"({stats['skipped']} unchanged, {removed} stale rows compacted, {stats['seconds']}s).")
+
+def main():
+    all_chunks = chunk_pdfs(PDF_DIR)
+    write_chunks(all_chunks, CHUNKS_OUTPUT)
+    if PINECONE_API_KEY:
+        upload_to_pinecone(all_chunks)
+    else:
+        print("PINECONE_API_KEY not found in environment. Indexing into the local vector index instead.")
+        index_locally(all_chunks)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+'''Persistent page -> file -> workspace summary tree.
+
+Every node is addressed by a hash of its inputs: a page node by its page
+number and text, a reduce node by its kind and the ordered hashes of its
+children. A node whose hash is already stored is never summarized again, so
+changing one page only recomputes that page, the reduce nodes above it and
+the root. Reductions have bounded fan-in (REDUCE_FAN_IN children and
+REDUCE_MAX_CHARS characters per call); larger inputs are reduced level by
+level so a single call never exceeds the model's context window.'''
+
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'cache'))
+TREE_PATH = os.getenv('SUMMARY_TREE_PATH', os.path.join(CACHE_DIR, 'summary_tree.sqlite3'))
+REDUCE_FAN_IN = int(os.getenv('REDUCE_FAN_IN', 16))
+# ~12k tokens of child summaries per reduce call
+REDUCE_MAX_CHARS = int(os.getenv('REDUCE_MAX_CHARS', 48000))
+
+
+def _hash(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+def page_hash(text, page_number):
+    return _hash('page', page_number, text)
+
+
+def leaf_hash(summary):
+    # a summary we only have as text (e.g. a file summary written before the tree existed)
+    return _hash('leaf', summary)
+
+
+def reduce_hash(kind, child_hashes):
+    return _hash(kind, *child_hashes)
+
+
+def group_children(items, fan_in=REDUCE_FAN_IN, max_chars=REDUCE_MAX_CHARS):
+    """
+    Split ordered (hash, summary) items into consecutive groups bounded by
+    fan_in items and max_chars characters. Grouping depends only on the items
+    themselves, so an appended page only disturbs the last group.
+    """
+    groups = []
+    current = []
+    size = 0
+    for item in items:
+        length = len(item[1]) + 1
+        if current and (len(current) >= fan_in or size + length > max_chars):
+            groups.append(current)
+            current = []
+            size = 0
+        current.append(item)
+        size += length
+    if current:
+        groups.append(current)
+    return groups
+
+
+class SummaryTree:
+    """
+    SQLite-backed node store plus the incremental map/reduce over it.
+    summarize(text, context_type, page_number) does the actual LLM call.
+    """
+
+    def __init__(self, summarize, path=TREE_PATH, max_workers=8, fan_in=REDUCE_FAN_IN, max_chars=REDUCE_MAX_CHARS):
+        self.summarize = summarize
+        self.path = path
+        self.max_workers = max_workers
+        self.fan_in = fan_in
+        self.max_chars = max_chars
+        self.lock = threading.Lock()
+        self.computed = 0
+        self.reused = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS nodes ("
+            "hash TEXT PRIMARY KEY, kind TEXT NOT NULL, inputs TEXT NOT NULL, "
+            "summary TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def get(self, node_hash):
+        with self.lock:
+            row = self.conn.execute("SELECT summary FROM nodes WHERE hash = ?", (node_hash,)).fetchone()
+        return row[0] if row else None
+
+    def node(self, node_hash):
+        with self.lock:
+            row = self.conn.execute("SELECT kind, inputs, summary FROM nodes WHERE hash = ?", (node_hash,)).fetchone()
+        if not row:
+            return None
+        return {"hash": node_hash, "kind": row[0], "inputs": json.loads(row[1]), "summary": row[2]}
+
+    def put(self, node_hash, kind, inputs, summary):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO nodes (hash, kind, inputs, summary, created) VALUES (?, ?, ?, ?, ?)",
+                (node_hash, kind, json.dumps(inputs), summary, time.time()),
+            )
+            self.conn.commit()
+
+    def _compute_missing(self, jobs):
+        """
+        jobs: list of (node_hash, kind, inputs, text, context_type, page_number).
+        Summarizes the nodes that are not stored yet, concurrently.
+        Returns {node_hash: summary} for all jobs.
+        """
+        results = {}
+        missing = {}
+        for job in jobs:
+            summary = self.get(job[0])
+            if summary is None:
+                missing.setdefault(job[0], job)
+            else:
+                results[job[0]] = summary
+        missing = list(missing.values())
+        self.reused += len(jobs) - len(missing)
+        self.computed += len(missing)
+
+        def run(job):
+            node_hash, kind, inputs, text, context_type, page_number = job
+            summary = self.summarize(text, context_type, page_number)
+            self.put(node_hash, kind, inputs, summary)
+            return node_hash, summary
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as pool:
+                for node_hash, summary in pool.map(run, missing):
+                    results[node_hash] = summary
+        return results
+
+    def summarize_pages(self, pages):
+        """
+        pages: list of (text, page_number). Returns [(hash, summary)] in page order.
+        """
+        jobs = []
+        for text, page_number in pages:
+            h = page_hash(text, page_number)
+            jobs.append((h, 'page', [], text, 'page', page_number))
+        results = self._compute_missing(jobs)
+        return [(job[0], results[job[0]]) for job in jobs]
+
+    def reduce(self, items, context_type):
+        """
+        Reduce ordered (hash, summary) items into a single node of kind
+        context_type ('file' or 'workspace'). Returns (hash, summary).
+        """
+        if not items:
+            return reduce_hash(context_type, []), ''
+        level = list(items)
+        while True:
+            groups = group_children(level, self.fan_in, self.max_chars)
+            if len(groups) == len(level) > 1:
+                # every child alone exceeds max_chars; pair them up so the tree still shrinks
+                groups = [level[i:i + 2] for i in range(0, len(level), 2)]
+            final = len(groups) == 1
+            kind = context_type if final else f"{context_type}_part"
+            jobs = []
+            for group in groups:
+                child_hashes = [h for h, _ in group]
+                text = "\n".join(summary for _, summary in group)
+                jobs.append((reduce_hash(kind, child_hashes), kind, child_hashes, text, context_type, None))
+            results = self._compute_missing(jobs)
+            level = [(job[0], results[job[0]]) for job in jobs]
+            if final:
+                return level[0]
+
+    def stats(self):
+        return {"computed": self.computed, "reused": self.reused}
@@ -0,0 +1,333 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import page_store
+
+'''Full-text index over the per-page text in page_store.
+
+One FTS5 row per page with text, keyed by rowid = document id * PAGE_SPAN
++ page number, so a hit's document and page come from its rowid and a
+document's pages are one rowid range. Queries use FTS5 syntax: words, "a phrase",
+prefix*, AND / OR / NOT, NEAR(). Hits are ranked by bm25 and come with a
+snippet.
+
+sync() makes the index follow page_store. It compares the documents table
+on both sides, so a re-sync with nothing new only reads those two tables.
+New documents are indexed, and a document whose OCR was completed since is
+re-indexed. Words are matched whole (unicode61, no stemming), so "section
+m" does not also match "section mechanical"; use a prefix to get word
+forms ("specification*").
+
+Usage: python prep/text_index.py sync
+       python prep/text_index.py stats
+       python prep/text_index.py optimize
+       python prep/text_index.py search QUERY [--documents] [--first N] [--last N] [--limit N] [--json]'''
+
+STORE_PATH = os.getenv('TEXT_INDEX_PATH', os.path.join(page_store.CACHE_DIR, 'text_index.sqlite3'))
+PAGE_SPAN = 1 << 20
+SNIPPET_TOKENS = 16
+SYNC_BATCH = 100
+# dropped when a chat prompt is turned into a query
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it of on or our should that the "
+    "their there these this to was what when where which who why will with would you your".split())
+_WORD = re.compile(r"\w+")
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def keyword_query(keywords):
+    """
+    An FTS query matching any of the phrases as written or as the start of
+    longer words ("requirement" finds "requirements").
+    """
+    return ' OR '.join(_quote(k) + '*' for k in keywords)
+
+
+def query_from_text(text):
+    """
+    An OR query over the content words of free text (a chat prompt), or None.
+    """
+    words = dict.fromkeys(w for w in _WORD.findall(text.lower()) if len(w) > 2 and w not in STOPWORDS)
+    return ' OR '.join(_quote(w) for w in words) or None
+
+
+class TextIndex:
+    """
+    SQLite tables: documents (content hash -> id, plus the page_store
+    page/pending-OCR counts it was indexed at) and pages_fts (FTS5, one row
+    per page).
+    """
+
+    def __init__(self, path=STORE_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " id INTEGER PRIMARY KEY, hash TEXT NOT NULL UNIQUE, pages INTEGER NOT NULL,"
+            " pending_ocr INTEGER NOT NULL, indexed_pages INTEGER NOT NULL, indexed REAL NOT NULL);"
+            "CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5("
+            " text, tokenize='unicode61 remove_diacritics 2', prefix='2 3');"
+        )
+        self.conn.commit()
+
+    def sync(self, store=None, hashes=None):
+        """
+        Index what page_store has that the index lacks or holds an older
+        version of. With hashes, only those documents are looked at and
+        nothing is removed. Returns {"indexed", "pages", "removed", "seconds"}.
+        """
+        start = time.perf_counter()
+        store = store or page_store.get_store()
+        catalog = store.catalog()
+        if hashes is not None:
+            hashes = set(hashes)
+            catalog = {h: sig for h, sig in catalog.items() if h in hashes}
+        with self.lock:
+            known = {row[0]: (row[1], (row[2], row[3])) for row in self.conn.execute(
+                "SELECT hash, id, pages, pending_ocr FROM documents")}
+        changed = [h for h, sig in catalog.items() if h not in known or known[h][1] != tuple(sig)]
+        removed = [] if hashes is not None else [h for h in known if h not in catalog]
+        pages = 0
+        for i in range(0, len(changed), SYNC_BATCH):
+            batch = [(h, catalog[h], [(n, text) for n, text, _ in store.pages(h) if text.strip()])
+                     for h in changed[i:i + SYNC_BATCH]]
+            with self.lock:
+                with self.conn:
+                    for doc_hash, (page_count, pending), texts in batch:
+                        doc_id = self._document_id(doc_hash, known)
+                        self.conn.execute(
+                            "UPDATE documents SET pages = ?, pending_ocr = ?, indexed_pages = ?, indexed = ? WHERE id = ?",
+                            (page_count, pending, len(texts), time.time(), doc_id))
+                        self.conn.executemany("INSERT INTO pages_fts (rowid, text) VALUES (?, ?)",
+                                              [(doc_id * PAGE_SPAN + n, text) for n, text in texts])
+                        pages += len(texts)
+        if removed:
+            with self.lock:
+                with self.conn:
+                    for doc_hash in removed:
+                        self._delete_pages(known[doc_hash][0])
+                        self.conn.execute("DELETE FROM documents WHERE id = ?", (known[doc_hash][0],))
+        return {"indexed": len(changed), "pages": pages, "removed": len(removed),
+                "seconds": round(time.perf_counter() - start, 2)}
+
+    def _document_id(self, doc_hash, known):
+        # called under the lock inside a transaction
+        if doc_hash in known:
+            doc_id = known[doc_hash][0]
+            self._delete_pages(doc_id)
+            return doc_id
+        return self.conn.execute(
+            "INSERT INTO documents (hash, pages, pending_ocr, indexed_pages, indexed) VALUES (?, 0, 0, 0, 0)",
+            (doc_hash,)).lastrowid
+
+    def _delete_pages(self, doc_id):
+        self.conn.execute("DELETE FROM pages_fts WHERE rowid >= ? AND rowid < ?",
+                          (doc_id * PAGE_SPAN, (doc_id + 1) * PAGE_SPAN))
+
+    def indexed(self, doc_hashes):
+        """
+        The subset of doc_hashes that is in the index.
+        """
+        with self.lock:
+            return {row[0] for row in self.conn.execute(
+                "SELECT hash FROM documents WHERE hash IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(doc_hashes)),))}
+
+    def _run(self, sql, params, query):
+        try:
+            with self.lock:
+                return self.conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"Bad search query {query!r}: {e}") from e
+
+    def _filters(self, doc_hashes, first, last):
+        clauses, params = [], []
+        if doc_hashes is not None:
+            clauses.append("rowid / ? IN (SELECT id FROM documents WHERE hash IN (SELECT value FROM json_each(?)))")
+            params += [PAGE_SPAN, json.dumps(list(doc_hashes))]
+        if first is not None:
+            clauses.append("rowid % ? >= ?")
+            params += [PAGE_SPAN, first]
+        if last is not None:
+            clauses.append("rowid % ? <= ?")
+            params += [PAGE_SPAN, last]
+        return ''.join(f" AND {c}" for c in clauses), params
+
+    def search(self, query, limit=20, offset=0, doc_hashes=None, first=None, last=None):
+        """
+        Best matching pages first: [{"hash", "page", "rank", "snippet"}].
+        rank is bm25 (lower is better). doc_hashes limits the documents,
+        first/last the page numbers within each.
+        """
+        where, params = self._filters(doc_hashes, first, last)
+        top = self._run(f"SELECT rowid, rank FROM pages_fts WHERE pages_fts MATCH ?{where} ORDER BY rank LIMIT ? OFFSET ?",
+                        [query] + params + [limit, offset], query)
+        if not top:
+            return []
+        # snippets only for the hits returned; in the ranking query they
+        # would be built for every matching page
+        with self.lock:
+            hashes = dict(self.conn.execute(
+                "SELECT id, hash FROM documents WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(sorted({rowid // PAGE_SPAN for rowid, _ in top})),)).fetchall())
+            snippets = {}
+            for rowid, _ in top:
+                snippets[rowid] = self.conn.execute(
+                    f"SELECT snippet(pages_fts, 0, '[', ']', '...', {SNIPPET_TOKENS}) FROM pages_fts"
+                    " WHERE pages_fts MATCH ? AND rowid = ?", (query, rowid)).fetchone()[0]
+        return [{"hash": hashes[rowid // PAGE_SPAN], "page": rowid % PAGE_SPAN, "rank": round(rank, 4),
+                 "snippet": snippets[rowid]} for rowid, rank in top]
+
+    def documents(self, query, limit=20, first=None, last=None):
+        """
+        Matching documents, best first: [{"hash", "pages" (matching pages),
+        "best_page", "rank"}], ranked by their best page.
+        """
+        where, params = self._filters(None, first, last)
+        rows = self._run(
+            "SELECT d.hash, COUNT(*), h.rowid % ?, MIN(h.rank) FROM ("
+            f" SELECT rowid, rank FROM pages_fts WHERE pages_fts MATCH ?{where}) h"
+            " JOIN documents d ON d.id = h.rowid / ? GROUP BY d.id ORDER BY MIN(h.rank) LIMIT ?",
+            [PAGE_SPAN, query] + params + [PAGE_SPAN, limit], query)
+        return [{"hash": h, "pages": n, "best_page": page, "rank": round(rank, 4)} for h, n, page, rank in rows]
+
+    def count(self, query, doc_hashes=None, first=None, last=None):
+        where, params = self._filters(doc_hashes, first, last)
+        return self._run(f"SELECT COUNT(*) FROM pages_fts WHERE pages_fts MATCH ?{where}", [query] + params, query)[0][0]
+
+    def matching_pages(self, doc_hashes, query, first=None, last=None):
+        """
+        {hash: [(page, text)]} of the pages first..last of doc_hashes that
+        match, from one query; a document without a match is left out.
+        """
+        where, params = self._filters(doc_hashes, first, last)
+        rows = self._run(
+            f"SELECT d.hash, f.page, f.text FROM (SELECT rowid / ? AS doc, rowid % ? AS page, text FROM pages_fts"
+            f" WHERE pages_fts MATCH ?{where}) f JOIN documents d ON d.id = f.doc ORDER BY f.doc, f.page",
+            [PAGE_SPAN, PAGE_SPAN, query] + params, query)
+        found = {}
+        for doc_hash, page, text in rows:
+            found.setdefault(doc_hash, []).append((page, text))
+        return found
+
+    def optimize(self):
+        with self.lock:
+            with self.conn:
+                self.conn.execute("INSERT INTO pages_fts (pages_fts) VALUES ('optimize')")
+
+    def stats(self):
+        with self.lock:
+            docs, pages = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(indexed_pages), 0) FROM documents").fetchone()
+        size = os.path.getsize(self.path) if self.path != ':memory:' else 0
+        return {"documents": docs, "pages": pages, "bytes": size}
+
+
+def rank_chunks(query_text, chunks, k):
+    """
+    Positions of the k chunks that best match free text, by bm25 over a
+    throwaway in-memory FTS5 table, in their original order. [] when no
+    content word of query_text occurs in any chunk.
+    """
+    query = query_from_text(query_text)
+    if not query:
+        return []
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute("CREATE VIRTUAL TABLE chunks USING fts5(text, tokenize='unicode61 remove_diacritics 2')")
+        conn.executemany("INSERT INTO chunks (rowid, text) VALUES (?, ?)", enumerate(chunks))
+        rows = conn.execute("SELECT rowid FROM chunks WHERE chunks MATCH ? ORDER BY bm25(chunks) LIMIT ?",
+                            (query, k)).fetchall()
+    finally:
+        conn.close()
+    return sorted(row[0] for row in rows)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = TextIndex()
+    return _index
+
+
+def search(query, limit=20, documents=False, first=None, last=None):
+    """
+    Bring the index up to date with page_store, then search it. Hits carry
+    the content hash, the file paths page_store knows for it and, per page
+    hit, its snippet.
+    """
+    index = get_index()
+    index.sync()
+    if documents:
+        hits = index.documents(query, limit=limit, first=first, last=last)
+    else:
+        hits = index.search(query, limit=limit, first=first, last=last)
+    paths = page_store.get_store().paths_for({hit["hash"] for hit in hits})
+    for hit in hits:
+        hit["paths"] = paths.get(hit["hash"], [])
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text index over page_store page text")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('sync')
+    sub.add_parser('stats')
+    sub.add_parser('optimize')
+    q = sub.add_parser('search')
+    q.add_argument('query')
+    q.add_argument('--documents', action='store_true', help="one line per document instead of per page")
+    q.add_argument('--first', type=int)
+    q.add_argument('--last', type=int)
+    q.add_argument('--limit', type=int, default=20)
+    q.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+    index = get_index()
+    if args.command == 'sync':
+        print(json.dumps({**index.sync(), **index.stats()}, indent=2))
+        return
+    if args.command == 'stats':
+        print(json.dumps(index.stats(), indent=2))
+        return
+    if args.command == 'optimize':
+        index.optimize()
+        print(json.dumps(index.stats(), indent=2))
+        return
+    start = time.perf_counter()
+    try:
+        hits = search(args.query, limit=args.limit, documents=args.documents, first=args.first, last=args.last)
+    except ValueError as e:
+        print(json.dumps({"error": str(e)}))
+        sys.exit(1)
+    ms = (time.perf_counter() - start) * 1000
+    if args.json:
+        print(json.dumps({"ms": round(ms, 2), "results": hits}, indent=2))
+        return
+    for hit in hits:
+        name = os.path.basename(hit["paths"][0]) if hit["paths"] else hit["hash"][:12]
+        if args.documents:
+            print(f"{hit['rank']:9.3f}  {name}  {hit['pages']} pages, best p.{hit['best_page']}")
+        else:
+            print(f"{hit['rank']:9.3f}  {name} p.{hit['page']}  {hit['snippet']}")
+    print(f"[text_index.py] {len(hits)} hits in {ms:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import re
+import unicodedata
+
+'''Text normalization for extracted PDF text.
+
+Rules:
+1. Non-ASCII: typographic characters (curly quotes, dashes, bullets, nbsp,
+   ligatures, ...) are mapped to ASCII, accented letters lose their accents,
+   control characters other than tab and newline are dropped and any
+   remaining non-ASCII run becomes one space.
+2. Lines: lines made mostly of dots, dashes and whitespace (> 60%, e.g.
+   table-of-contents leaders and rules) are dropped, as are lines that are
+   only a page header/footer ("Page 3", "Page 3 of 10", "- 3 -"). A bare
+   number of up to four digits is dropped only as the first or last line
+   of the text (a page number); elsewhere it may be a quantity.
+3. Inline: remaining "Page N [of M]" markers and dotted leaders ("....")
+   are removed.
+4. Numbers (optional): standalone integers are removed.
+5. Whitespace: all runs of whitespace, including the line joins, collapse
+   to a single space.
+
+Everything runs through precompiled regexes and str methods, so the
+character-level work stays in C; Python code only sees lines and non-ASCII
+runs.'''
+
+LEADER_RATIO = 0.6
+
+_TYPOGRAPHIC = {
+    '\u2018': "'", '\u2019': "'", '\u201a': "'", '\u201b': "'", '\u2032': "'",
+    '\u201c': '"', '\u201d': '"', '\u201e': '"', '\u2033': '"',
+    '\u2010': '-', '\u2011': '-', '\u2012': '-', '\u2013': '-', '\u2014': '-', '\u2015': '-', '\u2212': '-',
+    '\u2022': '*', '\u00b7': '*', '\u25cf': '*', '\u25aa': '*', '\uf0b7': '*',  # bullets (incl. Symbol font)
+    '\u2026': '...', '\u00a0': ' ', '\u2009': ' ', '\u202f': ' ', '\u200b': '',
+    '\ufb00': 'ff', '\ufb01': 'fi', '\ufb02': 'fl', '\ufb03': 'ffi', '\ufb04': 'ffl',
+    # spaced so 3\u00bd reads 3 1/2, not 31/2
+    '\u00bd': ' 1/2', '\u00bc': ' 1/4', '\u00be': ' 3/4', '\u00b0': ' deg ', '\u00d7': 'x',
+    '\u00ae': '(R)', '\u00a9': '(C)', '\u2122': '(TM)', '\u00a7': 'Sec. ',
+}
+ASCII_TABLE = str.maketrans(_TYPOGRAPHIC)
+# C0 controls and DEL are dropped
+for _code in list(range(32)) + [0x7f]:
+    ASCII_TABLE[_code] = None
+
+# non-ASCII and control runs; \r, vertical tab and form feed are left for splitlines()
+FOLD_RE = re.compile(r'[^\t\n\x0b\x0c\r\x20-\x7e]+')
+COMBINING_RE = re.compile(r'[\u0300-\u036f]+')
+NON_ASCII_RE = re.compile(r'[^\x00-\x7F]+')
+PAGE_LINE_RE = re.compile(r'(?:page\s+\d+(?:\s+of\s+\d+)?|-\s*\d+\s*-)', re.IGNORECASE)
+# the patterns below run after whitespace is collapsed to single spaces
+PAGE_INLINE_RE = re.compile(r'\bpage \d+(?: of \d+)?\b', re.IGNORECASE)
+LEADER_RE = re.compile(r'\.(?: ?\.){3,}')
+NUMBER_RE = re.compile(r'\b\d+\b')
+
+
+def _fold(match):
+    # only called for non-ASCII/control runs, which are rare in RFP text
+    run = match.group().translate(ASCII_TABLE)
+    if run.isascii():
+        return run
+    run = COMBINING_RE.sub('', unicodedata.normalize('NFKD', run))
+    return NON_ASCII_RE.sub(' ', run)
+
+
+def _keep_line(line):
+    # indentation and trailing blanks don't count towards the leader ratio
+    line = line.strip()
+    if not line:
+        return False
+    leader = line.count('.') + line.count('-') + line.count(' ') + line.count('\t')
+    if leader > LEADER_RATIO * len(line):
+        return False
+    if line[0] in 'Pp-':
+        return PAGE_LINE_RE.fullmatch(line) is None
+    return True
+
+
+def _page_number(line):
+    line = line.strip()
+    return line.isdigit() and len(line) <= 4
+
+
+def _strip_page_numbers(lines):
+    # a bare number opening or closing the text is its page number
+    first = next((i for i, line in enumerate(lines) if line.strip()), None)
+    if first is None:
+        return lines
+    last = next(i for i in range(len(lines) - 1, -1, -1) if lines[i].strip())
+    if _page_number(lines[last]):
+        del lines[last]
+    if first != last and _page_number(lines[first]):
+        del lines[first]
+    return lines
+
+
+def normalize(text, strip_numbers=False):
+    """
+    Normalize extracted PDF text into one line of clean ASCII prose.
+    strip_numbers also removes standalone integers (off by default, since
+    quantities matter for estimation).
+    """
+    text = FOLD_RE.sub(_fold, text)
+    lines = _strip_page_numbers(text.splitlines())
+    text = ' '.join(' '.join(line for line in lines if _keep_line(line)).split())
+    removed = 0
+    if 'age ' in text or 'AGE ' in text:
+        text, n = PAGE_INLINE_RE.subn(' ', text)
+        removed += n
+    if '..' in text:
+        text, n = LEADER_RE.subn(' ', text)
+        removed += n
+    if strip_numbers:
+        text, n = NUMBER_RE.subn(' ', text)
+        removed += n
+    return ' '.join(text.split()) if removed else text
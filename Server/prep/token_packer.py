@@ -0,0 +1,201 @@
+import os
+import re
+
+'''Token-budget chunk packer for the estimation prompt.
+
+Pages are split into blocks at blank lines and spec headings (SECTION 01 10 00,
+PART 2, 3.1 EXECUTION, ALL-CAPS titles, ...). Blocks are packed into requests
+of up to INPUT_TOKEN_BUDGET tokens, cutting at a heading once a request is
+mostly full. Blocks are only split when a single block is larger than a whole
+request. A small trailing chunk is folded into the previous request when
+that still fits the model's context window next to the prompt prefix and
+the output budget.'''
+
+CONTEXT_WINDOW = int(os.getenv('ESTIMATE_CONTEXT_WINDOW', 128000))
+OUTPUT_TOKENS = 4096
+INPUT_TOKEN_BUDGET = int(os.getenv('ESTIMATE_INPUT_TOKENS', 12000))
+# prefer to cut at a heading once a request is this full
+HEADING_CUT_FILL = 0.75
+# a final chunk below this fraction of the budget is merged backwards when possible
+TAIL_MERGE_FILL = 0.25
+SAFETY_MARGIN = 256
+
+HEADING_RE = re.compile(
+    r'^\s*(?:'
+    r'(?:SECTION|PART|ARTICLE|DIVISION|ATTACHMENT|EXHIBIT|APPENDIX)\b'
+    r'|\d{2}\s?\d{2}\s?\d{2}\b'            # CSI section numbers, e.g. 01 10 00
+    r'|\d+(?:\.\d+)*\.?\s+[A-Z]'            # 1.2 SCOPE / 3. EXECUTION
+    r'|[A-Z][A-Z0-9 ,&/\-]{3,}$'            # ALL CAPS TITLE LINE
+    r')'
+)
+
+_encoder = None
+
+
+def _get_encoder():
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+            try:
+                _encoder = tiktoken.encoding_for_model("gpt-4o-mini")
+            except KeyError:
+                _encoder = tiktoken.get_encoding("o200k_base")
+        except ImportError:
+            _encoder = False
+    return _encoder
+
+
+def count_tokens(text):
+    encoder = _get_encoder()
+    if encoder:
+        return len(encoder.encode(text, disallowed_special=()))
+    # tiktoken not installed: ~4 characters per token
+    return len(text) // 4 + 1
+
+
+def request_limit(prefix_tokens):
+    """
+    Largest chunk that still fits the context window with the prompt prefix
+    and the full output budget.
+    """
+    return CONTEXT_WINDOW - OUTPUT_TOKENS - prefix_tokens - SAFETY_MARGIN
+
+
+def split_blocks(page_text):
+    """
+    Split one page into blocks at blank lines and heading lines.
+    Returns [(is_heading, text)].
+    """
+    blocks = []
+    current = []
+    heading = False
+    for line in page_text.splitlines():
+        if not line.strip():
+            if current:
+                blocks.append((heading, '\n'.join(current)))
+                current, heading = [], False
+            continue
+        if HEADING_RE.match(line) and current:
+            blocks.append((heading, '\n'.join(current)))
+            current = []
+        if not current:
+            heading = bool(HEADING_RE.match(line))
+        current.append(line)
+    if current:
+        blocks.append((heading, '\n'.join(current)))
+    return blocks
+
+
+def _split_oversized(text, budget):
+    # a single block bigger than a whole request: cut on lines, then on words
+    pieces = []
+    current = []
+    size = 0
+    for line in text.splitlines():
+        tokens = count_tokens(line) + 1
+        if tokens > budget:
+            if current:
+                pieces.append('\n'.join(current))
+            current, size = [], 0
+            words = []
+            for word in line.split():
+                word_tokens = count_tokens(word) + 1
+                if words and size + word_tokens > budget:
+                    pieces.append(' '.join(words))
+                    words, size = [], 0
+                words.append(word)
+                size += word_tokens
+            if words:
+                current = [' '.join(words)]
+            continue
+        if current and size + tokens > budget:
+            pieces.append('\n'.join(current))
+            current, size = [], 0
+        current.append(line)
+        size += tokens
+    if current:
+        pieces.append('\n'.join(current))
+    return pieces
+
+
+def iter_blocks(pages, budget):
+    """
+    Yield (page_number, is_heading, text, tokens) for every block of every page.
+    """
+    for page_number, page_text in pages:
+        for is_heading, text in split_blocks(page_text):
+            tokens = count_tokens(text)
+            if tokens <= budget:
+                yield page_number, is_heading, text, tokens
+            else:
+                for i, piece in enumerate(_split_oversized(text, budget)):
+                    yield page_number, is_heading and i == 0, piece, count_tokens(piece)
+
+
+def _make_chunk(blocks):
+    return {
+        "text": '\n'.join(b[2] for b in blocks),
+        "first_page": blocks[0][0],
+        "last_page": blocks[-1][0],
+        "tokens": sum(b[3] for b in blocks) + len(blocks) - 1,
+    }
+
+
+def pack(pages, budget=INPUT_TOKEN_BUDGET, prefix_tokens=0):
+    """
+    Pack (page_number, text) pages into chunks of at most `budget` tokens.
+    Yields {"text", "first_page", "last_page", "tokens"} one chunk behind the
+    parser, so a small tail can still be merged into the previous chunk.
+    """
+    hard_limit = request_limit(prefix_tokens)
+    budget = min(budget, hard_limit)
+    held = None
+    current = []
+    size = 0
+    for block in iter_blocks(pages, budget):
+        _, is_heading, _, tokens = block
+        full = current and size + tokens + 1 > budget
+        heading_cut = current and is_heading and size >= budget * HEADING_CUT_FILL
+        if full or heading_cut:
+            if held is not None:
+                yield held
+            held = _make_chunk(current)
+            current, size = [], 0
+        current.append(block)
+        size += tokens + (1 if len(current) > 1 else 0)
+    if current:
+        tail = _make_chunk(current)
+        if held is not None and tail["tokens"] < budget * TAIL_MERGE_FILL and held["tokens"] + tail["tokens"] + 1 <= hard_limit:
+            held = {
+                "text": held["text"] + '\n' + tail["text"],
+                "first_page": held["first_page"],
+                "last_page": tail["last_page"],
+                "tokens": held["tokens"] + tail["tokens"] + 1,
+            }
+            tail = None
+        if held is not None:
+            yield held
+        if tail is not None:
+            yield tail
+    elif held is not None:
+        yield held
+
+
+def plan(pages, budget=INPUT_TOKEN_BUDGET, prefix_tokens=0):
+    """
+    Dry run of pack(): expected request count and token usage, no LLM calls.
+    """
+    chunks = list(pack(pages, budget, prefix_tokens))
+    chunk_tokens = [c["tokens"] for c in chunks]
+    return {
+        "requests": len(chunks),
+        "input_tokens": sum(chunk_tokens) + prefix_tokens * len(chunks),
+        "prefix_tokens_per_request": prefix_tokens,
+        "max_output_tokens": OUTPUT_TOKENS * len(chunks),
+        "budget": min(budget, request_limit(prefix_tokens)),
+        "chunks": [
+            {"tokens": c["tokens"], "pages": [c["first_page"], c["last_page"]]}
+            for c in chunks
+        ],
+    }
@@ -1,12 +1,12 @@
-from transformers import pipeline
 import os
-import re
 import sys
 import json
-import string
-import pdfplumber
-import openai
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from dotenv import load_dotenv
+import llm
+import token_packer
+import textnorm
+import page_store
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
 
@@ -27,105 +27,138 @@ def chunk_text(text, chunk_size=500):
     return [' '.join(words[i:i+chunk_size]) for i in range(0, len(words), chunk_size)]
 
 def clean_pdf_text(text):
-    import string
-    text = ''.join(ch for ch in text if ch in string.printable)
-    lines = text.splitlines()
-    cleaned_lines = []
-    for line in lines:
-        if len(line) == 0:
-            continue
-        nonword = sum(1 for c in line if c in '.- \t')
-        if nonword / len(line) > 0.6:
-            continue
-        cleaned_lines.append(line)
-    text = ' '.join(cleaned_lines)
-    text = re.sub(r'\\s+', ' ', text)
-    text = re.sub(r'\\bPage \\d+\\b', '', text)
-    text = re.sub(r'\\b\\d+\\b', '', text)
-    text = re.sub(r'[^\\x00-\\x7F]+', ' ', text)
-    return text.strip()
+    # whitespace, page marker, leader-line, non-ASCII and number stripping; see textnorm.py
+    return textnorm.normalize(text, strip_numbers=True)
+
+ESTIMATE_SYSTEM_PROMPT = "You are an expert construction estimator."
+ESTIMATE_PROMPT = (
+    "You are an expert construction estimator. "
+    "Read the following RFP excerpt and extract the following sections as a JSON object, with each section clearly labeled. "
+    "If a section is not mentioned, use an empty list or null. "
+    "Sections:\n"
+    "1. metadata: {title, location, owner, contact, issue_date, closing_date, other_dates}\n"
+    "2. materials: [list of all major and minor materials/parts, make sure material list is comprehensive. For each, provide: name/description, estimated required amount and units (e.g., pounds, square feet, cubic feet, metric, etc.), estimated cost per unit, reasoning for that material and number, evidence for that material and number, reasoning/evidence for materials that were intentionally left out (materials that were considered but not applicable, if necessary), and total estimated cost for that material.]\n"
+    "3. labor: [list of labor types/trades, certifications, etc., and for each, estimate the number of manhours required based on the timeline, project size, and difficulty]\n"
+    "4. equipment: [list of equipment, and for each, estimate the quantity or usage required for the project]\n"
+    "5. permits_and_licenses: [list]\n"
+    "6. insurance_and_bonds: [list]\n"
+    "7. subcontractors_and_vendors: [list]\n"
+    "8. timeline_and_scheduling: [list or description]\n"
+    "9. site_conditions_and_preparation: [list]\n"
+    "10. safety_and_compliance: [list]\n"
+    "11. overhead_and_profit: [list or description]\n"
+    "12. contingencies_and_allowances: [list]\n"
+    "13. quality_control_and_testing: [list]\n"
+    "14. closeout_and_warranty: [list]\n\n"
+    "For each of the 14 sections above, in addition to the main content, include two fields: 'reasoning' (a concise explanation of how you determined the estimate or number for that section) and 'evidence' (direct textual evidence or references from the RFP text that support your estimate). Both fields should be specific and clear.\n"
+    "Return your answer as a valid JSON object with these keys. "
+    "For each section, provide a concise bullet-point list or a short description. "
+    "For 'materials', provide a detailed breakdown as described above. "
+    "For 'labor', estimate the number of manhours for each labor type based on the timeline, size, and difficulty. "
+    "For 'equipment', estimate the quantity or usage required for each type. "
+    "For 'materials' and 'labor', suggest options if possible. "
+    "For 'labor', also note if wage selection is required or if average wages can be used.\n\n"
+    "At the end of your response, you must: (1) Provide a JSON object called 'section_costs' with estimated costs for each of the 14 sections above (use the same keys). For each section, estimate a reasonable cost based on the RFP text, industry standards, or typical project requirements. Do not leave any section at zero unless there is clear evidence in the RFP that the cost is truly zero. (2) Provide a 'total_bid' field with the sum of all section costs. (3) Provide a JSON object called 'section_costs_explanation' with, for each section, a 'reasoning' and 'evidence' field explaining and supporting the cost estimate. Example: {'section_costs': {'materials': 10000, 'labor': 15000, 'equipment': 5000, ...}, 'total_bid': 40000, 'section_costs_explanation': {'materials': {'reasoning': '...', 'evidence': '...'}, 'labor': {'reasoning': '...', 'evidence': '...'}, ...}}. Return all of these as part of the main JSON object.\n\n"
+)
+
+# Chunks sent to the LLM at the same time; llm.py's rate limiter still applies
+ESTIMATE_CONCURRENCY = int(os.getenv('ESTIMATE_CONCURRENCY', 4))
+
+def iter_pages(pdf_path):
+    """
+    Yield (page_number, text) for every page with a text layer, one page at a time.
+    Text comes from page_store, so a PDF seen before is not parsed again.
+    """
+    return page_store.iter_pages(pdf_path, run_ocr=False)
 
 def extract_text_from_pdfplumber(pdf_path):
-    text = ''
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + '\n'
-    return text.strip()
+    return '\n'.join(page_text for _, page_text in iter_pages(pdf_path)).strip()
+
+def prefix_tokens():
+    return token_packer.count_tokens(ESTIMATE_SYSTEM_PROMPT) + token_packer.count_tokens(ESTIMATE_PROMPT)
+
+def plan_estimate(pdf_path, budget=None):
+    """
+    Report how many requests and tokens estimating this PDF will take, without calling the LLM.
+    """
+    budget = budget or token_packer.INPUT_TOKEN_BUDGET
+    return token_packer.plan(iter_pages(pdf_path), budget=budget, prefix_tokens=prefix_tokens())
+
+def estimate_chunk(chunk):
+    """
+    Run the estimation prompt over one chunk. Returns (answer, answer_json).
+    """
+    answer = llm.complete(ESTIMATE_SYSTEM_PROMPT, ESTIMATE_PROMPT + chunk, max_tokens=4096, temperature=0.2).strip()
+    content = answer
+    if content.startswith('```json'):
+        content = content[7:]
+    if content.startswith('```'):
+        content = content[3:]
+    if content.endswith('```'):
+        content = content[:-3]
+    content = content.strip()
+    try:
+        answer_json = json.loads(content)
+    except Exception as e:
+        answer_json = None
+        print(f"[trajectory.py] Failed to parse JSON: {e}", file=sys.stderr, flush=True)
+    return answer, answer_json
+
+def iter_materials_from_pdf(pdf_path, max_workers=None, budget=None):
+    """
+    Estimate each chunk of the RFP and yield one progress dict per chunk.
+    Pages are parsed lazily and packed up to `budget` input tokens per request
+    (token_packer); up to max_workers chunks are with the LLM at once and
+    progress is yielded in completion order as each chunk finishes.
+    totalChunks is None until the whole PDF has been packed.
+    """
+    max_workers = max_workers or ESTIMATE_CONCURRENCY
+    budget = budget or token_packer.INPUT_TOKEN_BUDGET
+    chunks = token_packer.pack(iter_pages(pdf_path), budget=budget, prefix_tokens=prefix_tokens())
+    total_chunks = None
+    next_index = 0
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            while total_chunks is None and len(pending) < max_workers:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    total_chunks = next_index
+                    break
+                if not chunk["text"].strip():
+                    continue
+                future = pool.submit(estimate_chunk, chunk["text"])
+                pending[future] = (next_index, chunk)
+                next_index += 1
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk_id, chunk = pending.pop(future)
+                answer, answer_json = future.result()
+                progress = {
+                    "chunkIndex": chunk_id,
+                    "chunkText": chunk["text"],
+                    "answer": answer,
+                    "answer_json": answer_json,
+                    "page": chunk["first_page"],
+                    "pageRange": [chunk["first_page"], chunk["last_page"]],
+                    "totalChunks": total_chunks
+                }
+                print(f"[trajectory.py] Processed chunk {chunk_id+1} (pages {chunk['first_page']}-{chunk['last_page']}, {chunk['tokens']} tokens)", file=sys.stderr, flush=True)
+                yield progress
 
 def extract_materials_from_pdf(pdf_path):
-    import os
-    openai.api_key = os.getenv("OPENAI_API_KEY")
-    full_text = extract_text_from_pdfplumber(pdf_path)
-    chunk_size = 8000
-    all_chunks = [c for c in chunk_text(full_text, chunk_size=chunk_size) if c.strip()]
-    total_chunks = len(all_chunks)
-    for chunk_id, chunk in enumerate(all_chunks):
-        prompt = (
-            "You are an expert construction estimator. "
-            "Read the following RFP excerpt and extract the following sections as a JSON object, with each section clearly labeled. "
-            "If a section is not mentioned, use an empty list or null. "
-            "Sections:\n"
-            "1. metadata: {title, location, owner, contact, issue_date, closing_date, other_dates}\n"
-            "2. materials: [list of all major and minor materials/parts, make sure material list is comprehensive. For each, provide: name/description, estimated required amount and units (e.g., pounds, square feet, cubic feet, metric, etc.), estimated cost per unit, reasoning for that material and number, evidence for that material and number, reasoning/evidence for materials that were intentionally left out (materials that were considered but not applicable, if necessary), and total estimated cost for that material.]\n"
-            "3. labor: [list of labor types/trades, certifications, etc., and for each, estimate the number of manhours required based on the timeline, project size, and difficulty]\n"
-            "4. equipment: [list of equipment, and for each, estimate the quantity or usage required for the project]\n"
-            "5. permits_and_licenses: [list]\n"
-            "6. insurance_and_bonds: [list]\n"
-            "7. subcontractors_and_vendors: [list]\n"
-            "8. timeline_and_scheduling: [list or description]\n"
-            "9. site_conditions_and_preparation: [list]\n"
-            "10. safety_and_compliance: [list]\n"
-            "11. overhead_and_profit: [list or description]\n"
-            "12. contingencies_and_allowances: [list]\n"
-            "13. quality_control_and_testing: [list]\n"
-            "14. closeout_and_warranty: [list]\n\n"
-            "For each of the 14 sections above, in addition to the main content, include two fields: 'reasoning' (a concise explanation of how you determined the estimate or number for that section) and 'evidence' (direct textual evidence or references from the RFP text that support your estimate). Both fields should be specific and clear.\n"
-            "Return your answer as a valid JSON object with these keys. "
-            "For each section, provide a concise bullet-point list or a short description. "
-            "For 'materials', provide a detailed breakdown as described above. "
-            "For 'labor', estimate the number of manhours for each labor type based on the timeline, size, and difficulty. "
-            "For 'equipment', estimate the quantity or usage required for each type. "
-            "For 'materials' and 'labor', suggest options if possible. "
-            "For 'labor', also note if wage selection is required or if average wages can be used.\n\n"
-            "At the end of your response, you must: (1) Provide a JSON object called 'section_costs' with estimated costs for each of the 14 sections above (use the same keys). For each section, estimate a reasonable cost based on the RFP text, industry standards, or typical project requirements. Do not leave any section at zero unless there is clear evidence in the RFP that the cost is truly zero. (2) Provide a 'total_bid' field with the sum of all section costs. (3) Provide a JSON object called 'section_costs_explanation' with, for each section, a 'reasoning' and 'evidence' field explaining and supporting the cost estimate. Example: {'section_costs': {'materials': 10000, 'labor': 15000, 'equipment': 5000, ...}, 'total_bid': 40000, 'section_costs_explanation': {'materials': {'reasoning': '...', 'evidence': '...'}, 'labor': {'reasoning': '...', 'evidence': '...'}, ...}}. Return all of these as part of the main JSON object.\n\n"
-            + chunk
-        )
-        response = openai.chat.completions.create(
-            model="gpt-4o-mini-2024-07-18",
-            messages=[
-                {"role": "system", "content": "You are an expert construction estimator."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=4096,
-            temperature=0.2,
-        )
-        content = response.choices[0].message.content.strip()
-        if content.startswith('```json'):
-            content = content[7:]
-        if content.startswith('```'):
-            content = content[3:]
-        if content.endswith('```'):
-            content = content[:-3]
-        content = content.strip()
-        try:
-            answer_json = json.loads(content)
-        except Exception as e:
-            answer_json = None
-            print(f"[trajectory.py] Failed to parse JSON: {e}", file=sys.stderr, flush=True)
-        progress = {
-            "chunkIndex": chunk_id,
-            "chunkText": chunk,
-            "answer": response.choices[0].message.content.strip(),
-            "answer_json": answer_json, 
-            "page": None,
-            "totalChunks": total_chunks
-        }
+    for progress in iter_materials_from_pdf(pdf_path):
         print(json.dumps(progress), flush=True)
-        print(f"[trajectory.py] Processed chunk {chunk_id+1}", file=sys.stderr, flush=True)
 
-if __name__ == "__main__":
-    if len(sys.argv) > 1:
+def main():
+    if '--plan' in sys.argv:
+        args = [a for a in sys.argv[1:] if a != '--plan']
+        print(json.dumps(plan_estimate(args[0]), indent=2))
+    elif len(sys.argv) > 1:
         pdf_file = sys.argv[1]
-        extract_materials_from_pdf(pdf_file)
\ No newline at end of file
+        extract_materials_from_pdf(pdf_file)
+
+if __name__ == "__main__":
+    main()
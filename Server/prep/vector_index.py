@@ -0,0 +1,332 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+import contextlib
+
+'''Embedded vector index: a memory-mapped matrix plus a SQLite sidecar.
+
+Layout of an index directory:
+    index.sqlite3       info (dim, dtype, rows, generation): the committed extent
+                        entries (row, id, meta, live): one per matrix row
+    vectors.<gen>.bin   rows x dim matrix, float32 or int8, appended in place
+
+Vectors are L2-normalized on insert, so cosine similarity is a dot product;
+int8 indexes store round(v * 127). Opening an index reads the info row and
+the numbers of dead rows and maps the matrix; ids and metadata are read
+from SQLite only for the rows a call returns, so opening takes the same
+time at any size. Writes append vectors past the committed extent, then
+insert their entries and raise the row count in one transaction, which is
+what makes them visible, so a crash mid-append never exposes a torn row.
+Updating or deleting an id marks its old row dead. compact() copies the
+live rows into the next generation's vectors file and switches to it in one
+transaction; until that commits, the current generation is untouched.
+
+Usage: python prep/vector_index.py <index_dir> [stats|compact]'''
+
+INDEX_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'vector_index'))
+DB_NAME = 'index.sqlite3'
+# rows scored per matrix product, bounds the temporary score/convert buffers
+SEARCH_BLOCK_ROWS = 65536
+INT8_SCALE = 127.0
+
+
+def _normalize(np, vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def exists(path):
+    return os.path.exists(os.path.join(path, DB_NAME)) or os.path.exists(os.path.join(path, 'header.json'))
+
+
+class VectorIndex:
+    """
+    Append-only cosine index. upsert() matches the pinecone.Index call shape
+    so indexer.index_chunks can write to it directly.
+    """
+
+    def __init__(self, path, dim=None, dtype='float32'):
+        import numpy as np
+        self.np = np
+        self.path = path
+        self.lock = threading.Lock()
+        if not os.path.exists(self._file(DB_NAME)) and os.path.exists(self._file('header.json')):
+            self._migrate()
+        os.makedirs(path, exist_ok=True)
+        # transactions are explicit (see _transaction)
+        self.conn = sqlite3.connect(self._file(DB_NAME), timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS info ("
+            " dim INTEGER NOT NULL, dtype TEXT NOT NULL, rows INTEGER NOT NULL, generation INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " row INTEGER PRIMARY KEY, id TEXT NOT NULL, meta TEXT, live INTEGER NOT NULL);"
+            "CREATE UNIQUE INDEX IF NOT EXISTS entries_live_id ON entries(id) WHERE live = 1;"
+            "CREATE INDEX IF NOT EXISTS entries_dead ON entries(row) WHERE live = 0;"
+        )
+        info = self.conn.execute("SELECT dim, dtype, rows, generation FROM info").fetchone()
+        if info is None:
+            if dim is None:
+                raise ValueError(f"{path} does not exist and no dim was given")
+            if dtype not in ('float32', 'int8'):
+                raise ValueError("dtype must be 'float32' or 'int8'")
+            info = (dim, dtype, 0, 0)
+            open(self._vectors_file(0), 'wb').close()
+            self.conn.execute("INSERT INTO info (dim, dtype, rows, generation) VALUES (?, ?, ?, ?)", info)
+        elif dim is not None and dim != info[0]:
+            raise ValueError(f"{path} has dim {info[0]}, not {dim}")
+        self.dim, self.dtype, self.rows, self.generation = info
+        self._live = np.ones(self.rows, dtype=bool)
+        dead = [row for row, in self.conn.execute("SELECT row FROM entries WHERE live = 0")]
+        self._live[dead] = False
+        self.live_count = self.rows - len(dead)
+        self._remove_old_generations()
+        self._map()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _vectors_file(self, generation):
+        return self._file(f'vectors.{generation}.bin')
+
+    @property
+    def live(self):
+        # _live has spare capacity so appends do not copy it every batch
+        return self._live[:self.rows]
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _migrate(self):
+        # directories written before the SQLite sidecar: header.json, meta.jsonl, vectors.bin
+        with open(self._file('header.json'), 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        with open(self._file('meta.jsonl'), 'rb') as f:
+            lines = f.read(header['meta_bytes']).splitlines()
+        entries, row_of = [], {}
+        for row, line in enumerate(lines):
+            entry = json.loads(line)
+            old = row_of.pop(entry['id'], None)
+            if old is not None:
+                entries[old][3] = 0
+            if not entry.get('deleted'):
+                row_of[entry['id']] = row
+            entries.append([row, entry['id'], json.dumps(entry.get('meta')), 0 if entry.get('deleted') else 1])
+        tmp = self._file(DB_NAME + '.tmp')
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        conn = sqlite3.connect(tmp)
+        conn.executescript(
+            "CREATE TABLE info (dim INTEGER NOT NULL, dtype TEXT NOT NULL, rows INTEGER NOT NULL, generation INTEGER NOT NULL);"
+            "CREATE TABLE entries (row INTEGER PRIMARY KEY, id TEXT NOT NULL, meta TEXT, live INTEGER NOT NULL);"
+        )
+        conn.execute("INSERT INTO info VALUES (?, ?, ?, 0)", (header['dim'], header['dtype'], header['rows']))
+        conn.executemany("INSERT INTO entries VALUES (?, ?, ?, ?)", entries)
+        conn.commit()
+        conn.close()
+        if os.path.exists(self._file('vectors.bin')):
+            os.replace(self._file('vectors.bin'), self._vectors_file(0))
+        os.replace(tmp, self._file(DB_NAME))
+        for name in ('header.json', 'meta.jsonl'):
+            os.remove(self._file(name))
+
+    def _remove_old_generations(self):
+        for name in os.listdir(self.path):
+            parts = name.split('.')
+            if len(parts) == 3 and parts[0] == 'vectors' and parts[2] == 'bin' and parts[1].isdigit() \
+                    and int(parts[1]) < self.generation:
+                os.remove(self._file(name))
+
+    def _map(self):
+        np = self.np
+        if self.rows:
+            self.matrix = np.memmap(self._vectors_file(self.generation), dtype=self.dtype, mode='r',
+                                    shape=(self.rows, self.dim))
+        else:
+            self.matrix = np.zeros((0, self.dim), dtype=self.dtype)
+
+    def __len__(self):
+        return self.live_count
+
+    def _live_rows(self, ids):
+        return dict(self.conn.execute(
+            "SELECT id, row FROM entries WHERE live = 1 AND id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(ids)),)))
+
+    def add(self, ids, vectors, metas=None):
+        """
+        Insert or replace vectors. Replaced ids keep their old row, marked dead.
+        """
+        np = self.np
+        if not len(ids):
+            return 0
+        vectors = _normalize(np, vectors)
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"expected {len(ids)} x {self.dim} vectors, got {vectors.shape}")
+        if self.dtype == 'int8':
+            vectors = np.clip(np.rint(vectors * INT8_SCALE), -127, 127).astype(np.int8)
+        metas = metas if metas is not None else [None] * len(ids)
+        with self.lock:
+            start = self.rows
+            # the last occurrence of an id in the batch wins
+            newest = {vid: start + i for i, vid in enumerate(ids)}
+            replaced = list(self._live_rows(newest).values())
+            # truncate first: a crashed writer may have appended past the committed extent
+            with open(self._vectors_file(self.generation), 'r+b') as f:
+                f.truncate(start * self.dim * np.dtype(self.dtype).itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(np.ascontiguousarray(vectors, dtype=self.dtype).tobytes())
+            entries = [(start + i, vid, json.dumps(meta), int(newest[vid] == start + i))
+                       for i, (vid, meta) in enumerate(zip(ids, metas))]
+            with self._transaction():
+                self.conn.executemany("UPDATE entries SET live = 0 WHERE row = ?", [(row,) for row in replaced])
+                self.conn.executemany("INSERT INTO entries (row, id, meta, live) VALUES (?, ?, ?, ?)", entries)
+                self.conn.execute("UPDATE info SET rows = ?", (start + len(ids),))
+            self.rows = start + len(ids)
+            if self.rows > len(self._live):
+                grown = np.zeros(max(self.rows, 2 * len(self._live)), dtype=bool)
+                grown[:start] = self._live[:start]
+                self._live = grown
+            self._live[start:self.rows] = [live for _, _, _, live in entries]
+            self._live[replaced] = False
+            self.live_count += len(newest) - len(replaced)
+            self._map()
+        return len(ids)
+
+    def upsert(self, vectors):
+        ids, values, metas = zip(*vectors) if vectors else ((), (), ())
+        return {"upserted_count": self.add(list(ids), list(values), list(metas))}
+
+    def delete(self, ids):
+        """
+        Mark ids dead; their rows stay in the matrix until compact().
+        """
+        with self.lock:
+            rows = list(self._live_rows(set(ids)).values())
+            if rows:
+                with self._transaction():
+                    self.conn.executemany("UPDATE entries SET live = 0 WHERE row = ?", [(row,) for row in rows])
+                self._live[rows] = False
+                self.live_count -= len(rows)
+        return len(rows)
+
+    def get(self, vid):
+        row = self.conn.execute("SELECT meta FROM entries WHERE live = 1 AND id = ?", (vid,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def search(self, queries, k=8):
+        """
+        Top-k cosine search for one query vector or a (n, dim) batch.
+        Returns one list of (id, score, meta) per query, best first.
+        """
+        np = self.np
+        queries = _normalize(np, queries)
+        k = min(k, self.live_count)
+        if k == 0:
+            return [[] for _ in range(len(queries))]
+        scale = INT8_SCALE if self.dtype == 'int8' else 1.0
+        live = self.live
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, self.rows, SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.matrix[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores = queries @ block.T
+            if scale != 1.0:
+                scores /= scale
+            scores[:, ~live[start:start + len(block)]] = -np.inf
+            rows = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_scores, best_rows = scores, rows
+        hits = {int(row) for rows in best_rows for row in rows}
+        entries = {row: (vid, meta) for row, vid, meta in self.conn.execute(
+            "SELECT row, id, meta FROM entries WHERE row IN (SELECT value FROM json_each(?))",
+            (json.dumps(sorted(hits)),))}
+        results = []
+        for scores, rows in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            results.append([
+                (entries[int(rows[i])][0], float(scores[i]), json.loads(entries[int(rows[i])][1]))
+                for i in order if np.isfinite(scores[i])
+            ])
+        return results
+
+    def compact(self):
+        """
+        Copy the live rows into the next generation's vectors file and switch
+        to it, dropping dead rows. Returns the number of rows removed.
+        """
+        np = self.np
+        with self.lock:
+            live_rows = np.flatnonzero(self.live)
+            removed = self.rows - len(live_rows)
+            if not removed:
+                return 0
+            generation = self.generation + 1
+            with open(self._vectors_file(generation), 'wb') as f:
+                for start in range(0, len(live_rows), SEARCH_BLOCK_ROWS):
+                    f.write(np.ascontiguousarray(self.matrix[live_rows[start:start + SEARCH_BLOCK_ROWS]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with self._transaction():
+                self.conn.execute("DROP TABLE IF EXISTS entries_compacted")
+                self.conn.execute("CREATE TABLE entries_compacted ("
+                                  " row INTEGER PRIMARY KEY, id TEXT NOT NULL, meta TEXT, live INTEGER NOT NULL)")
+                self.conn.execute("INSERT INTO entries_compacted (row, id, meta, live)"
+                                  " SELECT ROW_NUMBER() OVER (ORDER BY row) - 1, id, meta, 1 FROM entries WHERE live = 1")
+                self.conn.execute("DROP TABLE entries")
+                self.conn.execute("ALTER TABLE entries_compacted RENAME TO entries")
+                self.conn.execute("CREATE UNIQUE INDEX entries_live_id ON entries(id) WHERE live = 1")
+                self.conn.execute("CREATE INDEX entries_dead ON entries(row) WHERE live = 0")
+                self.conn.execute("UPDATE info SET rows = ?, generation = ?", (len(live_rows), generation))
+            self.matrix = None
+            self.rows, self.generation = len(live_rows), generation
+            self._live = np.ones(self.rows, dtype=bool)
+            self.live_count = self.rows
+            self._remove_old_generations()
+            self._map()
+            return removed
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "rows": self.rows,
+            "live": self.live_count,
+            "generation": self.generation,
+            "bytes": self.rows * self.dim * self.np.dtype(self.dtype).itemsize,
+        }
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(json.dumps({"error": "Usage: vector_index.py <index_dir> [stats|compact]"}))
+        sys.exit(1)
+    index = VectorIndex(sys.argv[1])
+    command = sys.argv[2] if len(sys.argv) > 2 else 'stats'
+    if command == 'compact':
+        print(json.dumps({"removed": index.compact(), **index.stats()}, indent=2))
+    else:
+        print(json.dumps(index.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
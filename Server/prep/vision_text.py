@@ -1,24 +1,42 @@
 import os
+import re
 import sys
 import io
-from google.cloud import vision
+import json
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from dotenv import load_dotenv
 
 '''This script extracts text from an image using Google Cloud Vision API.
-It reads the image file, sends it to the Vision API, and prints the extracted text.'''
+It reads the image file, sends it to the Vision API, and prints the extracted text.
 
-if hasattr(sys.stdout, 'reconfigure'):
-    try:
-        sys.stdout.reconfigure(encoding='utf-8')
-        sys.stderr.reconfigure(encoding='utf-8')
-    except Exception:
-        pass
+Batch mode (iter_batch_text, or --batch MANIFEST_JSON [PDF]) takes a whole
+page manifest, answers pages whose PDF text layer is already good enough
+from page_store, and sends the rest as batch_annotate_images requests of
+up to VISION_BATCH_SIZE images, VISION_CONCURRENCY requests at a time, on
+one shared client. Results are printed as JSON lines as each batch returns.'''
 
 key_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../gcs-key.json'))
-os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = key_path
+
+# the Vision API accepts at most 16 images per batch_annotate_images request
+VISION_BATCH_SIZE = int(os.getenv('VISION_BATCH_SIZE', 16))
+VISION_CONCURRENCY = int(os.getenv('VISION_CONCURRENCY', 4))
+# a text layer with fewer word characters than this (or mostly undecodable glyphs) is OCRed instead
+TEXT_LAYER_MIN_CHARS = int(os.getenv('TEXT_LAYER_MIN_CHARS', 100))
+WORD_CHAR_RE = re.compile(r'[A-Za-z0-9]')
+BAD_GLYPH_RE = re.compile(r'\ufffd|\(cid:\d+\)')
+
+_client = None
+
+def get_client():
+    global _client
+    if _client is None:
+        from google.cloud import vision
+        _client = vision.ImageAnnotatorClient.from_service_account_file(key_path)
+    return _client
 
 def extract_text_from_image_vision(image_path):
-    client = vision.ImageAnnotatorClient()
+    from google.cloud import vision
+    client = get_client()
     with io.open(image_path, 'rb') as image_file:
         content = image_file.read()
     image = vision.Image(content=content)
@@ -32,9 +50,93 @@ def extract_text_from_image_vision(image_path):
     else:
         return ""
 
+def text_layer_ok(text):
+    """
+    True when a page's extracted text layer can stand in for OCR.
+    """
+    if not text:
+        return False
+    word_chars = len(WORD_CHAR_RE.findall(text))
+    if word_chars < TEXT_LAYER_MIN_CHARS:
+        return False
+    return len(BAD_GLYPH_RE.findall(text)) * 20 < word_chars
+
+def _vision_image(image):
+    from google.cloud import vision
+    if image.startswith('gs://'):
+        # the API reads GCS objects itself, no download needed
+        return vision.Image(source=vision.ImageSource(image_uri=image))
+    with io.open(image, 'rb') as image_file:
+        return vision.Image(content=image_file.read())
+
+def _annotate_batch(batch):
+    from google.cloud import vision
+    client = get_client()
+    feature = vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+    requests = [vision.AnnotateImageRequest(image=_vision_image(p["image"]), features=[feature]) for p in batch]
+    response = client.batch_annotate_images(requests=requests)
+    results = []
+    for page, resp in zip(batch, response.responses):
+        result = {"page": page["page"], "source": "vision", "text": ""}
+        if getattr(resp.error, 'message', None):
+            result["error"] = resp.error.message
+        elif resp.text_annotations:
+            result["text"] = resp.text_annotations[0].description.strip()
+        results.append(result)
+    return results
+
+def iter_batch_text(pages, pdf_path=None, batch_size=None, concurrency=None):
+    """
+    pages: [{"page": n, "image": gs:// URL or local path}].
+    Yields {"page", "text", "source": "text_layer" | "vision"[, "error"]}
+    per page, text-layer pages first, then each Vision batch as it returns.
+    """
+    batch_size = min(batch_size or VISION_BATCH_SIZE, 16)
+    pending = list(pages)
+    if pdf_path:
+        import page_store
+        wanted = {p["page"] for p in pending}
+        layer = {n: text for n, text in page_store.iter_pages(pdf_path, run_ocr=False) if n in wanted}
+        remaining = []
+        for page in pending:
+            text = layer.get(page["page"])
+            if text_layer_ok(text):
+                yield {"page": page["page"], "text": text.strip(), "source": "text_layer"}
+            else:
+                remaining.append(page)
+        pending = remaining
+    if not pending:
+        return
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    with ThreadPoolExecutor(max_workers=min(concurrency or VISION_CONCURRENCY, len(batches))) as pool:
+        futures = {pool.submit(_annotate_batch, batch): batch for batch in batches}
+        while futures:
+            finished, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for future in finished:
+                batch = futures.pop(future)
+                try:
+                    yield from future.result()
+                except Exception as e:
+                    print(f"[vision_text.py] Batch of {len(batch)} pages failed: {e}", file=sys.stderr, flush=True)
+                    for page in batch:
+                        yield {"page": page["page"], "text": "", "source": "vision", "error": str(e)}
+
 def main():
+    if hasattr(sys.stdout, 'reconfigure'):
+        try:
+            sys.stdout.reconfigure(encoding='utf-8')
+            sys.stderr.reconfigure(encoding='utf-8')
+        except Exception:
+            pass
+    if len(sys.argv) >= 3 and sys.argv[1] == '--batch':
+        with open(sys.argv[2], 'r', encoding='utf-8') as f:
+            pages = json.load(f)
+        pdf_path = sys.argv[3] if len(sys.argv) > 3 else None
+        for result in iter_batch_text(pages, pdf_path):
+            print(json.dumps(result), flush=True)
+        return
     if len(sys.argv) != 2:
-        print(f"Usage: python {os.path.basename(__file__)} <image_path>")
+        print(f"Usage: python {os.path.basename(__file__)} <image_path> | --batch <manifest_json> [pdf_path]")
         sys.exit(1)
     image_path = sys.argv[1]
     if not os.path.exists(image_path):
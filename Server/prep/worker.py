@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import importlib
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+'''Long-lived pool of warm Python workers for the Node routes.
+
+Speaks JSON lines over stdin/stdout. Each request is
+    {"id": 1, "method": "summarize_file", "params": {...}}
+and is answered with {"id": 1, "result": ...} or {"id": 1, "error": "..."}.
+Streaming methods additionally send {"id": 1, "event": {...}} lines before
+their result. Worker processes keep their imports and API clients between
+requests and are recycled after PYWORKER_MAX_TASKS tasks.'''
+
+PREP_DIR = os.path.dirname(os.path.abspath(__file__))
+TAKEOFF_DIR = os.path.abspath(os.path.join(PREP_DIR, '..', 'takeoff'))
+for _path in (PREP_DIR, TAKEOFF_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+PROCESSES = int(os.getenv('PYWORKER_PROCESSES', min(4, os.cpu_count() or 1)))
+MAX_PENDING = int(os.getenv('PYWORKER_MAX_PENDING', PROCESSES * 4))
+MAX_TASKS_PER_CHILD = int(os.getenv('PYWORKER_MAX_TASKS', 200))
+
+# method name -> (module, function)
+METHODS = {
+    'summarize_text': ('conversation', 'summarize_text'),
+    'summarize_file': ('conversation', 'summarize_file'),
+    'summarize_workspace': ('conversation', 'summarize_workspace'),
+    'answer_prompt': ('conversation', 'answer_prompt'),
+    'extract_materials_from_pdf': ('trajectory', 'iter_materials_from_pdf'),
+    'plan_estimate': ('trajectory', 'plan_estimate'),
+    'pdf_to_images': ('pdf_to_image_and_gcs', 'pdf_to_images'),
+    'iter_page_images': ('pdf_to_image_and_gcs', 'iter_page_images'),
+    'extract_text_from_image_vision': ('vision_text', 'extract_text_from_image_vision'),
+    'iter_batch_text': ('vision_text', 'iter_batch_text'),
+    'run_mask': ('mask', 'run_mask'),
+    'run_mask_batch': ('mask', 'run_mask_batch'),
+    'llm_cache_stats': ('llm', 'cache_stats'),
+    'search_rfps': ('text_index', 'search'),
+}
+# Methods whose function is a generator; every item is sent as an event.
+STREAMING = {'extract_materials_from_pdf', 'iter_page_images', 'iter_batch_text'}
+
+# (module, function) called once per worker process to build API clients up front
+WARMUP = [
+    ('llm', 'get_client'),
+    ('vision_text', 'get_client'),
+    ('pdf_to_image_and_gcs', 'get_storage_client'),
+    ('mask', 'get_session'),
+]
+
+_messages = None
+
+
+def _warm(messages):
+    global _messages
+    _messages = messages
+    for module_name, attr in WARMUP:
+        try:
+            getattr(importlib.import_module(module_name), attr)()
+        except Exception as e:
+            print(f"[worker.py] Warmup of {module_name}.{attr} failed: {e}", file=sys.stderr, flush=True)
+
+
+def _run(req_id, method, params):
+    try:
+        module_name, attr = METHODS[method]
+        fn = getattr(importlib.import_module(module_name), attr)
+        if method in STREAMING:
+            count = 0
+            for event in fn(**params):
+                _messages.put({"id": req_id, "event": event})
+                count += 1
+            result = count
+        else:
+            result = fn(**params)
+        _messages.put({"id": req_id, "result": result})
+    except Exception as e:
+        traceback.print_exc(file=sys.stderr)
+        _messages.put({"id": req_id, "error": str(e)})
+
+
+def _pump(messages, write):
+    while True:
+        msg = messages.get()
+        if msg is None:
+            break
+        write(msg)
+
+
+def _new_pool(ctx, messages):
+    return ProcessPoolExecutor(
+        max_workers=PROCESSES,
+        mp_context=ctx,
+        initializer=_warm,
+        initargs=(messages,),
+        max_tasks_per_child=MAX_TASKS_PER_CHILD,
+    )
+
+
+def _claim_stdout():
+    """
+    Move the protocol pipe off fd 1 and point fd 1 at stderr, so output
+    written straight to fd 1 (C extensions, subprocesses, the spawned
+    workers, which inherit it) cannot corrupt the JSON lines. Returns a
+    text stream on a private descriptor for the responses.
+    """
+    sys.stdout.flush()
+    protocol_fd = os.dup(1)  # not inherited by child processes
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    return os.fdopen(protocol_fd, 'w', encoding='utf-8')
+
+
+def serve(stdin=None, stdout=None):
+    stdin = stdin or sys.stdin
+    stdout = stdout or _claim_stdout()
+    write_lock = threading.Lock()
+
+    def write(msg):
+        line = json.dumps(msg, default=str)
+        with write_lock:
+            stdout.write(line + '\n')
+            stdout.flush()
+
+    # 'spawn' is required for max_tasks_per_child
+    ctx = multiprocessing.get_context('spawn')
+    messages = ctx.Queue()
+    pump = threading.Thread(target=_pump, args=(messages, write), daemon=True)
+    pump.start()
+    pool = _new_pool(ctx, messages)
+    slots = threading.BoundedSemaphore(MAX_PENDING)
+
+    def done(req_id):
+        def callback(future):
+            slots.release()
+            exc = future.exception()
+            if exc is not None:
+                # the task never got to report back (worker crashed, unpicklable params, ...)
+                write({"id": req_id, "error": f"Worker failed: {exc!r}"})
+        return callback
+
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            req = json.loads(line)
+        except ValueError as e:
+            write({"id": None, "error": f"Invalid request: {e}"})
+            continue
+        req_id = req.get('id')
+        method = req.get('method')
+        if method not in METHODS:
+            write({"id": req_id, "error": f"Unknown method: {method}"})
+            continue
+        slots.acquire()
+        try:
+            future = pool.submit(_run, req_id, method, req.get('params') or {})
+        except BrokenProcessPool:
+            print("[worker.py] Process pool broken, restarting", file=sys.stderr, flush=True)
+            pool = _new_pool(ctx, messages)
+            future = pool.submit(_run, req_id, method, req.get('params') or {})
+        future.add_done_callback(done(req_id))
+
+    pool.shutdown(wait=True)
+    messages.put(None)
+    pump.join()
+
+
+if __name__ == "__main__":
+    serve()
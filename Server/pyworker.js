@@ -0,0 +1,97 @@
+const { spawn } = require('child_process');
+const path = require('path');
+const readline = require('readline');
+
+// Client for prep/worker.py: one long-lived pool of warm Python processes
+// shared by every route instead of spawning a fresh interpreter per request.
+const WORKER_SCRIPT = path.join(__dirname, 'prep', 'worker.py');
+const PYTHON = process.env.PYTHON || 'python';
+// a call fails when the worker sends nothing for it (result or event) for this long
+const CALL_TIMEOUT_MS = parseInt(process.env.PYWORKER_CALL_TIMEOUT_MS || '600000', 10);
+// after a crash the worker is not restarted before this delay, doubling per crash in a row up to the max
+const RESTART_BACKOFF_MS = 1000;
+const RESTART_BACKOFF_MAX_MS = 30000;
+
+let proc = null;
+let nextId = 1;
+const pending = new Map();
+let crashes = 0;
+let restartAt = 0;
+
+function failAll(err) {
+  for (const [id, entry] of pending) {
+    clearTimeout(entry.timer);
+    entry.reject(err);
+    pending.delete(id);
+  }
+}
+
+// The worker is gone (exited, failed to spawn, or its stdin broke): fail its calls and hold off the restart.
+function lost(current, err) {
+  if (proc !== current) return;
+  proc = null;
+  crashes += 1;
+  restartAt = Date.now() + Math.min(RESTART_BACKOFF_MS * 2 ** (crashes - 1), RESTART_BACKOFF_MAX_MS);
+  console.error(`[pyworker] ${err.message}; next start in ${restartAt - Date.now()} ms`);
+  failAll(err);
+  current.kill();
+}
+
+function start() {
+  const current = spawn(PYTHON, [WORKER_SCRIPT], { env: process.env });
+  proc = current;
+  current.on('error', err => lost(current, new Error(`Python worker failed: ${err.message}`)));
+  current.stdin.on('error', err => lost(current, new Error(`Python worker stdin failed: ${err.message}`)));
+  readline.createInterface({ input: current.stdout }).on('line', line => {
+    let msg;
+    try {
+      msg = JSON.parse(line);
+    } catch {
+      return;
+    }
+    const entry = pending.get(msg.id);
+    if (!entry) return;
+    armTimeout(msg.id, entry);
+    if ('event' in msg) {
+      if (entry.onEvent) entry.onEvent(msg.event);
+      return;
+    }
+    clearTimeout(entry.timer);
+    pending.delete(msg.id);
+    // a worker that answers is healthy again
+    crashes = 0;
+    if (msg.error) entry.reject(new Error(msg.error));
+    else entry.resolve(msg.result);
+  });
+  current.stderr.on('data', d => process.stderr.write('[pyworker] ' + d));
+  current.on('close', code => lost(current, new Error(`Python worker exited with code ${code}`)));
+}
+
+function armTimeout(id, entry) {
+  clearTimeout(entry.timer);
+  entry.timer = setTimeout(() => {
+    if (pending.get(id) !== entry) return;
+    pending.delete(id);
+    entry.reject(new Error(`Python worker call ${entry.method} timed out after ${entry.timeoutMs} ms`));
+  }, entry.timeoutMs);
+}
+
+// call('summarize_file', { page_json_paths, output_path }) -> Promise<result>
+// onEvent receives the intermediate events of streaming methods; options.timeoutMs
+// overrides PYWORKER_CALL_TIMEOUT_MS (time allowed between messages for this call).
+function call(method, params = {}, onEvent = null, options = {}) {
+  if (!proc) {
+    const wait = restartAt - Date.now();
+    if (wait > 0) return Promise.reject(new Error(`Python worker is restarting, retry in ${wait} ms`));
+    start();
+  }
+  const id = nextId++;
+  return new Promise((resolve, reject) => {
+    const entry = { resolve, reject, onEvent, method, timeoutMs: options.timeoutMs || CALL_TIMEOUT_MS };
+    pending.set(id, entry);
+    armTimeout(id, entry);
+    proc.stdin.write(JSON.stringify({ id, method, params }) + '\n');
+  });
+}
+
+module.exports = { call };
@@ -1,7 +1,6 @@
 const express = require('express');
 const router = express.Router();
 const { Storage } = require('@google-cloud/storage');
-const { spawn } = require('child_process');
 const path = require('path');
 const fs = require('fs');
 
@@ -9,6 +8,7 @@ const BUCKET_NAME = process.env.GCS_BUCKET_NAME || 'pdfs_and_responses';
 const storage = new Storage();
 
 const Project = require('../models/Project');
+const pyworker = require('../pyworker');
 
 router.post('/ask', async (req, res) => {
   try {
@@ -178,15 +178,8 @@ router.post('/ask', async (req, res) => {
           localPagePaths.push(localPage);
           console.log(`[AI Conversation] [current-file] Downloaded page JSON: ${gcsPage} -> ${localPage}`);
         }
-        const pythonPath = path.join(__dirname, '../prep/conversation.py');
-        const args = ['--summarize', 'file', localSummaryPath, ...localPagePaths];
-        console.log(`[AI Conversation] [current-file] Summarizing file with: python ${pythonPath} ${args.join(' ')}`);
-        await new Promise((resolve, reject) => {
-          const proc = spawn('python', [pythonPath, ...args]);
-          proc.stdout.on('data', d => console.log(`[AI Conversation] [current-file] Python summary stdout:`, d.toString()));
-          proc.stderr.on('data', d => console.error(`[AI Conversation] [current-file] Python summary stderr:`, d.toString()));
-          proc.on('close', code => code === 0 ? resolve() : reject(new Error('Python summary failed')));
-        });
+        console.log(`[AI Conversation] [current-file] Summarizing file with python worker: ${localSummaryPath}`);
+        await pyworker.call('summarize_file', { page_json_paths: localPagePaths, output_path: localSummaryPath });
         await uploadGcsFile(localSummaryPath, fileSummaryGcs);
         console.log(`[AI Conversation] [current-file] Uploaded file summary to GCS: ${fileSummaryGcs}`);
         // Cleanup temp page JSONs
@@ -229,15 +222,8 @@ router.post('/ask', async (req, res) => {
             localPagePaths.push(localPage);
             console.log(`[AI Conversation] [whole-workspace] Downloaded page JSON: ${gcsPage} -> ${localPage}`);
           }
-          const pythonPath = path.join(__dirname, '../prep/conversation.py');
-          const args = ['--summarize', 'file', localSummaryPath, ...localPagePaths];
-          console.log(`[AI Conversation] [whole-workspace] Summarizing file with: python ${pythonPath} ${args.join(' ')}`);
-          await new Promise((resolve, reject) => {
-            const proc = spawn('python', [pythonPath, ...args]);
-            proc.stdout.on('data', d => console.log(`[AI Conversation] [whole-workspace] Python summary stdout:`, d.toString()));
-            proc.stderr.on('data', d => console.error(`[AI Conversation] [whole-workspace] Python summary stderr:`, d.toString()));
-            proc.on('close', code => code === 0 ? resolve() : reject(new Error('Python summary failed')));
-          });
+          console.log(`[AI Conversation] [whole-workspace] Summarizing file with python worker: ${localSummaryPath}`);
+          await pyworker.call('summarize_file', { page_json_paths: localPagePaths, output_path: localSummaryPath });
           await uploadGcsFile(localSummaryPath, fileSummaryGcs);
           console.log(`[AI Conversation] [whole-workspace] Uploaded file summary to GCS: ${fileSummaryGcs}`);
           // Cleanup temp page JSONs
@@ -252,34 +238,16 @@ router.post('/ask', async (req, res) => {
       }
       const projectFolder = fileFolders[0] ? fileFolders[0].split('/')[0] : '';
       const workspaceSummaryGcs = `${projectFolder}/ai_workspace_summary.json`;
-      let workspaceSummaryExists = false;
-      try {
-        const [exists] = await storage.bucket(BUCKET_NAME).file(workspaceSummaryGcs).exists();
-        workspaceSummaryExists = exists;
-        console.log(`[AI Conversation] [whole-workspace] Workspace summary exists: ${workspaceSummaryExists} at ${workspaceSummaryGcs}`);
-      } catch (e) {
-        console.log(`[AI Conversation] [whole-workspace] Error checking workspace summary existence:`, e);
-      }
       localWorkspaceSummaryPath = getTempPath('workspace_summary');
-      if (!workspaceSummaryExists) {
-        const pythonPath = path.join(__dirname, '../prep/conversation.py');
-        const args = ['--summarize', 'workspace', localWorkspaceSummaryPath, ...localFileSummaryPaths];
-        console.log(`[AI Conversation] [whole-workspace] Summarizing workspace with: python ${pythonPath} ${args.join(' ')}`);
-        await new Promise((resolve, reject) => {
-          const proc = spawn('python', [pythonPath, ...args]);
-          proc.stdout.on('data', d => console.log(`[AI Conversation] [whole-workspace] Python summary stdout:`, d.toString()));
-          proc.stderr.on('data', d => console.error(`[AI Conversation] [whole-workspace] Python summary stderr:`, d.toString()));
-          proc.on('close', code => code === 0 ? resolve() : reject(new Error('Python summary failed')));
-        });
-        await uploadGcsFile(localWorkspaceSummaryPath, workspaceSummaryGcs);
-        console.log(`[AI Conversation] [whole-workspace] Uploaded workspace summary to GCS: ${workspaceSummaryGcs}`);
-        // Cleanup temp file summary JSONs
-        for (const localFileSummary of localFileSummaryPaths) {
-          try { fs.unlinkSync(localFileSummary); } catch {}
-        }
-      } else {
-        await downloadGcsFile(workspaceSummaryGcs, localWorkspaceSummaryPath);
-        console.log(`[AI Conversation] [whole-workspace] Downloaded workspace summary from GCS: ${workspaceSummaryGcs}`);
+      // Always go through the summary tree: it reuses the stored root when no file
+      // changed and only re-reduces what changed when files were added or edited.
+      console.log(`[AI Conversation] [whole-workspace] Summarizing workspace with python worker: ${localWorkspaceSummaryPath}`);
+      await pyworker.call('summarize_workspace', { file_summary_paths: localFileSummaryPaths, output_path: localWorkspaceSummaryPath });
+      await uploadGcsFile(localWorkspaceSummaryPath, workspaceSummaryGcs);
+      console.log(`[AI Conversation] [whole-workspace] Uploaded workspace summary to GCS: ${workspaceSummaryGcs}`);
+      // Cleanup temp file summary JSONs
+      for (const localFileSummary of localFileSummaryPaths) {
+        try { fs.unlinkSync(localFileSummary); } catch {}
       }
       contextJson = JSON.parse(fs.readFileSync(localWorkspaceSummaryPath, 'utf-8'));
       tempFilePath = localWorkspaceSummaryPath;
@@ -305,94 +273,85 @@ router.post('/ask', async (req, res) => {
       }
     }
 
-    const pythonPath = path.join(__dirname, '../prep/conversation.py');
-    console.log('[AI Conversation] Spawning python:', pythonPath, prompt, tempFilePath);
-    const pythonProcess = spawn('python', [pythonPath, prompt, tempFilePath]);
+    console.log('[AI Conversation] Asking python worker:', prompt, tempFilePath);
+    let result = null;
+    let workerError = null;
+    try {
+      result = await pyworker.call('answer_prompt', { prompt, context_path: tempFilePath });
+    } catch (e) {
+      workerError = e;
+    }
 
-    let output = '';
-    let errorOutput = '';
-    pythonProcess.stdout.on('data', (data) => {
-      output += data.toString();
-      console.log('[AI Conversation] Python stdout:', data.toString());
-    });
-    pythonProcess.stderr.on('data', (data) => {
-      errorOutput += data.toString();
-      console.error('[AI Conversation] Python stderr:', data.toString());
-    });
+    fs.unlink(tempFilePath, () => {});
+    // Cleanup temp summary JSONs after AI call
+    if (contextScope === 'current-file' && localSummaryPath) {
+      try { fs.unlinkSync(localSummaryPath); } catch {}
+    }
+    if (contextScope === 'whole-workspace' && localWorkspaceSummaryPath) {
+      try { fs.unlinkSync(localWorkspaceSummaryPath); } catch {}
+    }
+    if (workerError) {
+      console.error('[AI Conversation] Python worker failed:', workerError.message);
+      return res.status(500).json({ error: 'Python script failed', details: workerError.message });
+    }
+    try {
+      console.log('[AI Conversation] Python output:', result);
+      const answerVal = result && result.content ? (typeof result.content === 'string' ? result.content : JSON.stringify(result.content)) : '';
+      if (prompt.trim() && answerVal.trim()) {
+        let aiResponseGcsPath = aiResponsePath;
+        if (!aiResponseGcsPath || aiResponseGcsPath.trim() === "") {
+          aiResponseGcsPath = `project_${projectId}/ai_response.json`;
+        }
+        const origFile = storage.bucket(BUCKET_NAME).file(aiResponseGcsPath);
+        let aiResponse = null;
+        try {
+          const [contents] = await origFile.download();
+          aiResponse = JSON.parse(contents.toString());
+        } catch {
+          aiResponse = { conversation: [] };
+        }
+        if (!aiResponse.conversation) aiResponse.conversation = [];
+        const appendedEntry = {
+          question: prompt,
+          answer: answerVal,
+          timestamp: new Date().toISOString()
+        };
+        aiResponse.conversation.push(appendedEntry);
 
-    pythonProcess.on('close', async (code) => {
-      fs.unlink(tempFilePath, () => {});
-      // Cleanup temp summary JSONs after AI call
-      if (contextScope === 'current-file' && localSummaryPath) {
-        try { fs.unlinkSync(localSummaryPath); } catch {}
-      }
-      if (contextScope === 'whole-workspace' && localWorkspaceSummaryPath) {
-        try { fs.unlinkSync(localWorkspaceSummaryPath); } catch {}
-      }
-      if (code !== 0) {
-        console.error('[AI Conversation] Python exited with code', code, 'stderr:', errorOutput);
-        return res.status(500).json({ error: 'Python script failed', details: errorOutput });
-      }
-      try {
-        console.log('[AI Conversation] Python output:', output);
-        const result = JSON.parse(output);
-        const answerVal = result && result.content ? (typeof result.content === 'string' ? result.content : JSON.stringify(result.content)) : '';
-        if (prompt.trim() && answerVal.trim()) {
-          let aiResponseGcsPath = aiResponsePath;
-          if (!aiResponseGcsPath || aiResponseGcsPath.trim() === "") {
-            aiResponseGcsPath = `project_${projectId}/ai_response.json`;
-          }
-          const origFile = storage.bucket(BUCKET_NAME).file(aiResponseGcsPath);
-          let aiResponse = null;
+        const match = answerVal.match(/```json[\s\n]*([\s\S]*?)```/i) || answerVal.match(/```[\s\n]*([\s\S]*?)```/i);
+        if (match && match[1]) {
           try {
-            const [contents] = await origFile.download();
-            aiResponse = JSON.parse(contents.toString());
-          } catch {
-            aiResponse = { conversation: [] };
-          }
-          if (!aiResponse.conversation) aiResponse.conversation = [];
-          const appendedEntry = {
-            question: prompt,
-            answer: answerVal,
-            timestamp: new Date().toISOString()
-          };
-          aiResponse.conversation.push(appendedEntry);
-
-          const match = answerVal.match(/```json[\s\n]*([\s\S]*?)```/i) || answerVal.match(/```[\s\n]*([\s\S]*?)```/i);
-          if (match && match[1]) {
-            try {
-              const jsonStr = match[1].trim();
-              const parsed = JSON.parse(jsonStr);
-              if (parsed && typeof parsed === 'object') {
-                if (!aiResponse.answer_json || typeof aiResponse.answer_json !== 'object') {
-                  aiResponse.answer_json = {};
-                }
-                for (const [key, value] of Object.entries(parsed)) {
-                  if (Array.isArray(value)) {
-                    aiResponse.answer_json[key] = value;
-                  } else if (
-                    typeof value === 'object' && value !== null &&
-                    typeof aiResponse.answer_json[key] === 'object' && aiResponse.answer_json[key] !== null &&
-                    !Array.isArray(value) && !Array.isArray(aiResponse.answer_json[key])
-                  ) {
-                    aiResponse.answer_json[key] = { ...aiResponse.answer_json[key], ...value };
-                  } else {
-                    aiResponse.answer_json[key] = value;
-                  }
+            const jsonStr = match[1].trim();
+            const parsed = JSON.parse(jsonStr);
+            if (parsed && typeof parsed === 'object') {
+              if (!aiResponse.answer_json || typeof aiResponse.answer_json !== 'object') {
+                aiResponse.answer_json = {};
+              }
+              for (const [key, value] of Object.entries(parsed)) {
+                if (Array.isArray(value)) {
+                  aiResponse.answer_json[key] = value;
+                } else if (
+                  typeof value === 'object' && value !== null &&
+                  typeof aiResponse.answer_json[key] === 'object' && aiResponse.answer_json[key] !== null &&
+                  !Array.isArray(value) && !Array.isArray(aiResponse.answer_json[key])
+                ) {
+                  aiResponse.answer_json[key] = { ...aiResponse.answer_json[key], ...value };
+                } else {
+                  aiResponse.answer_json[key] = value;
                 }
               }
-            } catch (err) {}
-          }
-
-          await origFile.save(Buffer.from(JSON.stringify(aiResponse, null, 2)), { contentType: 'application/json' });
+            }
+          } catch (err) {}
         }
-        console.log('[AI Conversation] Final response:', result);
-        res.json(result);
-      } catch (e) {
-        console.error('[AI Conversation] Failed to parse AI response:', output);
-        res.status(500).json({ error: 'Failed to parse AI response', details: output });
+
+        await origFile.save(Buffer.from(JSON.stringify(aiResponse, null, 2)), { contentType: 'application/json' });
       }
-    });
+      console.log('[AI Conversation] Final response:', result);
+      res.json(result);
+    } catch (e) {
+      console.error('[AI Conversation] Failed to handle AI response:', result);
+      res.status(500).json({ error: 'Failed to parse AI response', details: e.message });
+    }
   } catch (err) {
     res.status(500).json({ error: err.message });
   }
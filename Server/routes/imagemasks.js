@@ -1,7 +1,6 @@
 const express = require('express');
 const router = express.Router();
 const { Storage } = require('@google-cloud/storage');
-const { spawn } = require('child_process');
 const path = require('path');
 const fs = require('fs');
 
@@ -9,6 +8,7 @@ const fs = require('fs');
 const BUCKET_NAME = process.env.GCS_BUCKET_NAME || 'pdfs_and_responses';
 const storage = new Storage();
 const Project = require('../models/Project');
+const pyworker = require('../pyworker');
 
 router.post('/mask-page', async (req, res) => {
   try {
@@ -94,20 +94,16 @@ router.post('/mask-page', async (req, res) => {
     await pageFile.download({ destination: tempImagePath });
     console.log('[imagemasks] Downloaded page image to:', tempImagePath);
 
-    // Run mask.py for this image
-    const pythonPath = path.join(__dirname, '..', 'takeoff', 'mask.py');
-    const env = { ...process.env, PAGE_NUM: pageNum };
-    console.log('[imagemasks] Running mask.py:', pythonPath, tempImagePath);
-    await new Promise((resolve, reject) => {
-      const proc = spawn('python', [pythonPath, tempImagePath], { env });
-      proc.stdout.on('data', d => process.stdout.write('[mask.py stdout] ' + d));
-      proc.stderr.on('data', d => process.stderr.write('[mask.py stderr] ' + d));
-      proc.on('close', code => code === 0 ? resolve() : reject(new Error('mask.py failed')));
-    });
+    // Run mask.py for this image in the python worker, with its own output folder
+    const outputDir = fs.mkdtempSync(path.join(__dirname, `temp_mask_output_${pageNum}_`));
+    console.log('[imagemasks] Running run_mask:', tempImagePath, outputDir);
+    // optional drawing scale (e.g. 1/8" = 1'-0") and render DPI turn the takeoff areas into square feet
+    const { scale, dpi } = req.body;
+    const maskResult = await pyworker.call('run_mask', { image_path: tempImagePath, output_dir: outputDir, scale, dpi });
 
     // Output mask path (as written by mask.py)
-    const outputMaskPath = path.join(__dirname, '..', 'takeoff', 'output', 'room_mask_overlay.png');
-    const outputJsonPath = path.join(__dirname, '..', 'takeoff', 'output', 'roomplanner_results.json');
+    const outputMaskPath = maskResult.overlay || path.join(outputDir, 'room_mask_overlay.png');
+    const outputJsonPath = maskResult.json || path.join(outputDir, 'roomplanner_results.json');
     console.log('[imagemasks] Looking for output mask at:', outputMaskPath);
     if (!fs.existsSync(outputMaskPath)) {
       console.log('[imagemasks] Mask output not found:', outputMaskPath);
@@ -148,10 +144,20 @@ router.post('/mask-page', async (req, res) => {
 
     // Return the GCS URL for the mask
     const gcsUrl = `gs://${BUCKET_NAME}/${gcsPath}`;
-    res.json({ maskUrl: gcsUrl });
+    const takeoff = maskResult.result && maskResult.result.takeoff;
+    res.json({
+      maskUrl: gcsUrl,
+      takeoff: takeoff ? {
+        roomCount: takeoff.room_count,
+        unionAreaSqft: takeoff.union_area_sqft,
+        totalAreaSqft: takeoff.total_area_sqft,
+        unionAreaPx: takeoff.union_area_px,
+      } : null,
+    });
 
-    // Cleanup temp image
+    // Cleanup temp image and mask output
     try { fs.unlinkSync(tempImagePath); } catch {}
+    try { fs.rmSync(outputDir, { recursive: true, force: true }); } catch {}
   } catch (err) {
     console.error('[imagemasks] Error:', err);
     res.status(500).json({ error: err.message });
@@ -1,14 +1,13 @@
 const express = require('express');
 const multer = require('multer');
 const path = require('path');
-const { spawn } = require('child_process');
 const fs = require('fs');
+const crypto = require('crypto');
 const { Storage } = require('@google-cloud/storage');
 const Project = require('../models/Project');
 const User = require('../models/User');
 const projectsRoutes = require('./projects');
-const { execFile } = require('child_process');
-const visionScript = path.join(__dirname, '../prep/vision_text.py');
+const pyworker = require('../pyworker');
 
 const router = express.Router();
 
@@ -26,6 +25,17 @@ const upload = multer({
   }
 });
 
+// sha256 of a file, read as a stream
+function fileHash(filePath) {
+  return new Promise((resolve, reject) => {
+    const hash = crypto.createHash('sha256');
+    fs.createReadStream(filePath)
+      .on('data', chunk => hash.update(chunk))
+      .on('end', () => resolve(hash.digest('hex')))
+      .on('error', reject);
+  });
+}
+
 const JWT_SECRET = process.env.JWT_SECRET || 'dev_secret';
 async function authUser(req, res, next) {
   const authHeader = req.headers.authorization;
@@ -58,74 +68,66 @@ router.post('/calculate', authUser, upload.single('pdf'), async (req, res) => {
   res.setHeader('Connection', 'keep-alive');
   res.flushHeaders();
 
-  const scriptPath = path.join(__dirname, '../prep/trajectory.py');
-  const py = spawn('python', [scriptPath, pdfPath]);
-
   let aiResponse = null;
   let aiResponseChunks = [];
 
-  py.stdout.on('data', (data) => {
-    const lines = data.toString().split('\n').filter(Boolean);
-    for (const line of lines) {
-      try {
-        const chunk = JSON.parse(line);
-        aiResponseChunks.push(chunk);
-        res.write(`data: ${JSON.stringify(chunk)}\n\n`);
-      } catch (e) {}
-    }
-  });
-
-  py.stderr.on('data', (data) => {
-    res.write(`event: error\ndata: {"error": ${JSON.stringify(data.toString())}}\n\n`);
-  });
+  try {
+    await pyworker.call('extract_materials_from_pdf', { pdf_path: pdfPath }, (chunk) => {
+      aiResponseChunks.push(chunk);
+      res.write(`data: ${JSON.stringify(chunk)}\n\n`);
+    });
+  } catch (e) {
+    res.write(`event: error\ndata: {"error": ${JSON.stringify(e.message)}}\n\n`);
+  }
 
-  py.on('close', async (code) => {
-    fs.unlink(pdfPath, () => {});
-    res.write('event: end\ndata: {"done": true}\n\n');
-    res.end();
+  fs.unlink(pdfPath, () => {});
+  res.write('event: end\ndata: {"done": true}\n\n');
+  res.end();
 
-    aiResponse = aiResponseChunks.length ? aiResponseChunks[aiResponseChunks.length-1] : null;
+  // chunks stream in completion order; keep the last chunk of the document
+  aiResponse = aiResponseChunks.length
+    ? aiResponseChunks.reduce((last, chunk) => (chunk.chunkIndex > last.chunkIndex ? chunk : last))
+    : null;
 
-    let gcsAiUrl = null;
-    if (aiResponse) {
-      const baseName = req.file.originalname.replace(/\.pdf$/i, '');
-      const gcsAiFileName = `${Date.now()}_${baseName}_airesponse.json`;
-      const gcsAiFile = bucket.file(gcsAiFileName);
-      await gcsAiFile.save(Buffer.from(JSON.stringify(aiResponse)), { contentType: 'application/json' });
-      gcsAiUrl = `gs://${bucket.name}/${gcsAiFileName}`;
-    }
+  let gcsAiUrl = null;
+  if (aiResponse) {
+    const baseName = req.file.originalname.replace(/\.pdf$/i, '');
+    const gcsAiFileName = `${Date.now()}_${baseName}_airesponse.json`;
+    const gcsAiFile = bucket.file(gcsAiFileName);
+    await gcsAiFile.save(Buffer.from(JSON.stringify(aiResponse)), { contentType: 'application/json' });
+    gcsAiUrl = `gs://${bucket.name}/${gcsAiFileName}`;
+  }
 
-    const userId = req.user?._id;
-    const { projectId, projectName, model, temperature, customPrompt } = req.body;
-    if (projectId) {
-      const updateFields = {
-        owner: userId,
-        gcsPdfUrl,
-        gcsAiUrl,
-        model,
-        temperature,
-        customPrompt,
-      };
-      if (projectName) {
-        updateFields.name = projectName;
-      }
-      await Project.findByIdAndUpdate(
-        projectId,
-        updateFields,
-        { new: true }
-      );
-    } else {
-      await Project.create({
-        name: projectName || req.file.originalname,
-        owner: userId,
-        gcsPdfUrl,
-        gcsAiUrl,
-        model,
-        temperature,
-        customPrompt,
-      });
+  const userId = req.user?._id;
+  const { projectId, projectName, model, temperature, customPrompt } = req.body;
+  if (projectId) {
+    const updateFields = {
+      owner: userId,
+      gcsPdfUrl,
+      gcsAiUrl,
+      model,
+      temperature,
+      customPrompt,
+    };
+    if (projectName) {
+      updateFields.name = projectName;
     }
-  });
+    await Project.findByIdAndUpdate(
+      projectId,
+      updateFields,
+      { new: true }
+    );
+  } else {
+    await Project.create({
+      name: projectName || req.file.originalname,
+      owner: userId,
+      gcsPdfUrl,
+      gcsAiUrl,
+      model,
+      temperature,
+      customPrompt,
+    });
+  }
 });
 
 router.post('/processPdf', authUser, upload.single('pdf'), async (req, res) => {
@@ -137,111 +139,121 @@ router.post('/processPdf', authUser, upload.single('pdf'), async (req, res) => {
   if (!project) return res.status(404).json({ error: 'Project not found' });
 
   const pdfPath = req.file.path;
-  const gcsPrefix = `project_${projectId}/${Date.now()}_${req.file.originalname.replace(/\.[^/.]+$/, '')}`;
-  const py = spawn('python', [
-    path.join(__dirname, '../prep/pdf_to_image_and_gcs.py'),
-    pdfPath,
-    bucket.name,
-    gcsPrefix
-  ]);
-
-  let stdoutData = '';
+  // keyed on the file's content, so a retried upload of the same PDF finds its images manifest and resumes
+  const gcsPrefix = `project_${projectId}/pdf_${(await fileHash(pdfPath)).slice(0, 32)}`;
+  // ?stream=1: send each page as an SSE event as soon as its image and text are uploaded
+  const streaming = req.query.stream === '1';
+  if (streaming) {
+    res.setHeader('Content-Type', 'text/event-stream');
+    res.setHeader('Cache-Control', 'no-cache');
+    res.setHeader('Connection', 'keep-alive');
+    res.flushHeaders();
+  }
+  const pages = [];
+  const pageJobs = [];
   let stderrData = '';
-  py.stdout.on('data', (data) => {
-    stdoutData += data.toString();
-  });
-  py.stderr.on('data', (data) => {
-    stderrData += data.toString();
-  });
-  py.on('close', async (code) => {
-    fs.unlink(pdfPath, () => { console.log(`[PDFPARSE] Deleted local PDF: ${pdfPath}`); });
 
-    let manifest = [];
-    const lines = stdoutData.split(/\r?\n/).filter(Boolean);
-    for (let i = lines.length - 1; i >= 0; i--) {
-      try {
-        manifest = JSON.parse(lines[i]);
-        break;
-      } catch {}
-    }
+  // --- Per-page text extraction and GCS upload, batched as page images land ---
+  // Pages with a usable PDF text layer skip OCR; the rest go to Vision in multi-image requests.
+  const savePageText = async (page, text) => {
+    const textFileName = `page_${page}.json`;
+    const gcsTextFile = bucket.file(`${gcsPrefix}/${textFileName}`);
+    await gcsTextFile.save(Buffer.from(JSON.stringify({ text }), 'utf8'), { contentType: 'application/json' });
+    return `gs://${bucket.name}/${gcsPrefix}/${textFileName}`;
+  };
 
-    // --- Per-page text extraction and GCS upload ---
-    for (const page of manifest) {
-      const gcsImageUrl = page;
-      const imageFileName = path.basename(gcsImageUrl);
-      const localImagePath = path.join(__dirname, '../uploads', `temp_${Date.now()}_${imageFileName}`);
-      
+  const processBatch = async (events) => {
+    const imageUrls = new Map(events.map(e => [e.page, e.url]));
+    const pageCount = events[0].pageCount;
+    const saves = [];
+    const finishPage = async (result) => {
+      const imageGcsUrl = imageUrls.get(result.page);
+      let entry = imageGcsUrl;
       try {
-        console.log(`[PDFPARSE] Processing page: ${gcsImageUrl}`);
-        // 1. Download image from GCS to local
-        const imageBlob = bucket.file(gcsImageUrl.replace(`gs://${bucket.name}/`, ''));
-        await imageBlob.download({ destination: localImagePath });
-        console.log(`[PDFPARSE] Downloaded image to: ${localImagePath}`);
-        
-        // 2. Extract text using vision_text.py
-        let extractedText = '';
-        try {
-          console.log(`[PDFPARSE] Extracting text from: ${localImagePath}`);
-          extractedText = await new Promise((resolve, reject) => {
-            execFile('python', [visionScript, localImagePath], (error, stdout, stderr) => {
-              if (stderr) {
-                console.error(`[PDFPARSE][PYTHON STDERR]: ${stderr}`);
-              }
-              if (error) {
-                console.error(`[PDFPARSE] Text extraction error for ${localImagePath}:`, error);
-                return reject(error);
-              }
-              const match = stdout.match(/--- Extracted Text ---\s*([\s\S]*)/);
-              resolve(match ? match[1].trim() : '');
-            });
-          });
-          console.log(`[PDFPARSE] Extracted text length: ${extractedText.length}`);
-        } catch (e) {
-          console.error('[PDFPARSE] Text extraction failed:', e);
-          extractedText = '';
-        }
-        
-        // 3. Save text as JSON to GCS
-        const textFileName = imageFileName.replace('.png', '.json');
-        const gcsTextFile = bucket.file(`${gcsPrefix}/${textFileName}`);
-        const textJson = JSON.stringify({ text: extractedText });
-        await gcsTextFile.save(Buffer.from(textJson, 'utf8'), { contentType: 'application/json' });
-        const gcsTextUrl = `gs://${bucket.name}/${gcsPrefix}/${textFileName}`;
-        console.log(`[PDFPARSE] Uploaded text JSON to: ${gcsTextUrl}`);
-
-        const pageIndex = manifest.indexOf(page);
-        manifest[pageIndex] = {
-          imageGcsUrl: page,
-          textGcsUrl: gcsTextUrl
-        };
-        console.log(`[PDFPARSE] Updated manifest for page index ${pageIndex}`);
-
-        fs.unlink(localImagePath, () => {});
-        console.log(`[PDFPARSE] Deleted local image: ${localImagePath}`);
-        
+        if (result.error) console.error(`[PDFPARSE] Text extraction failed for page ${result.page}:`, result.error);
+        const textGcsUrl = await savePageText(result.page, result.text || '');
+        console.log(`[PDFPARSE] Page ${result.page}: ${result.source} text (${(result.text || '').length} chars) -> ${textGcsUrl}`);
+        entry = { imageGcsUrl, textGcsUrl };
       } catch (e) {
-        console.error('[PDFPARSE] Failed to process page:', page, e);
+        console.error('[PDFPARSE] Failed to process page:', imageGcsUrl, e);
+      }
+      imageUrls.delete(result.page);
+      pages[result.page - 1] = entry;
+      if (streaming) {
+        res.write(`data: ${JSON.stringify({ page: result.page, pageCount, ...(typeof entry === 'string' ? { imageGcsUrl: entry } : entry) })}\n\n`);
       }
+    };
+    try {
+      await pyworker.call('iter_batch_text', {
+        pages: events.map(e => ({ page: e.page, image: e.url })),
+        pdf_path: pdfPath,
+      }, (result) => { saves.push(finishPage(result)); });
+    } catch (e) {
+      console.error('[PDFPARSE] Batch text extraction failed:', e);
     }
+    await Promise.all(saves);
+    // pages the batch never answered keep their bare image URL
+    for (const [page, url] of imageUrls) pages[page - 1] = url;
+  };
 
-    const manifestFile = bucket.file(`${gcsPrefix}/manifest.json`);
-    await manifestFile.save(JSON.stringify(manifest), { contentType: 'application/json' });
-    await Project.findByIdAndUpdate(
-      projectId,
+  const VISION_BATCH = 16;
+  let buffered = [];
+  const flush = () => {
+    if (buffered.length) pageJobs.push(processBatch(buffered));
+    buffered = [];
+  };
+  try {
+    await pyworker.call('iter_page_images', { pdf_path: pdfPath, bucket_name: bucket.name, gcs_prefix: gcsPrefix }, (event) => {
+      buffered.push(event);
+      if (buffered.length >= VISION_BATCH) flush();
+    });
+  } catch (e) {
+    stderrData = e.message;
+    console.error('[PDFPARSE] iter_page_images failed:', e);
+  }
+  flush();
+  await Promise.all(pageJobs);
+  fs.unlink(pdfPath, () => { console.log(`[PDFPARSE] Deleted local PDF: ${pdfPath}`); });
+  const manifest = pages.filter(Boolean);
+
+  const manifestFile = bucket.file(`${gcsPrefix}/manifest.json`);
+  await manifestFile.save(JSON.stringify(manifest), { contentType: 'application/json' });
+  const gcsUrl = `gs://${bucket.name}/${gcsPrefix}/manifest.json`;
+  // the prefix is keyed on content, so a re-upload of the same PDF refreshes its existing
+  // entry (keeping its _id) instead of adding a second entry that shares the folder
+  const replaced = await Project.updateOne(
+    { _id: projectId, 'files.gcsUrl': gcsUrl },
+    {
+      $set: {
+        'files.$.name': req.file.originalname,
+        'files.$.pageImages': manifest,
+        'files.$.uploadedAt': new Date()
+      }
+    }
+  );
+  if (!replaced.matchedCount) {
+    await Project.updateOne(
+      { _id: projectId, 'files.gcsUrl': { $ne: gcsUrl } },
       {
         $push: {
           files: {
             name: req.file.originalname,
             type: 'application/pdf',
-            gcsUrl: `gs://${bucket.name}/${gcsPrefix}/manifest.json`,
+            gcsUrl,
             pageImages: manifest,
             uploadedAt: new Date()
           }
         }
       }
     );
-    res.json({ success: true, message: 'PDF processed and uploaded successfully.', manifest, stderr: stderrData });
-  });
+  }
+  const body = { success: true, message: 'PDF processed and uploaded successfully.', manifest, stderr: stderrData };
+  if (streaming) {
+    res.write(`event: end\ndata: ${JSON.stringify(body)}\n\n`);
+    res.end();
+  } else {
+    res.json(body);
+  }
 });
 
 module.exports = router;
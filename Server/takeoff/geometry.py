@@ -0,0 +1,282 @@
+# geometry.py -- Room areas, overlaps and floor-area totals from detector predictions
+# Usage: python geometry.py <roomplanner_results.json> [--scale '1/8" = 1'-0"'] [--dpi 200]
+
+import os
+import re
+import sys
+import json
+import math
+
+'''All quantities are computed over the whole predictions array at once:
+box and polygon (shoelace) areas, overlapping box pairs (an x-sorted sweep), and
+the union floor area. When every room is a box (or a polygon filling its
+box) the union is exact (coordinate-compressed coverage grid); otherwise it is read off a single
+room-ID label map, rasterized once at most GEOMETRY_MAX_SIDE pixels long.
+The label map also gives each room's visible area (smaller rooms are drawn
+last, so a closet inside a suite keeps its own pixels).
+
+Pixel quantities are in sheet pixels; with a drawing scale and the render
+DPI they are also given in square feet.'''
+
+# label map resolution cap; counts are scaled back to sheet pixels
+GEOMETRY_MAX_SIDE = int(os.getenv('GEOMETRY_MAX_SIDE', 2048))
+# pdf_to_image_and_gcs renders sheets at 200 DPI
+DEFAULT_DPI = 200
+# cells in the exact box-union grid before falling back to the label map
+BOX_UNION_MAX_CELLS = 4_000_000
+RECTANGLE_FILL = 0.995
+
+SCALE_RE = re.compile(
+    r'^\s*(?:(\d+)\s+)?(\d+(?:\.\d+)?)(?:\s*/\s*(\d+))?\s*(?:"|in\b|\'\')\s*=\s*'
+    r'(\d+(?:\.\d+)?)\s*(?:\'|ft\b)(?:\s*-?\s*(\d+(?:\.\d+)?)\s*(?:"|in\b))?\s*$',
+    re.IGNORECASE,
+)
+RATIO_RE = re.compile(r'^\s*1\s*:\s*(\d+(?:\.\d+)?)\s*$')
+
+
+def parse_scale(scale):
+    """
+    Real feet per inch of paper for a drawing scale: architectural
+    ('1/8" = 1\'-0"', '1 1/2" = 1\''), engineering ('1" = 20\''), a ratio
+    ('1:100') or a number (already feet per inch). None if unrecognised.
+    """
+    if scale is None:
+        return None
+    if isinstance(scale, (int, float)):
+        return float(scale) if scale > 0 else None
+    m = SCALE_RE.match(scale)
+    if m:
+        whole, num, den, feet, inches = m.groups()
+        paper = float(num) / float(den) if den else float(num)
+        paper += float(whole) if whole else 0.0
+        real = float(feet) + (float(inches) / 12.0 if inches else 0.0)
+        return real / paper if paper > 0 else None
+    m = RATIO_RE.match(scale)
+    if m:
+        return float(m.group(1)) / 12.0
+    try:
+        return parse_scale(float(scale))
+    except ValueError:
+        return None
+
+
+def feet_per_pixel(scale, dpi=DEFAULT_DPI):
+    per_inch = parse_scale(scale)
+    return per_inch / dpi if per_inch and dpi else None
+
+
+def _has_box(pred):
+    return None not in (pred.get('x'), pred.get('y'), pred.get('width'), pred.get('height'))
+
+
+def boxes(predictions):
+    """
+    (n, 4) [x0, y0, x1, y1] array of prediction boxes.
+    """
+    import numpy as np
+    xywh = np.array([(p['x'], p['y'], p['width'], p['height']) for p in predictions], dtype=np.float64).reshape(-1, 4)
+    half = xywh[:, 2:] / 2
+    return np.hstack([xywh[:, :2] - half, xywh[:, :2] + half])
+
+
+def box_areas(b):
+    import numpy as np
+    return np.maximum(b[:, 2] - b[:, 0], 0) * np.maximum(b[:, 3] - b[:, 1], 0)
+
+
+def _polygons(predictions):
+    """
+    Polygon vertices padded to a (n, k, 2) array by repeating each last
+    vertex (which adds nothing to a shoelace sum), and the vertex counts.
+    """
+    import numpy as np
+    counts = np.array([len(p.get('points') or []) for p in predictions], dtype=np.int64)
+    k = max(int(counts.max()) if len(counts) else 0, 1)
+    vertices = np.zeros((len(predictions), k, 2), dtype=np.float64)
+    for i, p in enumerate(predictions):
+        points = p.get('points') or []
+        if points:
+            vertices[i, :len(points)] = [(pt['x'], pt['y']) for pt in points]
+            vertices[i, len(points):] = vertices[i, len(points) - 1]
+    return vertices, counts
+
+
+def polygon_areas(predictions, b=None):
+    """
+    Shoelace area of each prediction's polygon; the box area when it has fewer than 3 points.
+    """
+    import numpy as np
+    b = boxes(predictions) if b is None else b
+    vertices, counts = _polygons(predictions)
+    x, y = vertices[:, :, 0], vertices[:, :, 1]
+    shoelace = np.abs((x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y).sum(axis=1)) / 2
+    return np.where(counts >= 3, shoelace, box_areas(b))
+
+
+def pairwise_overlap(b):
+    """
+    Overlapping box pairs as arrays (i, j, area) with i < j and area > 0.
+    Boxes are swept in x0 order: each box is only paired with the run of
+    later boxes that start before it ends, so sparse sheets never build
+    an n x n matrix.
+    """
+    import numpy as np
+    order = np.argsort(b[:, 0], kind='stable')
+    s = b[order]
+    n = len(s)
+    ends = np.searchsorted(s[:, 0], s[:, 2], side='left')
+    counts = np.maximum(ends - np.arange(1, n + 1), 0)
+    total = int(counts.sum())
+    first = np.repeat(np.arange(n), counts)
+    # position of each candidate within its run: 0, 1, ... counts[i] - 1
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    second = first + 1 + offsets
+    w = np.minimum(s[first, 2], s[second, 2]) - np.maximum(s[first, 0], s[second, 0])
+    h = np.minimum(s[first, 3], s[second, 3]) - np.maximum(s[first, 1], s[second, 1])
+    area = np.maximum(w, 0) * np.maximum(h, 0)
+    hit = area > 0
+    i, j = order[first[hit]], order[second[hit]]
+    return np.minimum(i, j), np.maximum(i, j), area[hit]
+
+
+def box_union_area(b):
+    """
+    Exact area of a union of boxes: coverage counts on the grid of distinct
+    box edges from a 2-D difference array (one cumulative sum per axis).
+    None when the grid would exceed BOX_UNION_MAX_CELLS.
+    """
+    import numpy as np
+    if not len(b):
+        return 0.0
+    xs, ys = np.unique(b[:, [0, 2]]), np.unique(b[:, [1, 3]])
+    if len(xs) * len(ys) > BOX_UNION_MAX_CELLS:
+        return None
+    ix0, ix1 = np.searchsorted(xs, b[:, 0]), np.searchsorted(xs, b[:, 2])
+    iy0, iy1 = np.searchsorted(ys, b[:, 1]), np.searchsorted(ys, b[:, 3])
+    diff = np.zeros((len(ys), len(xs)), dtype=np.int32)
+    np.add.at(diff, (iy0, ix0), 1)
+    np.add.at(diff, (iy0, ix1), -1)
+    np.add.at(diff, (iy1, ix0), -1)
+    np.add.at(diff, (iy1, ix1), 1)
+    covered = diff.cumsum(axis=0).cumsum(axis=1)[:-1, :-1] > 0
+    return float(np.diff(ys) @ covered @ np.diff(xs))
+
+
+def label_map(predictions, width, height, max_side=GEOMETRY_MAX_SIDE, areas=None):
+    """
+    Room-ID image (0 = no room, i + 1 = predictions[i]) rasterized in one
+    pass, largest rooms first so nested rooms stay visible. Returns
+    (int32 array, factor) where one label pixel is factor x factor sheet pixels.
+    """
+    import numpy as np
+    from PIL import Image, ImageDraw
+    factor = max(1.0, max(width, height) / max_side) if max_side else 1.0
+    size = (max(1, math.ceil(width / factor)), max(1, math.ceil(height / factor)))
+    areas = polygon_areas(predictions) if areas is None else areas
+    vertices, counts = _polygons(predictions)
+    if vertices.shape[1] < 4:
+        vertices = np.concatenate([vertices, np.repeat(vertices[:, -1:], 4 - vertices.shape[1], axis=1)], axis=1)
+    # rooms without a polygon are drawn as their box
+    b = boxes(predictions)
+    plain = counts < 3
+    corners = np.stack([b[:, [0, 1]], b[:, [2, 1]], b[:, [2, 3]], b[:, [0, 3]]], axis=1)
+    vertices[plain, :4] = corners[plain]
+    vertices[plain, 4:] = corners[plain, 3:4]
+    counts = np.where(plain, 4, counts)
+    vertices = vertices / factor
+    # ImageDraw fills both boundary pixels; shrinking each outline by one
+    # pixel about its box centre keeps a w x h box at w * h pixels
+    low, high = vertices.min(axis=1, keepdims=True), vertices.max(axis=1, keepdims=True)
+    extent = np.maximum(high - low, 1e-9)
+    vertices = (low + high) / 2 + (vertices - (low + high) / 2) * np.maximum(extent - 1, 0) / extent
+
+    image = Image.new("I", size, 0)
+    draw = ImageDraw.Draw(image)
+    for i in np.argsort(-areas, kind='stable'):
+        draw.polygon(vertices[i, :counts[i]].ravel().tolist(), fill=int(i) + 1)
+    return np.asarray(image, dtype=np.int32), factor
+
+
+def measure(predictions, width, height, scale=None, dpi=DEFAULT_DPI, max_side=GEOMETRY_MAX_SIDE, labels=False):
+    """
+    Takeoff quantities for one sheet's predictions. With labels=True the
+    label map is returned under "label_map" (not JSON-serializable).
+    """
+    import numpy as np
+    predictions = [p for p in predictions if _has_box(p)]
+    ft_per_px = feet_per_pixel(scale, dpi)
+    sqft = (lambda px: round(float(px) * ft_per_px ** 2, 2)) if ft_per_px else (lambda px: None)
+    n = len(predictions)
+    b = boxes(predictions)
+    box_area = box_areas(b)
+    area = polygon_areas(predictions, b)
+    pair_i, pair_j, pair_area = pairwise_overlap(b)
+    overlap = (np.bincount(pair_i, pair_area, minlength=n) + np.bincount(pair_j, pair_area, minlength=n)).astype(np.float64)
+
+    # polygons that fill their box (the usual 4-corner rooms) count as boxes
+    rectangles = bool(np.all(area >= box_area * RECTANGLE_FILL))
+    union = box_union_area(b) if rectangles else None
+    method = "boxes" if union is not None else "label_map"
+    label_image, factor, visible = None, None, None
+    if union is None or labels:
+        label_image, factor = label_map(predictions, width, height, max_side, area)
+        visible = np.bincount(label_image.ravel(), minlength=n + 1)[1:] * factor ** 2
+        if union is None:
+            union = float(visible.sum())
+
+    columns = {
+        "box": np.round(b, 1).tolist(),
+        "box_area_px": np.round(box_area, 1).tolist(),
+        "area_px": np.round(area, 1).tolist(),
+        "overlap_px": np.round(overlap, 1).tolist(),
+        "area_sqft": np.round(area * ft_per_px ** 2, 2).tolist() if ft_per_px else [None] * n,
+    }
+    if visible is not None:
+        columns["visible_area_px"] = np.round(visible, 1).tolist()
+    rooms = [
+        {"id": i + 1, "class": pred.get('class'), "confidence": pred.get('confidence'),
+         **{key: values[i] for key, values in columns.items()}}
+        for i, pred in enumerate(predictions)
+    ]
+    order = np.lexsort((pair_j, pair_i))
+
+    takeoff = {
+        "room_count": n,
+        "scale": scale if isinstance(scale, str) else None,
+        "feet_per_pixel": ft_per_px,
+        "dpi": dpi,
+        "total_area_px": round(float(area.sum()), 1),
+        "union_area_px": round(union, 1),
+        "overlap_area_px": round(float(pair_area.sum()), 1),
+        "total_area_sqft": sqft(area.sum()),
+        "union_area_sqft": sqft(union),
+        "union_method": method,
+        "label_map_factor": factor,
+        "overlaps": [list(pair) for pair in zip((pair_i[order] + 1).tolist(), (pair_j[order] + 1).tolist(),
+                                                 np.round(pair_area[order], 1).tolist())],
+        "rooms": rooms,
+    }
+    if labels:
+        takeoff["label_map"] = label_image
+    return takeoff
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Room areas and overlaps from a roomplanner_results.json")
+    parser.add_argument("results", help="Detector results JSON")
+    parser.add_argument("--scale", default=None, help="Drawing scale, e.g. '1/8\" = 1'-0\"' or 1:100")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI, help=f"Sheet render DPI (default: {DEFAULT_DPI})")
+    args = parser.parse_args()
+    with open(args.results, "r") as f:
+        result = json.load(f)
+    image = result.get("image") or {}
+    if not image.get("width") or not image.get("height"):
+        print("Error: results JSON has no image size", file=sys.stderr)
+        sys.exit(1)
+    takeoff = measure(result.get("predictions", []), image["width"], image["height"], args.scale, args.dpi)
+    print(json.dumps(takeoff, indent=2))
+
+
+if __name__ == "__main__":
+    main()
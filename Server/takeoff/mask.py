@@ -1,106 +1,507 @@
 
 # mask.py -- Generate room mask overlay from blueprint image
-# Usage: python mask.py <input_image_path> [output_dir]
+# Usage: python mask.py [input_image_path ...] [--output DIR] [--max-side N] [--tiled] [--url URL]
 
 import os
 import sys
-import requests
 from dotenv import load_dotenv
 import io
 import json
-from PIL import Image, ImageOps, ImageDraw
+import time
+import uuid
+import random
 
-def run_mask(image_path, output_dir=None, threshold=200, verbose=True):
+# longest side of the image sent to the detector; boxes are scaled back to full resolution
+DETECT_MAX_SIDE = int(os.getenv('MASK_DETECT_MAX_SIDE', 2048))
+MASK_CONCURRENCY = int(os.getenv('MASK_CONCURRENCY', 4))
+DETECT_URL = "https://detect.roboflow.com/estima_ai/2"
+FILL_RGBA = (255, 0, 128, 60)
+OUTLINE_RGBA = (255, 0, 128, 180)
+OUTLINE_WIDTH = 3
+DETECT_RETRIES = int(os.getenv('MASK_DETECT_RETRIES', 3))
+# tiled mode (MASK_TILED=1 makes it the default for run_mask): sheet-pixel tiles; the overlap should exceed the largest room so one tile sees it whole
+TILED = os.getenv('MASK_TILED', '0') == '1'
+TILE_SIZE = int(os.getenv('MASK_TILE_SIZE', 2048))
+TILE_OVERLAP = int(os.getenv('MASK_TILE_OVERLAP', 512))
+TILE_CONCURRENCY = int(os.getenv('MASK_TILE_CONCURRENCY', 8))
+# duplicates across tiles: same class and IoU above NMS_IOU, or the smaller box mostly inside the larger
+NMS_IOU = float(os.getenv('MASK_NMS_IOU', 0.5))
+NMS_CONTAINMENT = float(os.getenv('MASK_NMS_CONTAINMENT', 0.8))
+# boxes ending this close to an inner tile edge are pieces of a room the tile cut;
+# overlapping pieces (intersection over the smaller above NMS_MERGE) are unioned
+TILE_EDGE_MARGIN = int(os.getenv('MASK_TILE_EDGE_MARGIN', 16))
+NMS_MERGE = float(os.getenv('MASK_NMS_MERGE', 0.2))
+
+_session = None
+
+def get_session():
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+        # one pooled connection per concurrent page or tile
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(MASK_CONCURRENCY, TILE_CONCURRENCY))
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+def _api_key():
     # Load API key from ../.env
     load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
-    API_KEY = os.getenv("ROBOFLOW_API_KEY")
-    if not API_KEY:
+    api_key = os.getenv("ROBOFLOW_API_KEY")
+    if not api_key:
         raise RuntimeError("ROBOFLOW_API_KEY not found")
+    return api_key
+
+def decode(image):
+    """
+    A decoded PIL image from a path, PIL image or array; the file is read once.
+    """
+    Image = _pil()
+    if isinstance(image, str):
+        with Image.open(image) as img:
+            img.load()
+            return img
+    if isinstance(image, Image.Image):
+        return image
+    return Image.fromarray(image)
+
+def load_gray(image):
+    """
+    2-D uint8 grayscale array of an image path, PIL image or array.
+    """
+    import numpy as np
+    if isinstance(image, np.ndarray) and image.ndim == 2:
+        return image
+    return np.asarray(decode(image).convert("L"))
+
+def _pil():
+    from PIL import Image
+    return Image
+
+_luts = {}
 
-    URL = "https://detect.roboflow.com/estima_ai/2"
-    PARAMS = {
-        "api_key": API_KEY,
+def binarize(gray, threshold=200):
+    """
+    255 where gray > threshold, else 0, via a 256-entry lookup table.
+    """
+    import numpy as np
+    lut = _luts.get(threshold)
+    if lut is None:
+        lut = _luts[threshold] = np.where(np.arange(256) > threshold, 255, 0).astype(np.uint8)
+    return lut[gray]
+
+def min_pool(gray, factor):
+    """
+    Downsample by an integer factor keeping the darkest pixel of each block,
+    so one-pixel plan lines survive. Edges are padded with white.
+    """
+    import numpy as np
+    if factor <= 1:
+        return gray
+    h, w = gray.shape
+    ph, pw = -h % factor, -w % factor
+    if ph or pw:
+        gray = np.pad(gray, ((0, ph), (0, pw)), constant_values=255)
+    return gray.reshape(gray.shape[0] // factor, factor, gray.shape[1] // factor, factor).min(axis=(1, 3))
+
+def prepare_upload(gray, threshold=200, max_side=DETECT_MAX_SIDE):
+    """
+    Binarized detector input as PNG bytes and the factor back to full resolution.
+    Pooling runs before the LUT (thresholding is monotone, so the result is the
+    same) so only the small image is thresholded and encoded.
+    """
+    factor = max(1, -(-max(gray.shape) // max_side)) if max_side else 1
+    small = binarize(min_pool(gray, factor), threshold)
+    buf = io.BytesIO()
+    _pil().fromarray(small, mode="L").save(buf, format='PNG')
+    return buf.getvalue(), factor, small
+
+def detect(png_bytes, api_key=None, url=DETECT_URL, filename="binarized_input.png", retries=DETECT_RETRIES):
+    """
+    POST one PNG to the detector. Connection errors, 429 and 5xx are retried with backoff.
+    """
+    params = {
+        "api_key": api_key or _api_key(),
         "confidence": 10,
         "overlap": 10,
         "format": "json"
     }
-
-    if output_dir is None:
-        output_dir = os.path.join(os.path.dirname(__file__), "output")
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Binarize image
-    img_orig = Image.open(image_path).convert("L")
-    img_bin = img_orig.point(lambda x: 255 if x > threshold else 0, mode='1')
-    bin_image_path = os.path.join(output_dir, "binarized_input.png")
-    img_bin.convert("L").save(bin_image_path)
-    if verbose:
-        print(f"Binarized image saved as {bin_image_path}")
-
-    # POST request to API using binarized image
-    img_bytes = io.BytesIO()
-    img_bin.convert("RGB").save(img_bytes, format='PNG')
-    img_bytes.seek(0)
-    response = requests.post(URL, params=PARAMS, files={"file": ("binarized_input.png", img_bytes, "image/png")})
-
+    for attempt in range(retries + 1):
+        try:
+            response = get_session().post(url, params=params, files={"file": (filename, png_bytes, "image/png")})
+            error = None if response.status_code != 429 and response.status_code < 500 else f"HTTP {response.status_code}"
+        except OSError as e:
+            # requests' ConnectionError and Timeout derive from OSError
+            error = f"{type(e).__name__}: {e}"
+        if error is None:
+            break
+        if attempt == retries:
+            raise RuntimeError(f"API Error: {error}")
+        delay = 0.5 * 2 ** attempt * (1 + random.random() * 0.25)
+        print(f"[mask.py] {filename} failed ({error}), retrying in {delay:.1f}s", file=sys.stderr, flush=True)
+        time.sleep(delay)
     if response.status_code != 200:
         raise RuntimeError(f"API Error: {response.status_code}\n{response.text}")
+    return response.json()
+
+def _transform(pred, factor=1, dx=0, dy=0):
+    for key, offset in (('x', dx), ('y', dy), ('width', 0), ('height', 0)):
+        if pred.get(key) is not None:
+            pred[key] = pred[key] * factor + offset
+    for point in pred.get('points', []) or []:
+        point['x'] = point['x'] * factor + dx
+        point['y'] = point['y'] * factor + dy
+    return pred
 
-    result = response.json()
-    if verbose:
-        print(f"Detected {len(result.get('predictions', []))} rooms")
-
-    # Save JSON
-    json_path = os.path.join(output_dir, "roomplanner_results.json")
-    with open(json_path, "w") as jf:
-        json.dump(result, jf, indent=2)
-    if verbose:
-        print(f"Results JSON saved as {json_path}")
-
-    # Draw mask overlay
-    try:
-        img = Image.open(image_path).convert("RGBA")
-        mask = Image.new("RGBA", img.size, (0,0,0,0))
-        draw = ImageDraw.Draw(mask)
+def scale_result(result, factor, width, height):
+    """
+    Map detector coordinates (boxes and polygon points) back to the full-resolution sheet.
+    """
+    if factor != 1:
         for pred in result.get('predictions', []):
-            x = pred.get('x')
-            y = pred.get('y')
-            w = pred.get('width')
-            h = pred.get('height')
-            if None not in (x, y, w, h):
-                left = int(x - w/2)
-                top = int(y - h/2)
-                right = int(x + w/2)
-                bottom = int(y + h/2)
-                draw.rectangle([left, top, right, bottom], outline=(255,0,128,180), width=3, fill=(255,0,128,60))
-        overlayed = Image.alpha_composite(img, mask)
-        overlay_path = os.path.join(output_dir, "room_mask_overlay.png")
-        overlayed.save(overlay_path)
+            _transform(pred, factor)
+    result['image'] = {'width': width, 'height': height}
+    return result
+
+def tile_grid(width, height, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """
+    (left, top, right, bottom) tiles covering the sheet, overlapping by
+    `overlap` pixels; the last row and column are shifted back to end on the edge.
+    """
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        stride = max(1, tile_size - overlap)
+        positions = list(range(0, length - tile_size, stride))
+        return positions + [length - tile_size]
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in starts(height) for x in starts(width)]
+
+def nms(boxes, scores, classes=None, iou_threshold=NMS_IOU, containment_threshold=NMS_CONTAINMENT):
+    """
+    Greedy non-maximum suppression over (n, 4) [x0, y0, x1, y1] boxes, each
+    step vectorized over the remaining boxes. A box is dropped when a
+    higher-scoring box of the same class overlaps it by IoU or covers most of
+    it (a room cut at a tile edge inside the same room seen whole). Returns
+    kept indices, best first.
+    """
+    import numpy as np
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    areas = _areas(boxes)
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind='stable')
+    classes = np.asarray(classes) if classes is not None else None
+    keep = []
+    while order.size:
+        i, rest = order[0], order[1:]
+        keep.append(i)
+        w = np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0])
+        h = np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1])
+        inter = np.maximum(w, 0) * np.maximum(h, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            iou = inter / (areas[i] + areas[rest] - inter)
+            contained = inter / np.minimum(areas[i], areas[rest])
+        duplicate = (iou > iou_threshold) | (contained > containment_threshold)
+        if classes is not None:
+            duplicate &= classes[rest] == classes[i]
+        order = rest[~duplicate]
+    return np.array(keep, dtype=np.int64)
+
+def _has_box(pred):
+    return None not in (pred.get('x'), pred.get('y'), pred.get('width'), pred.get('height'))
+
+def _corners(pred):
+    return (pred['x'] - pred['width'] / 2, pred['y'] - pred['height'] / 2,
+            pred['x'] + pred['width'] / 2, pred['y'] + pred['height'] / 2)
+
+def _union(pieces):
+    """
+    One prediction covering all pieces: the most confident piece with the
+    union box and that box as its polygon.
+    """
+    x0, y0 = min(_corners(p)[0] for p in pieces), min(_corners(p)[1] for p in pieces)
+    x1, y1 = max(_corners(p)[2] for p in pieces), max(_corners(p)[3] for p in pieces)
+    pred = dict(max(pieces, key=lambda p: p.get('confidence', 0.0)))
+    pred.update({"x": (x0 + x1) / 2, "y": (y0 + y1) / 2, "width": x1 - x0, "height": y1 - y0,
+                 "points": [{"x": x0, "y": y0}, {"x": x0, "y": y1}, {"x": x1, "y": y1}, {"x": x1, "y": y0}]})
+    return pred
+
+def merge_predictions(predictions, cut=None, iou_threshold=NMS_IOU, containment_threshold=NMS_CONTAINMENT,
+                      merge_threshold=NMS_MERGE):
+    """
+    Deduplicate predictions in sheet coordinates. Whole boxes go through
+    nms(). Pieces (cut[i] True: the box touched an inner tile edge) are
+    dropped when mostly inside a kept whole box, otherwise overlapping
+    pieces of the same class are unioned into one room.
+    """
+    import numpy as np
+    cut = list(cut) if cut is not None else [False] * len(predictions)
+    valid = [i for i, p in enumerate(predictions) if _has_box(p)]
+    if not valid:
+        return []
+    predictions = [predictions[i] for i in valid]
+    cut = np.array([bool(cut[i]) for i in valid])
+    boxes = np.array([_corners(p) for p in predictions], dtype=np.float64)
+    scores = np.array([p.get('confidence', 0.0) for p in predictions])
+    classes = np.array([str(p.get('class')) for p in predictions])
+
+    whole = np.flatnonzero(~cut)
+    kept = whole[nms(boxes[whole], scores[whole], classes[whole], iou_threshold, containment_threshold)]
+    merged = [predictions[i] for i in kept]
+
+    pieces = np.flatnonzero(cut)
+    if pieces.size and kept.size:
+        w = np.minimum(boxes[pieces, None, 2], boxes[None, kept, 2]) - np.maximum(boxes[pieces, None, 0], boxes[None, kept, 0])
+        h = np.minimum(boxes[pieces, None, 3], boxes[None, kept, 3]) - np.maximum(boxes[pieces, None, 1], boxes[None, kept, 1])
+        inside = np.maximum(w, 0) * np.maximum(h, 0) / _areas(boxes[pieces])[:, None]
+        same = classes[pieces, None] == classes[None, kept]
+        pieces = pieces[~((inside > containment_threshold) & same).any(axis=1)]
+    order = list(pieces[np.argsort(-scores[pieces], kind='stable')])
+    while order:
+        group = [order.pop(0)]
+        box = boxes[group[0]].copy()
+        grown = True
+        # keep absorbing pieces that touch the growing box (a room cut by up to four tiles)
+        while grown and order:
+            rest = np.array(order)
+            w = np.minimum(box[2], boxes[rest, 2]) - np.maximum(box[0], boxes[rest, 0])
+            h = np.minimum(box[3], boxes[rest, 3]) - np.maximum(box[1], boxes[rest, 1])
+            inter = np.maximum(w, 0) * np.maximum(h, 0)
+            smaller = np.minimum(_areas(box[None])[0], _areas(boxes[rest]))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                touching = (inter / smaller > merge_threshold) & (classes[rest] == classes[group[0]])
+            grown = bool(touching.any())
+            if grown:
+                group += list(rest[touching])
+                order = list(rest[~touching])
+                box = np.array([boxes[group, 0].min(), boxes[group, 1].min(), boxes[group, 2].max(), boxes[group, 3].max()])
+        merged.append(_union([predictions[i] for i in group]) if len(group) > 1 else predictions[group[0]])
+    return merged
+
+def _areas(boxes):
+    import numpy as np
+    return np.maximum(boxes[:, 2] - boxes[:, 0], 0) * np.maximum(boxes[:, 3] - boxes[:, 1], 0)
+
+def _is_cut(pred, tile, width, height, margin=TILE_EDGE_MARGIN):
+    left, top, right, bottom = tile
+    x0, y0, x1, y1 = _corners(pred)
+    return ((left > 0 and x0 - left < margin) or (top > 0 and y0 - top < margin)
+            or (right < width and right - x1 < margin) or (bottom < height and bottom - y1 < margin))
+
+def detect_tiled(gray, threshold=200, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, concurrency=TILE_CONCURRENCY,
+                 max_side=DETECT_MAX_SIDE, api_key=None, url=DETECT_URL):
+    """
+    Detect rooms tile by tile, `concurrency` tiles in flight, and merge the
+    tiles' predictions in sheet coordinates (see merge_predictions). Returns a result shaped like a
+    single detector response (roomplanner_results.json) plus "tiles".
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    api_key = api_key or _api_key()
+    start = time.perf_counter()
+    height, width = gray.shape
+    tiles = tile_grid(width, height, tile_size, overlap)
+
+    def one(tile):
+        left, top, right, bottom = tile
+        png_bytes, factor, _ = prepare_upload(gray[top:bottom, left:right], threshold, max_side)
+        result = detect(png_bytes, api_key, url, filename=f"tile_{left}_{top}.png")
+        return [_transform(pred, factor, left, top) for pred in result.get('predictions', [])]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(tiles)))) as pool:
+        found = [(pred, tile) for tile, preds in zip(tiles, pool.map(one, tiles)) for pred in preds]
+    cut = [_has_box(pred) and _is_cut(pred, tile, width, height) for pred, tile in found]
+    predictions = merge_predictions([pred for pred, _ in found], cut)
+    if len(tiles) > 1:
+        print(f"[mask.py] {len(tiles)} tiles: {len(found)} predictions, {len(predictions)} after merging", file=sys.stderr, flush=True)
+    return {
+        "inference_id": str(uuid.uuid4()),
+        "time": round(time.perf_counter() - start, 3),
+        "image": {"width": width, "height": height},
+        "predictions": predictions,
+        "tiles": len(tiles),
+    }
+
+def _box(pred, width, height):
+    x, y, w, h = (pred.get(k) for k in ('x', 'y', 'width', 'height'))
+    if None in (x, y, w, h):
+        return None
+    left, top = max(int(x - w/2), 0), max(int(y - h/2), 0)
+    right, bottom = min(int(x + w/2), width - 1), min(int(y + h/2), height - 1)
+    if right < left or bottom < top:
+        return None
+    return left, top, right, bottom
+
+def _blend(pixels, rgba):
+    import numpy as np
+    # integer "over" blend; uint16 holds (255 - a) * x + a * c + 127
+    alpha = rgba[3]
+    color = np.array(rgba[:3], dtype=np.uint16) * alpha + 127
+    return ((pixels.astype(np.uint16) * (255 - alpha) + color) // 255).astype(np.uint8)
+
+def render_overlay(image, predictions):
+    """
+    Full-resolution RGB overlay of translucent boxes on the sheet (2-D gray
+    or RGB array). Boxes are painted into a one-byte map (0 none, 1 fill,
+    2 outline; later boxes overwrite earlier ones, as in an ImageDraw mask)
+    covering only their bounding area, then each paint is blended once.
+    """
+    import numpy as np
+    out = np.repeat(image[:, :, None], 3, axis=2) if image.ndim == 2 else np.array(image[:, :, :3])
+    height, width = out.shape[:2]
+    boxes = [box for box in (_box(pred, width, height) for pred in predictions) if box is not None]
+    if not boxes:
+        return out
+    x0, y0 = min(b[0] for b in boxes), min(b[1] for b in boxes)
+    x1, y1 = max(b[2] for b in boxes) + 1, max(b[3] for b in boxes) + 1
+    paint = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    t = OUTLINE_WIDTH
+    for left, top, right, bottom in boxes:
+        left, top, right, bottom = left - x0, top - y0, right - x0, bottom - y0
+        paint[top:bottom + 1, left:right + 1] = 2
+        paint[top + t:bottom - t + 1, left + t:right - t + 1] = 1
+    region = out[y0:y1, x0:x1]
+    for value, rgba in ((1, FILL_RGBA), (2, OUTLINE_RGBA)):
+        where = paint == value
+        region[where] = _blend(region[where], rgba)
+    return out
+
+def run_mask(image_path, output_dir=None, threshold=200, verbose=True, save=True, save_binarized=False,
+             max_side=DETECT_MAX_SIDE, api_key=None, url=DETECT_URL, tiled=TILED, tile_size=TILE_SIZE,
+             tile_overlap=TILE_OVERLAP, scale=None, dpi=None, save_labels=False):
+    """
+    Detect rooms on one sheet. The image is decoded once; the detector gets a
+    binarized copy at most max_side pixels long and boxes come back in sheet
+    coordinates. tiled=True sends overlapping tile_size tiles instead (see
+    detect_tiled). result["takeoff"] holds geometry.measure() quantities,
+    in square feet too when the drawing scale is given. With save=False
+    nothing is written and only "result" is set.
+    """
+    import numpy as np
+    api_key = api_key or _api_key()
+    image = decode(image_path)
+    gray = np.asarray(image.convert("L"))
+    height, width = gray.shape
+    if save:
+        if output_dir is None:
+            output_dir = os.path.join(os.path.dirname(__file__), "output")
+        os.makedirs(output_dir, exist_ok=True)
+    bin_image_path = None
+    if tiled:
+        result = detect_tiled(gray, threshold, tile_size, tile_overlap, max_side=max_side, api_key=api_key, url=url)
+        if verbose:
+            print(f"Detected {len(result['predictions'])} rooms in {result['tiles']} tiles of {tile_size}px")
+    else:
+        png_bytes, factor, small = prepare_upload(gray, threshold, max_side)
+        if save and save_binarized:
+            bin_image_path = os.path.join(output_dir, "binarized_input.png")
+            with open(bin_image_path, "wb") as f:
+                f.write(png_bytes)
+            if verbose:
+                print(f"Binarized image saved as {bin_image_path}")
+
+        # POST request to API using binarized image
+        result = scale_result(detect(png_bytes, api_key, url), factor, width, height)
         if verbose:
-            print(f"Room mask overlay image saved as {overlay_path}")
-    except Exception as e:
-        print("Could not create mask overlay:", e)
+            print(f"Detected {len(result.get('predictions', []))} rooms (detector input {small.shape[1]}x{small.shape[0]}, scale {factor})")
+
+    import geometry
+    takeoff = geometry.measure(result.get('predictions', []), width, height, scale, dpi or geometry.DEFAULT_DPI,
+                               labels=save and save_labels)
+    label_image = takeoff.pop("label_map", None)
+    result['takeoff'] = takeoff
+    if verbose and takeoff["union_area_sqft"] is not None:
+        print(f"Floor area {takeoff['union_area_sqft']} sq ft over {takeoff['room_count']} rooms")
 
-    if verbose:
-        print("Results saved in:", output_dir)
+    json_path = None
+    overlay_path = None
+    labels_path = None
+    if save:
+        # Save JSON
+        json_path = os.path.join(output_dir, "roomplanner_results.json")
+        with open(json_path, "w") as jf:
+            json.dump(result, jf, indent=2)
+        if verbose:
+            print(f"Results JSON saved as {json_path}")
+
+        # Draw mask overlay
+        try:
+            overlay_path = os.path.join(output_dir, "room_mask_overlay.png")
+            overlay = render_overlay(np.asarray(image.convert("RGB")), result.get('predictions', []))
+            _pil().fromarray(overlay, mode="RGB").save(overlay_path, compress_level=1)
+            if verbose:
+                print(f"Room mask overlay image saved as {overlay_path}")
+        except Exception as e:
+            overlay_path = None
+            print("Could not create mask overlay:", e)
+
+        if label_image is not None:
+            labels_path = os.path.join(output_dir, "room_labels.png")
+            _pil().fromarray(label_image.astype(np.uint16)).save(labels_path)
+
+        if verbose:
+            print("Results saved in:", output_dir)
     return {
         "binarized_image": bin_image_path,
         "json": json_path,
         "overlay": overlay_path,
+        "labels": labels_path,
         "result": result
     }
 
-if __name__ == "__main__":
+def run_mask_batch(image_paths, output_dir=None, concurrency=MASK_CONCURRENCY, **kwargs):
+    """
+    run_mask over many pages, MASK_CONCURRENCY at a time on the shared session.
+    Each page writes into its own subfolder of output_dir. Returns results in
+    input order; a failed page gets {"error": message}.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(__file__), "output")
+    kwargs.setdefault("verbose", False)
+    kwargs.setdefault("api_key", _api_key())
+
+    def one(indexed):
+        i, image_path = indexed
+        stem = os.path.splitext(os.path.basename(image_path))[0] if isinstance(image_path, str) else f"page_{i + 1}"
+        try:
+            return run_mask(image_path, output_dir=os.path.join(output_dir, stem), **kwargs)
+        except Exception as e:
+            print(f"[mask.py] {stem}: {e}", file=sys.stderr, flush=True)
+            return {"error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        return list(pool.map(one, enumerate(image_paths)))
+
+def main():
     import argparse
     SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
     default_image = os.path.join(SCRIPT_DIR, "data", "ex1.png")
     parser = argparse.ArgumentParser(description="Generate room mask overlay from blueprint image.")
-    parser.add_argument("image_path", nargs="?", default=default_image, help=f"Path to input image (default: {default_image})")
+    parser.add_argument("image_paths", nargs="*", default=[default_image], help=f"Input image path(s) (default: {default_image})")
     parser.add_argument("--output", "-o", help="Output directory", default=None)
     parser.add_argument("--threshold", type=int, default=200, help="Binarization threshold (default: 200)")
+    parser.add_argument("--max-side", type=int, default=DETECT_MAX_SIDE, help=f"Longest side sent to the detector, 0 for full size (default: {DETECT_MAX_SIDE})")
+    parser.add_argument("--save-binarized", action="store_true", help="Also write the binarized detector input")
+    parser.add_argument("--tiled", action="store_true", default=TILED, help="Detect on overlapping tiles and merge with NMS")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE, help=f"Tile size in sheet pixels (default: {TILE_SIZE})")
+    parser.add_argument("--tile-overlap", type=int, default=TILE_OVERLAP, help=f"Tile overlap in sheet pixels (default: {TILE_OVERLAP})")
+    parser.add_argument("--scale", default=None, help="Drawing scale for square-foot areas, e.g. '1/8\" = 1'-0\"'")
+    parser.add_argument("--dpi", type=int, default=None, help="Render DPI of the sheet (default: 200)")
+    parser.add_argument("--save-labels", action="store_true", help="Also write the room-ID label map (16-bit PNG)")
+    parser.add_argument("--url", default=DETECT_URL, help="Detector endpoint (e.g. a local bench/stub_detector.py)")
     parser.add_argument("--quiet", action="store_true", help="Suppress verbose output")
     args = parser.parse_args()
-    if not os.path.exists(args.image_path):
-        print(f"Error: Input image '{args.image_path}' not found.")
-        sys.exit(1)
-    run_mask(args.image_path, output_dir=args.output, threshold=args.threshold, verbose=not args.quiet)
+    for image_path in args.image_paths:
+        if not os.path.exists(image_path):
+            print(f"Error: Input image '{image_path}' not found.")
+            sys.exit(1)
+    options = dict(threshold=args.threshold, save_binarized=args.save_binarized, max_side=args.max_side, url=args.url,
+                   tiled=args.tiled, tile_size=args.tile_size, tile_overlap=args.tile_overlap,
+                   scale=args.scale, dpi=args.dpi, save_labels=args.save_labels)
+    if len(args.image_paths) == 1:
+        run_mask(args.image_paths[0], output_dir=args.output, verbose=not args.quiet, **options)
+    else:
+        run_mask_batch(args.image_paths, output_dir=args.output, verbose=not args.quiet, **options)
+
+if __name__ == "__main__":
+    main()
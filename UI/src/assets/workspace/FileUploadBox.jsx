@@ -1,12 +1,15 @@
 import React, { useRef, useState } from 'react';
 import { Box, Typography, Button, LinearProgress, CircularProgress } from '@mui/material';
+import uploadPdf from './uploadPdf';
 
-export default function FileUploadBox({ onFilesUploaded, error }) {
+export default function FileUploadBox({ onFilesUploaded, error, projectId }) {
   const fileInputRef = useRef();
   const [uploading, setUploading] = useState(false);
   const [localError, setLocalError] = useState('');
   const [progress, setProgress] = useState(0); 
   const [currentFile, setCurrentFile] = useState('');
+  // pages rendered so far for the current file, from the upload's event stream
+  const [pagesDone, setPagesDone] = useState('');
 
   const handleFileChange = async (e) => {
     const files = Array.from(e.target.files);
@@ -24,29 +27,20 @@ export default function FileUploadBox({ onFilesUploaded, error }) {
         for (let i = 0; i < files.length; i++) {
           const file = files[i];
           setCurrentFile(file.name);
-          await new Promise((resolve, reject) => {
-            const xhr = new XMLHttpRequest();
-            const formData = new FormData();
-            formData.append('pdf', file);
-            xhr.open('POST', `${import.meta.env.VITE_API_URL}/api/pdf/processPdf`, true);
-            xhr.setRequestHeader('Authorization', `Bearer ${localStorage.getItem('token')}`);
-            xhr.upload.onprogress = (event) => {
-              if (event.lengthComputable) {
-                setProgress(Math.round((event.loaded / event.total) * 100));
-              }
-            };
-            xhr.onload = () => {
-              setProgress(100);
-              setTimeout(() => setProgress(0), 500);
-              if (xhr.status >= 200 && xhr.status < 300) {
-                resolve();
-              } else {
-                reject(new Error('Upload failed'));
-              }
-            };
-            xhr.onerror = () => reject(new Error('Upload failed'));
-            xhr.send(formData);
+          setPagesDone('');
+          // pages finish out of order, so count them rather than showing the latest page number
+          let pages = 0;
+          await uploadPdf(file, {
+            projectId,
+            onUploadProgress: setProgress,
+            onPage: ({ pageCount }) => {
+              pages += 1;
+              setPagesDone(`${pages} of ${pageCount} pages`);
+              setProgress(Math.round((pages / pageCount) * 100));
+            },
           });
+          setProgress(100);
+          setTimeout(() => setProgress(0), 500);
         }
         await onFilesUploaded(files);
       }
@@ -55,6 +49,7 @@ export default function FileUploadBox({ onFilesUploaded, error }) {
     }
     setUploading(false);
     setCurrentFile('');
+    setPagesDone('');
     setProgress(0);
   };
 
@@ -83,7 +78,7 @@ export default function FileUploadBox({ onFilesUploaded, error }) {
         <Box sx={{ width: '100%', mt: 2, mb: 1, display: 'flex', flexDirection: 'column', alignItems: 'center' }}>
           <CircularProgress size={36} sx={{ mb: 1, color: '#1976d2' }} />
           <LinearProgress variant="determinate" value={progress} sx={{ width: '100%', height: 8, borderRadius: 2, mb: 1 }} />
-          <Typography variant="body2" color="primary" sx={{ fontWeight: 500 }}>{currentFile ? `Uploading: ${currentFile}` : 'Uploading...'} ({progress}%)</Typography>
+          <Typography variant="body2" color="primary" sx={{ fontWeight: 500 }}>{currentFile ? `${pagesDone ? 'Processing' : 'Uploading'}: ${currentFile}` : 'Uploading...'} ({pagesDone || `${progress}%`})</Typography>
         </Box>
       )}
       {(error || localError) && <Typography color="error" sx={{ mt: 2 }}>{error || localError}</Typography>}
@@ -1,6 +1,7 @@
 import React, { useRef, useState } from 'react';
 import { Box, Typography, Button, List, ListItem, IconButton, LinearProgress, CircularProgress } from '@mui/material';
 import DeleteIcon from '@mui/icons-material/Delete';
+import uploadPdf from './uploadPdf';
 
 export default function MultiFileUploadBox({ onConfirm, error, onUploadComplete, projectId }) {
   const fileInputRef = useRef();
@@ -8,6 +9,8 @@ export default function MultiFileUploadBox({ onConfirm, error, onUploadComplete,
   const [localError, setLocalError] = useState('');
   const [uploading, setUploading] = useState(false);
   const [progressArr, setProgressArr] = useState([]);
+  // "pages done/page count" per file once its pages start streaming back
+  const [pagesArr, setPagesArr] = useState([]);
   // ...existing code...
 
   const handleFileChange = (e) => {
@@ -28,50 +31,36 @@ export default function MultiFileUploadBox({ onConfirm, error, onUploadComplete,
     setUploading(true);
     setLocalError('');
     setProgressArr(Array(selectedFiles.length).fill(0));
+    setPagesArr([]);
     try {
       for (let i = 0; i < selectedFiles.length; i++) {
         const file = selectedFiles[i];
-        await new Promise((resolve, reject) => {
-          const xhr = new XMLHttpRequest();
-          const formData = new FormData();
-          formData.append('pdf', file);
-          if (projectId) {
-            formData.append('projectId', projectId);
-          }
-          xhr.open('POST', `${import.meta.env.VITE_API_URL}/api/pdf/processPdf`, true);
-          xhr.setRequestHeader('Authorization', `Bearer ${localStorage.getItem('token')}`);
-          xhr.upload.onprogress = (event) => {
-            if (event.lengthComputable) {
-              setProgressArr(prev => {
-                const arr = [...prev];
-                arr[i] = Math.round((event.loaded / event.total) * 100);
-                return arr;
-              });
-            }
-          };
-          xhr.onload = () => {
-            setProgressArr(prev => {
+        const setProgress = (value) => setProgressArr(prev => {
+          const arr = [...prev];
+          arr[i] = value;
+          return arr;
+        });
+        // pages finish out of order, so count them rather than showing the latest page number
+        let pages = 0;
+        await uploadPdf(file, {
+          projectId,
+          onUploadProgress: setProgress,
+          onPage: ({ pageCount }) => {
+            pages += 1;
+            setPagesArr(prev => {
               const arr = [...prev];
-              arr[i] = 100;
+              arr[i] = `${pages}/${pageCount}`;
               return arr;
             });
-            setTimeout(() => setProgressArr(prev => {
-              const arr = [...prev];
-              arr[i] = 0;
-              return arr;
-            }), 500);
-            if (xhr.status >= 200 && xhr.status < 300) {
-              resolve();
-            } else {
-              reject(new Error('Upload failed'));
-            }
-          };
-          xhr.onerror = () => reject(new Error('Upload failed'));
-          xhr.send(formData);
+            setProgress(Math.round((pages / pageCount) * 100));
+          },
         });
+        setProgress(100);
+        setTimeout(() => setProgress(0), 500);
       }
       setSelectedFiles([]);
       setProgressArr([]);
+      setPagesArr([]);
       if (onUploadComplete) onUploadComplete();
     } catch {
       setLocalError('Upload failed.');
@@ -179,7 +168,7 @@ export default function MultiFileUploadBox({ onConfirm, error, onUploadComplete,
             {uploading && (
               <Box sx={{ width: '100%', display: 'flex', alignItems: 'center', gap: 2, mt: 1 }}>
                 <LinearProgress variant="determinate" value={progressArr[idx] || 0} sx={{ flex: 1, height: 12, borderRadius: 6, bgcolor: '#fff4', boxShadow: '0 0 8px #fff' }} />
-                <Typography variant="caption" sx={{ minWidth: 36, color: '#fff', fontWeight: 900, fontSize: 16, textShadow: '0 0 8px #000' }}>{progressArr[idx] || 0}%</Typography>
+                <Typography variant="caption" sx={{ minWidth: 36, color: '#fff', fontWeight: 900, fontSize: 16, textShadow: '0 0 8px #000' }}>{pagesArr[idx] || `${progressArr[idx] || 0}%`}</Typography>
                 {progressArr[idx] < 100 && <CircularProgress size={24} sx={{ ml: 2, color: '#fff', filter: 'drop-shadow(0 0 8px #fff)' }} />}
               </Box>
             )}
@@ -0,0 +1,60 @@
+// Upload one PDF to /api/pdf/processPdf?stream=1 and follow its server-sent events.
+// onUploadProgress(percent) tracks the request body; onPage({ page, pageCount, imageGcsUrl, textGcsUrl })
+// fires as each page is rendered and stored, before the whole document is done.
+// Resolves with the final { success, manifest, ... } body.
+export default function uploadPdf(file, { projectId, onUploadProgress, onPage } = {}) {
+  return new Promise((resolve, reject) => {
+    const xhr = new XMLHttpRequest();
+    const formData = new FormData();
+    formData.append('pdf', file);
+    if (projectId) {
+      formData.append('projectId', projectId);
+    }
+    xhr.open('POST', `${import.meta.env.VITE_API_URL}/api/pdf/processPdf?stream=1`, true);
+    xhr.setRequestHeader('Authorization', `Bearer ${localStorage.getItem('token')}`);
+    xhr.upload.onprogress = (event) => {
+      if (event.lengthComputable && onUploadProgress) {
+        onUploadProgress(Math.round((event.loaded / event.total) * 100));
+      }
+    };
+
+    let seen = 0;
+    let result = null;
+    let failure = null;
+    const readEvents = () => {
+      // responseText grows while the stream is open; events end with a blank line
+      const text = xhr.responseText;
+      let end;
+      while ((end = text.indexOf('\n\n', seen)) >= 0) {
+        const block = text.slice(seen, end);
+        seen = end + 2;
+        let name = 'message';
+        let data = '';
+        for (const line of block.split('\n')) {
+          if (line.startsWith('event:')) name = line.slice(6).trim();
+          else if (line.startsWith('data:')) data += line.slice(5).trim();
+        }
+        if (!data) continue;
+        const payload = JSON.parse(data);
+        if (name === 'end') result = payload;
+        else if (name === 'error') failure = new Error(payload.error || 'Upload failed');
+        else if (onPage) onPage(payload);
+      }
+    };
+    xhr.onprogress = () => {
+      if (xhr.status >= 200 && xhr.status < 300) readEvents();
+    };
+    xhr.onload = () => {
+      if (xhr.status < 200 || xhr.status >= 300) {
+        reject(new Error('Upload failed'));
+        return;
+      }
+      readEvents();
+      if (failure) reject(failure);
+      else if (result) resolve(result);
+      else reject(new Error('Upload ended before the PDF was processed'));
+    };
+    xhr.onerror = () => reject(new Error('Upload failed'));
+    xhr.send(formData);
+  });
+}
@@ -6,6 +6,7 @@ import DocumentList from './DocumentList';
 import DocumentViewer from './DocumentViewer';
 import FileUploadBox from './FileUploadBox';
 import MultiFileUploadBox from './MultiFileUploadBox';
+import uploadPdf from './uploadPdf';
 import Conversation from '../components/Conversation';
 import Tools from './Tools';
 import FloorplanMasker from './vision/floorplans';
@@ -148,16 +149,8 @@ export default function Workspace({ project }) {
         setUploadError('Only PDF files are supported.');
         continue;
       }
-      const formData = new FormData();
-      formData.append('pdf', file);
-      formData.append('projectId', project._id || project.id);
       try {
-        const res = await fetch(`${import.meta.env.VITE_API_URL}/api/pdf/processPdf`, {
-          method: 'POST',
-          headers: { Authorization: `Bearer ${localStorage.getItem('token')}` },
-          body: formData,
-        });
-        if (!res.ok) throw new Error('Upload failed');
+        await uploadPdf(file, { projectId: project._id || project.id });
 
         await new Promise(r => setTimeout(r, 400)); 
         const res2 = await fetch(`${import.meta.env.VITE_API_URL}/api/projects/${project._id || project.id}`, {
@@ -1,3 +0,0 @@
-import torch
-import torch.nn as nn
-